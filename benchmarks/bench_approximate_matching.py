@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+容错匹配基准测试
+比较精确匹配与容错匹配 (--max-mismatches / --max-edits) 的速度:
+S1 查询序列匹配 (build_matcher) 与 S2 分隔符定位 (split_record 所用的查找函数),
+reads中的连接序列按比例带有随机替换/插入/缺失。
+另以动态规划的朴素实现校验 ApproximatePattern.find 的结果。
+精确出现优先, 因此能精确匹配的reads在容错模式下结果不变。
+
+用法: python benchmarks/bench_approximate_matching.py [--reads 100000] [--read-length 150]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from S2_Split import (find_separators_approximately, find_separators_in_sequence, get_reverse_complement,
+                      prepare_separators)
+from sequence_matchers import ApproximatePattern, build_matcher
+
+LINKER = "ATGTCGGAACTGTTGCTTGTCCGACT"
+SEPARATOR1 = "GATCATGTCGGAACTGTTGCTTGTCCGACTGATC"
+SEPARATOR2 = "AGATCGGAAGA"
+
+def random_bases(length, rng):
+    return "".join(rng.choice("ACGT") for _ in range(length))
+
+def mutate(sequence, errors, rng, allow_indels):
+    """对sequence做errors次随机替换 (allow_indels时也可能是插入/缺失)"""
+    bases = list(sequence)
+    for _ in range(errors):
+        position = rng.randrange(len(bases))
+        operation = rng.choice("sid") if allow_indels else "s"
+        if operation == "s":
+            bases[position] = rng.choice([base for base in "ACGT" if base != bases[position]])
+        elif operation == "i":
+            bases.insert(position, rng.choice("ACGT"))
+        else:
+            del bases[position]
+    return "".join(bases)
+
+def make_reads(num_reads, read_length, rng, allow_indels, error_rate):
+    """
+    约1/3 reads不含分隔符, 其余依次含sep1、sep2 (正向或反向互补),
+    其中比例为error_rate的sep1带1~2个错误
+    """
+    reads = []
+    for index in range(num_reads):
+        if index % 3 == 0:
+            reads.append(random_bases(read_length, rng).encode('ascii'))
+            continue
+        separator1 = SEPARATOR1 if index % 2 else get_reverse_complement(SEPARATOR1)
+        if rng.random() < error_rate:
+            separator1 = mutate(separator1, rng.randint(1, 2), rng, allow_indels)
+        parts = [random_bases(rng.randint(20, 40), rng), separator1, random_bases(rng.randint(20, 40), rng),
+                 SEPARATOR2]
+        sequence = "".join(parts)
+        sequence += random_bases(max(0, read_length - len(sequence)), rng)
+        reads.append(sequence[:read_length].encode('ascii'))
+    return reads
+
+def edit_distance_ends(sequence, pattern, start):
+    """朴素动态规划: 以每个位置结尾 (起点>=start) 的最小编辑距离"""
+    column = list(range(len(pattern) + 1))
+    distances = []
+    for symbol in sequence[start:]:
+        new_column = [0]
+        for row in range(1, len(pattern) + 1):
+            new_column.append(min(column[row] + 1, new_column[row - 1] + 1,
+                                  column[row - 1] + (pattern[row - 1] != symbol)))
+        column = new_column
+        distances.append(column[-1])
+    return distances
+
+def naive_find(sequence, pattern, max_mismatches, max_edits, start):
+    """ApproximatePattern.find 的朴素实现, 用于校验 (精确出现优先)"""
+    exact = sequence.find(pattern, start)
+    if exact != -1:
+        return (exact, exact + len(pattern)) if not max_edits else (exact + len(pattern), 0)
+    if not max_edits:
+        for candidate in range(start, len(sequence) - len(pattern) + 1):
+            window = sequence[candidate:candidate + len(pattern)]
+            if sum(a != b for a, b in zip(window, pattern)) <= max_mismatches:
+                return candidate, candidate + len(pattern)
+        return None
+    distances = edit_distance_ends(sequence, pattern, start)
+    within = [index for index, distance in enumerate(distances) if distance <= max_edits]
+    if not within:
+        return None
+    # 第一个不超过容错数的结尾, 之后距离仍下降时向后延伸
+    index = within[0]
+    while index + 1 < len(distances) and distances[index + 1] < distances[index]:
+        index += 1
+    return start + index + 1, distances[index]
+
+def check_against_naive(num_cases, rng):
+    """
+    短字母表随机序列上, ApproximatePattern.find 须与朴素实现一致 (编辑模式比较结尾和距离),
+    且search及带stop的find与之相符
+    """
+    for case in range(num_cases):
+        alphabet = "ACGT" if case % 2 else "AC"
+        pattern = "".join(rng.choice(alphabet) for _ in range(rng.randint(3, 12))).encode('ascii')
+        sequence = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40))).encode('ascii')
+        max_errors = rng.randint(1, min(3, len(pattern) - 1))
+        start = rng.randint(0, 5)
+        for max_mismatches, max_edits in ((max_errors, 0), (0, max_errors)):
+            searcher = ApproximatePattern(pattern, max_mismatches, max_edits)
+            actual = searcher.find(sequence, start)
+            # 给出stop时的结果须与不限范围时一致 (起点>=stop时为None)
+            stop = rng.randint(start, start + 30)
+            expected_bounded = actual if actual is not None and actual[0] < stop else None
+            if searcher.find(sequence, start, stop) != expected_bounded:
+                return (pattern, sequence, max_mismatches, max_edits, start, stop, expected_bounded)
+            expected = naive_find(sequence, pattern, max_mismatches, max_edits, start)
+            if max_edits and actual is not None:
+                match_start, match_end = actual
+                distances = edit_distance_ends(sequence[match_start:match_end], pattern, 0)
+                actual = (match_end, distances[-1] if distances else len(pattern))
+            if actual != expected or searcher.search(sequence) != (searcher.find(sequence) is not None):
+                return (pattern, sequence, max_mismatches, max_edits, start, expected, actual)
+    return None
+
+def naive_find_separators(sequence, sep1_fwd, sep1_rc, sep2_fwd, sep2_rc):
+    """
+    find_separators_approximately 的朴素实现: 精确查找有结果时直接返回,
+    否则四种组合各自完整查找, 取R2最短者 (相同时取靠前的)
+    """
+    exact_result = find_separators_in_sequence(sequence, sep1_fwd.pattern, sep1_rc.pattern,
+                                               sep2_fwd.pattern, sep2_rc.pattern)
+    if exact_result:
+        return exact_result
+    best = None
+    for orientation, sep1, sep2 in (('forward', sep1_fwd, sep2_fwd), ('reverse', sep1_rc, sep2_rc),
+                                    ('mixed_fwd_rc', sep1_fwd, sep2_rc), ('mixed_rc_fwd', sep1_rc, sep2_fwd)):
+        sep1_hit = sep1.find(sequence)
+        sep2_hit = sep2.find(sequence, sep1_hit[1]) if sep1_hit else None
+        if sep2_hit and (best is None or sep2_hit[0] - sep1_hit[1] < best[2] - best[1]):
+            best = (sep1_hit[0], sep1_hit[1], sep2_hit[0], orientation)
+    return best
+
+def check_separator_locator(num_cases, rng):
+    """短分隔符及随机序列上, find_separators_approximately 须与朴素实现一致"""
+    for case in range(num_cases):
+        separator1 = "".join(rng.choice("ACGT") for _ in range(rng.randint(3, 6)))
+        separator2 = "".join(rng.choice("ACGT") for _ in range(rng.randint(3, 6)))
+        sequence = "".join(rng.choice("ACGT") for _ in range(rng.randint(10, 60))).encode('ascii')
+        max_errors = 1
+        for max_mismatches, max_edits in ((max_errors, 0), (0, max_errors)):
+            separators = prepare_separators(separator1, separator2, max_mismatches, max_edits)
+            expected = naive_find_separators(sequence, *separators)
+            actual = find_separators_approximately(sequence, *separators)
+            if actual != expected:
+                return (separator1, separator2, sequence, max_mismatches, max_edits, expected, actual)
+    return None
+
+def reads_per_second(function, reads):
+    start = time.perf_counter()
+    hits = sum(1 for sequence in reads if function(sequence))
+    elapsed = time.perf_counter() - start
+    return (len(reads) / elapsed if elapsed > 0 else float("inf")), hits
+
+def main():
+    parser = argparse.ArgumentParser(description="容错匹配基准测试")
+    parser.add_argument("--reads", type=int, default=100000, help="reads数 (默认: 100000)")
+    parser.add_argument("--read-length", type=int, default=150, help="read长度 (默认: 150)")
+    parser.add_argument("--max-errors", type=int, default=2, help="容错数 (默认: 2)")
+    parser.add_argument("--error-rate", type=float, default=0.05,
+                        help="含分隔符的reads中sep1带测序错误的比例 (默认: 0.05)")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子 (默认: 1)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    mismatch = check_against_naive(20000, rng) or check_separator_locator(20000, rng)
+    if mismatch:
+        print(f"错误: 容错查找与朴素实现结果不一致: {mismatch}", file=sys.stderr)
+        sys.exit(1)
+
+    linker = LINKER.encode('ascii')
+    linker_rc = get_reverse_complement(linker)
+    modes = (("精确", 0, 0), ("错配", args.max_errors, 0), ("编辑", 0, args.max_errors))
+    print(f"reads数: {args.reads}, read长度: {args.read_length}, 容错数: {args.max_errors}, "
+          f"sep1错误比例: {args.error_rate}")
+    print(f"{'测试':<14}{'模式':<6}{'reads/s':>14}{'命中reads':>12}{'相对精确':>10}")
+    for allow_indels in (False, True):
+        reads = make_reads(args.reads, args.read_length, rng, allow_indels, args.error_rate)
+        label = "含插入缺失" if allow_indels else "仅替换"
+        exact_speeds = {}
+        for mode_name, max_mismatches, max_edits in modes:
+            matcher = build_matcher("in", [linker], [linker_rc], max_mismatches, max_edits)
+            separators = prepare_separators(SEPARATOR1, SEPARATOR2, max_mismatches, max_edits)
+            find_separators = find_separators_approximately if max_mismatches or max_edits \
+                else find_separators_in_sequence
+            for test_name, function in ((f"S1匹配/{label}", lambda sequence: any(matcher.match(sequence))),
+                                        (f"S2分隔符/{label}", lambda sequence: find_separators(sequence, *separators))):
+                speed, hits = reads_per_second(function, reads)
+                exact_speed = exact_speeds.setdefault(test_name, speed)
+                print(f"{test_name:<14}{mode_name:<6}{speed:>14,.0f}{hits:>12}{exact_speed / speed:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+NumPy只计数基准测试
+比较S1只计数时逐条匹配 (iter_fastq_records + 'in' 引擎) 与按块向量化匹配
+(iter_record_blocks + 'numpy' 引擎) 的速度, 并检查两者计数完全一致。
+数据在内存中生成 (不含解压耗时), 约1/3 reads含连接序列, 1/3含其反向互补。
+
+用法: python benchmarks/bench_numpy_counting.py [--reads 500000] [--read-length 150]
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from S1_Process_gen import count_records_vectorized, get_reverse_complement, iter_fastq_records
+from sequence_matchers import build_matcher, numpy_available
+
+LINKER = "ATGTCGGAACTGTTGCTTGTCCGACT"
+EXTRA_PATTERN = "GATC"
+
+def random_bases(length, rng):
+    return "".join(rng.choice("ACGT") for _ in range(length))
+
+def make_fastq(num_reads, read_length, rng):
+    """生成FASTQ文本 (bytes), 连接序列插入在随机位置"""
+    linker_rc = get_reverse_complement(LINKER)
+    records = []
+    for index in range(num_reads):
+        sequence = random_bases(read_length, rng)
+        if index % 3:
+            linker = LINKER if index % 3 == 1 else linker_rc
+            offset = rng.randint(0, read_length - len(linker))
+            sequence = sequence[:offset] + linker + sequence[offset + len(linker):]
+        records.append(f"@read{index}\n{sequence}\n+\n{'I' * read_length}\n")
+    return "".join(records).encode('ascii')
+
+def count_per_read(data, matcher):
+    """process_file_worker 的逐条计数循环"""
+    counts = [0, 0]
+    total_reads = 0
+    for record_lines in iter_fastq_records(io.BytesIO(data)):
+        total_reads += 1
+        match_fwd, match_rc = matcher.match(record_lines[1])
+        counts[0] += int(match_fwd)
+        counts[1] += int(match_rc)
+    return total_reads, counts
+
+def count_vectorized(data, matcher):
+    counts_per_set = [[0, 0]]
+    total_reads = count_records_vectorized(io.BytesIO(data), None, [matcher], [0], counts_per_set)
+    return total_reads, counts_per_set[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="NumPy只计数基准测试")
+    parser.add_argument("--reads", type=int, default=500000, help="reads数 (默认: 500000)")
+    parser.add_argument("--read-length", type=int, default=150, help="read长度 (默认: 150)")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子 (默认: 1)")
+    args = parser.parse_args()
+
+    if not numpy_available():
+        print("错误: 未安装 numpy", file=sys.stderr)
+        sys.exit(1)
+
+    rng = random.Random(args.seed)
+    data = make_fastq(args.reads, args.read_length, rng)
+    print(f"reads数: {args.reads}, read长度: {args.read_length}, 数据量: {len(data) / 1e6:.1f} MB")
+    print(f"{'查询序列':<12}{'逐条 reads/s':>16}{'向量化 reads/s':>18}{'加速':>8}")
+    for label, raw_patterns in (("连接序列", [LINKER]), ("连接序列+GATC", [LINKER, EXTRA_PATTERN])):
+        forward_patterns = [pattern.encode('ascii') for pattern in raw_patterns]
+        rc_patterns = [get_reverse_complement(pattern) for pattern in forward_patterns]
+        speeds = []
+        results = []
+        for engine, count in (("in", count_per_read), ("numpy", count_vectorized)):
+            matcher = build_matcher(engine, forward_patterns, rc_patterns)
+            start = time.perf_counter()
+            results.append(count(data, matcher))
+            elapsed = time.perf_counter() - start
+            speeds.append(args.reads / elapsed if elapsed > 0 else float("inf"))
+        if results[0] != results[1]:
+            print(f"错误: {label} 的计数不一致: 逐条 {results[0]}, 向量化 {results[1]}", file=sys.stderr)
+            sys.exit(1)
+        print(f"{label:<12}{speeds[0]:>16,.0f}{speeds[1]:>18,.0f}{speeds[1] / speeds[0]:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+S1匹配引擎基准测试
+比较各匹配引擎在 1/4/16 个查询序列下的 reads/s。
+三分之一的reads中植入该组合的全部查询序列 (其中一半整体反向互补), 测量全部序列同时出现的路径。
+
+用法: python benchmarks/bench_s1_matchers.py [--reads 200000] [--read-length 150]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from S1_Process_gen import get_reverse_complement
+from sequence_matchers import (MATCH_ENGINE_AHO_CORASICK, MATCH_ENGINE_NUMPY, MATCH_ENGINES, build_matcher,
+                               numpy_available, pyahocorasick_available)
+
+LINKER = "ATGTCGGAACTGTTGCTTGTCCGACT"
+
+def make_patterns(count, rng):
+    """The SeqA linker plus random 8-mers, so that every pattern set contains a realistic hit."""
+    patterns = [LINKER]
+    while len(patterns) < count:
+        patterns.append("".join(rng.choice("ACGT") for _ in range(8)))
+    return patterns[:count]
+
+def make_reads(num_reads, read_length, rng):
+    """Random background reads (str); patterns are planted per pattern set by plant_patterns()."""
+    return ["".join(rng.choice("ACGT") for _ in range(read_length)) for _ in range(num_reads)]
+
+def plant_patterns(reads, patterns, rng):
+    """
+    Plants every pattern of the set, non-overlapping and in random order, into a third of the reads
+    (half of those reverse-complemented as a whole, so all RC patterns co-occur), and returns the
+    reads as bytes. The other reads keep their random background, which exercises the early-exit path.
+    """
+    planted_length = sum(len(pattern) for pattern in patterns)
+    hit_reads = []
+    for i, sequence in enumerate(reads):
+        if i % 3 == 0:
+            if planted_length > len(sequence):
+                raise ValueError(f"read长度 {len(sequence)} 放不下全部查询序列 ({planted_length} bp)")
+            order = rng.sample(patterns, len(patterns))
+            # Split the free bases into len(order)+1 gaps around the planted patterns
+            cuts = sorted(rng.randint(0, len(sequence) - planted_length) for _ in order)
+            pieces = []
+            position = 0
+            previous_cut = 0
+            for cut, pattern in zip(cuts, order):
+                pieces.append(sequence[position:position + cut - previous_cut])
+                position += cut - previous_cut
+                pieces.append(pattern)
+                position += len(pattern)
+                previous_cut = cut
+            pieces.append(sequence[position:])
+            sequence = "".join(pieces)
+            if i % 2 == 1:
+                sequence = get_reverse_complement(sequence)
+        hit_reads.append((sequence + "\n").encode('ascii')) # S1 matches sequence lines as bytes
+    return hit_reads
+
+def time_engine(engine, forward_patterns, rc_patterns, reads):
+    matcher = build_matcher(engine, forward_patterns, rc_patterns)
+    fwd_count = 0
+    rc_count = 0
+    start = time.perf_counter()
+    for sequence in reads:
+        match_fwd, match_rc = matcher.match(sequence)
+        fwd_count += match_fwd
+        rc_count += match_rc
+    elapsed = time.perf_counter() - start
+    return len(reads) / elapsed if elapsed > 0 else float("inf"), fwd_count, rc_count
+
+def main():
+    parser = argparse.ArgumentParser(description="S1匹配引擎基准测试")
+    parser.add_argument("--reads", type=int, default=200000, help="测试reads数 (默认: 200000)")
+    parser.add_argument("--read-length", type=int, default=150, help="read长度 (默认: 150)")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子 (默认: 1)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    background_reads = make_reads(args.reads, args.read_length, rng)
+    engines = [engine for engine in MATCH_ENGINES
+               if (engine != MATCH_ENGINE_AHO_CORASICK or pyahocorasick_available())
+               and (engine != MATCH_ENGINE_NUMPY or numpy_available())]
+    skipped_engines = [engine for engine in MATCH_ENGINES if engine not in engines]
+    if skipped_engines:
+        print(f"警告: 缺少可选依赖, 跳过引擎: {', '.join(skipped_engines)}", file=sys.stderr)
+
+    print(f"reads数: {args.reads}, read长度: {args.read_length}")
+    print(f"{'序列数':>6}  {'引擎':<14}{'reads/s':>14}{'正向匹配':>10}{'反向匹配':>10}")
+    for pattern_count in (1, 4, 16):
+        patterns = make_patterns(pattern_count, rng)
+        reads = plant_patterns(background_reads, patterns, rng)
+        forward_patterns = [p.encode('ascii') for p in patterns]
+        rc_patterns = [get_reverse_complement(p) for p in forward_patterns]
+        counts = set()
+        for engine in engines:
+            reads_per_second, fwd_count, rc_count = time_engine(engine, forward_patterns, rc_patterns, reads)
+            counts.add((fwd_count, rc_count))
+            print(f"{pattern_count:>6}  {engine:<14}{reads_per_second:>14,.0f}{fwd_count:>10}{rc_count:>10}")
+        if len(counts) != 1:
+            print(f"错误: {pattern_count} 个序列时各引擎计数不一致: {counts}", file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+S2分隔符定位基准测试
+比较 find_separators_in_sequence 与原先的6次find+排序实现,
+分别测试无分隔符、正向分隔符、混合方向分隔符三类reads, 并检查两者结果一致。
+
+用法: python benchmarks/bench_s2_separators.py [--reads 200000] [--read-length 150]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from S2_Split import find_separators_in_sequence, get_reverse_complement, prepare_separators
+
+SEPARATOR1 = "GATCATGTCGGAACTGTTGCTTGTCCGACTGATC"
+SEPARATOR2 = "AGATCGGAAGA"
+
+def legacy_find_separators_in_sequence(sequence, sep1_fwd, sep1_rc, sep2_fwd, sep2_rc):
+    """
+    原实现 (原样保留作为基准): 四种组合各查找一次 (共6次find), 排序后取R2最短的组合
+    """
+    results = []
+    
+    # 1. 正向组合: sep1_fwd + sep2_fwd
+    sep1_pos = sequence.find(sep1_fwd)
+    if sep1_pos != -1:
+        sep1_end = sep1_pos + len(sep1_fwd)
+        sep2_pos = sequence.find(sep2_fwd, sep1_end)
+        if sep2_pos != -1:
+            results.append((sep1_pos, sep1_end, sep2_pos, 'forward'))
+    
+    # 2. 反向互补组合: sep1_rc + sep2_rc
+    sep1_pos = sequence.find(sep1_rc)
+    if sep1_pos != -1:
+        sep1_end = sep1_pos + len(sep1_rc)
+        sep2_pos = sequence.find(sep2_rc, sep1_end)
+        if sep2_pos != -1:
+            results.append((sep1_pos, sep1_end, sep2_pos, 'reverse'))
+    
+    # 3. 混合组合1: sep1_fwd + sep2_rc
+    sep1_pos = sequence.find(sep1_fwd)
+    if sep1_pos != -1:
+        sep1_end = sep1_pos + len(sep1_fwd)
+        sep2_pos = sequence.find(sep2_rc, sep1_end)
+        if sep2_pos != -1:
+            results.append((sep1_pos, sep1_end, sep2_pos, 'mixed_fwd_rc'))
+    
+    # 4. 混合组合2: sep1_rc + sep2_fwd
+    sep1_pos = sequence.find(sep1_rc)
+    if sep1_pos != -1:
+        sep1_end = sep1_pos + len(sep1_rc)
+        sep2_pos = sequence.find(sep2_fwd, sep1_end)
+        if sep2_pos != -1:
+            results.append((sep1_pos, sep1_end, sep2_pos, 'mixed_rc_fwd'))
+    
+    # 返回最佳匹配（最短的R2序列，通常更可靠）
+    if results:
+        # 按R2长度排序，选择最短的
+        results.sort(key=lambda x: x[2] - x[1])
+        return results[0]
+    
+    return None
+
+def random_bases(length, rng):
+    return "".join(rng.choice("ACGT") for _ in range(length))
+
+def make_read(read_length, parts, rng):
+    """随机序列中依次插入parts中的分隔符, 位置随机"""
+    sequence = random_bases(read_length, rng)
+    offset = rng.randint(0, 20)
+    for part in parts:
+        if offset + len(part) > read_length:
+            break
+        sequence = sequence[:offset] + part + sequence[offset + len(part):]
+        offset += len(part) + rng.randint(5, 30)
+    return sequence.encode('ascii')
+
+def make_reads(kind, num_reads, read_length, rng):
+    sep1_rc = get_reverse_complement(SEPARATOR1)
+    sep2_rc = get_reverse_complement(SEPARATOR2)
+    if kind == "no-hit":
+        layouts = [()]
+    elif kind == "forward":
+        layouts = [(SEPARATOR1, SEPARATOR2)]
+    else:
+        layouts = [(SEPARATOR1, sep2_rc), (sep1_rc, SEPARATOR2), (sep1_rc, sep2_rc),
+                   (SEPARATOR1, sep2_rc, SEPARATOR2), (sep1_rc, SEPARATOR1, sep2_rc, SEPARATOR2)]
+    return [make_read(read_length, layouts[i % len(layouts)], rng) for i in range(num_reads)]
+
+def time_locator(locator, reads, separators):
+    start = time.perf_counter()
+    results = [locator(sequence, *separators) for sequence in reads]
+    elapsed = time.perf_counter() - start
+    return len(reads) / elapsed if elapsed > 0 else float("inf"), results
+
+def check_random_equivalence(num_reads, rng):
+    """短字母表随机序列及回文分隔符下, 新旧实现结果必须完全一致"""
+    for _ in range(num_reads):
+        separator1 = random_bases(rng.randint(1, 3), rng)
+        separator2 = rng.choice([random_bases(rng.randint(1, 3), rng), "AT", "GC"])
+        separators = prepare_separators(separator1, separator2)
+        sequence = random_bases(rng.randint(0, 30), rng).encode('ascii')
+        expected = legacy_find_separators_in_sequence(sequence, *separators)
+        actual = find_separators_in_sequence(sequence, *separators)
+        if expected != actual:
+            return (sequence, separator1, separator2, expected, actual)
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description="S2分隔符定位基准测试")
+    parser.add_argument("--reads", type=int, default=200000, help="每类reads数 (默认: 200000)")
+    parser.add_argument("--read-length", type=int, default=150, help="read长度 (默认: 150)")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子 (默认: 1)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    mismatch = check_random_equivalence(100000, rng)
+    if mismatch:
+        print(f"错误: 新旧实现结果不一致: {mismatch}", file=sys.stderr)
+        sys.exit(1)
+
+    separators = prepare_separators(SEPARATOR1, SEPARATOR2)
+    print(f"每类reads数: {args.reads}, read长度: {args.read_length}")
+    print(f"{'reads类型':<12}{'原实现 reads/s':>18}{'新实现 reads/s':>18}{'加速':>8}")
+    for kind in ("no-hit", "forward", "mixed"):
+        reads = make_reads(kind, args.reads, args.read_length, rng)
+        legacy_speed, legacy_results = time_locator(legacy_find_separators_in_sequence, reads, separators)
+        speed, results = time_locator(find_separators_in_sequence, reads, separators)
+        if results != legacy_results:
+            print(f"错误: {kind} reads的结果不一致", file=sys.stderr)
+            sys.exit(1)
+        print(f"{kind:<12}{legacy_speed:>18,.0f}{speed:>18,.0f}{speed / legacy_speed:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
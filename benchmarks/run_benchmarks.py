@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+S1/S2/HiC输入整理 端到端基准测试
+用 synthetic_fastq.py 生成确定性的合成数据 (SeqA连接序列, MboI分隔符), 在多个输入大小和并行任务数下计时:
+  s1       process_file_worker: jobs个进程各处理一个文件 (输入的硬链接), 写出匹配的reads
+  s2       split_fastq_by_sequences_paired: jobs为1时逐条处理, 大于1时按 --chunk-reads 分块在jobs个进程中并行
+  staging  prepare_hic_input + prepare_hic_rawdata: 按各staging_mode放置S2输出 (S2分割不计时)
+每个测试在单独的子进程中运行, 峰值RSS为该子进程及其工作进程中最大的常驻内存。
+结果 (reads/s, MB/s 按未压缩FASTQ计, 峰值RSS) 写入JSON; 给定基线时, reads/s低于基线 (1 - 阈值) 倍的测试视为退化,
+以退出码1结束。基线为本机之前的结果 (--save-baseline), 不同机器之间不可比较。
+
+用法: python benchmarks/run_benchmarks.py [--sizes 20000,100000] [--jobs 1,2,4] [--cases s1,s2,staging]
+      [--repeat 3] [--baseline benchmarks/baseline.json] [--threshold 0.2] [--save-baseline] [-o results.json]
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent / "src"))
+
+from resource_probe import probe_resources
+from synthetic_fastq import LINKERS, SyntheticFastqSpec, write_synthetic_fastq
+
+CASES = ("s1", "s2", "staging")
+STAGING_BENCH_MODES = ("copy", "hardlink", "reflink", "symlink")
+DEFAULT_SIZES = "20000,100000"
+DEFAULT_JOBS = "1,2,4"
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_BASELINE = BENCHMARK_DIR / "baseline.json"
+DEFAULT_RESULTS_DIR = BENCHMARK_DIR / "results"
+DEFAULT_CHUNK_READS = 20000
+MIN_LENGTH = 10
+RESULTS_VERSION = 1
+
+def get_case_key(case):
+    key = f"{case['name']}/reads={case['reads']}/jobs={case['jobs']}"
+    return f"{key}/{case['mode']}" if case.get('mode') else key
+
+def run_s1_case(case, work_dir):
+    """
+    jobs个进程各用process_file_worker处理一个输入的硬链接, 写出匹配的reads; 返回处理的reads数
+    """
+    from gzip_codec import default_gzip_options
+    from S1_Process_gen import make_pattern_set, prepare_fastq_output_dirs, process_file_worker
+    from sequence_matchers import DEFAULT_MATCH_ENGINE
+
+    input_dir = work_dir / "S1_input"
+    input_dir.mkdir()
+    input_files = []
+    for index in range(case['jobs']):
+        input_file = input_dir / f"lane{index}.fq.gz"
+        os.link(case['input'], input_file)
+        input_files.append(str(input_file))
+    pattern_set = make_pattern_set("benchmark", LINKERS['SeqA'], work_dir / "S1_Matched")
+    prepare_fastq_output_dirs(pattern_set, False)
+    match_options = {'engine': case.get('engine') or DEFAULT_MATCH_ENGINE, 'max_mismatches': 0, 'max_edits': 0}
+    worker_args = [(input_file, [pattern_set], None, True, 64 * 1024 * 1024, match_options, default_gzip_options(), None)
+                   for input_file in input_files]
+
+    start_time = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=case['jobs']) as executor:
+        results = list(executor.map(process_file_worker, worker_args))
+    seconds = time.perf_counter() - start_time
+    if any(result is None for result in results):
+        raise RuntimeError("process_file_worker 处理失败")
+    return seconds, case['reads'] * case['jobs'], case['uncompressed_bytes'] * case['jobs']
+
+def run_s2_case(case, work_dir):
+    """
+    split_fastq_by_sequences_paired 分割一个输入文件
+    """
+    from S2_Split import split_fastq_by_sequences_paired
+    from synthetic_fastq import ADAPTER, get_separator1
+
+    chunk_reads = case['chunk_reads'] if case['jobs'] > 1 else 0
+    start_time = time.perf_counter()
+    success = split_fastq_by_sequences_paired(case['input'], str(work_dir / "S2_Split" / "sample"),
+                                              get_separator1("SeqA", "MboI"), ADAPTER, MIN_LENGTH,
+                                              chunk_reads=chunk_reads, jobs=case['jobs'])
+    seconds = time.perf_counter() - start_time
+    if not success:
+        raise RuntimeError("split_fastq_by_sequences_paired 处理失败")
+    return seconds, case['reads'], case['uncompressed_bytes']
+
+def run_staging_case(case, work_dir):
+    """
+    先分割输入 (不计时), 再按mode计时 prepare_hic_input 和 prepare_hic_rawdata; 吞吐量按放置的R1/R2计
+    """
+    from S1S2HiC_Pipeline import prepare_hic_input, prepare_hic_rawdata
+    from S2_Split import split_fastq_by_sequences_paired
+    from synthetic_fastq import ADAPTER, get_separator1
+
+    os.chdir(work_dir)
+    sample_dir = Path("S2_Split") / "sample"
+    if not split_fastq_by_sequences_paired(case['input'], str(sample_dir), get_separator1("SeqA", "MboI"), ADAPTER,
+                                           MIN_LENGTH):
+        raise RuntimeError("split_fastq_by_sequences_paired 处理失败")
+    staged_bytes = sum(path.stat().st_size for path in sample_dir.glob("*_R[12].fq.gz"))
+    s2_config = {'output_dir': "S2_Split"}
+    hic_config = {'input_dir': "HiC_Input", 'staging_mode': case['mode']}
+
+    start_time = time.perf_counter()
+    if not prepare_hic_input(s2_config, hic_config) or not prepare_hic_rawdata(hic_config):
+        raise RuntimeError("HiC输入整理失败")
+    seconds = time.perf_counter() - start_time
+    # 吞吐量的字节数为两处各放置一次的压缩文件大小
+    return seconds, case['reads'], staged_bytes * 2
+
+CASE_RUNNERS = {
+    's1': run_s1_case,
+    's2': run_s2_case,
+    'staging': run_staging_case
+}
+
+def get_peak_rss_mb():
+    """
+    本进程及已结束的子进程中最大的常驻内存 (Linux下ru_maxrss单位为KB, macOS为字节)
+    """
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+def run_case_in_this_process(case):
+    """
+    --run-case: 在本 (子) 进程中运行一个测试, 结果以JSON写到标准输出的最后一行
+    """
+    work_dir = Path(case['work_dir'])
+    # 被测函数的进度输出不计入结果
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        seconds, reads, data_bytes = CASE_RUNNERS[case['name']](case, work_dir)
+    print(json.dumps({'seconds': seconds, 'reads': reads, 'bytes': data_bytes, 'peak_rss_mb': get_peak_rss_mb()}))
+
+def run_case(case, repeat):
+    """
+    在新的子进程中运行测试repeat次 (每次使用新的工作目录), 取最快的一次
+    """
+    best = None
+    for _ in range(repeat):
+        work_dir = Path(tempfile.mkdtemp(prefix=f"{case['name']}_", dir=case['scratch_dir']))
+        try:
+            completed = subprocess.run([sys.executable, __file__, "--run-case", json.dumps(dict(case, work_dir=str(work_dir)))],
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{get_case_key(case)} 失败:\n{completed.stderr[-2000:]}")
+        measurement = json.loads(completed.stdout.strip().splitlines()[-1])
+        if best is None or measurement['seconds'] < best['seconds']:
+            best = measurement
+    seconds = max(best['seconds'], 1e-9)
+    return {
+        'key': get_case_key(case),
+        'case': case['name'],
+        'reads': case['reads'],
+        'jobs': case['jobs'],
+        'mode': case.get('mode'),
+        'seconds': round(seconds, 4),
+        'reads_per_s': round(best['reads'] / seconds, 1),
+        'mb_per_s': round(best['bytes'] / 1024 ** 2 / seconds, 2),
+        'peak_rss_mb': round(best['peak_rss_mb'], 1)
+    }
+
+def build_cases(selected_cases, sizes, job_counts, inputs, args):
+    cases = []
+    for reads in sizes:
+        input_file, uncompressed_bytes = inputs[reads]
+        common = {'reads': reads, 'input': str(input_file), 'uncompressed_bytes': uncompressed_bytes,
+                  'scratch_dir': str(args.work_dir), 'chunk_reads': args.chunk_reads, 'engine': args.match_engine}
+        for name in selected_cases:
+            if name == "staging":
+                cases.extend(dict(common, name=name, jobs=1, mode=mode) for mode in STAGING_BENCH_MODES)
+            else:
+                cases.extend(dict(common, name=name, jobs=jobs) for jobs in job_counts)
+    return cases
+
+def compare_with_baseline(results, baseline, threshold):
+    """
+    与基线比较reads/s, 返回退化的测试 [(key, 当前, 基线)]; 基线中没有的测试不比较
+    """
+    baseline_results = {result['key']: result for result in baseline.get('results', [])}
+    regressions = []
+    print(f"\n=== 与基线比较 (阈值 {threshold:.0%}) ===")
+    for result in results:
+        baseline_result = baseline_results.get(result['key'])
+        if baseline_result is None:
+            print(f"  {result['key']}: 基线中没有")
+            continue
+        change = result['reads_per_s'] / baseline_result['reads_per_s'] - 1
+        regressed = change < -threshold
+        mark = "❌ 退化" if regressed else "✅"
+        print(f"  {result['key']}: {result['reads_per_s']:.0f} reads/s, 基线 {baseline_result['reads_per_s']:.0f} "
+              f"({change:+.1%}) {mark}")
+        if regressed:
+            regressions.append((result['key'], result['reads_per_s'], baseline_result['reads_per_s']))
+    return regressions
+
+def parse_int_list(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="S1/S2/HiC输入整理 端到端基准测试 (合成数据)")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"要运行的测试, 逗号分隔 (默认: {','.join(CASES)})")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"输入reads数, 逗号分隔 (默认: {DEFAULT_SIZES})")
+    parser.add_argument("--jobs", default=DEFAULT_JOBS, help=f"s1/s2的并行任务数, 逗号分隔 (默认: {DEFAULT_JOBS})")
+    parser.add_argument("--read-length", type=int, default=150, help="read长度 (默认: 150)")
+    parser.add_argument("--seed", type=int, default=1, help="合成数据的随机种子 (默认: 1)")
+    parser.add_argument("--chunk-reads", type=int, default=DEFAULT_CHUNK_READS,
+                        help=f"s2并行时每块reads数 (默认: {DEFAULT_CHUNK_READS})")
+    parser.add_argument("--match-engine", default=None, help="s1的匹配引擎 (默认: S1的默认引擎)")
+    parser.add_argument("--repeat", type=int, default=1, help="每个测试运行次数, 取最快的一次 (默认: 1)")
+    parser.add_argument("--work-dir", type=Path, default=None, help="合成数据和临时输出目录 (默认: 系统临时目录)")
+    parser.add_argument("-o", "--output", type=Path, default=None,
+                        help=f"结果JSON (默认: {DEFAULT_RESULTS_DIR.relative_to(BENCHMARK_DIR.parent)}/bench_<时间>.json)")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE,
+                        help=f"基线JSON, 存在时与之比较 (默认: {DEFAULT_BASELINE.relative_to(BENCHMARK_DIR.parent)})")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"reads/s低于基线的比例超过此值时视为退化 (默认: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果写为基线 (不与旧基线比较)")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case_in_this_process(json.loads(args.run_case))
+        return
+
+    selected_cases = [name.strip() for name in args.cases.split(",") if name.strip()]
+    unknown_cases = [name for name in selected_cases if name not in CASES]
+    if unknown_cases:
+        parser.error(f"未知的测试: {', '.join(unknown_cases)} (可用: {', '.join(CASES)})")
+    sizes = parse_int_list(args.sizes)
+    job_counts = parse_int_list(args.jobs)
+
+    temp_dir = None
+    if args.work_dir is None:
+        temp_dir = tempfile.TemporaryDirectory(prefix="s1s2hic_bench_")
+        args.work_dir = Path(temp_dir.name)
+    args.work_dir.mkdir(parents=True, exist_ok=True)
+    args.work_dir = args.work_dir.resolve()
+
+    probe = probe_resources()
+    print(f"资源探测: {probe.describe()}")
+    try:
+        inputs = {}
+        for reads in sizes:
+            input_file = args.work_dir / f"synthetic_{reads}_seed{args.seed}.fq.gz"
+            spec = SyntheticFastqSpec(reads=reads, read_length=args.read_length, seed=args.seed)
+            _, uncompressed_bytes = write_synthetic_fastq(input_file, spec)
+            inputs[reads] = (input_file, uncompressed_bytes)
+            print(f"合成数据: {input_file.name} ({reads} reads, 未压缩 {uncompressed_bytes / 1024 ** 2:.1f} MB)")
+
+        results = []
+        print(f"\n{'测试':<36}{'秒':>9}{'reads/s':>12}{'MB/s':>9}{'峰值RSS(MB)':>13}")
+        for case in build_cases(selected_cases, sizes, job_counts, inputs, args):
+            result = run_case(case, args.repeat)
+            results.append(result)
+            print(f"{result['key']:<36}{result['seconds']:>9.2f}{result['reads_per_s']:>12.0f}"
+                  f"{result['mb_per_s']:>9.1f}{result['peak_rss_mb']:>13.1f}")
+    except RuntimeError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    report = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpus': probe.cpus,
+            'memory_gb': round(probe.memory_limit_bytes / 1024 ** 3, 1) if probe.memory_limit_bytes else None
+        },
+        'settings': {
+            'sizes': sizes, 'jobs': job_counts, 'read_length': args.read_length, 'seed': args.seed,
+            'chunk_reads': args.chunk_reads, 'match_engine': args.match_engine, 'repeat': args.repeat
+        },
+        'results': results
+    }
+    output = args.output or DEFAULT_RESULTS_DIR / f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding='utf-8')
+    print(f"\n结果已写入: {output}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding='utf-8')
+        print(f"基线已写入: {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"未找到基线 {args.baseline}, 不比较 (可用 --save-baseline 保存本次结果为基线)")
+        return
+    baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+    regressions = compare_with_baseline(results, baseline, args.threshold)
+    if regressions:
+        print(f"⚠️  {len(regressions)} 个测试的reads/s低于基线超过 {args.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+    print("🎉 没有超过阈值的退化")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+确定性合成FASTQ.gz生成器
+按给定比例在reads中放置SeqA/SeqB连接序列及MboI/CviQI分隔符 (S2的separator1为 酶切位点+连接序列+酶切位点,
+separator2为通用adapter), 覆盖S2的四种方向组合, 放置的序列可按错误率带随机替换。
+同样的参数和种子总是生成逐字节相同的文件 (gzip头的mtime固定为0), 可用于基准测试和比较输出。
+
+reads类型 (--mix 中的名称, 对应S2方向统计):
+  forward       插入片段 + separator1 + 插入片段 + separator2
+  reverse       插入片段 + rc(separator1) + 插入片段 + rc(separator2)
+  mixed_fwd_rc  插入片段 + separator1 + 插入片段 + rc(separator2)
+  mixed_rc_fwd  插入片段 + rc(separator1) + 插入片段 + separator2
+  linker_only   只含连接序列 (正向或反向互补各半; S1匹配, S2无分隔符)
+  none          随机序列
+分隔符之后的片段短于S2最小长度的reads在S2中被丢弃。
+
+用法: python benchmarks/synthetic_fastq.py -o sample.fq.gz [--reads 100000] [--read-length 150]
+      [--linker SeqA] [--enzyme MboI] [--mix forward=0.3,reverse=0.2,mixed_fwd_rc=0.05,linker_only=0.1]
+      [--error-rate 0.0] [--seed 1]
+"""
+
+import argparse
+import gzip
+import random
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# 连接序列 (与 configs/Group*_config.yaml 的 S1_config.patterns 相同)
+LINKERS = {
+    'SeqA': "ATGTCGGAACTGTTGCTTGTCCGACT",
+    'SeqB': "ATGTCGGAGTTCTTAGGCGCTGGTTGCGTTGAGAACTCCGACT"
+}
+# 酶切位点: separator1 = 位点 + 连接序列 + 位点 (MboI: GATC, CviQI: TA)
+ENZYME_SITES = {
+    'MboI': "GATC",
+    'CviQI': "TA"
+}
+ADAPTER = "AGATCGGAAGA"  # separator2
+READ_TYPES = ("forward", "reverse", "mixed_fwd_rc", "mixed_rc_fwd", "linker_only", "none")
+DEFAULT_MIX = {'forward': 0.3, 'reverse': 0.2, 'mixed_fwd_rc': 0.05, 'mixed_rc_fwd': 0.05, 'linker_only': 0.1}  # 其余为none
+DEFAULT_READ_LENGTH = 150
+DEFAULT_COMPRESSLEVEL = 1
+WRITE_BATCH_READS = 10000
+
+BASES = b"ACGT"
+# 随机字节 -> 碱基 (256可被4整除, 四种碱基等概率)
+RANDOM_BASE_TABLE = bytes(BASES[byte % 4] for byte in range(256))
+COMPLEMENT_TABLE = bytes.maketrans(b"ACGT", b"TGCA")
+
+def reverse_complement(sequence):
+    return sequence.translate(COMPLEMENT_TABLE)[::-1]
+
+def get_separator1(linker_name, enzyme):
+    site = ENZYME_SITES[enzyme]
+    return site + LINKERS[linker_name] + site
+
+def parse_mix(mix_text):
+    """
+    'forward=0.3,reverse=0.2' -> {'forward': 0.3, 'reverse': 0.2}; 比例之和不能超过1, 其余为none
+    """
+    mix = {}
+    for item in mix_text.split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in READ_TYPES:
+            raise ValueError(f"未知的reads类型 '{name}' (可用: {', '.join(READ_TYPES)})")
+        mix[name] = float(value)
+    if sum(mix.values()) > 1 + 1e-9:
+        raise ValueError(f"reads类型比例之和超过1: {mix_text}")
+    return mix
+
+@dataclass
+class SyntheticFastqSpec:
+    """
+    合成数据的参数; enzymes有多个时 (如 MboI,CviQI 的多酶切实验), 每条含分隔符的read随机选一个
+    """
+    reads: int = 100000
+    read_length: int = DEFAULT_READ_LENGTH
+    linker: str = "SeqA"
+    enzymes: tuple = ("MboI",)
+    mix: dict = field(default_factory=lambda: dict(DEFAULT_MIX))
+    error_rate: float = 0.0  # 放置的连接序列/分隔符中每个碱基被随机替换的概率
+    seed: int = 1
+
+    def separator_pairs(self):
+        """
+        (名称, separator1, separator2) 列表, 与S2_Split的 --separator-pair 对应
+        """
+        return [(enzyme, get_separator1(self.linker, enzyme), ADAPTER) for enzyme in self.enzymes]
+
+class SyntheticReadGenerator:
+    """
+    按SyntheticFastqSpec逐条生成FASTQ记录 (bytes)
+    """
+    def __init__(self, spec):
+        if spec.linker not in LINKERS:
+            raise ValueError(f"未知的连接序列 '{spec.linker}' (可用: {', '.join(LINKERS)})")
+        for enzyme in spec.enzymes:
+            if enzyme not in ENZYME_SITES:
+                raise ValueError(f"未知的酶 '{enzyme}' (可用: {', '.join(ENZYME_SITES)})")
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+        self.linker = LINKERS[spec.linker].encode('ascii')
+        self.separators = [(separator1.encode('ascii'), separator2.encode('ascii'))
+                           for _, separator1, separator2 in spec.separator_pairs()]
+        self.type_names = list(spec.mix) + ["none"]
+        self.type_weights = list(spec.mix.values()) + [max(0.0, 1 - sum(spec.mix.values()))]
+        self.quality = b"I" * spec.read_length
+
+    def random_bases(self, length):
+        return self.rng.randbytes(length).translate(RANDOM_BASE_TABLE) if length > 0 else b""
+
+    def add_errors(self, sequence):
+        if not self.spec.error_rate:
+            return sequence
+        bases = bytearray(sequence)
+        for position in range(len(bases)):
+            if self.rng.random() < self.spec.error_rate:
+                bases[position] = self.rng.choice([base for base in BASES if base != bases[position]])
+        return bytes(bases)
+
+    def planted_sequence(self, read_type):
+        """
+        read_type类型的read中放置的片段 (各片段之间插入随机序列)
+        """
+        if read_type == "linker_only":
+            return [self.linker if self.rng.random() < 0.5 else reverse_complement(self.linker)]
+        separator1, separator2 = self.rng.choice(self.separators)
+        if read_type in ("reverse", "mixed_rc_fwd"):
+            separator1 = reverse_complement(separator1)
+        if read_type in ("reverse", "mixed_fwd_rc"):
+            separator2 = reverse_complement(separator2)
+        return [separator1, separator2]
+
+    def make_sequence(self, read_type):
+        length = self.spec.read_length
+        if read_type == "none":
+            return self.random_bases(length)
+        pieces = [self.add_errors(piece) for piece in self.planted_sequence(read_type)]
+        free_length = max(0, length - sum(map(len, pieces)))
+        # 随机划分各片段之前的插入长度, 剩余部分补在末尾
+        cut_points = sorted(self.rng.randint(0, free_length) for _ in pieces)
+        parts = []
+        previous = 0
+        for cut_point, piece in zip(cut_points, pieces):
+            parts.append(self.random_bases(cut_point - previous))
+            parts.append(piece)
+            previous = cut_point
+        parts.append(self.random_bases(free_length - previous))
+        return b"".join(parts)[:length]
+
+    def iter_records(self):
+        """
+        生成 (read类型, FASTQ记录bytes)
+        """
+        for index in range(self.spec.reads):
+            read_type = self.rng.choices(self.type_names, self.type_weights)[0]
+            sequence = self.make_sequence(read_type)
+            quality = self.quality if len(sequence) == self.spec.read_length else b"I" * len(sequence)
+            yield read_type, b"@SYN:%d:%d %s 1:N:0\n%s\n+\n%s\n" % (
+                self.spec.seed, index, read_type.encode('ascii'), sequence, quality)
+
+def write_synthetic_fastq(path, spec, compresslevel=DEFAULT_COMPRESSLEVEL):
+    """
+    写出合成FASTQ.gz, 返回各reads类型的条数和未压缩字节数: ({类型: 条数}, 字节数)
+    """
+    type_counts = dict.fromkeys(READ_TYPES, 0)
+    uncompressed_bytes = 0
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as raw_file, \
+            gzip.GzipFile(filename="", mode='wb', fileobj=raw_file, compresslevel=compresslevel, mtime=0) as f:
+        batch = []
+        for read_type, record in SyntheticReadGenerator(spec).iter_records():
+            type_counts[read_type] += 1
+            batch.append(record)
+            if len(batch) >= WRITE_BATCH_READS:
+                data = b"".join(batch)
+                uncompressed_bytes += len(data)
+                f.write(data)
+                batch = []
+        data = b"".join(batch)
+        uncompressed_bytes += len(data)
+        f.write(data)
+    return type_counts, uncompressed_bytes
+
+def main():
+    parser = argparse.ArgumentParser(description="生成确定性的合成FASTQ.gz (放置连接序列和分隔符)")
+    parser.add_argument("-o", "--output", required=True, help="输出文件 (.fq.gz)")
+    parser.add_argument("--reads", type=int, default=100000, help="reads数 (默认: 100000)")
+    parser.add_argument("--read-length", type=int, default=DEFAULT_READ_LENGTH,
+                        help=f"read长度 (默认: {DEFAULT_READ_LENGTH})")
+    parser.add_argument("--linker", choices=sorted(LINKERS), default="SeqA", help="连接序列 (默认: SeqA)")
+    parser.add_argument("--enzyme", default="MboI",
+                        help=f"酶, 逗号分隔多个时每条read随机选一个 (可用: {', '.join(ENZYME_SITES)}; 默认: MboI)")
+    parser.add_argument("--mix", default=",".join(f"{name}={value}" for name, value in DEFAULT_MIX.items()),
+                        help=f"各reads类型的比例, 其余为none (类型: {', '.join(READ_TYPES)})")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="放置序列中每个碱基被替换的概率 (默认: 0)")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子 (默认: 1)")
+    parser.add_argument("--compresslevel", type=int, default=DEFAULT_COMPRESSLEVEL,
+                        help=f"gzip压缩级别 (默认: {DEFAULT_COMPRESSLEVEL})")
+    args = parser.parse_args()
+
+    try:
+        spec = SyntheticFastqSpec(
+            reads=args.reads,
+            read_length=args.read_length,
+            linker=args.linker,
+            enzymes=tuple(enzyme.strip() for enzyme in args.enzyme.split(",") if enzyme.strip()),
+            mix=parse_mix(args.mix),
+            error_rate=args.error_rate,
+            seed=args.seed
+        )
+        type_counts, uncompressed_bytes = write_synthetic_fastq(args.output, spec, args.compresslevel)
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"已写出 {args.output}: {spec.reads} 条reads, 未压缩 {uncompressed_bytes / 1024 ** 2:.1f} MB")
+    for read_type, count in type_counts.items():
+        print(f"  {read_type}: {count}")
+    for name, separator1, separator2 in spec.separator_pairs():
+        print(f"  分隔符 {name}: separator1={separator1} separator2={separator2}")
+
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,64 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import concurrent.futures
+import contextlib
+import logging
+import multiprocessing
 import os
 import sys
 import glob
+import shlex
 import subprocess
+import tempfile
 from pathlib import Path
 from datetime import datetime
 import shutil
+from dataclasses import asdict
 import yaml
 
+from chunk_handoff import (DEFAULT_HANDOFF_CHUNK_READS, DEFAULT_HANDOFF_COMPRESSLEVEL, remove_handoff_end,
+                           write_handoff_end, write_json_atomic)
+from file_staging import DEFAULT_STAGING_MODE, STAGING_DIRECT, STAGING_MODES, FileStager
+from gzip_codec import gzip_options_from_config
+from hic_stream_mapper import (DEFAULT_HICPRO_BIN, DEFAULT_MAPPING_JOBS, build_post_mapping_command,
+                               get_hicpro_config_file)
+from S1_Process_gen import (S1Config, S1Count, S1Scanner, build_file_metrics, get_fastq_output_paths,
+                            parse_lines_option)
+from S2_Split import (DEFAULT_PROGRESS_SECONDS, DEFAULT_SEPARATOR1, DEFAULT_SEPARATOR2, PAIR_OUTPUT_PER_PAIR,
+                      PairedSplitter, S2Config, S2Result, get_default_jobs, get_split_sample_dir_name,
+                      init_split_worker, parse_separator_pair, run_paired_split)
+from stage_manifest import DEFAULT_MANIFEST_DIR, StageManifest
+from stage_metrics import (DEFAULT_METRICS_DIR, FILE_STATUS_FAILED, FILE_STATUS_UP_TO_DATE, FileMetrics,
+                           StageMetrics, get_file_size, load_metrics_file, load_stage_metrics, record_stage,
+                           write_stage_metrics_report)
+from stage_logs import (DEFAULT_LOG_BACKUP_COUNT, DEFAULT_LOG_DIR, DEFAULT_LOG_MAX_MB, LineLogWriter, get_log_path,
+                        open_stage_log, run_streamed, start_queue_logging)
+from stage_profiler import (DEFAULT_PROFILE_DIR, PROFILE_MODES, build_profile_args, get_profile_env,
+                            profile_options_from_config, profile_stage)
+
 # --- Default Values ---
 DEFAULT_INPUT_PATTERN = "*gz"
 DEFAULT_S1_OUTPUT_DIR = "S1_Matched"
 DEFAULT_S2_OUTPUT_DIR = "S2_Split"
 DEFAULT_HIC_INPUT_DIR = "HiC_Input"
+HIC_TRIM_DIR = "Run2_trim"  # 跳过trim时HiC-Pro直接读取的目录
+HIC_OUTPUT_DIR = "Run3_hic"  # HiC-Pro输出目录 (模块2)
+HIC_DATA_DIR_PATTERN = "Run4_HICdata*"  # 收集.hic文件的目录 (模块3/4)
+HIC_COMPLETE_MARKER = ".hicpro_complete.json"  # HiC-Pro成功完成后写入HIC_OUTPUT_DIR, 记入HiC清单
 DEFAULT_SEQUENCE_DESCRIPTION = "S1S2HiC完整流程"
 DEFAULT_LINES_TO_PROCESS = 100000
+STAGE_EXECUTION_IN_PROCESS = "in-process"  # S1/S2在本进程(及进程池)中直接调用, 结果以数据对象返回
+STAGE_EXECUTION_SUBPROCESS = "subprocess"  # 每个阶段/文件启动 S1_Process_gen.py / S2_Split.py 子进程
+STAGE_EXECUTION_MODES = (STAGE_EXECUTION_IN_PROCESS, STAGE_EXECUTION_SUBPROCESS)
+DEFAULT_STAGE_EXECUTION = STAGE_EXECUTION_IN_PROCESS
+# --stage: 只运行流程中的一个阶段 (多组调度器以此把每个组拆成相互依赖的任务)
+PIPELINE_STAGE_S1 = "s1"
+PIPELINE_STAGE_S2 = "s2"
+PIPELINE_STAGE_STAGING = "staging"  # 整理HiC输入 (第三步)
+PIPELINE_STAGE_HIC = "hic"  # 运行HiC-Pro (第四步)
+PIPELINE_STAGES = (PIPELINE_STAGE_S1, PIPELINE_STAGE_S2, PIPELINE_STAGE_STAGING, PIPELINE_STAGE_HIC)
+DEFAULT_HIC_CPU_COUNT = 10
 
 def load_config(config_file):
     """
@@ -70,6 +112,8 @@ def merge_config_with_args(config, args):
         s2_config['min_length'] = args.min_length
     if hasattr(args, 's2_output_dir') and args.s2_output_dir != DEFAULT_S2_OUTPUT_DIR:
         s2_config['output_dir'] = args.s2_output_dir
+    if hasattr(args, 'jobs') and args.jobs:
+        s2_config['jobs'] = args.jobs
     
     # HiC配置
     hic_config = config.get('HiC_config', {})
@@ -81,10 +125,15 @@ def merge_config_with_args(config, args):
         hic_config['config_type'] = args.hic_config
     if hasattr(args, 'hic_modules') and args.hic_modules != "1,2,3":
         hic_config['modules'] = args.hic_modules
-    if hasattr(args, 'hic_cpu') and args.hic_cpu != 10:
+    # 给出即覆盖 (包括与默认值相同的值): 调度器以 --hic-cpu 把HiC-Pro限制在为它预留的CPU数内
+    if getattr(args, 'hic_cpu', None) is not None:
         hic_config['cpu_count'] = args.hic_cpu
     if hasattr(args, 'hic_conda_env') and args.hic_conda_env != "hicpro3":
         hic_config['conda_env'] = args.hic_conda_env
+    if hasattr(args, 'stream_handoff') and args.stream_handoff:
+        hic_config.setdefault('stream_handoff', {})['enabled'] = True
+    if hasattr(args, 'stream_consumer') and args.stream_consumer:
+        hic_config.setdefault('stream_handoff', {})['consumer'] = args.stream_consumer
     
     # 流程控制
     workflow_control = config.get('workflow_control', {})
@@ -94,6 +143,26 @@ def merge_config_with_args(config, args):
         workflow_control['skip_s2'] = args.skip_s2
     if hasattr(args, 'skip_hic') and args.skip_hic:
         workflow_control['skip_hic'] = args.skip_hic
+    if hasattr(args, 'fused_s1s2') and args.fused_s1s2:
+        workflow_control['fused_s1s2'] = args.fused_s1s2
+    if hasattr(args, 'pipelined_s1s2') and args.pipelined_s1s2:
+        workflow_control['pipelined_s1s2'] = args.pipelined_s1s2
+    if hasattr(args, 'stage_execution') and args.stage_execution:
+        workflow_control['stage_execution'] = args.stage_execution
+    
+    if hasattr(args, 'staging_mode') and args.staging_mode:
+        config.setdefault('HiC_config', {})['staging_mode'] = args.staging_mode
+    
+    if hasattr(args, 'log_dir') and args.log_dir:
+        config.setdefault('advanced_config', {})['log_dir'] = args.log_dir
+    
+    if hasattr(args, 'profile') and args.profile:
+        config.setdefault('advanced_config', {}).setdefault('profiling', {})['mode'] = args.profile
+    if hasattr(args, 'profile_memory') and args.profile_memory:
+        config.setdefault('advanced_config', {}).setdefault('profiling', {})['tracemalloc'] = True
+    
+    if hasattr(args, 'force') and args.force:
+        workflow_control['incremental'] = False
     
     return {
         'S1_config': s1_config,
@@ -128,30 +197,219 @@ def validate_config(config):
     if 'input_dir' not in config['HiC_config']:
         config['HiC_config']['input_dir'] = DEFAULT_HIC_INPUT_DIR
     
+    staging_mode = config['HiC_config'].get('staging_mode') or DEFAULT_STAGING_MODE
+    if staging_mode not in STAGING_MODES:
+        print(f"错误: 无效的staging_mode: {staging_mode} (可选: {', '.join(STAGING_MODES)})", file=sys.stderr)
+        return False
+    
     return True
 
-def run_s1_process(s1_config):
+def build_gzip_args(stage_config):
     """
-    运行S1处理步骤
+    根据S1_config/S2_config中的gzip_backend、gzip_threads、compresslevel、bgzf生成命令行参数
+    """
+    gzip_args = []
+    if stage_config.get('gzip_backend'):
+        gzip_args.extend(["--gzip-backend", str(stage_config['gzip_backend'])])
+    if stage_config.get('gzip_threads'):
+        gzip_args.extend(["--gzip-threads", str(stage_config['gzip_threads'])])
+    if stage_config.get('compresslevel') is not None:
+        gzip_args.extend(["--compresslevel", str(stage_config['compresslevel'])])
+    if stage_config.get('bgzf'):
+        gzip_args.append("--bgzf")
+    return gzip_args
+
+def build_separator_args(s2_config):
+    """
+    根据S2_config生成分隔符参数: 配置了separator_pairs时每个分隔符对一个 --separator-pair,
+    否则使用 separator1/separator2
+    """
+    separator_args = [
+        "--sep1", s2_config.get('separator1', DEFAULT_SEPARATOR1),
+        "--sep2", s2_config.get('separator2', DEFAULT_SEPARATOR2)
+    ]
+    for separator_pair in s2_config.get('separator_pairs') or []:
+        separator_args.extend(["--separator-pair",
+                               f"{separator_pair['name']}={separator_pair['separator1']},{separator_pair['separator2']}"])
+    if s2_config.get('pair_output'):
+        separator_args.extend(["--pair-output", s2_config['pair_output']])
+    return separator_args
+
+def build_tolerance_args(stage_config, prefix=""):
+    """
+    根据S1_config或S2_config生成容错匹配参数 (max_mismatches / max_edits)
+    """
+    tolerance_args = []
+    for key in ('max_mismatches', 'max_edits'):
+        if stage_config.get(key):
+            tolerance_args.extend([f"--{prefix}{key.replace('_', '-')}", str(stage_config[key])])
+    return tolerance_args
+
+def build_split_args(s2_config, current_dir):
+    """
+    融合S1+S2模式: 根据S2_config生成S1的分割参数 (输出目录、分隔符、最小长度、压缩级别)
+    """
+    s2_output_dir = s2_config['output_dir']
+    if not Path(s2_output_dir).is_absolute():
+        s2_output_dir = Path(current_dir) / s2_output_dir
+    split_args = [
+        "--split-output-dir", str(s2_output_dir),
+        *build_separator_args(s2_config),
+        *build_tolerance_args(s2_config, prefix="split-"),
+        "--min-length", str(s2_config.get('min_length', 5))
+    ]
+    if s2_config.get('compresslevel') is not None:
+        split_args.extend(["--split-compresslevel", str(s2_config['compresslevel'])])
+    if s2_config.get('handoff_chunk_reads'):
+        split_args.extend(["--split-handoff-chunk-reads", str(s2_config['handoff_chunk_reads'])])
+    return split_args
+
+def build_s2_stage_config(s2_config, gzip_options, jobs=1):
+    """
+    根据S2_config生成 S2Config (进程内调用S2或融合模式), 参数含义与S2命令行相同
+    """
+    return S2Config(
+        separator1=str(s2_config.get('separator1', DEFAULT_SEPARATOR1)).upper(),
+        separator2=str(s2_config.get('separator2', DEFAULT_SEPARATOR2)).upper(),
+        separator_pairs=[parse_separator_pair(f"{separator_pair['name']}={separator_pair['separator1']},"
+                                              f"{separator_pair['separator2']}")
+                         for separator_pair in s2_config.get('separator_pairs') or []],
+        min_length=int(s2_config.get('min_length', 5)),
+        pair_output=s2_config.get('pair_output') or PAIR_OUTPUT_PER_PAIR,
+        max_mismatches=int(s2_config.get('max_mismatches') or 0),
+        max_edits=int(s2_config.get('max_edits') or 0),
+        chunk_reads=int(s2_config.get('chunk_reads') or 0),
+        jobs=jobs,
+        gzip_options=gzip_options,
+        progress_seconds=float(s2_config.get('progress_seconds', DEFAULT_PROGRESS_SECONDS)),
+        handoff_chunk_reads=int(s2_config.get('handoff_chunk_reads') or 0)
+    )
+
+def build_s1_stage_config(s1_config, s2_config, current_dir):
+    """
+    根据S1_config (融合模式下另有S2_config) 生成 S1Config, 与subprocess模式的S1命令行参数一一对应
+    """
+    gzip_options = gzip_options_from_config(s1_config)
+    # 设置输出目录(相对于当前工作目录或绝对路径)
+    output_dir = s1_config['output_dir']
+    if not Path(output_dir).is_absolute():
+        output_dir = Path(current_dir) / output_dir
+    stage_config = S1Config(
+        pattern_sets=[(s1_config.get('description', DEFAULT_SEQUENCE_DESCRIPTION), str(s1_config['patterns']),
+                       str(output_dir))],
+        lines_to_process=parse_lines_option(s1_config.get('lines_to_process', DEFAULT_LINES_TO_PROCESS)),
+        # 融合模式下匹配的FASTQ中间文件可通过 keep_intermediate: false 省略
+        write_matching_reads=s2_config is None or s1_config.get('keep_intermediate', True),
+        gzip_options=gzip_options
+    )
+    if s2_config is not None:
+        s2_output_dir = s2_config['output_dir']
+        if not Path(s2_output_dir).is_absolute():
+            s2_output_dir = Path(current_dir) / s2_output_dir
+        split_gzip_options = dict(gzip_options)
+        if s2_config.get('compresslevel') is not None:
+            split_gzip_options['compresslevel'] = int(s2_config['compresslevel'])
+        stage_config.split_output_dir = str(s2_output_dir)
+        stage_config.split = build_s2_stage_config(s2_config, split_gzip_options)
+    if s1_config.get('jobs'):
+        stage_config.jobs = int(s1_config['jobs'])
+    if s1_config.get('max_buffer_mb'):
+        stage_config.max_buffer_mb = int(s1_config['max_buffer_mb'])
+    if s1_config.get('chunk_reads'):
+        stage_config.chunk_reads = int(s1_config['chunk_reads'])
+    if s1_config.get('match_engine'):
+        stage_config.match_engine = s1_config['match_engine']
+    stage_config.max_mismatches = int(s1_config.get('max_mismatches') or 0)
+    stage_config.max_edits = int(s1_config.get('max_edits') or 0)
+    return stage_config
+
+def open_pipeline_log(config, stage_name):
+    """
+    按advanced_config中的log_dir、log_max_mb、log_backup_count打开阶段日志 (<log_dir>/<阶段>.log)
+    """
+    advanced_config = config.get('advanced_config') or {}
+    return open_stage_log(stage_name,
+                          log_dir=advanced_config.get('log_dir') or DEFAULT_LOG_DIR,
+                          max_mb=advanced_config.get('log_max_mb') or DEFAULT_LOG_MAX_MB,
+                          backup_count=advanced_config.get('log_backup_count', DEFAULT_LOG_BACKUP_COUNT))
+
+def open_pipeline_manifest(config, stage_name):
+    """
+    打开阶段清单 <manifest_dir>/<阶段>.json (advanced_config.manifest_dir、manifest_checksum);
+    workflow_control.incremental 为false (或 --force) 时所有文件重新处理
+    """
+    advanced_config = config.get('advanced_config') or {}
+    return StageManifest(stage_name,
+                         manifest_dir=advanced_config.get('manifest_dir') or DEFAULT_MANIFEST_DIR,
+                         incremental=(config.get('workflow_control') or {}).get('incremental', True),
+                         checksum=bool(advanced_config.get('manifest_checksum', False)))
+
+def build_s2_manifest_params(stage_config):
+    """
+    清单中记录的S2参数: 只包含影响输出内容的参数 (并行度、gzip后端/线程数、进度间隔不影响输出)
+    """
+    return {
+        'separator_pairs': [list(pair_spec) for pair_spec in stage_config.get_pair_specs()],
+        'min_length': stage_config.min_length,
+        'pair_output': stage_config.pair_output,
+        'max_mismatches': stage_config.max_mismatches,
+        'max_edits': stage_config.max_edits,
+        'compresslevel': stage_config.gzip_options.get('compresslevel'),
+        'bgzf': stage_config.gzip_options.get('bgzf'),
+        'handoff_chunk_reads': stage_config.handoff_chunk_reads
+    }
+
+def build_s1_manifest_params(stage_config):
+    """
+    清单中记录的S1参数 (融合模式下另有S2参数), 同样只包含影响输出内容的参数
+    """
+    return {
+        'pattern_sets': [list(pattern_set) for pattern_set in stage_config.pattern_sets],
+        'lines_to_process': stage_config.lines_to_process,
+        'write_matching_reads': stage_config.write_matching_reads,
+        'write_unmatched_reads': stage_config.write_unmatched_reads,
+        'max_mismatches': stage_config.max_mismatches,
+        'max_edits': stage_config.max_edits,
+        'compresslevel': stage_config.gzip_options.get('compresslevel'),
+        'bgzf': stage_config.gzip_options.get('bgzf'),
+        'split_output_dir': stage_config.split_output_dir,
+        'split': build_s2_manifest_params(stage_config.split) if stage_config.split is not None else None
+    }
+
+def get_manifest_key(input_file):
+    return str(Path(input_file).absolute())
+
+def print_output_tail(output_tail):
+    """
+    失败时打印子进程(或S2工作进程)输出的最后若干行, 完整输出见阶段日志
+    """
+    if output_tail:
+        print(f"错误输出 (最后 {len(output_tail.splitlines())} 行):", file=sys.stderr)
+        print(output_tail, file=sys.stderr)
+
+def run_s1_subprocess(s1_config, s2_config, current_dir, stage_log, manifest, metrics):
+    """
+    以子进程运行 S1_Process_gen.py, 输出逐行写入S1日志, 各文件的指标经 --metrics-file 取回并加入metrics
+    子进程一次处理所有输入文件, 因此按整个阶段判断: 所有输入都是最新时跳过, 否则全部重新处理
     """
-    print(f"\n=== 第一步: 运行S1序列匹配处理 ===")
-    
     s1_script = Path(__file__).parent / "S1_Process_gen.py"
     if not s1_script.exists():
         print(f"错误: 找不到S1脚本: {s1_script}", file=sys.stderr)
         return False
     
-    # 检查输入目录
-    input_dir = s1_config.get('input_dir')
-    if input_dir and not Path(input_dir).exists():
-        print(f"错误: S1输入目录不存在: {input_dir}", file=sys.stderr)
-        return False
-    
-    # 如果有输入目录，切换到该目录运行
-    current_dir = os.getcwd()
-    if input_dir:
-        print(f"切换到S1输入目录: {input_dir}")
-        os.chdir(input_dir)
+    stage_config = build_s1_stage_config(s1_config, s2_config, current_dir)
+    manifest_params = build_s1_manifest_params(stage_config)
+    input_files = sorted(glob.glob(s1_config.get('input_pattern', DEFAULT_INPUT_PATTERN)))
+    if input_files and all(manifest.is_up_to_date(get_manifest_key(input_file), [input_file], manifest_params)
+                           for input_file in input_files):
+        print(f"S1: {len(input_files)} 个输入文件均已是最新, 跳过 (清单: {manifest.path})")
+        for input_file in input_files:
+            metrics.add_file(FileMetrics(input_file=input_file, status=FILE_STATUS_UP_TO_DATE,
+                                         bytes_in=get_file_size(input_file)))
+        return True
+    for input_file in input_files:
+        # S1以追加方式写出FASTQ, 重新处理前删除旧输出 (包括上次中断时写了一半的文件)
+        manifest.remove_outputs(get_manifest_key(input_file), get_fastq_output_paths(stage_config, input_file))
     
     # 构建S1命令
     s1_cmd = [
@@ -159,115 +417,507 @@ def run_s1_process(s1_config):
         "-p", s1_config['patterns'],
         "-d", s1_config.get('description', DEFAULT_SEQUENCE_DESCRIPTION),
         "-i", s1_config.get('input_pattern', DEFAULT_INPUT_PATTERN),
-        "-N", str(s1_config.get('lines_to_process', DEFAULT_LINES_TO_PROCESS)),
-        "--write-matching-reads"
+        "-N", str(s1_config.get('lines_to_process', DEFAULT_LINES_TO_PROCESS))
     ]
     
-    # 设置输出目录(相对于当前工作目录或绝对路径)
-    output_dir = s1_config['output_dir']
-    if not Path(output_dir).is_absolute():
-        output_dir = Path(current_dir) / output_dir
-    s1_cmd.extend(["--fastq-output-dir", str(output_dir)])
+    # 融合模式下匹配的FASTQ中间文件可通过 keep_intermediate: false 省略
+    if s2_config is None or s1_config.get('keep_intermediate', True):
+        # 设置输出目录(相对于当前工作目录或绝对路径)
+        output_dir = s1_config['output_dir']
+        if not Path(output_dir).is_absolute():
+            output_dir = Path(current_dir) / output_dir
+        s1_cmd.extend(["--write-matching-reads", "--fastq-output-dir", str(output_dir)])
+    
+    if s2_config is not None:
+        s1_cmd.extend(build_split_args(s2_config, current_dir))
     
     if s1_config.get('jobs'):
         s1_cmd.extend(["-j", str(s1_config['jobs'])])
     
-    print(f"执行命令: {' '.join(s1_cmd)}")
+    if s1_config.get('max_buffer_mb'):
+        s1_cmd.extend(["--max-buffer-mb", str(s1_config['max_buffer_mb'])])
     
-    try:
-        result = subprocess.run(s1_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        print("S1处理成功完成!")
-        print("S1输出:")
-        print(result.stdout)
-        if result.stderr:
-            print("S1警告/信息:")
-            print(result.stderr)
+    if s1_config.get('chunk_reads'):
+        s1_cmd.extend(["--chunk-reads", str(s1_config['chunk_reads'])])
+    
+    if s1_config.get('match_engine'):
+        s1_cmd.extend(["--match-engine", s1_config['match_engine']])
+    
+    s1_cmd.extend(build_tolerance_args(s1_config))
+    
+    s1_cmd.extend(build_gzip_args(s1_config))
+    
+    s1_cmd.extend(build_profile_args())
+    
+    with tempfile.TemporaryDirectory(prefix="S1_metrics_") as metrics_temp_dir:
+        metrics_file = Path(metrics_temp_dir) / "S1.json"
+        s1_cmd.extend(["--metrics-file", str(metrics_file)])
+        stage_log.info(f"执行命令: {' '.join(s1_cmd)}")
         
-        # 返回原目录
-        os.chdir(current_dir)
-        return True
-    except subprocess.CalledProcessError as e:
+        try:
+            run_streamed(s1_cmd, stage_log)
+        except subprocess.CalledProcessError as e:
+            print(f"S1处理失败: {e}", file=sys.stderr)
+            print_output_tail(e.stderr or e.output)
+            return False
+        subprocess_metrics = load_metrics_file(metrics_file)
+        if subprocess_metrics is not None:
+            metrics.files.extend(subprocess_metrics.files)
+    
+    for input_file in input_files:
+        output_paths = get_fastq_output_paths(stage_config, input_file)
+        if stage_config.split_output_dir:
+            split_dir = Path(stage_config.split_output_dir) / get_split_sample_dir_name(Path(input_file).name)
+            output_paths.extend(split_dir.glob("*.fq.gz"))
+        manifest.record(get_manifest_key(input_file), [input_file], output_paths, manifest_params)
+    print("S1处理成功完成!")
+    return True
+
+def run_s1_in_process(s1_config, s2_config, current_dir, stage_results, stage_log, manifest, metrics,
+                      on_file_ready=None):
+    """
+    在本进程中通过 S1Scanner 运行S1 (文件在进程池中并行处理), 结果存入 stage_results['S1'], 各文件的指标加入metrics
+    只处理清单中不是最新的输入文件, 最新文件的计数和融合S2结果取自清单, TSV和指标仍包含所有文件
+    TSV与命令行模式相同, 写入当前目录下的CountFold; 本进程的输出逐行写入S1日志
+    on_file_ready(input_file, output_paths) 在每个文件完成 (或已是最新) 时调用, output_paths 为该文件的FASTQ输出
+    """
+    stage_config = build_s1_stage_config(s1_config, s2_config, current_dir)
+    try:
+        scanner = S1Scanner(stage_config)
+    except ValueError as e:
         print(f"S1处理失败: {e}", file=sys.stderr)
-        print(f"错误输出: {e.stderr}", file=sys.stderr)
-        # 返回原目录
-        os.chdir(current_dir)
         return False
+    
+    input_pattern = s1_config.get('input_pattern', DEFAULT_INPUT_PATTERN)
+    input_files = glob.glob(input_pattern)
+    if not input_files:
+        print(f"警告: 未找到匹配模式 '{input_pattern}' 的文件。", file=sys.stderr)
+    print(f"S1进程内运行: {len(input_files)} 个输入文件")
+    
+    manifest_params = build_s1_manifest_params(stage_config)
+    pending_files = []
+    cached_counts = []
+    cached_split_results = []
+    cached_file_metrics = []
+    for input_file in input_files:
+        key = get_manifest_key(input_file)
+        if manifest.is_up_to_date(key, [input_file], manifest_params):
+            cached_result = manifest.get_result(key) or {}
+            file_counts = [S1Count(**count) for count in cached_result.get('counts') or []]
+            split_result = None
+            if cached_result.get('split_result'):
+                split_result = S2Result(**cached_result['split_result'])
+                cached_split_results.append(split_result)
+            cached_counts.extend(file_counts)
+            cached_file_metrics.append(build_file_metrics(input_file, file_counts, split_result,
+                                                          get_fastq_output_paths(stage_config, input_file),
+                                                          status=FILE_STATUS_UP_TO_DATE))
+            if on_file_ready is not None:
+                on_file_ready(input_file, get_fastq_output_paths(stage_config, input_file))
+            continue
+        # S1以追加方式写出FASTQ, 重新处理前删除旧输出 (包括上次中断时写了一半的文件)
+        manifest.remove_outputs(key, get_fastq_output_paths(stage_config, input_file))
+        pending_files.append(input_file)
+    if len(pending_files) < len(input_files):
+        print(f"S1增量运行: {len(input_files) - len(pending_files)} 个文件已是最新, "
+              f"处理 {len(pending_files)} 个 (清单: {manifest.path})")
+    
+    def record_file(file_path, counts, split_result):
+        output_paths = get_fastq_output_paths(stage_config, file_path)
+        file_result = {'counts': [asdict(count) for count in counts]}
+        if split_result is not None:
+            output_paths.extend([*split_result.r1_outputs, *split_result.r2_outputs, split_result.discarded_output])
+            file_result['split_result'] = asdict(split_result)
+        manifest.record(get_manifest_key(file_path), [file_path], output_paths, manifest_params, file_result)
+        if on_file_ready is not None:
+            on_file_ready(file_path, get_fastq_output_paths(stage_config, file_path))
+    
+    # 本进程的输出写入S1日志; S1进程池工作进程的输出经队列交给本进程写入 (worker_log)
+    stderr_writer = LineLogWriter(stage_log, logging.WARNING)
+    with contextlib.redirect_stdout(LineLogWriter(stage_log)), contextlib.redirect_stderr(stderr_writer):
+        s1_result = scanner.run(pending_files, on_file_done=record_file, worker_log=stage_log)
+        s1_result.counts = sorted(s1_result.counts + cached_counts, key=lambda count: count.sample_name)
+        s1_result.split_results = sorted(s1_result.split_results + cached_split_results,
+                                         key=lambda split_result: split_result.input_file)
+        s1_result.file_metrics = sorted(s1_result.file_metrics + cached_file_metrics,
+                                        key=lambda file_metrics: file_metrics.input_file)
+        tsv_path = scanner.default_tsv_path()
+        tsv_path.parent.mkdir(parents=True, exist_ok=True)
+        s1_result.write_tsv(tsv_path, echo=True)
+    stderr_writer.flush()
+    stage_results['S1'] = s1_result
+    metrics.files.extend(s1_result.file_metrics)
+    
+    print("S1处理成功完成!")
+    if s1_result.failed_files:
+        print(f"警告: S1处理失败的文件: {', '.join(s1_result.failed_files)}", file=sys.stderr)
+    return True
 
-def run_s2_split(s1_config, s2_config):
+def run_s1_process(s1_config, s2_config=None, stage_execution=DEFAULT_STAGE_EXECUTION, stage_results=None,
+                   stage_log=None, manifest=None, metrics=None, on_file_ready=None):
     """
-    运行S2分割步骤
+    运行S1处理步骤
+    提供s2_config时为融合S1+S2模式: S1在同一次扫描中直接写出S2的R1/R2/discarded文件
+    stage_execution为 'in-process' 时在本进程中调用S1Scanner, 'subprocess' 时启动 S1_Process_gen.py
+    S1的输出逐行写入stage_log (默认 pipeline_logs/S1.log); 已完成的文件记录在manifest
+    (默认 pipeline_manifests/S1.json), 输入和参数未改变的文件不再重新处理
+    各输入文件的指标 (stage_metrics.FileMetrics) 加入metrics
+    on_file_ready(input_file, output_paths) 在每个输入文件完成时调用 (仅进程内运行, 用于S1→S2流水线)
     """
-    print(f"\n=== 第二步: 运行S2序列分割处理 ===")
-    
-    s2_script = Path(__file__).parent / "S2_Split.py"
-    if not s2_script.exists():
-        print(f"错误: 找不到S2脚本: {s2_script}", file=sys.stderr)
-        return False
+    if s2_config is not None:
+        print(f"\n=== 第一步: 运行S1序列匹配处理 (融合S2分割) ===")
+    else:
+        print(f"\n=== 第一步: 运行S1序列匹配处理 ===")
     
-    # 获取S2输入目录
-    s2_input_dir = s2_config.get('input_dir', s1_config['output_dir'])
-    if not Path(s2_input_dir).exists():
-        print(f"错误: S2输入目录不存在: {s2_input_dir}", file=sys.stderr)
-        return False
+    stage_log = stage_log or open_stage_log("S1")
+    print(f"S1日志: {get_log_path(stage_log)}")
+    # 在切换到输入目录之前打开, 清单路径按当前目录解析
+    manifest = manifest or StageManifest("S1")
+    metrics = metrics if metrics is not None else StageMetrics("S1")
     
-    # 查找S2输入的文件
-    s1_files = glob.glob(os.path.join(s2_input_dir, "*.gz"))
-    if not s1_files:
-        print(f"错误: 在 {s2_input_dir} 中未找到任何.gz文件", file=sys.stderr)
+    # 检查输入目录
+    input_dir = s1_config.get('input_dir')
+    if input_dir and not Path(input_dir).exists():
+        print(f"错误: S1输入目录不存在: {input_dir}", file=sys.stderr)
         return False
     
-    print(f"S2输入目录: {s2_input_dir}")
-    print(f"找到 {len(s1_files)} 个S2输入文件")
-    
-    success_count = 0
-    failed_files = []
+    # 如果有输入目录，切换到该目录运行
+    current_dir = os.getcwd()
+    if input_dir:
+        print(f"切换到S1输入目录: {input_dir}")
+        os.chdir(input_dir)
     
-    for s1_file in s1_files:
+    try:
+        if stage_execution == STAGE_EXECUTION_SUBPROCESS:
+            return run_s1_subprocess(s1_config, s2_config, current_dir, stage_log, manifest, metrics)
+        return run_s1_in_process(s1_config, s2_config, current_dir,
+                                 stage_results if stage_results is not None else {}, stage_log, manifest, metrics,
+                                 on_file_ready)
+    finally:
+        # 返回原目录
+        os.chdir(current_dir)
+
+def get_s2_jobs(s1_config, s2_config):
+    """
+    S2总并行任务数: S2_config.jobs, 其次S1_config.jobs, 否则按本进程可用的CPU和内存确定
+    """
+    jobs = s2_config.get('jobs') or s1_config.get('jobs')
+    return max(1, int(jobs)) if jobs else get_default_jobs()
+
+def run_s2_file(s2_cmd, stage_log, prefix):
+    """
+    运行单个文件的S2命令, 输出逐行写入S2日志 (行首带prefix, 并发文件的输出可区分)
+    返回: (是否成功, 最后若干行输出, 错误信息)
+    """
+    try:
+        run_streamed(s2_cmd, stage_log, prefix)
+        return True, "", None
+    except subprocess.CalledProcessError as e:
+        return False, e.stderr or e.output, e
+
+def load_s2_file_metrics(metrics_file, s1_file, success, error):
+    """
+    子进程模式下S2_Split.py经 --metrics-file 写出的文件指标; 失败或未写出时只记录状态
+    """
+    if success:
+        subprocess_metrics = load_metrics_file(metrics_file)
+        if subprocess_metrics is not None and subprocess_metrics.files:
+            return subprocess_metrics.files[0]
+        return FileMetrics(input_file=s1_file, bytes_in=get_file_size(s1_file))
+    return FileMetrics(input_file=s1_file, status=FILE_STATUS_FAILED, bytes_in=get_file_size(s1_file),
+                       error=str(error))
+
+class S2SplitRunner:
+    """
+    按文件提交和收集S2分割, 各文件的S2相互独立:
+    stage_execution为 'in-process' 时在进程池中直接调用 PairedSplitter, 'subprocess' 时在有界线程池中为每个文件启动 S2_Split.py
+    输入 (S1输出) 和参数与manifest记录相同、输出完整的文件跳过; 各文件的指标加入metrics
+    run_s2_split 一次提交所有S2输入, 流水线模式在每个S1文件完成时立即提交 (submit), 最后由 wait() 收集
+    文件路径在构造时解析为绝对路径, 提交时可以处在其他工作目录 (S1在输入目录中运行)
+    """
+    def __init__(self, s1_config, s2_config, stage_execution, stage_log, manifest, metrics, file_count):
+        self.s2_config = s2_config
+        self.stage_log = stage_log
+        self.manifest = manifest
+        self.metrics = metrics
+        self.in_process = stage_execution != STAGE_EXECUTION_SUBPROCESS
+        self.s2_script = Path(__file__).parent / "S2_Split.py"
+        self.output_dir = Path(s2_config['output_dir']).absolute()
+        # 总并行任务数由同时运行的文件分享; 文件内分块并行时总进程数保持在jobs以内
+        total_jobs = get_s2_jobs(s1_config, s2_config)
+        self.jobs = max(1, min(total_jobs, file_count))
+        self.chunk_jobs = max(1, total_jobs // self.jobs)
+        self.stage_config = None
+        self.manifest_params = None
+        self.stack = contextlib.ExitStack()
+        self.executor = None
+        self.metrics_temp_dir = None
+        self.future_to_file = {}
+        self.submitted_count = 0
+        self.success_count = 0
+        self.up_to_date_count = 0
+        self.failed_files = []
+        self.split_results = []
+
+    def start(self):
+        """
+        检查S2脚本和分隔符配置并启动线程池/进程池, 配置无效时返回False
+        """
+        if not self.in_process and not self.s2_script.exists():
+            print(f"错误: 找不到S2脚本: {self.s2_script}", file=sys.stderr)
+            return False
+        try:
+            self.stage_config = build_s2_stage_config(self.s2_config, gzip_options_from_config(self.s2_config),
+                                                      self.chunk_jobs)
+            if self.in_process:
+                # 提前检查分隔符配置, 避免每个文件各自失败
+                PairedSplitter(self.stage_config)
+        except ValueError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return False
+        self.manifest_params = build_s2_manifest_params(self.stage_config)
+        # 子进程模式下各文件的指标经 --metrics-file 写入临时目录
+        self.metrics_temp_dir = Path(self.stack.enter_context(tempfile.TemporaryDirectory(prefix="S2_metrics_")))
+        if self.in_process:
+            # 流水线模式下第一个文件在S1运行期间提交, 此时本进程有S1进程池和日志队列的线程;
+            # forkserver启动的工作进程不继承这些线程和打开的文件
+            mp_context = None
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                mp_context = multiprocessing.get_context('forkserver')
+            # 工作进程的输出经队列交给本进程写入S2日志
+            log_queue, log_listener = start_queue_logging(self.stage_log, mp_context)
+            self.stack.callback(log_listener.stop)
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs, mp_context=mp_context,
+                                                                   initializer=init_split_worker,
+                                                                   initargs=(log_queue, get_profile_env()))
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs)
+        self.stack.enter_context(self.executor)
+        return True
+
+    def close(self):
+        """
+        等待已提交的文件结束并关闭线程池/进程池 (未经 wait() 收集的结果不记录)
+        """
+        self.stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, s1_file):
+        """
+        提交一个S2输入文件 (S1输出); 清单中已是最新时直接记为成功
+        """
+        self.submitted_count += 1
+        s1_file = str(Path(s1_file).absolute())
         file_name = Path(s1_file).name
-        print(f"\n处理文件: {file_name}")
         
         # 为每个文件创建独立的输出目录
         file_base_name = file_name.replace('.gz', '').replace('.fq', '').replace('.fastq', '')
-        file_output_dir = Path(s2_config['output_dir']) / file_base_name
+        file_output_dir = self.output_dir / file_base_name
+        
+        key = get_manifest_key(s1_file)
+        if self.manifest.is_up_to_date(key, [s1_file], self.manifest_params):
+            self.stage_log.info(f"已是最新, 跳过: {file_name}")
+            cached_result = self.manifest.get_result(key)
+            if cached_result:
+                split_result = S2Result(**cached_result)
+                self.split_results.append(split_result)
+                self.metrics.add_file(split_result.file_metrics(FILE_STATUS_UP_TO_DATE))
+            else:
+                self.metrics.add_file(FileMetrics(input_file=s1_file, status=FILE_STATUS_UP_TO_DATE,
+                                                  bytes_in=get_file_size(s1_file)))
+            self.success_count += 1
+            self.up_to_date_count += 1
+            return
+        # 删除上次记录的输出 (分隔符对改变后文件名可能不同); 未记录的旧输出会被覆盖
+        self.manifest.remove_outputs(key)
+        
+        self.stage_log.info(f"提交文件: {file_name}")
+        if self.in_process:
+            future = self.executor.submit(run_paired_split, (self.stage_config, s1_file, str(file_output_dir)))
+            self.future_to_file[future] = (s1_file, file_output_dir, None)
+            return
         
         # 构建S2命令
+        s2_config = self.s2_config
         s2_cmd = [
-            sys.executable, str(s2_script),
+            sys.executable, str(self.s2_script),
             "-i", s1_file,
             "-o", str(file_output_dir),
-            "--sep1", s2_config.get('separator1', "GATCATGTCGGAACTGTTGCTTGTCCGACTGATC"),
-            "--sep2", s2_config.get('separator2', "AGATCGGAAGA"),
+            *build_separator_args(s2_config),
+            *build_tolerance_args(s2_config),
             "--min-length", str(s2_config.get('min_length', 5))
         ]
+        s2_cmd.extend(build_gzip_args(s2_config))
+        if s2_config.get('chunk_reads'):
+            s2_cmd.extend(["--chunk-reads", str(s2_config['chunk_reads']), "-j", str(self.chunk_jobs)])
+        if s2_config.get('progress_seconds') is not None:
+            s2_cmd.extend(["--progress-seconds", str(s2_config['progress_seconds'])])
+        if s2_config.get('handoff_chunk_reads'):
+            s2_cmd.extend(["--handoff-chunk-reads", str(s2_config['handoff_chunk_reads'])])
+        s2_cmd.extend(build_profile_args())
+        metrics_file = self.metrics_temp_dir / f"{self.submitted_count}.json"
+        s2_cmd.extend(["--metrics-file", str(metrics_file)])
         
-        print(f"执行命令: {' '.join(s2_cmd)}")
+        self.stage_log.info(f"执行命令: {' '.join(s2_cmd)}")
+        future = self.executor.submit(run_s2_file, s2_cmd, self.stage_log, f"[{file_name}] ")
+        self.future_to_file[future] = (s1_file, file_output_dir, metrics_file)
+
+    def collect(self, future):
+        """
+        记录一个已结束文件的结果: 成功时写入清单, 失败时附上最后若干行输出
+        各文件的输出已逐行写入日志 (行首为文件名), 这里只报告结果
+        """
+        s1_file, file_output_dir, metrics_file = self.future_to_file.pop(future)
+        file_name = Path(s1_file).name
+        split_result = None
+        if self.in_process:
+            split_result, output_tail = future.result()
+            success, error = split_result.success, split_result.error
+            self.split_results.append(split_result)
+            self.metrics.add_file(split_result.file_metrics())
+        else:
+            success, output_tail, error = future.result()
+            self.metrics.add_file(load_s2_file_metrics(metrics_file, s1_file, success, error))
+        if success:
+            self.stage_log.info(f"✓ {file_name} 处理成功!")
+            self.success_count += 1
+            if split_result is not None:
+                self.manifest.record(get_manifest_key(s1_file), [s1_file],
+                                     [*split_result.r1_outputs, *split_result.r2_outputs,
+                                      split_result.discarded_output],
+                                     self.manifest_params, asdict(split_result))
+            else:
+                self.manifest.record(get_manifest_key(s1_file), [s1_file], sorted(file_output_dir.glob("*.fq.gz")),
+                                     self.manifest_params)
+        else:
+            self.stage_log.error(f"✗ {file_name} 处理失败: {error}")
+            print_output_tail(output_tail)
+            self.failed_files.append(file_name)
+
+    def collect_done(self):
+        """
+        不等待, 收集已结束的文件 (流水线模式下每个S1文件完成时调用, 清单及时更新)
+        """
+        for future in [future for future in self.future_to_file if future.done()]:
+            self.collect(future)
+
+    def wait(self):
+        """
+        等待并收集所有已提交的文件, 关闭线程池/进程池 (工作进程的日志随之写完) 后打印统计; 全部成功时返回True
+        """
+        for future in concurrent.futures.as_completed(list(self.future_to_file)):
+            self.collect(future)
+        self.close()
+        self.metrics.files.sort(key=lambda file_metrics: file_metrics.input_file)
         
-        try:
-            result = subprocess.run(s2_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-            print(f"✓ {file_name} 处理成功!")
-            print("S2输出:")
-            print(result.stdout)
-            if result.stderr:
-                print("S2警告/信息:")
-                print(result.stderr)
-            success_count += 1
-        except subprocess.CalledProcessError as e:
-            print(f"✗ {file_name} 处理失败: {e}", file=sys.stderr)
-            print(f"错误输出: {e.stderr}", file=sys.stderr)
-            failed_files.append(file_name)
+        print(f"\n=== S2处理完成统计 ===")
+        print(f"成功处理: {self.success_count}/{self.submitted_count} 个文件")
+        if self.up_to_date_count:
+            print(f"其中已是最新而跳过: {self.up_to_date_count} 个 (清单: {self.manifest.path})")
+        
+        if self.failed_files:
+            print(f"失败文件: {', '.join(self.failed_files)}")
+            return False
+        return True
+
+def run_s2_split(s1_config, s2_config, stage_execution=DEFAULT_STAGE_EXECUTION, stage_results=None,
+                 stage_log=None, manifest=None, metrics=None):
+    """
+    运行S2分割步骤: S2输入目录 (默认S1输出目录) 中的所有文件交给 S2SplitRunner
+    stage_execution为 'in-process' 时各文件在进程池中直接调用 PairedSplitter, 'subprocess' 时每个文件启动 S2_Split.py
+    各文件的输出逐行写入stage_log (默认 pipeline_logs/S2.log), 行首为 [文件名]
+    输入 (S1输出) 和参数与manifest (默认 pipeline_manifests/S2.json) 记录相同、输出完整的文件跳过
+    各文件的指标 (reads数、字节数、耗时、orientation_stats等) 加入metrics
+    """
+    print(f"\n=== 第二步: 运行S2序列分割处理 ===")
     
-    print(f"\n=== S2处理完成统计 ===")
-    print(f"成功处理: {success_count}/{len(s1_files)} 个文件")
+    stage_log = stage_log or open_stage_log("S2")
+    print(f"S2日志: {get_log_path(stage_log)}")
+    manifest = manifest or StageManifest("S2")
+    metrics = metrics if metrics is not None else StageMetrics("S2")
     
-    if failed_files:
-        print(f"失败文件: {', '.join(failed_files)}")
+    # 获取S2输入目录
+    s2_input_dir = s2_config.get('input_dir', s1_config['output_dir'])
+    if not Path(s2_input_dir).exists():
+        print(f"错误: S2输入目录不存在: {s2_input_dir}", file=sys.stderr)
         return False
     
-    return True
+    # 查找S2输入的文件
+    s1_files = glob.glob(os.path.join(s2_input_dir, "*.gz"))
+    if not s1_files:
+        print(f"错误: 在 {s2_input_dir} 中未找到任何.gz文件", file=sys.stderr)
+        return False
+    
+    print(f"S2输入目录: {s2_input_dir}")
+    print(f"找到 {len(s1_files)} 个S2输入文件")
+    
+    with S2SplitRunner(s1_config, s2_config, stage_execution, stage_log, manifest, metrics, len(s1_files)) as runner:
+        print(f"S2并行任务数: {runner.jobs}")
+        if not runner.start():
+            return False
+        for s1_file in s1_files:
+            runner.submit(s1_file)
+        success = runner.wait()
+    
+    if stage_results is not None and runner.in_process:
+        stage_results['S2'] = sorted(runner.split_results, key=lambda split_result: split_result.input_file)
+    return success
+
+def run_s1_s2_pipelined(s1_config, s2_config, stage_execution=DEFAULT_STAGE_EXECUTION, stage_results=None,
+                        s1_log=None, s1_manifest=None, s1_metrics=None, s2_log=None, s2_manifest=None,
+                        s2_metrics=None):
+    """
+    S1→S2流水线: 每个S1文件完成 (或清单中已是最新) 时立即把它的匹配输出交给S2, S2与其余S1文件同时运行,
+    总耗时接近 max(S1, S2) 而不是 S1 + S2; 一个慢的lane不再拖住其他样本的S2。
+    S1匹配输出仍写入 S1_config.output_dir, 两个阶段的日志、清单和指标与分别运行时相同;
+    只处理本次S1输入对应的S1输出 (分别运行时S2处理S1输出目录中的所有文件)。
+    运行期间进程数为S1与S2并行任务数之和。需要进程内运行方式 (S1按文件回调)。
+    返回: (S1是否成功, S2是否成功)
+    """
+    s1_log = s1_log or open_stage_log("S1")
+    s2_log = s2_log or open_stage_log("S2")
+    s1_manifest = s1_manifest or StageManifest("S1")
+    s2_manifest = s2_manifest or StageManifest("S2")
+    s2_metrics = s2_metrics if s2_metrics is not None else StageMetrics("S2")
+    print(f"\n=== 第一、二步: S1→S2流水线 (每个S1文件完成后立即进行S2分割) ===")
+    print(f"S2日志: {get_log_path(s2_log)}")
+    
+    # S1在输入目录中运行, 在此之前解析输入文件数, 作为S2并行任务数的上限
+    input_pattern = s1_config.get('input_pattern', DEFAULT_INPUT_PATTERN)
+    input_files = glob.glob(os.path.join(s1_config['input_dir'], input_pattern)
+                            if s1_config.get('input_dir') else input_pattern)
+    with S2SplitRunner(s1_config, s2_config, stage_execution, s2_log, s2_manifest, s2_metrics,
+                       max(1, len(input_files))) as runner:
+        print(f"S2并行任务数: {runner.jobs}")
+        if not runner.start():
+            return False, False
+        
+        def hand_off(input_file, output_paths):
+            # 没有匹配reads的输入不产生S1输出
+            if output_paths and Path(output_paths[0]).is_file():
+                runner.submit(output_paths[0])
+            runner.collect_done()
+        
+        s1_success = run_s1_process(s1_config, None, stage_execution, stage_results, s1_log, s1_manifest,
+                                    s1_metrics, on_file_ready=hand_off)
+        s2_success = runner.wait()
+    
+    if stage_results is not None:
+        stage_results['S2'] = sorted(runner.split_results, key=lambda split_result: split_result.input_file)
+    if s1_success and not runner.submitted_count:
+        print(f"错误: S1没有产生任何S2输入文件 ({s1_config['output_dir']})", file=sys.stderr)
+        return s1_success, False
+    return s1_success, s2_success
 
-def prepare_hic_input(s2_config, hic_config):
+def prepare_hic_input(s2_config, hic_config, reuse_existing=False):
     """
     将S2输出整理为HiC-Pro输入格式
+    reuse_existing为True时 (增量运行), 已放置且与S2输出一致的文件不再重复放置
     """
     print(f"\n=== 第三步: 准备HiC-Pro输入目录 ===")
     
@@ -283,6 +933,10 @@ def prepare_hic_input(s2_config, hic_config):
     
     print(f"S2数据源目录: {s2_output_dir}")
     
+    # 按staging_mode放置文件 (复制/硬链接/reflink/符号链接), 不支持时改为复制
+    stager = FileStager(hic_config.get('staging_mode') or DEFAULT_STAGING_MODE, reuse_existing)
+    print(f"放置方式: {stager.mode}")
+    
     # 找到所有S2输出目录
     s2_sample_dirs = [d for d in s2_output_dir.iterdir() if d.is_dir()]
     print(f"找到 {len(s2_sample_dirs)} 个S2输出目录")
@@ -297,35 +951,37 @@ def prepare_hic_input(s2_config, hic_config):
         hic_sample_dir.mkdir(exist_ok=True)
         
         # 查找R1和R2文件
-        r1_files = list(s2_sample_dir.glob("*_R1.fq.gz"))
-        r2_files = list(s2_sample_dir.glob("*_R2.fq.gz"))
+        r1_files = sorted(s2_sample_dir.glob("*_R1.fq.gz"))
+        r2_files = sorted(s2_sample_dir.glob("*_R2.fq.gz"))
         
         if not r1_files or not r2_files:
             print(f"  错误: 在{s2_sample_dir}中未找到R1或R2文件")
             continue
         
-        # 复制文件到HiC输入目录
+        # 放置文件到HiC输入目录
         for r1_file in r1_files:
             dest_r1 = hic_sample_dir / r1_file.name
-            shutil.copy2(r1_file, dest_r1)
-            print(f"  已复制: {r1_file.name} -> {sample_name}/{r1_file.name}")
+            staged_mode = stager.stage(r1_file, dest_r1)
+            print(f"  已放置 ({staged_mode}): {r1_file.name} -> {sample_name}/{r1_file.name}")
         
         for r2_file in r2_files:
             dest_r2 = hic_sample_dir / r2_file.name
-            shutil.copy2(r2_file, dest_r2)
-            print(f"  已复制: {r2_file.name} -> {sample_name}/{r2_file.name}")
+            staged_mode = stager.stage(r2_file, dest_r2)
+            print(f"  已放置 ({staged_mode}): {r2_file.name} -> {sample_name}/{r2_file.name}")
         
         success_count += 1
     
     print(f"\n=== HiC输入准备完成 ===")
     print(f"成功处理 {success_count} 个样本")
+    print(f"文件放置: {stager.describe_counts()}")
     print(f"HiC输入目录: {hic_input_dir}")
     
     return success_count > 0
 
-def prepare_hic_rawdata(hic_config):
+def prepare_hic_rawdata(hic_config, reuse_existing=False):
     """
     直接将HiC输入数据放入Run2_trim目录，跳过trim步骤
+    reuse_existing同 prepare_hic_input
     """
     print(f"\n=== 准备HiC-Pro Run2_trim目录（跳过trim步骤） ===")
     
@@ -335,9 +991,12 @@ def prepare_hic_rawdata(hic_config):
         return False
     
     # 创建Run2_trim目录（HiC-Pro期望的目录）
-    trim_dir = Path("Run2_trim")
+    trim_dir = Path(HIC_TRIM_DIR)
     trim_dir.mkdir(exist_ok=True)
     
+    stager = FileStager(hic_config.get('staging_mode') or DEFAULT_STAGING_MODE, reuse_existing)
+    print(f"放置方式: {stager.mode}")
+    
     # 找到所有样本目录
     sample_dirs = [d for d in hic_input_dir.iterdir() if d.is_dir()]
     print(f"找到 {len(sample_dirs)} 个样本目录")
@@ -352,8 +1011,9 @@ def prepare_hic_rawdata(hic_config):
         sample_trim_dir.mkdir(exist_ok=True)
         
         # 查找R1和R2文件
-        r1_files = list(sample_dir.glob("*_R1.fq.gz"))
-        r2_files = list(sample_dir.glob("*_R2.fq.gz"))
+        # 排序保证多个分隔符对的R1/R2文件一一对应
+        r1_files = sorted(sample_dir.glob("*_R1.fq.gz"))
+        r2_files = sorted(sample_dir.glob("*_R2.fq.gz"))
         
         if not r1_files or not r2_files:
             print(f"  错误: 在{sample_dir}中未找到R1或R2文件")
@@ -369,25 +1029,106 @@ def prepare_hic_rawdata(hic_config):
                 hic_r1_name = f"{sample_name}_R1.fq.gz"
                 hic_r2_name = f"{sample_name}_R2.fq.gz"
             
-            # 复制并重命名文件到样本子目录
+            # 放置并重命名文件到样本子目录
             dest_r1 = sample_trim_dir / hic_r1_name
             dest_r2 = sample_trim_dir / hic_r2_name
             
-            shutil.copy2(r1_file, dest_r1)
-            shutil.copy2(r2_file, dest_r2)
+            r1_mode = stager.stage(r1_file, dest_r1)
+            r2_mode = stager.stage(r2_file, dest_r2)
             
-            print(f"  已复制: {r1_file.name} -> Run2_trim/{sample_name}/{hic_r1_name}")
-            print(f"  已复制: {r2_file.name} -> Run2_trim/{sample_name}/{hic_r2_name}")
+            print(f"  已放置 ({r1_mode}): {r1_file.name} -> {HIC_TRIM_DIR}/{sample_name}/{hic_r1_name}")
+            print(f"  已放置 ({r2_mode}): {r2_file.name} -> {HIC_TRIM_DIR}/{sample_name}/{hic_r2_name}")
         
         success_count += 1
     
     print(f"\n=== HiC Run2_trim准备完成 ===")
     print(f"成功处理 {success_count} 个样本")
+    print(f"文件放置: {stager.describe_counts()}")
     print(f"Run2_trim目录: {trim_dir.absolute()}")
     
     return success_count > 0
 
-def run_hic_pipeline(hic_config):
+def get_stream_handoff_config(hic_config):
+    """
+    HiC_config.stream_handoff 的设置 (未启用时返回None): chunk_reads 每块配对reads数, compresslevel 分块的压缩级别,
+    consumer 在S1/S2运行期间读取分块的命令 (最后一个参数为交接目录, 为空时运行HiC-Pro时由hic_stream_mapper.py映射分块),
+    hicpro/hicpro_config/mapping_jobs 分块映射使用的HiC-Pro可执行文件、配置文件 (为空时按config_type选择) 和同时映射的分块数
+    """
+    stream_handoff = hic_config.get('stream_handoff') or {}
+    if not stream_handoff.get('enabled', False):
+        return None
+    compresslevel = stream_handoff.get('compresslevel')
+    return {
+        'chunk_reads': int(stream_handoff.get('chunk_reads') or DEFAULT_HANDOFF_CHUNK_READS),
+        'compresslevel': DEFAULT_HANDOFF_COMPRESSLEVEL if compresslevel is None else int(compresslevel),
+        'consumer': stream_handoff.get('consumer') or None,
+        'hicpro': stream_handoff.get('hicpro') or DEFAULT_HICPRO_BIN,
+        'hicpro_config': stream_handoff.get('hicpro_config') or None,
+        'mapping_jobs': int(stream_handoff.get('mapping_jobs') or DEFAULT_MAPPING_JOBS),
+        'stream_mapping': False # 由main在使用hic_stream_mapper.py作为消费者时设置
+    }
+
+def build_stream_mapper_command(hic_config, stream_handoff):
+    """
+    分块映射消费者 (hic_stream_mapper.py) 的命令, run_stream_handoff 会在最后附加交接目录
+    """
+    mapper_cmd = [
+        sys.executable, str(Path(__file__).parent / "hic_stream_mapper.py"),
+        "--config-type", str(hic_config.get('config_type', 1)),
+        "--hicpro", stream_handoff['hicpro'],
+        "--conda-env", hic_config.get('conda_env', 'hicpro3'),
+        "--output-dir", str(Path(HIC_OUTPUT_DIR).absolute()),
+        "--cpu", str(hic_config.get('cpu_count') or DEFAULT_HIC_CPU_COUNT),
+        "--jobs", str(stream_handoff['mapping_jobs'])
+    ]
+    if stream_handoff['hicpro_config']:
+        mapper_cmd.extend(["--hicpro-config", stream_handoff['hicpro_config']])
+    return shlex.join(mapper_cmd)
+
+@contextlib.contextmanager
+def run_stream_handoff(stream_handoff, handoff_dir, stage_log=None):
+    """
+    分块流式交接: S2 (或融合模式的S1) 把R1/R2分块原子发布到 handoff_dir/<样本>/ (chunk_handoff),
+    配置了consumer时在后台运行 `consumer <handoff_dir>`, 与S1/S2同时读取已发布的分块。
+    退出时写入结束标记 (其中的阶段抛出异常或退出时标记为失败), 再等待消费者结束;
+    产生的dict中 'success' 为消费者是否成功 (未配置consumer时为True)。消费者的输出逐行写入stage_log
+    """
+    handoff_dir = Path(handoff_dir).absolute()
+    handoff_dir.mkdir(parents=True, exist_ok=True)
+    remove_handoff_end(handoff_dir)
+    state = {'success': True}
+    
+    print(f"\n=== 分块流式交接: R1/R2每 {stream_handoff['chunk_reads']} 条配对reads发布到 {handoff_dir} "
+          f"(压缩级别 {stream_handoff['compresslevel']}) ===")
+    consumer_future = None
+    with contextlib.ExitStack() as stack:
+        if stream_handoff['consumer']:
+            stage_log = stage_log or open_stage_log("handoff")
+            consumer_cmd = shlex.split(stream_handoff['consumer']) + [str(handoff_dir)]
+            print(f"分块消费者日志: {get_log_path(stage_log)}")
+            stage_log.info(f"执行命令: {' '.join(consumer_cmd)}")
+            executor = stack.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers=1))
+            consumer_future = executor.submit(run_streamed, consumer_cmd, stage_log)
+        
+        stages_success = False
+        try:
+            yield state
+            stages_success = True
+        finally:
+            write_handoff_end(handoff_dir, stages_success)
+            if consumer_future is not None:
+                try:
+                    consumer_future.result()
+                    print("分块消费者成功完成!")
+                except subprocess.CalledProcessError as e:
+                    print(f"分块消费者失败: {e}", file=sys.stderr)
+                    print_output_tail(e.stderr or e.output)
+                    state['success'] = False
+                except OSError as e:
+                    print(f"无法启动分块消费者: {e}", file=sys.stderr)
+                    state['success'] = False
+
+def run_hic_pipeline(hic_config, stage_log=None):
     """
     运行HiC-Pro流程
     支持两种HiC-Pro脚本：
@@ -420,8 +1161,8 @@ def run_hic_pipeline(hic_config):
             "-n", str(hic_config.get('config_type', 1)),
             "-p", project_name,
             "-t", "Run2_trim",  # 修剪目录参数
-            "-o", "Run3_hic",   # 输出目录参数  
-            "-u", str(hic_config.get('cpu_count', 10)),
+            "-o", HIC_OUTPUT_DIR,   # 输出目录参数
+            "-u", str(hic_config.get('cpu_count') or DEFAULT_HIC_CPU_COUNT),
             "-e", hic_config.get('conda_env', 'hicpro3'),
             "-m", hic_config.get('modules', '2,3')  # 默认跳过trim模块
         ]
@@ -447,21 +1188,86 @@ def run_hic_pipeline(hic_config):
             "-n", str(hic_config.get('config_type', 1)),
             "-p", project_name,
             "-i", hic_config['input_dir'],
-            "-u", str(hic_config.get('cpu_count', 10)),
+            "-u", str(hic_config.get('cpu_count') or DEFAULT_HIC_CPU_COUNT),
             "-e", hic_config.get('conda_env', 'hicpro3'),
             "-m", hic_config.get('modules', '1,2,3')
         ]
     
-    print(f"执行命令: {' '.join(hic_cmd)}")
+    stage_log = stage_log or open_stage_log("HiC")
+    print(f"HiC日志: {get_log_path(stage_log)}")
+    stage_log.info(f"执行命令: {' '.join(hic_cmd)}")
     
     try:
-        # 使用bash运行脚本
-        result = subprocess.run(["bash"] + hic_cmd, check=True, universal_newlines=True)
+        # 使用bash运行脚本, 输出逐行写入HiC日志
+        run_streamed(["bash"] + hic_cmd, stage_log)
         print("HiC-Pro流程成功完成!")
         return True
     except subprocess.CalledProcessError as e:
         print(f"HiC-Pro流程失败: {e}", file=sys.stderr)
+        print_output_tail(e.stderr or e.output)
+        return False
+
+def run_hic_post_mapping(hic_config, stream_handoff, stage_log=None):
+    """
+    分块流式交接时全部分块已在S1/S2运行期间映射 (hic_stream_mapper.py):
+    只运行映射之后的HiC-Pro步骤, 再由HiC-Pro脚本运行模块2之后的模块 (如模块3 Juicebox转换),
+    不再对Run2_trim整体重新映射
+    """
+    print(f"\n=== 第四步: 运行映射之后的HiC-Pro步骤 (分块已在S1/S2运行期间映射) ===")
+    try:
+        config_file = get_hicpro_config_file(hic_config.get('config_type', 1), stream_handoff['hicpro_config'])
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return False
+    hic_cmd = build_post_mapping_command(stream_handoff['hicpro'], Path(HIC_OUTPUT_DIR).absolute(), config_file,
+                                         hic_config.get('cpu_count') or DEFAULT_HIC_CPU_COUNT,
+                                         hic_config.get('conda_env', 'hicpro3'))
+    stage_log = stage_log or open_stage_log("HiC")
+    print(f"HiC日志: {get_log_path(stage_log)}")
+    stage_log.info(f"执行命令: {' '.join(hic_cmd)}")
+    try:
+        run_streamed(hic_cmd, stage_log)
+    except subprocess.CalledProcessError as e:
+        print(f"HiC-Pro流程失败: {e}", file=sys.stderr)
+        print_output_tail(e.stderr or e.output)
+        return False
+    except OSError as e:
+        print(f"无法启动HiC-Pro: {e}", file=sys.stderr)
         return False
+    print("映射之后的HiC-Pro步骤成功完成!")
+    
+    # 模块1 (trim) 和模块2 (HiC-Pro) 已由分块映射和上面的步骤完成
+    later_modules = [module.strip() for module in str(hic_config.get('modules', '2,3')).split(',')
+                     if module.strip() not in ('', '1', '2')]
+    if not later_modules:
+        return True
+    return run_hic_pipeline(dict(hic_config, modules=','.join(later_modules)), stage_log)
+
+def get_hic_complete_marker_path():
+    return Path(HIC_OUTPUT_DIR) / HIC_COMPLETE_MARKER
+
+def get_hic_output_files():
+    """
+    HiC-Pro的结果文件 (Run3_hic 和 Run4_HICdata* 中的全部文件, 不含完成标记), 记入HiC清单:
+    结果被删除或改动后下次运行不会跳过HiC-Pro
+    """
+    result_dirs = [Path(HIC_OUTPUT_DIR), *sorted(Path('.').glob(HIC_DATA_DIR_PATTERN))]
+    return sorted(path for result_dir in result_dirs if result_dir.is_dir()
+                  for path in result_dir.rglob('*') if path.is_file() and path.name != HIC_COMPLETE_MARKER)
+
+def write_hic_complete_marker(hic_config, output_count):
+    """
+    HiC-Pro成功完成后写入完成标记 (运行前删除): 中断或失败的运行没有标记, 不会被视为最新
+    """
+    marker_path = get_hic_complete_marker_path()
+    marker_path.parent.mkdir(parents=True, exist_ok=True)
+    write_json_atomic(marker_path, {
+        'completed_at': datetime.now().isoformat(timespec='seconds'),
+        'project_name': hic_config.get('project_name'),
+        'modules': hic_config.get('modules'),
+        'output_files': output_count
+    })
+    return marker_path
 
 def run_hicpro_direct(hic_config):
     """
@@ -494,7 +1300,7 @@ def run_hicpro_direct(hic_config):
         "-i", "rawdata",  # 输入目录（rawdata）
         "-o", str(output_dir),  # 输出目录
         "-c", config_file,  # 配置文件
-        "-p", str(hic_config.get('cpu_count', 10))  # CPU数量
+        "-p", str(hic_config.get('cpu_count') or DEFAULT_HIC_CPU_COUNT)  # CPU数量
     ]
     
     # 根据模块设置决定运行步骤
@@ -533,12 +1339,28 @@ def run_hicpro_direct(hic_config):
         print(f"运行HiC-Pro时发生错误: {e}", file=sys.stderr)
         return False
 
+def get_report_stages(config):
+    """
+    报告包含的阶段: 融合模式下S2在S1中完成, 跳过HiC时没有整理和HiC-Pro阶段
+    """
+    workflow_control = config.get('workflow_control') or {}
+    stages = ["S1"]
+    if not workflow_control.get('fused_s1s2', False):
+        stages.append("S2")
+    if not workflow_control.get('skip_hic', False):
+        stages.extend(["staging", "HiC"])
+    return stages
+
+def get_metrics_dir(config):
+    return Path((config.get('advanced_config') or {}).get('metrics_dir') or DEFAULT_METRICS_DIR).absolute()
+
 def generate_complete_report(config):
     """
-    生成完整的流程报告
+    生成完整的流程报告, 各阶段的统计由 <metrics_dir>/<阶段>.json 指标记录生成
     """
     print(f"\n=== 生成完整流程报告 ===")
     
+    metrics_dir = get_metrics_dir(config)
     s1_config = config['S1_config']
     s2_config = config['S2_config']
     hic_config = config['HiC_config']
@@ -558,40 +1380,22 @@ def generate_complete_report(config):
             f.write("目录结构:\n")
             f.write(f"S1输出目录: {s1_config['output_dir']}\n")
             f.write(f"S2输出目录: {s2_config['output_dir']}\n")
-            f.write(f"HiC输入目录: {hic_config['input_dir']}\n\n")
+            f.write(f"HiC输入目录: {hic_config['input_dir']}\n")
+            f.write(f"阶段指标目录: {metrics_dir}\n\n")
             
-            # 统计S1输出文件
-            s1_files = glob.glob(os.path.join(s1_config['output_dir'], "*.gz"))
-            f.write(f"S1输出文件数: {len(s1_files)}\n")
-            for s1_file in s1_files:
-                f.write(f"  - {Path(s1_file).name}\n")
+            # 各阶段的统计来自阶段指标记录 (按阶段分别运行时也包含之前运行的阶段)
+            for stage_name in get_report_stages(config):
+                stage_metrics = load_stage_metrics(metrics_dir, stage_name)
+                if stage_metrics is None:
+                    f.write(f"{stage_name} 阶段: 无指标记录 (未运行或已跳过)\n\n")
+                    continue
+                write_stage_metrics_report(f, stage_metrics)
             
-            f.write("\n")
-            
-            # 统计S2输出目录
-            s2_dirs = [d for d in Path(s2_config['output_dir']).iterdir() if d.is_dir()]
-            f.write(f"S2输出目录数: {len(s2_dirs)}\n")
-            for s2_dir in s2_dirs:
-                f.write(f"  - {s2_dir.name}/\n")
-                s2_files = list(s2_dir.glob("*.gz"))
-                for s2_file in s2_files:
-                    f.write(f"    * {s2_file.name}\n")
-            
-            f.write("\n")
-            
-            # 统计HiC输入目录
-            if Path(hic_config['input_dir']).exists():
-                hic_dirs = [d for d in Path(hic_config['input_dir']).iterdir() if d.is_dir()]
-                f.write(f"HiC输入目录数: {len(hic_dirs)}\n")
-                for hic_dir in hic_dirs:
-                    f.write(f"  - {hic_dir.name}/\n")
-                    hic_files = list(hic_dir.glob("*.gz"))
-                    for hic_file in hic_files:
-                        f.write(f"    * {hic_file.name}\n")
-            
-            f.write("\n配置信息:\n")
+            f.write("配置信息:\n")
             f.write(f"S1分隔符1: {s2_config.get('separator1', 'N/A')}\n")
             f.write(f"S1分隔符2: {s2_config.get('separator2', 'N/A')}\n")
+            for separator_pair in s2_config.get('separator_pairs') or []:
+                f.write(f"分隔符对 {separator_pair['name']}: {separator_pair['separator1']} / {separator_pair['separator2']}\n")
             f.write(f"最小长度: {s2_config.get('min_length', 'N/A')}\n")
             f.write(f"HiC配置类型: {hic_config.get('config_type', 'N/A')}\n")
             f.write(f"HiC CPU数: {hic_config.get('cpu_count', 'N/A')}\n")
@@ -640,6 +1444,17 @@ def main():
         "--project-name",
         help="(可选) HiC-Pro项目名称。覆盖配置文件中的设置"
     )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        help="(可选) S1和S2的并行任务数。覆盖配置文件中S1_config.jobs和S2_config.jobs的设置"
+    )
+    parser.add_argument(
+        "--hic-cpu",
+        type=int,
+        help=f"(可选) HiC-Pro使用的CPU数。覆盖配置文件中的 HiC_config.cpu_count\n"
+             f"(默认: 配置文件中的设置, 未设置时为 {DEFAULT_HIC_CPU_COUNT})"
+    )
     
     # 流程控制参数
     parser.add_argument(
@@ -657,6 +1472,70 @@ def main():
         action="store_true",
         help="(可选) 跳过HiC步骤，只运行S1S2流程"
     )
+    parser.add_argument(
+        "--stage",
+        choices=PIPELINE_STAGES,
+        help=f"(可选) 只运行一个阶段: {PIPELINE_STAGE_S1} S1 (融合模式下含S2分割), {PIPELINE_STAGE_S2} S2, "
+             f"{PIPELINE_STAGE_STAGING} 整理HiC输入,\n{PIPELINE_STAGE_HIC} 运行HiC-Pro。"
+             "前面阶段的输出须已存在, 供多组调度器 S1S2HiC_Scheduler.py 使用"
+    )
+    parser.add_argument(
+        "--fused-s1s2",
+        action="store_true",
+        help="(可选) 融合S1+S2: S1匹配的reads在同一次扫描中直接分割为R1/R2, 不再单独运行S2"
+    )
+    parser.add_argument(
+        "--pipelined-s1s2",
+        action="store_true",
+        help="(可选) S1→S2流水线: 每个S1文件完成后立即开始它的S2分割, S2与其余S1文件同时运行 (需要进程内运行方式)"
+    )
+    parser.add_argument(
+        "--stage-execution",
+        choices=STAGE_EXECUTION_MODES,
+        help=f"(可选) S1/S2的运行方式: {STAGE_EXECUTION_IN_PROCESS} 在本进程(进程池)中直接调用, 结果写入报告; "
+             f"{STAGE_EXECUTION_SUBPROCESS} 启动独立的脚本子进程 (默认: {DEFAULT_STAGE_EXECUTION})"
+    )
+    parser.add_argument(
+        "--staging-mode",
+        choices=STAGING_MODES,
+        help="(可选) S2输出放入HiC输入目录/Run2_trim的方式: copy 复制, hardlink 硬链接, reflink 写时复制克隆,\n"
+             "symlink 符号链接 (文件系统不支持时改为复制); direct 由S2直接写入HiC读取的目录。覆盖配置文件中的设置\n"
+             f"(默认: {DEFAULT_STAGING_MODE})"
+    )
+    parser.add_argument(
+        "--stream-handoff",
+        action="store_true",
+        help="(可选) 分块流式交接 (需要 --skip-trim): S2把R1/R2按块原子发布到 Run2_trim/<样本>/, 不再整理HiC输入,\n"
+             "下游可在S2结束前读取已发布的分块。覆盖配置文件中的 HiC_config.stream_handoff.enabled"
+    )
+    parser.add_argument(
+        "--stream-consumer",
+        metavar="COMMAND",
+        help="(可选) 分块流式交接的消费者命令, 在S1/S2运行期间以 '<命令> Run2_trim目录' 在后台运行,\n"
+             "读取已发布的分块, 读到结束标记后退出。未指定且运行HiC-Pro时由 hic_stream_mapper.py 在分块发布后\n"
+             "立即运行HiC-Pro映射, 第四步只运行映射之后的步骤。覆盖配置文件中的 HiC_config.stream_handoff.consumer"
+    )
+    parser.add_argument(
+        "--log-dir",
+        help=f"(可选) 各阶段日志目录, 每个阶段写入按大小轮转的 <阶段>.log。覆盖配置文件中的设置 (默认: {DEFAULT_LOG_DIR})"
+    )
+    parser.add_argument(
+        "--profile",
+        choices=PROFILE_MODES,
+        help="(可选) 对每个阶段做性能剖析: cprofile 写出 .prof, sampling 写出火焰图可用的折叠栈,\n"
+             f"结果写入 <profiling.output_dir>/<阶段>/ (默认: {DEFAULT_PROFILE_DIR})。覆盖配置文件中的设置"
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="(可选) 对每个阶段用tracemalloc记录内存峰值和占用最多的代码行。覆盖配置文件中的设置"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="(可选) 忽略各阶段清单 (manifest), 重新处理所有文件并重建清单。默认只处理输入或参数改变、\n"
+             "上次未完成或输出缺失的文件"
+    )
     parser.add_argument(
         "--skip-trim",
         action="store_true",
@@ -711,13 +1590,14 @@ def main():
                 'description': args.description,
                 'input_pattern': args.input_pattern,
                 'lines_to_process': DEFAULT_LINES_TO_PROCESS,
-                'jobs': None,
+                'jobs': args.jobs,
                 'output_dir': DEFAULT_S1_OUTPUT_DIR
             },
             'S2_config': {
-                'separator1': "GATCATGTCGGAACTGTTGCTTGTCCGACTGATC",
-                'separator2': "AGATCGGAAGA",
+                'separator1': DEFAULT_SEPARATOR1,
+                'separator2': DEFAULT_SEPARATOR2,
                 'min_length': 10,
+                'jobs': args.jobs,
                 'output_dir': DEFAULT_S2_OUTPUT_DIR
             },
             'HiC_config': {
@@ -725,19 +1605,55 @@ def main():
                 'project_name': args.project_name,
                 'config_type': 1,
                 'modules': "1,2,3",
-                'cpu_count': 10,
-                'conda_env': "hicpro3"
+                'cpu_count': args.hic_cpu or DEFAULT_HIC_CPU_COUNT,
+                'conda_env': "hicpro3",
+                'staging_mode': args.staging_mode or DEFAULT_STAGING_MODE,
+                'stream_handoff': {'enabled': args.stream_handoff, 'consumer': args.stream_consumer}
             },
             'workflow_control': {
                 'skip_s1': args.skip_s1,
                 'skip_s2': args.skip_s2,
-                'skip_hic': args.skip_hic
+                'skip_hic': args.skip_hic,
+                'fused_s1s2': args.fused_s1s2,
+                'pipelined_s1s2': args.pipelined_s1s2,
+                'stage_execution': args.stage_execution or DEFAULT_STAGE_EXECUTION,
+                'incremental': not args.force
             },
             'advanced_config': {
-                'generate_report': True
+                'generate_report': True,
+                'log_dir': args.log_dir or DEFAULT_LOG_DIR,
+                'manifest_dir': DEFAULT_MANIFEST_DIR,
+                'metrics_dir': DEFAULT_METRICS_DIR,
+                'profiling': {'mode': args.profile, 'tracemalloc': args.profile_memory}
             }
         }
     
+    # direct放置方式: S2 (或融合模式的S1) 直接写入HiC读取的目录, 之后无需整理
+    # 跳过trim时为 Run2_trim/<样本>/, 否则为 HiC_config.input_dir/<样本>/
+    staging_mode = config['HiC_config'].get('staging_mode') or DEFAULT_STAGING_MODE
+    if staging_mode == STAGING_DIRECT:
+        config['S2_config']['output_dir'] = HIC_TRIM_DIR if args.skip_trim else config['HiC_config']['input_dir']
+    
+    # 分块流式交接: S2 (或融合模式的S1) 把R1/R2分块直接发布到 Run2_trim/<样本>/, 相当于direct放置方式
+    stream_handoff = get_stream_handoff_config(config['HiC_config'])
+    if stream_handoff is not None:
+        if not args.skip_trim:
+            print("警告: 分块流式交接需要 --skip-trim (HiC-Pro直接读取Run2_trim), 将按原方式放置HiC输入",
+                  file=sys.stderr)
+            stream_handoff = None
+        elif args.stage or (config.get('workflow_control') or {}).get('skip_s2', False):
+            print("警告: 跳过S2或只运行一个阶段时不能使用分块流式交接, 将按原方式放置HiC输入", file=sys.stderr)
+            stream_handoff = None
+        else:
+            staging_mode = STAGING_DIRECT
+            config['S2_config']['output_dir'] = HIC_TRIM_DIR
+            config['S2_config']['handoff_chunk_reads'] = stream_handoff['chunk_reads']
+            config['S2_config']['compresslevel'] = stream_handoff['compresslevel']
+            # 未指定消费者且运行HiC-Pro时, 由hic_stream_mapper.py在分块发布后立即映射, 第四步只运行映射之后的步骤
+            if stream_handoff['consumer'] is None and not (config.get('workflow_control') or {}).get('skip_hic', False):
+                stream_handoff['consumer'] = build_stream_mapper_command(config['HiC_config'], stream_handoff)
+                stream_handoff['stream_mapping'] = True
+    
     # 显示配置摘要
     print("S1S2HiC 完整处理流程开始")
     print("=" * 60)
@@ -750,67 +1666,212 @@ def main():
     print(f"S1输出目录: {config['S1_config']['output_dir']}")
     print(f"S2输出目录: {config['S2_config']['output_dir']}")
     print(f"HiC输入目录: {config['HiC_config']['input_dir']}")
+    print(f"HiC输入放置方式: {staging_mode}")
     print(f"HiC配置类型: {config['HiC_config'].get('config_type', 1)}")
     
     success = True
     workflow_control = config.get('workflow_control', {})
     
-    # 第一步：运行S1处理（除非跳过）
-    if not workflow_control.get('skip_s1', False):
-        success = run_s1_process(config['S1_config'])
+    fused_s1s2 = workflow_control.get('fused_s1s2', False)
+    if fused_s1s2 and (workflow_control.get('skip_s1', False) or workflow_control.get('skip_s2', False)):
+        print("警告: 跳过S1或S2时不能使用融合S1+S2模式, 将分别运行各步骤", file=sys.stderr)
+        fused_s1s2 = False
+    
+    stage_execution = workflow_control.get('stage_execution') or DEFAULT_STAGE_EXECUTION
+    if stage_execution not in STAGE_EXECUTION_MODES:
+        print(f"错误: 无效的stage_execution: {stage_execution} (可选: {', '.join(STAGE_EXECUTION_MODES)})",
+              file=sys.stderr)
+        sys.exit(1)
+    print(f"S1/S2运行方式: {stage_execution}")
+    
+    # S1→S2流水线需要S1按文件回调 (进程内运行) 且两个步骤都在本次运行
+    pipelined_s1s2 = workflow_control.get('pipelined_s1s2', False)
+    if pipelined_s1s2:
+        if fused_s1s2:
+            print("警告: 融合S1+S2模式已在S1扫描中完成S2分割, 忽略S1→S2流水线", file=sys.stderr)
+            pipelined_s1s2 = False
+        elif (workflow_control.get('skip_s1', False) or workflow_control.get('skip_s2', False) or args.stage
+              or 'input_dir' in config['S2_config']):
+            print("警告: 跳过S1或S2、只运行一个阶段或另行指定S2输入目录时不能使用S1→S2流水线, 将分别运行各步骤",
+                  file=sys.stderr)
+            pipelined_s1s2 = False
+        elif stage_execution != STAGE_EXECUTION_IN_PROCESS:
+            print(f"警告: S1→S2流水线需要 {STAGE_EXECUTION_IN_PROCESS} 运行方式, 将分别运行各步骤", file=sys.stderr)
+            pipelined_s1s2 = False
+        else:
+            print("S1→S2流水线: 是")
+    incremental = workflow_control.get('incremental', True)
+    manifest_dir = config.get('advanced_config', {}).get('manifest_dir') or DEFAULT_MANIFEST_DIR
+    print(f"增量运行: {'是' if incremental else '否 (重新处理所有文件)'} (清单目录: {manifest_dir})")
+    # 在各阶段切换工作目录之前解析剖析结果目录和指标目录
+    profile_options = profile_options_from_config(config.get('advanced_config'))
+    metrics_dir = get_metrics_dir(config)
+    metrics_group = config['HiC_config'].get('project_name') or (Path(args.config).stem if args.config else None)
+    print(f"阶段指标目录: {metrics_dir}")
+    stage_results = {}
+    
+    # --stage: 只运行一个阶段, 前面阶段的输出须已存在
+    stage = args.stage
+    skip_hic = workflow_control.get('skip_hic', False)
+    if stage:
+        print(f"只运行阶段: {stage}")
+    
+    # 分块流式交接时, 消费者在S1/S2运行期间读取已发布的分块, S1/S2结束后写入结束标记
+    handoff_context = (run_stream_handoff(stream_handoff, HIC_TRIM_DIR, open_pipeline_log(config, "handoff"))
+                       if stream_handoff is not None else contextlib.nullcontext({'success': True}))
+    with handoff_context as handoff_state:
+        # 第一步：运行S1处理（除非跳过）
+        if stage not in (None, PIPELINE_STAGE_S1):
+            pass
+        elif pipelined_s1s2:
+            # 两个阶段同时运行, 各自的指标记录覆盖整个流水线的时间
+            with profile_stage(profile_options, "S1S2"), \
+                    record_stage(metrics_dir, "S1", metrics_group) as s1_metrics, \
+                    record_stage(metrics_dir, "S2", metrics_group) as s2_metrics:
+                s1_metrics.extra['pipelined'] = s2_metrics.extra['pipelined'] = True
+                s1_success, s2_success = run_s1_s2_pipelined(
+                    config['S1_config'], config['S2_config'], stage_execution, stage_results,
+                    open_pipeline_log(config, "S1"), open_pipeline_manifest(config, "S1"), s1_metrics,
+                    open_pipeline_log(config, "S2"), open_pipeline_manifest(config, "S2"), s2_metrics)
+                s1_metrics.success = s1_success
+                s2_metrics.success = s2_success
         
-        if not success:
-            print("S1处理失败，终止流程", file=sys.stderr)
-            sys.exit(1)
-    else:
-        print("\n=== 跳过S1步骤，使用现有S1输出 ===")
-        if not Path(config['S1_config']['output_dir']).exists():
-            print(f"错误: S1输出目录不存在: {config['S1_config']['output_dir']}", file=sys.stderr)
-            sys.exit(1)
-    
-    # 第二步：运行S2处理（除非跳过）
-    if not workflow_control.get('skip_s2', False):
-        success = run_s2_split(config['S1_config'], config['S2_config'])
+            if not s1_success:
+                print("S1处理失败，终止流程", file=sys.stderr)
+                sys.exit(1)
+            if not s2_success:
+                print("S2处理失败，终止流程", file=sys.stderr)
+                sys.exit(1)
+        elif not workflow_control.get('skip_s1', False):
+            with profile_stage(profile_options, "S1"), record_stage(metrics_dir, "S1", metrics_group) as stage_metrics:
+                success = run_s1_process(config['S1_config'], config['S2_config'] if fused_s1s2 else None,
+                                         stage_execution, stage_results, open_pipeline_log(config, "S1"),
+                                         open_pipeline_manifest(config, "S1"), stage_metrics)
+                stage_metrics.success = success
         
-        if not success:
-            print("S2处理失败，终止流程", file=sys.stderr)
-            sys.exit(1)
-    else:
-        print("\n=== 跳过S2步骤，使用现有S2输出 ===")
-        if not Path(config['S2_config']['output_dir']).exists():
-            print(f"错误: S2输出目录不存在: {config['S2_config']['output_dir']}", file=sys.stderr)
-            sys.exit(1)
+            if not success:
+                print("S1处理失败，终止流程", file=sys.stderr)
+                sys.exit(1)
+        else:
+            print("\n=== 跳过S1步骤，使用现有S1输出 ===")
+            if not Path(config['S1_config']['output_dir']).exists():
+                print(f"错误: S1输出目录不存在: {config['S1_config']['output_dir']}", file=sys.stderr)
+                sys.exit(1)
+    
+        # 第二步：运行S2处理（除非跳过, 融合模式下已在S1中完成）
+        if stage not in (None, PIPELINE_STAGE_S2):
+            pass
+        elif fused_s1s2:
+            print("\n=== 融合S1+S2模式, S2分割已在S1中完成 ===")
+        elif pipelined_s1s2:
+            pass
+        elif not workflow_control.get('skip_s2', False):
+            with profile_stage(profile_options, "S2"), record_stage(metrics_dir, "S2", metrics_group) as stage_metrics:
+                success = run_s2_split(config['S1_config'], config['S2_config'], stage_execution, stage_results,
+                                       open_pipeline_log(config, "S2"), open_pipeline_manifest(config, "S2"),
+                                       stage_metrics)
+                stage_metrics.success = success
+        
+            if not success:
+                print("S2处理失败，终止流程", file=sys.stderr)
+                sys.exit(1)
+        else:
+            print("\n=== 跳过S2步骤，使用现有S2输出 ===")
+            if not Path(config['S2_config']['output_dir']).exists():
+                print(f"错误: S2输出目录不存在: {config['S2_config']['output_dir']}", file=sys.stderr)
+                sys.exit(1)
+
+    
+    if not handoff_state['success']:
+        print("分块消费者失败，终止流程", file=sys.stderr)
+        sys.exit(1)
     
     # 第三步：准备HiC输入
-    if not workflow_control.get('skip_hic', False):
+    if skip_hic:
+        if stage in (None, PIPELINE_STAGE_STAGING, PIPELINE_STAGE_HIC):
+            print("\n=== 跳过HiC步骤，只运行S1S2流程 ===")
+    elif stage in (None, PIPELINE_STAGE_STAGING):
         # 检查是否跳过trim步骤
-        if args.skip_trim:
+        if staging_mode == STAGING_DIRECT:
+            # S2已直接写入HiC读取的目录
+            print(f"\n=== 第三步: S2输出已直接写入 {config['S2_config']['output_dir']}, 无需整理HiC输入 ===")
+            success = Path(config['S2_config']['output_dir']).exists()
+        elif args.skip_trim:
             # 跳过trim，直接准备rawdata
-            success = prepare_hic_input(config['S2_config'], config['HiC_config'])
-            if success:
-                success = prepare_hic_rawdata(config['HiC_config'])
+            with profile_stage(profile_options, "staging"), \
+                    record_stage(metrics_dir, "staging", metrics_group) as stage_metrics:
+                stage_metrics.extra['staging_mode'] = staging_mode
+                success = prepare_hic_input(config['S2_config'], config['HiC_config'], incremental)
+                if success:
+                    success = prepare_hic_rawdata(config['HiC_config'], incremental)
+                stage_metrics.success = success
         else:
             # 正常流程，准备HiC输入用于trim步骤
-            success = prepare_hic_input(config['S2_config'], config['HiC_config'])
+            with profile_stage(profile_options, "staging"), \
+                    record_stage(metrics_dir, "staging", metrics_group) as stage_metrics:
+                stage_metrics.extra['staging_mode'] = staging_mode
+                success = prepare_hic_input(config['S2_config'], config['HiC_config'], incremental)
+                stage_metrics.success = success
         
         if not success:
             print("HiC输入准备失败，终止流程", file=sys.stderr)
             sys.exit(1)
-        
-        # 第四步：运行HiC-Pro流程
+    
+    # 第四步：运行HiC-Pro流程
+    if not skip_hic and stage in (None, PIPELINE_STAGE_HIC):
         if args.skip_trim:
             # 修改HiC配置，跳过模块1（trim）
             original_modules = config['HiC_config'].get('modules', '1,2,3')
             config['HiC_config']['modules'] = '2,3'  # 跳过模块1
             print(f"跳过trim步骤，运行HiC-Pro模块: {config['HiC_config']['modules']}")
         
-        success = run_hic_pipeline(config['HiC_config'])
-        
-        if not success:
-            print("HiC-Pro流程失败", file=sys.stderr)
-            sys.exit(1)
-    else:
-        print("\n=== 跳过HiC步骤，只运行S1S2流程 ===")
+        # HiC-Pro按整个样本组运行: HiC读取的文件和HiC参数都与上次成功运行时相同则跳过
+        hic_read_dir = Path(HIC_TRIM_DIR if args.skip_trim else config['HiC_config']['input_dir'])
+        hic_inputs = sorted(hic_read_dir.rglob("*.fq.gz"))
+        hic_params = {key: config['HiC_config'].get(key)
+                      for key in ('script_type', 'config_type', 'modules', 'project_name', 'conda_env')}
+        stream_mapped = stream_handoff is not None and stream_handoff['stream_mapping']
+        hic_params['stream_mapping'] = stream_mapped
+        hic_manifest = open_pipeline_manifest(config, "HiC")
+        # 清单记录了结果文件和完成标记: 结果缺失、被改动或上次运行未完成时重新运行
+        if hic_inputs and get_hic_complete_marker_path().exists() and \
+                hic_manifest.is_up_to_date("HiC-Pro", hic_inputs, hic_params):
+            print(f"\n=== 第四步: HiC输入 ({len(hic_inputs)} 个文件) 和参数与上次成功运行相同, 跳过HiC-Pro "
+                  f"(清单: {hic_manifest.path}) ===")
+            with record_stage(metrics_dir, "HiC", metrics_group) as stage_metrics:
+                for hic_input in hic_inputs:
+                    stage_metrics.add_file(FileMetrics(input_file=str(hic_input), status=FILE_STATUS_UP_TO_DATE,
+                                                       bytes_in=get_file_size(hic_input)))
+                stage_metrics.success = True
+        else:
+            # HiC-Pro在外部进程中运行, 剖析只包含本进程中的启动和等待; CPU时间和内存峰值包括HiC-Pro子进程
+            with profile_stage(profile_options, "HiC"), \
+                    record_stage(metrics_dir, "HiC", metrics_group) as stage_metrics:
+                for hic_input in hic_inputs:
+                    stage_metrics.add_file(FileMetrics(input_file=str(hic_input), bytes_in=get_file_size(hic_input)))
+                get_hic_complete_marker_path().unlink(missing_ok=True)
+                if stream_mapped:
+                    success = run_hic_post_mapping(config['HiC_config'], stream_handoff, open_pipeline_log(config, "HiC"))
+                else:
+                    success = run_hic_pipeline(config['HiC_config'], open_pipeline_log(config, "HiC"))
+                stage_metrics.success = success
+            
+            if not success:
+                print("HiC-Pro流程失败", file=sys.stderr)
+                sys.exit(1)
+            hic_outputs = get_hic_output_files()
+            hic_marker = write_hic_complete_marker(config['HiC_config'], len(hic_outputs))
+            hic_manifest.record("HiC-Pro", hic_inputs, [*hic_outputs, hic_marker], hic_params)
+    
+    # 按阶段运行时只在最后一个阶段生成报告 (统计只包含本次运行的阶段)
+    if stage is not None:
+        if not skip_hic:
+            final_stage = PIPELINE_STAGE_HIC
+        else:
+            final_stage = PIPELINE_STAGE_S1 if fused_s1s2 else PIPELINE_STAGE_S2
+        if stage != final_stage:
+            print(f"\n阶段 {stage} 成功完成")
+            return
     
     # 生成完整报告
     if config.get('advanced_config', {}).get('generate_report', True):
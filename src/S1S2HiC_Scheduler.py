@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+S1S2HiC 多组任务调度器
+读取 parallel_config.yaml 及各组的流程配置, 为每个启用的组生成
+S1 → S2 → 整理HiC输入 → HiC-Pro 四个相互依赖的任务 (所有组共同组成一个DAG),
+在全局CPU、内存和并发I/O任务数的预算内按优先级调度, 取代 runsh.sh 中
+(run_group ...) & 加固定 sleep 的后台任务方式。
+每个任务以 S1S2HiC_Pipeline.py --stage <阶段> 在组的工作目录中运行, S1/S2的 -j 与HiC-Pro的 --hic-cpu
+取调度器分配的CPU数, 因此同时运行的任务不会超出CPU预算。任务输出写入 <log_dir>/<组>_<阶段>.log,
+结束时打印并写出每个任务的等待、运行时间 (<log_dir>/scheduler_<时间>.tsv)。
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import yaml
+
+from resource_probe import get_cpu_limit, probe_resources
+from S1S2HiC_Pipeline import (DEFAULT_HIC_CPU_COUNT, PIPELINE_STAGE_HIC, PIPELINE_STAGE_S1, PIPELINE_STAGE_S2,
+                              PIPELINE_STAGE_STAGING, PIPELINE_STAGES)
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_PARALLEL_CONFIG = REPO_DIR / "configs" / "templates" / "parallel_config.yaml"
+DEFAULT_SCHEDULER_LOG_DIR = "parallel_logs"
+DEFAULT_MAX_IO_TASKS = 2 # 同时运行的I/O密集任务 (S1/S2/整理) 数, 避免多个组同时读写同一磁盘
+DEFAULT_MEMORY_FRACTION = 0.8 # max_memory_gb为auto时使用的内存上限比例
+# 各阶段任务的默认内存预估 (GB), 可在 scheduler.task_memory_gb 或组的 resources 中覆盖
+DEFAULT_TASK_MEMORY_GB = {
+    PIPELINE_STAGE_S1: 2.0,
+    PIPELINE_STAGE_S2: 2.0,
+    PIPELINE_STAGE_STAGING: 0.5,
+    PIPELINE_STAGE_HIC: 16.0
+}
+IO_STAGES = (PIPELINE_STAGE_S1, PIPELINE_STAGE_S2, PIPELINE_STAGE_STAGING)
+
+TASK_PENDING = "pending"
+TASK_RUNNING = "running"
+TASK_SUCCESS = "success"
+TASK_FAILED = "failed"
+TASK_SKIPPED = "skipped"  # 依赖的任务失败
+
+def expand_path(path, base_dir=None):
+    """
+    展开环境变量和~; 相对路径相对于base_dir
+    """
+    path = os.path.expanduser(os.path.expandvars(str(path)))
+    if base_dir is not None and not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+    return Path(path)
+
+@dataclass
+class SchedulerTask:
+    """
+    一个组的一个阶段: 在work_dir中运行command, 占用cpus个CPU、memory_gb内存,
+    io为True时占用一个并发I/O名额; depends_on为必须先成功完成的任务名
+    """
+    name: str
+    group_id: str
+    stage: str
+    command: list
+    work_dir: Path
+    log_path: Path
+    cpus: int
+    memory_gb: float
+    io: bool
+    priority: int
+    order: int
+    depends_on: list = field(default_factory=list)
+    status: str = TASK_PENDING
+    ready_time: Optional[float] = None
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+    returncode: Optional[int] = None
+    process: Optional[subprocess.Popen] = None
+
+    @property
+    def wait_seconds(self):
+        if self.ready_time is None or self.start_time is None:
+            return None
+        return self.start_time - self.ready_time
+
+    @property
+    def run_seconds(self):
+        if self.start_time is None or self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+class ResourceBudget:
+    """
+    全局资源预算: CPU数、内存 (GB) 和并发I/O任务数
+    """
+    def __init__(self, cpus, memory_gb, io_tasks):
+        self.cpus = cpus
+        self.memory_gb = memory_gb
+        self.io_tasks = io_tasks
+        self.used_cpus = 0
+        self.used_memory_gb = 0.0
+        self.used_io_tasks = 0
+
+    def fits(self, task):
+        return (self.used_cpus + task.cpus <= self.cpus
+                and self.used_memory_gb + task.memory_gb <= self.memory_gb + 1e-9
+                and (not task.io or self.used_io_tasks < self.io_tasks))
+
+    def acquire(self, task):
+        self.used_cpus += task.cpus
+        self.used_memory_gb += task.memory_gb
+        self.used_io_tasks += int(task.io)
+
+    def release(self, task):
+        self.used_cpus -= task.cpus
+        self.used_memory_gb -= task.memory_gb
+        self.used_io_tasks -= int(task.io)
+
+    def describe(self):
+        return f"CPU {self.cpus} 个, 内存 {self.memory_gb:.1f} GB, 并发I/O任务 {self.io_tasks} 个"
+
+def load_yaml(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+def build_budget(scheduler_settings, args):
+    """
+    由 scheduler 配置节及命令行参数确定全局预算; auto 为本进程可用的CPU数 (CPU亲和性、cgroup配额) /
+    内存上限 (物理内存与cgroup上限中较小者) 的80%
+    """
+    probe = probe_resources()
+    print(f"资源探测: {probe.describe()}")
+    max_cpus = args.max_cpus or scheduler_settings.get('max_cpus', 'auto')
+    if max_cpus == 'auto':
+        max_cpus = probe.cpus
+    max_memory_gb = args.max_memory_gb or scheduler_settings.get('max_memory_gb', 'auto')
+    if max_memory_gb == 'auto':
+        memory_limit_bytes = probe.memory_limit_bytes
+        max_memory_gb = memory_limit_bytes / 1024 ** 3 * DEFAULT_MEMORY_FRACTION if memory_limit_bytes else float('inf')
+    max_io_tasks = args.max_io or scheduler_settings.get('max_io_tasks', DEFAULT_MAX_IO_TASKS)
+    return ResourceBudget(max(1, int(max_cpus)), float(max_memory_gb), max(1, int(max_io_tasks)))
+
+def get_stage_cpus(stage, group_config):
+    """
+    阶段请求的CPU数: S1为S1_config.jobs, S2为S2_config.jobs (其次S1_config.jobs), HiC为cpu_count;
+    未配置时为本进程可用的CPU数, 整理HiC输入为1
+    """
+    s1_jobs = (group_config.get('S1_config') or {}).get('jobs')
+    if stage == PIPELINE_STAGE_S1:
+        return int(s1_jobs or get_cpu_limit())
+    if stage == PIPELINE_STAGE_S2:
+        return int((group_config.get('S2_config') or {}).get('jobs') or s1_jobs or get_cpu_limit())
+    if stage == PIPELINE_STAGE_HIC:
+        return int((group_config.get('HiC_config') or {}).get('cpu_count') or DEFAULT_HIC_CPU_COUNT)
+    return 1
+
+def get_group_stages(group_config, pipeline_args):
+    """
+    组需要运行的阶段 (按依赖顺序), 与 S1S2HiC_Pipeline.py 的跳过/融合设置一致
+    """
+    workflow_control = group_config.get('workflow_control') or {}
+    skip_s1 = workflow_control.get('skip_s1') or '--skip-s1' in pipeline_args
+    skip_s2 = workflow_control.get('skip_s2') or '--skip-s2' in pipeline_args
+    skip_hic = workflow_control.get('skip_hic') or '--skip-hic' in pipeline_args
+    fused_s1s2 = (workflow_control.get('fused_s1s2') or '--fused-s1s2' in pipeline_args) \
+        and not (skip_s1 or skip_s2)
+    stages = []
+    if not skip_s1:
+        stages.append(PIPELINE_STAGE_S1)
+    if not skip_s2 and not fused_s1s2:
+        stages.append(PIPELINE_STAGE_S2)
+    if not skip_hic:
+        stages.extend([PIPELINE_STAGE_STAGING, PIPELINE_STAGE_HIC])
+    return stages
+
+def build_tasks(parallel_config, budget, selected_groups=None, log_dir=None):
+    """
+    为每个启用的组生成任务; 同组的任务依次依赖, 不同组之间没有依赖
+    返回: (任务列表, 日志目录)
+    """
+    global_settings = parallel_config.get('global_settings') or {}
+    scheduler_settings = parallel_config.get('scheduler') or {}
+    script_dir = global_settings.get('script_dir', 'auto')
+    script_dir = REPO_DIR if script_dir in ('auto', None, '') else expand_path(script_dir)
+    pipeline_script = expand_path(global_settings.get('pipeline_script') or 'src/S1S2HiC_Pipeline.py', script_dir)
+    config_dir = expand_path(global_settings.get('config_dir') or 'configs', script_dir)
+    log_dir = expand_path(log_dir or global_settings.get('log_dir') or DEFAULT_SCHEDULER_LOG_DIR, script_dir)
+    python_cmd = shlex.split(str(global_settings.get('python_cmd') or sys.executable))
+    pipeline_args = shlex.split(str(global_settings.get('pipeline_args') or ""))
+    task_memory_gb = dict(DEFAULT_TASK_MEMORY_GB, **(scheduler_settings.get('task_memory_gb') or {}))
+
+    tasks = []
+    for order, (group_id, group_settings) in enumerate((parallel_config.get('processing_groups') or {}).items()):
+        if selected_groups and group_id not in selected_groups:
+            continue
+        if not selected_groups and not group_settings.get('enabled', True):
+            continue
+        group_config_path = expand_path(group_settings['config_file'], config_dir)
+        group_config = load_yaml(group_config_path)
+        work_dir = expand_path(group_settings['work_dir'])
+        resources = group_settings.get('resources') or {}
+        priority = int(group_settings.get('priority', 0))
+
+        previous_task = None
+        for stage in get_group_stages(group_config, pipeline_args):
+            stage_resources = resources.get(stage) or {}
+            cpus = int(stage_resources.get('cpus') or get_stage_cpus(stage, group_config))
+            if cpus > budget.cpus:
+                print(f"警告: {group_id}/{stage} 请求 {cpus} 个CPU, 超出预算, 改为 {budget.cpus} 个", file=sys.stderr)
+                cpus = budget.cpus
+            memory_gb = float(stage_resources.get('memory_gb') or task_memory_gb[stage])
+            if memory_gb > budget.memory_gb:
+                print(f"警告: {group_id}/{stage} 预估内存 {memory_gb} GB 超出预算, 按 {budget.memory_gb:.1f} GB 计",
+                      file=sys.stderr)
+                memory_gb = budget.memory_gb
+
+            command = [*python_cmd, str(pipeline_script), "-c", str(group_config_path), "--stage", stage,
+                       *pipeline_args]
+            # 把分配的CPU数传给流程, 保证任务实际使用的进程数不超过调度器预留的数量
+            if stage in (PIPELINE_STAGE_S1, PIPELINE_STAGE_S2):
+                command.extend(["-j", str(cpus)])
+            elif stage == PIPELINE_STAGE_HIC:
+                command.extend(["--hic-cpu", str(cpus)])
+
+            task = SchedulerTask(
+                name=f"{group_id}/{stage}",
+                group_id=group_id,
+                stage=stage,
+                command=command,
+                work_dir=work_dir,
+                log_path=log_dir / f"{group_id}_{stage}.log",
+                cpus=cpus,
+                memory_gb=memory_gb,
+                io=stage in IO_STAGES,
+                priority=priority,
+                order=order,
+                depends_on=[previous_task.name] if previous_task else []
+            )
+            tasks.append(task)
+            previous_task = task
+    return tasks, log_dir
+
+def clean_group_outputs(parallel_config, selected_groups=None):
+    """
+    按各组的 cleanup_patterns 删除工作目录中之前的结果 (与 runsh.sh 的清理相同)
+    """
+    for group_id, group_settings in (parallel_config.get('processing_groups') or {}).items():
+        if selected_groups and group_id not in selected_groups:
+            continue
+        if not selected_groups and not group_settings.get('enabled', True):
+            continue
+        work_dir = expand_path(group_settings['work_dir'])
+        for pattern in group_settings.get('cleanup_patterns') or []:
+            for path in glob.glob(str(work_dir / pattern)):
+                print(f"删除: {path}")
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+
+def run_task_process(task):
+    """
+    在线程中运行任务命令 (独立进程组, 中断时可整体终止), 输出写入任务日志; 返回退出码
+    """
+    with open(task.log_path, 'w', encoding='utf-8') as log_file:
+        log_file.write(f"# {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} 工作目录: {task.work_dir}\n")
+        log_file.write(f"# 命令: {shlex.join(task.command)}\n")
+        log_file.flush()
+        task.process = subprocess.Popen(task.command, cwd=task.work_dir, stdout=log_file, stderr=subprocess.STDOUT,
+                                        start_new_session=True)
+        return task.process.wait()
+
+class TaskScheduler:
+    """
+    在ResourceBudget内运行任务DAG: 依赖都已成功的任务按优先级 (组priority高者优先, 其次靠后的阶段优先,
+    使已开始的组尽快完成并释放磁盘和内存, 再按组在配置中的顺序) 依次检查, 放得进剩余预算就启动
+    (回填: 较大的任务等待时, 较小的任务可以先运行)。任务失败时同组后续任务跳过, 其他组继续
+    """
+    def __init__(self, tasks, budget):
+        self.tasks = tasks
+        self.tasks_by_name = {task.name: task for task in tasks}
+        self.budget = budget
+        self.start_time = None
+
+    def update_ready_tasks(self):
+        """
+        标记依赖失败的任务为跳过, 返回依赖都已成功的待运行任务 (按优先级排序)
+        """
+        ready_tasks = []
+        for task in self.tasks:
+            if task.status != TASK_PENDING:
+                continue
+            dependency_statuses = [self.tasks_by_name[name].status for name in task.depends_on]
+            if any(status in (TASK_FAILED, TASK_SKIPPED) for status in dependency_statuses):
+                task.status = TASK_SKIPPED
+                print(f"跳过 {task.name}: 依赖的任务未成功完成")
+                continue
+            if all(status == TASK_SUCCESS for status in dependency_statuses):
+                if task.ready_time is None:
+                    task.ready_time = time.monotonic()
+                ready_tasks.append(task)
+        ready_tasks.sort(key=lambda task: (-task.priority, -PIPELINE_STAGES.index(task.stage), task.order))
+        return ready_tasks
+
+    def run(self):
+        """
+        运行所有任务, 返回是否全部成功
+        """
+        self.start_time = time.monotonic()
+        running = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(self.tasks))) as executor:
+            try:
+                while True:
+                    for task in self.update_ready_tasks():
+                        if self.budget.fits(task):
+                            self.budget.acquire(task)
+                            task.status = TASK_RUNNING
+                            task.start_time = time.monotonic()
+                            print(f"[{self.elapsed()}] 启动 {task.name} (CPU {task.cpus}, 内存 {task.memory_gb:g} GB"
+                                  f"{', I/O' if task.io else ''}; 已用 CPU {self.budget.used_cpus}/{self.budget.cpus}) "
+                                  f"日志: {task.log_path}")
+                            running[executor.submit(run_task_process, task)] = task
+                    if not running:
+                        break
+                    done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        task = running.pop(future)
+                        task.end_time = time.monotonic()
+                        self.budget.release(task)
+                        try:
+                            task.returncode = future.result()
+                        except OSError as e:
+                            print(f"错误: 无法运行 {task.name}: {e}", file=sys.stderr)
+                            task.returncode = -1
+                        task.status = TASK_SUCCESS if task.returncode == 0 else TASK_FAILED
+                        mark = "✅" if task.status == TASK_SUCCESS else "❌"
+                        print(f"[{self.elapsed()}] {mark} {task.name} 结束 (退出码 {task.returncode}, "
+                              f"用时 {task.run_seconds:.1f} 秒)")
+            except KeyboardInterrupt:
+                print("\n🛑 接收到中断信号，正在终止所有运行中的任务...", file=sys.stderr)
+                self.terminate(running.values())
+                raise
+        return all(task.status == TASK_SUCCESS for task in self.tasks)
+
+    def terminate(self, tasks):
+        for task in tasks:
+            if task.process is not None and task.process.poll() is None:
+                try:
+                    os.killpg(task.process.pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    def elapsed(self):
+        seconds = int(time.monotonic() - self.start_time)
+        return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def format_seconds(seconds):
+    return "-" if seconds is None else f"{seconds:.1f}"
+
+def write_timing_report(tasks, report_path):
+    """
+    打印并写出每个任务的状态、资源和等待/运行时间 (TSV)
+    """
+    header = ["任务", "状态", "CPU", "内存(GB)", "等待(秒)", "运行(秒)", "退出码", "日志"]
+    rows = [[task.name, task.status, task.cpus, f"{task.memory_gb:g}", format_seconds(task.wait_seconds),
+             format_seconds(task.run_seconds), "-" if task.returncode is None else task.returncode, task.log_path]
+            for task in tasks]
+    print("\n=== 任务用时 ===")
+    for row in [header] + rows:
+        print("\t".join(map(str, row)))
+    with open(report_path, 'w', encoding='utf-8') as f:
+        for row in [header] + rows:
+            f.write("\t".join(map(str, row)) + "\n")
+    print(f"任务用时已写入: {report_path}")
+
+def print_plan(tasks, budget):
+    print(f"全局预算: {budget.describe()}")
+    print(f"共 {len(tasks)} 个任务:")
+    for task in tasks:
+        dependency_text = f" 依赖 {', '.join(task.depends_on)}" if task.depends_on else ""
+        print(f"  {task.name}: CPU {task.cpus}, 内存 {task.memory_gb:g} GB{', I/O' if task.io else ''}, "
+              f"优先级 {task.priority}{dependency_text}")
+        print(f"    {shlex.join(task.command)}  (工作目录: {task.work_dir})")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="S1S2HiC多组调度器: 将各组拆分为 S1→S2→整理HiC输入→HiC-Pro 任务, 在全局CPU/内存/I/O预算内按优先级运行",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "-c", "--config",
+        default=str(DEFAULT_PARALLEL_CONFIG),
+        help=f"(可选) 并行配置文件 (默认: {DEFAULT_PARALLEL_CONFIG.relative_to(REPO_DIR)})"
+    )
+    parser.add_argument(
+        "-g", "--groups",
+        nargs="+",
+        help="(可选) 只运行指定的组ID (包括未启用的组), 默认运行所有启用的组"
+    )
+    parser.add_argument(
+        "--max-cpus",
+        type=int,
+        help="(可选) 全局CPU预算。覆盖配置文件 scheduler.max_cpus (默认: 本机CPU数)"
+    )
+    parser.add_argument(
+        "--max-memory-gb",
+        type=float,
+        help="(可选) 全局内存预算 (GB)。覆盖配置文件 scheduler.max_memory_gb (默认: 内存上限的80%%, 物理内存与cgroup上限中较小者)"
+    )
+    parser.add_argument(
+        "--max-io",
+        type=int,
+        help=f"(可选) 同时运行的I/O密集任务 (S1/S2/整理HiC输入) 数。覆盖配置文件 scheduler.max_io_tasks "
+             f"(默认: {DEFAULT_MAX_IO_TASKS})"
+    )
+    parser.add_argument(
+        "--log-dir",
+        help="(可选) 任务日志目录。覆盖配置文件 global_settings.log_dir"
+    )
+    parser.add_argument(
+        "--clean",
+        action="store_true",
+        help="(可选) 运行前按各组的 cleanup_patterns 删除之前的结果 (默认保留, 各阶段按清单增量运行)"
+    )
+    parser.add_argument(
+        "-n", "--dry-run",
+        action="store_true",
+        help="(可选) 只打印任务、资源分配和命令, 不运行"
+    )
+    args = parser.parse_args()
+
+    try:
+        parallel_config = load_yaml(args.config)
+    except (OSError, yaml.YAMLError) as e:
+        print(f"错误: 无法读取并行配置文件 {args.config}: {e}", file=sys.stderr)
+        sys.exit(1)
+    budget = build_budget(parallel_config.get('scheduler') or {}, args)
+
+    try:
+        tasks, log_dir = build_tasks(parallel_config, budget, args.groups, args.log_dir)
+    except (OSError, KeyError, yaml.YAMLError) as e:
+        print(f"错误: 无法读取组配置: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not tasks:
+        print("错误: 没有需要运行的任务 (没有启用的组)", file=sys.stderr)
+        sys.exit(1)
+
+    print("=== S1S2HiC 多组调度开始 ===")
+    print(f"配置文件: {args.config}")
+    print(f"处理时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print_plan(tasks, budget)
+    print("=" * 60)
+    if args.dry_run:
+        return
+
+    for task in tasks:
+        if not task.work_dir.is_dir():
+            print(f"错误: {task.group_id} 的工作目录不存在: {task.work_dir}", file=sys.stderr)
+            sys.exit(1)
+    if args.clean:
+        clean_group_outputs(parallel_config, args.groups)
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    # SIGTERM与Ctrl+C相同: 终止所有运行中任务的进程组后退出
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    scheduler = TaskScheduler(tasks, budget)
+    try:
+        success = scheduler.run()
+    except KeyboardInterrupt:
+        sys.exit(1)
+
+    print("=" * 60)
+    print(f"总用时: {scheduler.elapsed()}")
+    write_timing_report(tasks, log_dir / f"scheduler_{datetime.now().strftime('%Y%m%d_%H%M%S')}.tsv")
+    status_counts = {}
+    for task in tasks:
+        status_counts[task.status] = status_counts.get(task.status, 0) + 1
+    print(f"任务状态: {', '.join(f'{status} {count}' for status, count in status_counts.items())}")
+    if success:
+        print("🎉 所有任务处理成功完成!")
+    else:
+        print("⚠️  部分任务失败，请检查日志文件")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,26 +2,103 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import concurrent.futures
+import contextlib
+import logging
+import multiprocessing
 import os
 import sys
 import glob
 import subprocess
+import tempfile
 from pathlib import Path
 from datetime import datetime
 
+from S1_Process_gen import S1Config, S1Scanner, parse_lines_option
+from S2_Split import (DEFAULT_MIN_LENGTH, DEFAULT_SEPARATOR1, DEFAULT_SEPARATOR2, PairedSplitter, S2Config,
+                      add_separator_pair_arguments, get_default_jobs, init_split_worker, parse_separator_pair,
+                      run_paired_split)
+from stage_metrics import (DEFAULT_METRICS_DIR, FILE_STATUS_FAILED, FileMetrics, StageMetrics, get_file_size,
+                           load_metrics_file, load_stage_metrics, record_stage, write_stage_metrics_report)
+from stage_logs import (DEFAULT_LOG_DIR, LineLogWriter, get_log_path, open_stage_log, run_streamed,
+                        start_queue_logging)
+from stage_profiler import (add_profile_arguments, build_profile_args, get_profile_env, profile_options_from_args,
+                            profile_stage)
+
 # --- Default Values ---
 DEFAULT_INPUT_PATTERN = "*gz"
 DEFAULT_S1_OUTPUT_DIR = "S1_Matched"
 DEFAULT_S2_OUTPUT_DIR = "S2_Split"
 DEFAULT_SEQUENCE_DESCRIPTION = "S1S2串联处理"
 DEFAULT_LINES_TO_PROCESS = 100000
+STAGE_EXECUTION_IN_PROCESS = "in-process"  # S1/S2在本进程(及进程池)中直接调用, 结果以数据对象返回
+STAGE_EXECUTION_SUBPROCESS = "subprocess"  # 每个阶段/文件启动 S1_Process_gen.py / S2_Split.py 子进程
+STAGE_EXECUTION_MODES = (STAGE_EXECUTION_IN_PROCESS, STAGE_EXECUTION_SUBPROCESS)
+DEFAULT_STAGE_EXECUTION = STAGE_EXECUTION_IN_PROCESS
+
+def print_output_tail(output_tail):
+    """
+    失败时打印子进程(或S2工作进程)输出的最后若干行, 完整输出见阶段日志
+    """
+    if output_tail:
+        print(f"错误输出 (最后 {len(output_tail.splitlines())} 行):", file=sys.stderr)
+        print(output_tail, file=sys.stderr)
 
-def run_s1_process(patterns, input_pattern, s1_output_dir, description, lines_to_process, jobs):
+def run_s1_in_process(patterns, input_pattern, s1_output_dir, description, lines_to_process, jobs, stage_results,
+                      stage_log, metrics):
+    """
+    在本进程中通过 S1Scanner 运行S1, 结果 (S1Result) 存入 stage_results['S1'], 各文件的指标加入metrics;
+    本进程的输出逐行写入S1日志
+    """
+    try:
+        scanner = S1Scanner(S1Config(
+            pattern_sets=[(description, patterns, s1_output_dir)],
+            lines_to_process=parse_lines_option(lines_to_process),
+            jobs=jobs,
+            write_matching_reads=True
+        ))
+    except ValueError as e:
+        print(f"S1处理失败: {e}", file=sys.stderr)
+        return False
+    
+    input_files = glob.glob(input_pattern)
+    if not input_files:
+        print(f"警告: 未找到匹配模式 '{input_pattern}' 的文件。", file=sys.stderr)
+    print(f"S1进程内运行: {len(input_files)} 个输入文件")
+    
+    # 本进程的输出写入S1日志; S1进程池工作进程的输出经队列交给本进程写入 (worker_log)
+    stderr_writer = LineLogWriter(stage_log, logging.WARNING)
+    with contextlib.redirect_stdout(LineLogWriter(stage_log)), contextlib.redirect_stderr(stderr_writer):
+        s1_result = scanner.run(input_files, worker_log=stage_log)
+        tsv_path = scanner.default_tsv_path()
+        tsv_path.parent.mkdir(parents=True, exist_ok=True)
+        s1_result.write_tsv(tsv_path, echo=True)
+    stderr_writer.flush()
+    stage_results['S1'] = s1_result
+    metrics.files.extend(s1_result.file_metrics)
+    
+    print("S1处理成功完成!")
+    if s1_result.failed_files:
+        print(f"警告: S1处理失败的文件: {', '.join(s1_result.failed_files)}", file=sys.stderr)
+    return True
+
+def run_s1_process(patterns, input_pattern, s1_output_dir, description, lines_to_process, jobs,
+                   stage_execution=DEFAULT_STAGE_EXECUTION, stage_results=None, stage_log=None, metrics=None):
     """
     运行S1处理步骤
+    stage_execution为 'in-process' 时在本进程中调用S1Scanner, 'subprocess' 时启动 S1_Process_gen.py
+    S1的输出逐行写入stage_log (默认 pipeline_logs/S1.log), 各输入文件的指标加入metrics
     """
     print(f"\n=== 第一步: 运行S1序列匹配处理 ===")
     
+    stage_log = stage_log or open_stage_log("S1")
+    print(f"S1日志: {get_log_path(stage_log)}")
+    metrics = metrics if metrics is not None else StageMetrics("S1")
+    
+    if stage_execution != STAGE_EXECUTION_SUBPROCESS:
+        return run_s1_in_process(patterns, input_pattern, s1_output_dir, description, lines_to_process, jobs,
+                                 stage_results if stage_results is not None else {}, stage_log, metrics)
+    
     s1_script = Path(__file__).parent / "S1_Process_gen.py"
     if not s1_script.exists():
         print(f"错误: 找不到S1脚本: {s1_script}", file=sys.stderr)
@@ -41,30 +118,66 @@ def run_s1_process(patterns, input_pattern, s1_output_dir, description, lines_to
     if jobs:
         s1_cmd.extend(["-j", str(jobs)])
     
-    print(f"执行命令: {' '.join(s1_cmd)}")
+    s1_cmd.extend(build_profile_args())
     
+    with tempfile.TemporaryDirectory(prefix="S1_metrics_") as metrics_temp_dir:
+        metrics_file = Path(metrics_temp_dir) / "S1.json"
+        s1_cmd.extend(["--metrics-file", str(metrics_file)])
+        stage_log.info(f"执行命令: {' '.join(s1_cmd)}")
+        
+        try:
+            run_streamed(s1_cmd, stage_log)
+        except subprocess.CalledProcessError as e:
+            print(f"S1处理失败: {e}", file=sys.stderr)
+            print_output_tail(e.stderr or e.output)
+            return False
+        subprocess_metrics = load_metrics_file(metrics_file)
+        if subprocess_metrics is not None:
+            metrics.files.extend(subprocess_metrics.files)
+    print("S1处理成功完成!")
+    return True
+
+def run_s2_file(s2_cmd, stage_log, prefix):
+    """
+    运行单个文件的S2命令, 输出逐行写入S2日志 (行首带prefix, 并发文件的输出可区分)
+    返回: (是否成功, 最后若干行输出, 错误信息)
+    """
     try:
-        result = subprocess.run(s1_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        print("S1处理成功完成!")
-        print("S1输出:")
-        print(result.stdout)
-        if result.stderr:
-            print("S1警告/信息:")
-            print(result.stderr)
-        return True
+        run_streamed(s2_cmd, stage_log, prefix)
+        return True, "", None
     except subprocess.CalledProcessError as e:
-        print(f"S1处理失败: {e}", file=sys.stderr)
-        print(f"错误输出: {e.stderr}", file=sys.stderr)
-        return False
+        return False, e.stderr or e.output, e
+
+def load_s2_file_metrics(metrics_file, s1_file, success, error):
+    """
+    子进程模式下S2_Split.py经 --metrics-file 写出的文件指标; 失败或未写出时只记录状态
+    """
+    if success:
+        subprocess_metrics = load_metrics_file(metrics_file)
+        if subprocess_metrics is not None and subprocess_metrics.files:
+            return subprocess_metrics.files[0]
+        return FileMetrics(input_file=s1_file, bytes_in=get_file_size(s1_file))
+    return FileMetrics(input_file=s1_file, status=FILE_STATUS_FAILED, bytes_in=get_file_size(s1_file),
+                       error=str(error))
 
-def run_s2_split(s1_output_dir, s2_output_dir, sep1, sep2, min_length, r1_only=True):
+def run_s2_split(s1_output_dir, s2_output_dir, sep1, sep2, min_length, r1_only=True, jobs=None,
+                 separator_pairs=None, pair_output=None, stage_execution=DEFAULT_STAGE_EXECUTION, stage_results=None,
+                 stage_log=None, metrics=None):
     """
-    运行S2分割步骤
+    运行S2分割步骤, 各文件在最多jobs个并行任务中处理 (默认按本进程可用的CPU和内存确定)
+    separator_pairs为 "NAME=SEP1,SEP2" 列表时, 一次扫描同时尝试所有分隔符对
+    stage_execution为 'in-process' 时各文件在进程池中直接调用 PairedSplitter, 结果 (S2Result) 存入 stage_results['S2']
+    各文件的输出逐行写入stage_log (默认 pipeline_logs/S2.log), 行首为 [文件名]; 各文件的指标加入metrics
     """
     print(f"\n=== 第二步: 运行S2序列分割处理 ===")
     
+    stage_log = stage_log or open_stage_log("S2")
+    print(f"S2日志: {get_log_path(stage_log)}")
+    metrics = metrics if metrics is not None else StageMetrics("S2")
+    
+    in_process = stage_execution != STAGE_EXECUTION_SUBPROCESS
     s2_script = Path(__file__).parent / "S2_Split.py"
-    if not s2_script.exists():
+    if not in_process and not s2_script.exists():
         print(f"错误: 找不到S2脚本: {s2_script}", file=sys.stderr)
         return False
     
@@ -78,40 +191,103 @@ def run_s2_split(s1_output_dir, s2_output_dir, sep1, sep2, min_length, r1_only=T
     
     success_count = 0
     failed_files = []
+    split_results = []
     
-    for s1_file in s1_files:
-        file_name = Path(s1_file).name
-        print(f"\n处理文件: {file_name}")
-        
-        # 为每个文件创建独立的输出目录
-        file_base_name = file_name.replace('.gz', '').replace('.fq', '').replace('.fastq', '')
-        file_output_dir = Path(s2_output_dir) / file_base_name
-        
-        # 构建S2命令
-        s2_cmd = [
-            sys.executable, str(s2_script),
-            "-i", s1_file,
-            "-o", str(file_output_dir),
-            "--sep1", sep1,
-            "--sep2", sep2,
-            "--min-length", str(min_length)
-        ]
-        
-        print(f"执行命令: {' '.join(s2_cmd)}")
-        
+    # 各文件的S2相互独立, 在有界线程池中并发运行 (实际计算在S2子进程中);
+    # 进程内模式则直接使用进程池
+    s2_jobs = max(1, min(jobs or get_default_jobs(), len(s1_files)))
+    print(f"S2并行任务数: {s2_jobs}")
+    
+    log_listener = None
+    if in_process:
         try:
-            result = subprocess.run(s2_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-            print(f"✓ {file_name} 处理成功!")
-            print("S2输出:")
-            print(result.stdout)
-            if result.stderr:
-                print("S2警告/信息:")
-                print(result.stderr)
-            success_count += 1
-        except subprocess.CalledProcessError as e:
-            print(f"✗ {file_name} 处理失败: {e}", file=sys.stderr)
-            print(f"错误输出: {e.stderr}", file=sys.stderr)
-            failed_files.append(file_name)
+            stage_config = S2Config(
+                separator1=sep1.upper(),
+                separator2=sep2.upper(),
+                separator_pairs=[parse_separator_pair(separator_pair) for separator_pair in separator_pairs or []],
+                min_length=min_length,
+                pair_output=pair_output
+            )
+            # 提前检查分隔符配置, 避免每个文件各自失败
+            PairedSplitter(stage_config)
+        except ValueError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return False
+        # forkserver启动的工作进程不继承本进程的线程 (日志队列) 和打开的文件
+        mp_context = None
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context('forkserver')
+        # 工作进程的输出经队列交给本进程写入S2日志
+        log_queue, log_listener = start_queue_logging(stage_log, mp_context)
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=s2_jobs, mp_context=mp_context,
+                                                          initializer=init_split_worker,
+                                                          initargs=(log_queue, get_profile_env()))
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=s2_jobs)
+    
+    with contextlib.ExitStack() as stack:
+        if log_listener is not None:
+            stack.callback(log_listener.stop)
+        # 子进程模式下各文件的指标经 --metrics-file 写入临时目录
+        metrics_temp_dir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="S2_metrics_")))
+        stack.enter_context(executor)
+        future_to_file = {}
+        for s1_file in s1_files:
+            file_name = Path(s1_file).name
+            
+            # 为每个文件创建独立的输出目录
+            file_base_name = file_name.replace('.gz', '').replace('.fq', '').replace('.fastq', '')
+            file_output_dir = Path(s2_output_dir) / file_base_name
+            
+            print(f"提交文件: {file_name}")
+            if in_process:
+                future_to_file[executor.submit(run_paired_split, (stage_config, s1_file, str(file_output_dir)))] = \
+                    (s1_file, None)
+                continue
+            
+            # 构建S2命令
+            s2_cmd = [
+                sys.executable, str(s2_script),
+                "-i", s1_file,
+                "-o", str(file_output_dir),
+                "--sep1", sep1,
+                "--sep2", sep2,
+                "--min-length", str(min_length)
+            ]
+            for separator_pair in separator_pairs or []:
+                s2_cmd.extend(["--separator-pair", separator_pair])
+            if pair_output:
+                s2_cmd.extend(["--pair-output", pair_output])
+            s2_cmd.extend(build_profile_args())
+            metrics_file = metrics_temp_dir / f"{len(future_to_file)}.json"
+            s2_cmd.extend(["--metrics-file", str(metrics_file)])
+            
+            stage_log.info(f"执行命令: {' '.join(s2_cmd)}")
+            future_to_file[executor.submit(run_s2_file, s2_cmd, stage_log, f"[{file_name}] ")] = (s1_file, metrics_file)
+        
+        # 各文件的输出已逐行写入日志 (行首为文件名), 完成时只报告结果, 失败时附上最后若干行输出
+        for future in concurrent.futures.as_completed(future_to_file):
+            s1_file, metrics_file = future_to_file[future]
+            file_name = Path(s1_file).name
+            if in_process:
+                split_result, output_tail = future.result()
+                success, error = split_result.success, split_result.error
+                split_results.append(split_result)
+                metrics.add_file(split_result.file_metrics())
+            else:
+                success, output_tail, error = future.result()
+                metrics.add_file(load_s2_file_metrics(metrics_file, s1_file, success, error))
+            if success:
+                stage_log.info(f"✓ {file_name} 处理成功!")
+                success_count += 1
+            else:
+                stage_log.error(f"✗ {file_name} 处理失败: {error}")
+                print_output_tail(output_tail)
+                failed_files.append(file_name)
+    
+    if stage_results is not None and in_process:
+        stage_results['S2'] = sorted(split_results, key=lambda split_result: split_result.input_file)
+    metrics.files.sort(key=lambda file_metrics: file_metrics.input_file)
     
     print(f"\n=== S2处理完成统计 ===")
     print(f"成功处理: {success_count}/{len(s1_files)} 个文件")
@@ -122,9 +298,9 @@ def run_s2_split(s1_output_dir, s2_output_dir, sep1, sep2, min_length, r1_only=T
     
     return True
 
-def generate_summary_report(s1_output_dir, s2_output_dir, patterns, description):
+def generate_summary_report(s1_output_dir, s2_output_dir, patterns, description, metrics_dir):
     """
-    生成处理总结报告
+    生成处理总结报告, S1/S2的统计由 <metrics_dir>/<阶段>.json 指标记录生成
     """
     print(f"\n=== 生成处理总结报告 ===")
     
@@ -139,27 +315,17 @@ def generate_summary_report(s1_output_dir, s2_output_dir, patterns, description)
             f.write(f"查询序列: {patterns}\n")
             f.write(f"序列描述: {description}\n")
             f.write(f"S1输出目录: {s1_output_dir}\n")
-            f.write(f"S2输出目录: {s2_output_dir}\n\n")
+            f.write(f"S2输出目录: {s2_output_dir}\n")
+            f.write(f"阶段指标目录: {metrics_dir}\n\n")
             
-            # 统计S1输出文件
-            s1_files = glob.glob(os.path.join(s1_output_dir, "*.gz"))
-            f.write(f"S1输出文件数: {len(s1_files)}\n")
-            for s1_file in s1_files:
-                f.write(f"  - {Path(s1_file).name}\n")
+            for stage_name in ("S1", "S2"):
+                stage_metrics = load_stage_metrics(metrics_dir, stage_name)
+                if stage_metrics is None:
+                    f.write(f"{stage_name} 阶段: 无指标记录 (未运行或已跳过)\n\n")
+                    continue
+                write_stage_metrics_report(f, stage_metrics)
             
-            f.write("\n")
-            
-            # 统计S2输出目录
-            s2_dirs = [d for d in Path(s2_output_dir).iterdir() if d.is_dir()]
-            f.write(f"S2输出目录数: {len(s2_dirs)}\n")
-            for s2_dir in s2_dirs:
-                f.write(f"  - {s2_dir.name}/\n")
-                # 列出每个目录中的文件
-                s2_files = list(s2_dir.glob("*.gz"))
-                for s2_file in s2_files:
-                    f.write(f"    * {s2_file.name}\n")
-            
-            f.write("\n处理流程:\n")
+            f.write("处理流程:\n")
             f.write("1. S1_Process_gen.py: 从原始文件中筛选匹配指定序列模式的reads\n")
             f.write("2. S2_Split.py: 将匹配的reads根据分隔符分割为R1和R2配对文件\n")
             
@@ -202,26 +368,27 @@ def main():
         "-j", "--jobs",
         type=int,
         default=None,
-        help="(可选) S1处理：并行处理的最大任务数"
+        help="(可选) S1和S2处理：并行处理的最大任务数。默认CPU核心数"
     )
     
     # S2相关参数
     parser.add_argument(
         "--sep1",
-        default="GATCATGTCGGAACTGTTGCTTGTCCGACTGATC",
+        default=DEFAULT_SEPARATOR1,
         help="(可选) S2处理：第一个分隔符序列"
     )
     parser.add_argument(
         "--sep2",
-        default="AGATCGGAAGA", 
+        default=DEFAULT_SEPARATOR2,
         help="(可选) S2处理：第二个分隔符序列"
     )
     parser.add_argument(
         "--min-length",
         type=int,
-        default=10,
-        help="(可选) S2处理：分割后序列的最小长度。默认: 10"
+        default=DEFAULT_MIN_LENGTH,
+        help=f"(可选) S2处理：分割后序列的最小长度。默认: {DEFAULT_MIN_LENGTH}"
     )
+    add_separator_pair_arguments(parser)
     
     # 输出目录参数
     parser.add_argument(
@@ -241,8 +408,29 @@ def main():
         action="store_true",
         help="(可选) 跳过S1步骤，直接使用现有的S1输出目录进行S2处理"
     )
+    parser.add_argument(
+        "--log-dir",
+        default=DEFAULT_LOG_DIR,
+        help=f"(可选) 各阶段日志目录, S1/S2的输出逐行写入按大小轮转的 S1.log / S2.log。默认: '{DEFAULT_LOG_DIR}'"
+    )
+    parser.add_argument(
+        "--stage-execution",
+        choices=STAGE_EXECUTION_MODES,
+        default=DEFAULT_STAGE_EXECUTION,
+        help=f"(可选) S1/S2的运行方式: {STAGE_EXECUTION_IN_PROCESS} 在本进程(进程池)中直接调用, 统计写入报告;\n"
+             f"{STAGE_EXECUTION_SUBPROCESS} 启动独立的脚本子进程。默认: {DEFAULT_STAGE_EXECUTION}"
+    )
+    parser.add_argument(
+        "--metrics-dir",
+        default=DEFAULT_METRICS_DIR,
+        help=f"(可选) 阶段指标目录: 每个阶段写出 <阶段>.json (各文件的reads数、字节数、耗时、吞吐量等),\n"
+             f"并追加到 metrics_history.jsonl; 总结报告由这些记录生成。默认: '{DEFAULT_METRICS_DIR}'"
+    )
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
+    profile_options = profile_options_from_args(args)
+    metrics_dir = Path(args.metrics_dir).absolute()
     
     print("S1S2 串联处理流程开始")
     print("=" * 50)
@@ -253,17 +441,24 @@ def main():
     print(f"S2输出目录: {args.s2_output_dir}")
     
     success = True
+    stage_results = {}
     
     # 第一步：运行S1处理（除非跳过）
     if not args.skip_s1:
-        success = run_s1_process(
-            args.patterns,
-            args.input_pattern, 
-            args.s1_output_dir,
-            args.description,
-            args.lines,
-            args.jobs
-        )
+        with profile_stage(profile_options, "S1"), record_stage(metrics_dir, "S1", args.description) as stage_metrics:
+            success = run_s1_process(
+                args.patterns,
+                args.input_pattern, 
+                args.s1_output_dir,
+                args.description,
+                args.lines,
+                args.jobs,
+                args.stage_execution,
+                stage_results,
+                open_stage_log("S1", args.log_dir),
+                stage_metrics
+            )
+            stage_metrics.success = success
         
         if not success:
             print("S1处理失败，终止流程", file=sys.stderr)
@@ -275,13 +470,22 @@ def main():
             sys.exit(1)
     
     # 第二步：运行S2处理
-    success = run_s2_split(
-        args.s1_output_dir,
-        args.s2_output_dir,
-        args.sep1,
-        args.sep2,
-        args.min_length
-    )
+    with profile_stage(profile_options, "S2"), record_stage(metrics_dir, "S2", args.description) as stage_metrics:
+        success = run_s2_split(
+            args.s1_output_dir,
+            args.s2_output_dir,
+            args.sep1,
+            args.sep2,
+            args.min_length,
+            jobs=args.jobs,
+            separator_pairs=args.separator_pair,
+            pair_output=args.pair_output,
+            stage_execution=args.stage_execution,
+            stage_results=stage_results,
+            stage_log=open_stage_log("S2", args.log_dir),
+            metrics=stage_metrics
+        )
+        stage_metrics.success = success
     
     if not success:
         print("S2处理失败", file=sys.stderr)
@@ -292,7 +496,8 @@ def main():
         args.s1_output_dir,
         args.s2_output_dir, 
         args.patterns,
-        args.description
+        args.description,
+        metrics_dir
     )
     
     print("\n" + "=" * 50)
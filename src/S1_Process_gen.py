@@ -2,14 +2,34 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import gzip
 import glob
 import os
 import sys
 from datetime import datetime
+import collections
 import concurrent.futures
+import contextlib
+import io
+import logging
+import multiprocessing
+from dataclasses import dataclass, field
 from pathlib import Path
-import shutil # For nproc equivalent check
+from typing import Optional
+
+from sequence_matchers import (MATCH_ENGINES, DEFAULT_MATCH_ENGINE, MATCH_ENGINE_AHO_CORASICK, MATCH_ENGINE_IN,
+                               MATCH_ENGINE_NUMPY, build_matcher, numpy_available, pyahocorasick_available)
+from gzip_codec import (add_gzip_arguments, default_gzip_options, describe_gzip_options, gzip_options_from_args,
+                        open_gzip_reader, open_gzip_writer)
+from resource_probe import DEFAULT_MEMORY_FRACTION, get_cpu_limit, probe_resources
+from stage_metrics import (FILE_STATUS_DONE, FILE_STATUS_FAILED, FileMetrics, ResourceTimer, StageMetrics,
+                           get_file_size, get_total_size, write_metrics_file)
+from stage_logs import LineLogWriter, get_worker_logger, init_worker_logging, start_queue_logging
+from stage_profiler import (add_profile_arguments, get_profile_env, init_worker_profiling, profile_options_from_args,
+                            profile_stage, profiled_worker)
+from S2_Split import (PairedSplitWriter, S2Config, S2Result, add_separator_pair_arguments,
+                     add_separator_tolerance_arguments,
+                     get_split_base_name, get_split_sample_dir_name, make_split_settings,
+                     parse_separator_pair, print_split_summary, split_record_batch)
 
 # --- Default Values ---
 DEFAULT_INPUT_PATTERN = "*gz"
@@ -18,163 +38,1044 @@ DEFAULT_OUTPUT_DIR_FASTQ = "Outfastq"  # Default for matched FASTQ records
 DEFAULT_UNMATCHED_SUBDIR = "Unmap"   # Subdirectory for unmatched reads
 DEFAULT_LINES_TO_PROCESS = 100000
 DEFAULT_SEQUENCE_DESCRIPTION = "未说明序列名字"
-DEFAULT_MAX_JOBS_FALLBACK = 4
+DEFAULT_MAX_BUFFER_MB = 64 # Per-worker memory ceiling for buffered output records
+MIN_MAX_BUFFER_MB = 8        # Lower bound when the buffer is shrunk to fit the available memory
+WORKER_OVERHEAD_MB = 64      # Estimated per-worker memory besides the output buffer (gzip streams, batches)
+DEFAULT_CHUNK_READS = 0      # Records per batch for intra-file parallelism; 0 disables it
+DEFAULT_SEPARATOR1 = "GATCATGTCGGAACTGTTGCTTGTCCGACTGATC" # Fused S2 split, same defaults as S2_Split.py
+DEFAULT_SEPARATOR2 = "AGATCGGAAGA"
+DEFAULT_SPLIT_MIN_LENGTH = 10
+DEFAULT_BLOCK_BYTES = 4 * 1024 * 1024 # Decompressed bytes per block on the numpy count-only path
+
+# FASTQ is pure ASCII, so records are handled as bytes end to end (no text decoding).
+COMPLEMENT_MAP_STR = str.maketrans("ATCGatcg", "TAGCTAGC")
+COMPLEMENT_MAP_BYTES = bytes.maketrans(b"ATCGatcg", b"TAGCTAGC")
+
+# (matchers, matcher_index_per_set) of a chunked-mode pool worker, built once by init_scan_worker
+_worker_matchers = None
 
 # --- Helper Functions ---
 
 def get_reverse_complement(dna_sequence):
     """
     Calculates the reverse complement of a DNA sequence.
-    Handles both upper and lower case.
+    Handles both upper and lower case. Accepts str or bytes and returns the same type.
     """
-    complement_map = str.maketrans("ATCGatcg", "TAGCTAGC")
-    complemented_seq = dna_sequence.translate(complement_map)
+    if isinstance(dna_sequence, bytes):
+        complemented_seq = dna_sequence.translate(COMPLEMENT_MAP_BYTES)
+    else:
+        complemented_seq = dna_sequence.translate(COMPLEMENT_MAP_STR)
     return complemented_seq[::-1]
 
 def get_cpu_count():
     """
-    Tries to get the number of CPU cores.
-    Falls back to DEFAULT_MAX_JOBS_FALLBACK if nproc is not available or fails.
+    Returns the number of CPUs this process may actually use: the CPU affinity
+    mask, capped by the cgroup CPU quota (see resource_probe).
     """
-    nproc_path = shutil.which("nproc")
-    if nproc_path:
-        try:
-            import subprocess
-            result = subprocess.run([nproc_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
-            return int(result.stdout.strip())
-        except Exception:
-            return DEFAULT_MAX_JOBS_FALLBACK
-    return DEFAULT_MAX_JOBS_FALLBACK
+    return get_cpu_limit()
+
+def iter_fastq_records(handle, max_lines=None):
+    """
+    Lazily yields complete 4-line FASTQ records from an open file handle.
+    Only the first max_lines lines are considered when max_lines is given;
+    a trailing incomplete record is dropped, matching the line-based counting
+    (total reads = lines scanned // 4).
+    """
+    record_lines = []
+    for line_index, line in enumerate(handle):
+        if max_lines is not None and line_index >= max_lines:
+            break
+        record_lines.append(line)
+        if len(record_lines) == 4:
+            yield record_lines
+            record_lines = []
+
+def iter_record_blocks(handle, max_lines=None, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Block-wise counterpart of iter_fastq_records for the numpy count-only path.
+    Reads the decompressed stream in blocks of block_bytes and yields
+    (buffer, newlines, record_count): the block as a uint8 array, the positions
+    of its newlines and the number of complete records it starts with. Lines of
+    an incomplete record are carried over to the next block; max_lines and the
+    trailing incomplete record are handled exactly as in iter_fastq_records.
+    """
+    import numpy # Optional dependency, only needed for the numpy match engine
+    pending = b""
+    lines_left = max_lines
+    while lines_left is None or lines_left >= 4:
+        data = handle.read(block_bytes)
+        block = pending + data
+        if not data:
+            if not block:
+                break
+            if not block.endswith(b"\n"):
+                block += b"\n" # A final line without newline still counts as a line
+        buffer = numpy.frombuffer(block, dtype=numpy.uint8)
+        newlines = numpy.flatnonzero(buffer == ord("\n"))
+        line_count = len(newlines) if lines_left is None else min(len(newlines), lines_left)
+        record_count = line_count // 4
+        if record_count:
+            yield buffer, newlines, record_count
+            if lines_left is not None:
+                lines_left -= 4 * record_count
+        if not data:
+            break
+        pending = block[newlines[4 * record_count - 1] + 1:] if record_count else block
+
+def count_records_vectorized(handle, max_lines, matchers, matcher_index_per_set, counts_per_set):
+    """
+    Count-only matching over whole blocks of reads with NumpyBatchMatcher.match_block.
+    Adds the per-set [fwd, rc] counts into counts_per_set and returns the number
+    of reads processed; results equal the per-read loop of process_file_worker.
+    """
+    total_reads_processed = 0
+    for buffer, newlines, record_count in iter_record_blocks(handle, max_lines):
+        total_reads_processed += record_count
+        matches = [matcher.match_block(buffer, newlines, record_count) for matcher in matchers]
+        for set_index, counts in enumerate(counts_per_set):
+            match_fwd, match_rc = matches[matcher_index_per_set[set_index]]
+            counts[0] += int(match_fwd.sum())
+            counts[1] += int(match_rc.sum())
+    return total_reads_processed
+
+class BufferedRecordWriter:
+    """
+    Collects FASTQ records (bytes) in memory and flushes them to a gzip file once the
+    buffered size exceeds max_buffer_bytes, so memory stays bounded regardless
+    of input size. The output file is only opened (in append mode) on the first
+    flush, so no file is created when no record is ever written.
+    gzip_options is the gzip_codec options dict (backend, threads, compresslevel, bgzf).
+    """
+    def __init__(self, output_path, max_buffer_bytes, gzip_options=None):
+        self.output_path = output_path
+        self.gzip_options = gzip_options or {}
+        self.max_buffer_bytes = max(1, max_buffer_bytes)
+        self.buffered_records = []
+        self.buffered_bytes = 0
+        self.writer = None
+        self.failed = False
+
+    def add(self, record_bytes):
+        self.buffered_records.append(record_bytes)
+        self.buffered_bytes += len(record_bytes)
+        if self.buffered_bytes >= self.max_buffer_bytes:
+            self.flush()
 
+    def flush(self):
+        if not self.buffered_records:
+            return
+        if not self.failed:
+            try:
+                if self.writer is None:
+                    self.writer = open_gzip_writer(self.output_path, 'ab', **self.gzip_options) # 'ab' for binary append
+                self.writer.write(b"".join(self.buffered_records))
+            except Exception as e:
+                print(f"警告: 写入FASTQ记录到 '{self.output_path}' 时发生错误: {e}", file=sys.stderr)
+                self.failed = True
+        self.buffered_records = []
+        self.buffered_bytes = 0
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except Exception as e:
+                print(f"警告: 关闭FASTQ输出文件 '{self.output_path}' 时发生错误: {e}", file=sys.stderr)
+            self.writer = None
+
+def get_sample_name(gz_file_path):
+    """
+    Derives the sample name from an input path by dropping .gz and .fq/.fastq.
+    """
+    sample_name = Path(gz_file_path).name
+    if sample_name.endswith(".gz"):
+        sample_name = sample_name[:-3]
+    if sample_name.endswith(".fq"):
+        sample_name = sample_name[:-3]
+    elif sample_name.endswith(".fastq"):
+        sample_name = sample_name[:-6]
+    return sample_name
+
+def build_result_tuple(sample_name, sequence_description_str, patterns_string,
+                       all_fwd_line_count, all_rc_line_count, total_reads_processed):
+    """
+    Builds the TSV result row, adding the match percentages.
+    """
+    fwd_percentage_str = "N/A"
+    rc_percentage_str = "N/A"
+
+    if total_reads_processed > 0:
+        # Percentages are based on reads matching the criteria, not lines.
+        fwd_percentage = (all_fwd_line_count / total_reads_processed) * 100
+        rc_percentage = (all_rc_line_count / total_reads_processed) * 100
+        fwd_percentage_str = f"{fwd_percentage:.2f}%"
+        rc_percentage_str = f"{rc_percentage:.2f}%"
+
+    return (sample_name, sequence_description_str, patterns_string,
+            all_fwd_line_count, all_rc_line_count, total_reads_processed,
+            fwd_percentage_str, rc_percentage_str)
+
+def get_max_lines(effective_lines_to_process, process_all_lines_flag):
+    """
+    Returns the per-file line limit, or None when all lines are processed.
+    """
+    if not process_all_lines_flag and effective_lines_to_process is not None:
+        return effective_lines_to_process
+    return None
+
+def open_record_writers(base_input_filename, pattern_sets, max_buffer_bytes, gzip_options):
+    """
+    Creates one (matched_writer, unmatched_writer) pair per pattern set for one
+    input file. Either writer is None when the corresponding output is disabled.
+    The memory ceiling is shared between all writers that are actually in use.
+    """
+    active_writer_count = sum(int(bool(pattern_set['write_matching'])) + int(bool(pattern_set['write_unmatched']))
+                              for pattern_set in pattern_sets)
+    per_writer_buffer_bytes = max_buffer_bytes // max(1, active_writer_count)
+
+    writer_pairs = []
+    for pattern_set in pattern_sets:
+        matched_writer = None
+        unmatched_writer = None
+        if pattern_set['write_matching']:
+            matched_writer = BufferedRecordWriter(
+                Path(pattern_set['out_dir']) / base_input_filename, per_writer_buffer_bytes, gzip_options) # Matched reads go to .gz
+        if pattern_set['write_unmatched']:
+            # Unmatched reads also go to a .gz file inside the unmap directory
+            unmatched_writer = BufferedRecordWriter(
+                Path(pattern_set['unmap_dir']) / base_input_filename, per_writer_buffer_bytes, gzip_options)
+        writer_pairs.append((matched_writer, unmatched_writer))
+    return writer_pairs
+
+def close_record_writers(writer_pairs):
+    for matched_writer, unmatched_writer in writer_pairs:
+        for writer in (matched_writer, unmatched_writer):
+            if writer is not None:
+                writer.close()
+
+def build_pattern_set_matchers(match_options, pattern_sets):
+    """
+    Builds one matcher per distinct pattern list. Pattern sets with the same
+    patterns (e.g. several groups searching the SeqA linker) share one matcher,
+    so each read is matched once per distinct list.
+    match_options: {'engine', 'max_mismatches', 'max_edits'}; a nonzero error
+    budget selects the error-tolerant matcher.
+    Returns:
+        tuple: (matchers, matcher_index_per_set)
+    """
+    matchers = []
+    matcher_index_per_set = []
+    matcher_index_by_patterns = {}
+    for pattern_set in pattern_sets:
+        key = tuple(pattern_set['forward_patterns'])
+        if key not in matcher_index_by_patterns:
+            matcher_index_by_patterns[key] = len(matchers)
+            matchers.append(build_matcher(match_options['engine'], pattern_set['forward_patterns'],
+                                          pattern_set['rc_patterns'], match_options['max_mismatches'],
+                                          match_options['max_edits']))
+        matcher_index_per_set.append(matcher_index_by_patterns[key])
+    return matchers, matcher_index_per_set
+
+def open_split_writer(base_input_filename, split_options):
+    """
+    Creates the fused S2 writer for one input file. Outputs go to
+    <split output dir>/<sample dir>/<base>_R1/_R2/_discarded.fq.gz, the same
+    layout the pipeline produces when S2_Split.py runs on the matched file
+    (chunked _partNNNN_R1/_R2 files with a positive handoff_chunk_reads).
+    """
+    return PairedSplitWriter(
+        Path(split_options['output_dir']) / get_split_sample_dir_name(base_input_filename),
+        get_split_base_name(base_input_filename),
+        split_options['separator_pairs'], split_options['min_length'], split_options['gzip_options'],
+        split_options['combined'], split_options['handoff_chunk_reads'])
+
+def report_split_summary(gz_file_path, split_writer, malformed_count):
+    """
+    Prints the S2 statistics of a fused split to stderr in one write, so that
+    summaries of concurrent workers do not interleave (stdout carries the TSV).
+    """
+    summary = io.StringIO()
+    with contextlib.redirect_stdout(summary):
+        print(f"\n=== S2分割: {gz_file_path} ===", end="")
+        print_split_summary(split_writer)
+    if malformed_count:
+        summary.write(f"警告: 跳过 {malformed_count} 条格式错误的记录\n")
+    sys.stderr.write(summary.getvalue())
+
+@dataclass
+class S1Count:
+    """
+    Match counts of one (sample, pattern set) pair; as_row() gives its TSV row.
+    """
+    sample_name: str
+    description: str
+    patterns: str
+    forward_reads: int
+    rc_reads: int
+    total_reads: int
+
+    def as_row(self):
+        return build_result_tuple(self.sample_name, self.description, self.patterns,
+                                  self.forward_reads, self.rc_reads, self.total_reads)
+
+def build_result_counts(sample_name, pattern_sets, counts_per_set, total_reads_processed):
+    """
+    Builds one S1Count per pattern set from its [fwd_count, rc_count].
+    """
+    return [S1Count(sample_name, pattern_set['description'], pattern_set['patterns_string'],
+                    fwd_count, rc_count, total_reads_processed)
+            for pattern_set, (fwd_count, rc_count) in zip(pattern_sets, counts_per_set)]
+
+def build_file_metrics(input_file, counts, split_result=None, output_paths=(), timer=None, status=FILE_STATUS_DONE):
+    """
+    Builds the stage_metrics.FileMetrics of one S1 input: reads, input and
+    output bytes, per-set match counts and the fused split statistics.
+    timer is the stopped ResourceTimer of the processing (None for files
+    taken from a manifest, whose output bytes are not re-measured).
+    """
+    total_reads = counts[0].total_reads if counts else 0
+    details = {
+        'sample_name': counts[0].sample_name if counts else get_sample_name(input_file),
+        'pattern_sets': [{
+            'description': count.description,
+            'patterns': count.patterns,
+            'forward_reads': count.forward_reads,
+            'rc_reads': count.rc_reads,
+            'matched_percentage': max(count.forward_reads, count.rc_reads) / total_reads * 100 if total_reads else None
+        } for count in counts]
+    }
+    bytes_out = get_total_size(output_paths)
+    if split_result is not None:
+        details['split'] = split_result.split_details()
+        bytes_out += split_result.bytes_out
+    file_metrics = FileMetrics(input_file=str(input_file), status=status, reads=total_reads,
+                               bytes_in=get_file_size(input_file), bytes_out=bytes_out, details=details)
+    if timer is not None:
+        file_metrics.set_usage(timer)
+    return file_metrics
+
+def get_writer_output_paths(writer_pairs):
+    return [writer.output_path for pair in writer_pairs for writer in pair if writer is not None]
+
+@profiled_worker("S1_file_worker")
 def process_file_worker(args_tuple):
     """
     Worker function to process a single file.
+    Records are streamed from the input and matched/unmatched reads are written
+    out in bounded batches, so memory use does not grow with the input size.
+    The file is decompressed and parsed once for all pattern sets; each read is
+    routed to the outputs of every set it matches. Count-only runs with the
+    numpy engine (no FASTQ outputs, no fused split) are counted block-wise by
+    count_records_vectorized instead of read by read.
     Args:
         args_tuple (tuple): Contains (
             gz_file_path,
-            patterns_string,
-            forward_patterns_list,
-            rc_patterns_list,
+            pattern_sets,               # list of dicts, see make_pattern_set
             effective_lines_to_process, # int or None
             process_all_lines_flag,     # bool
-            sequence_description_str,
-            write_matching_reads_flag,  # bool
-            out_fastq_dir_path_str,     # string, path to the directory for matched output FASTQ files
-            write_unmatched_reads_flag, # bool
-            unmap_output_dir_path_str   # string, path to the directory for unmatched output FASTQ files
+            max_buffer_bytes,           # int, memory ceiling for buffered output records per worker
+            match_options,              # dict, {'engine': one of sequence_matchers.MATCH_ENGINES,
+                                        #        'max_mismatches': int, 'max_edits': int}
+            gzip_options,               # dict, gzip_codec options (backend, threads, compresslevel, bgzf)
+            split_options               # dict or None, fused S2 split of the first set's matched reads
+                                        # {'output_dir', 'separator_pairs', 'min_length', 'gzip_options', 'combined'}
         )
     Returns:
-        tuple: (sample_name, sequence_description, patterns_string,
-                all_fwd_line_count, all_rc_line_count, total_reads_processed,
-                fwd_percentage_str, rc_percentage_str)
+        tuple: (counts,        # list, one S1Count per pattern set
+                split_result,  # S2_Split.S2Result of the fused split, None without matched reads or split
+                file_metrics)  # stage_metrics.FileMetrics of this file (time, CPU and peak memory of the worker)
                or None if file processing failed.
     """
-    (gz_file_path, patterns_string, forward_patterns_list, rc_patterns_list,
-     effective_lines_to_process, process_all_lines_flag, sequence_description_str,
-     write_matching_reads_flag, out_fastq_dir_path_str,
-     write_unmatched_reads_flag, unmap_output_dir_path_str) = args_tuple
+    (gz_file_path, pattern_sets, effective_lines_to_process, process_all_lines_flag,
+     max_buffer_bytes, match_options, gzip_options, split_options) = args_tuple
+    timer = ResourceTimer()
 
     base_input_filename = Path(gz_file_path).name
-    sample_name = base_input_filename
-    if sample_name.endswith(".gz"):
-        sample_name = sample_name[:-3]
-    if sample_name.endswith(".fq"):
-        sample_name = sample_name[:-3]
-    elif sample_name.endswith(".fastq"):
-        sample_name = sample_name[:-6]
+    sample_name = get_sample_name(gz_file_path)
+    max_lines = get_max_lines(effective_lines_to_process, process_all_lines_flag)
+    matchers, matcher_index_per_set = build_pattern_set_matchers(match_options, pattern_sets)
+
+    writer_pairs = open_record_writers(base_input_filename, pattern_sets, max_buffer_bytes, gzip_options)
+    split_writer = None # Created on the first matched read, like the S1 matched output
+    split_error = None
+    split_malformed_count = 0
 
-    lines_scanned_content = []
+    total_reads_processed = 0
+    # Per set: [reads where all forward patterns co-occur, reads where all RC patterns co-occur]
+    counts_per_set = [[0, 0] for _ in pattern_sets]
+
+    count_only = split_options is None and all(writer is None for pair in writer_pairs for writer in pair)
+    vectorized = count_only and all(hasattr(matcher, 'match_block') for matcher in matchers)
+
+    # For counting, we check the sequence line of each read.
+    # A read matches if its sequence line contains ALL forward patterns OR ALL RC patterns.
+    # The counts are based on reads, not individual lines.
     try:
-        with gzip.open(gz_file_path, 'rt', errors='ignore') as f:
-            if not process_all_lines_flag and effective_lines_to_process is not None:
-                for i, line in enumerate(f):
-                    if i >= effective_lines_to_process:
-                        break
-                    lines_scanned_content.append(line)
+        with open_gzip_reader(gz_file_path, **gzip_options) as f:
+            if vectorized:
+                total_reads_processed = count_records_vectorized(f, max_lines, matchers, matcher_index_per_set,
+                                                                 counts_per_set)
             else:
-                lines_scanned_content = list(f)
+                for current_record_lines in iter_fastq_records(f, max_lines):
+                    total_reads_processed += 1
+                    sequence_line = current_record_lines[1] # Second line is the sequence
+                    matches = [matcher.match(sequence_line) for matcher in matchers]
+
+                    record_bytes = None
+                    for set_index, (matched_writer, unmatched_writer) in enumerate(writer_pairs):
+                        match_fwd, match_rc = matches[matcher_index_per_set[set_index]]
+                        counts = counts_per_set[set_index]
+                        if match_fwd: # Count as a forward match if all forward patterns are present
+                            counts[0] += 1
+                        if match_rc: # Count as an RC match if all RC patterns are present
+                            counts[1] += 1
+                        # Note: A read could match both fwd and rc criteria if patterns overlap; it's counted for both.
+
+                        if matched_writer is not None and (match_fwd or match_rc):
+                            record_bytes = record_bytes or b"".join(current_record_lines)
+                            matched_writer.add(record_bytes)
+                        elif unmatched_writer is not None and not (match_fwd or match_rc): # Only if it didn't match fwd/rc
+                            record_bytes = record_bytes or b"".join(current_record_lines)
+                            unmatched_writer.add(record_bytes)
+
+                    if split_options is not None and any(matches[matcher_index_per_set[0]]):
+                        if split_writer is None:
+                            split_writer = open_split_writer(base_input_filename, split_options)
+                        if not split_writer.add_record(*(line.strip() for line in current_record_lines)):
+                            split_malformed_count += 1
     except Exception as e:
         print(f"警告: 处理文件 '{gz_file_path}' 时发生错误 (读取阶段): {e}", file=sys.stderr)
+        split_error = e
         return None
+    finally:
+        close_record_writers(writer_pairs)
+        if split_writer is not None:
+            # A failed split marks its hand-off chunks as failed instead of done
+            split_writer.close(split_error)
 
-    num_lines_scanned = len(lines_scanned_content)
-    total_reads_processed = num_lines_scanned // 4
+    timer.stop()
+    split_result = None
+    if split_writer is not None:
+        report_split_summary(gz_file_path, split_writer, split_malformed_count)
+        split_result = S2Result.from_writer(gz_file_path, split_writer).set_usage(timer)
 
-    all_fwd_line_count = 0 # Counts lines where all forward patterns co-occur in sequence
-    all_rc_line_count = 0  # Counts lines where all RC patterns co-occur in sequence
-    
-    # For counting, we check the sequence line of each read.
-    # A read matches if its sequence line contains ALL forward patterns OR ALL RC patterns.
-    # The counts all_fwd_line_count and all_rc_line_count are based on reads, not individual lines.
-    
-    # Temporary storage for reads to be written
-    matched_reads_to_write = []
-    unmatched_reads_to_write = []
-
-    if lines_scanned_content:
-        # Iterate through records for counting and preparing for writing
-        for i in range(0, num_lines_scanned, 4):
-            current_record_lines = lines_scanned_content[i : i + 4]
-            if len(current_record_lines) == 4: # Ensure it's a full record
-                sequence_line = current_record_lines[1] # Second line is the sequence
-
-                match_fwd = False
-                if forward_patterns_list:
-                    match_fwd = all(pattern in sequence_line for pattern in forward_patterns_list)
-
-                match_rc = False
-                if rc_patterns_list:
-                    match_rc = all(rc_pattern in sequence_line for rc_pattern in rc_patterns_list)
-
-                if match_fwd: # Count as a forward match if all forward patterns are present
-                    all_fwd_line_count += 1
-                if match_rc: # Count as an RC match if all RC patterns are present
-                    all_rc_line_count +=1
-                # Note: A read could match both fwd and rc criteria if patterns overlap; it's counted for both.
-                # The percentages will be based on these counts relative to total_reads_processed.
-
-                if write_matching_reads_flag and (match_fwd or match_rc):
-                    matched_reads_to_write.append("".join(current_record_lines))
-                elif write_unmatched_reads_flag and not (match_fwd or match_rc): # Only if it didn't match fwd/rc
-                    unmatched_reads_to_write.append("".join(current_record_lines))
-
-
-        # Writing logic
-        if write_matching_reads_flag and matched_reads_to_write:
-            output_fastq_file_matched = Path(out_fastq_dir_path_str) / base_input_filename # Matched reads go to .gz
-            try:
-                with gzip.open(output_fastq_file_matched, 'at', errors='ignore') as writer: # 'at' for text mode append
-                    for record_str in matched_reads_to_write:
-                        writer.write(record_str)
-            except Exception as e:
-                print(f"警告: 写入匹配的FASTQ记录到 '{output_fastq_file_matched}' 时发生错误: {e}", file=sys.stderr)
+    counts = build_result_counts(sample_name, pattern_sets, counts_per_set, total_reads_processed)
+    return counts, split_result, build_file_metrics(gz_file_path, counts, split_result,
+                                                    get_writer_output_paths(writer_pairs), timer)
 
-        if write_unmatched_reads_flag and unmatched_reads_to_write:
-            # Unmatched reads also go to a .gz file inside the unmap directory
-            output_fastq_file_unmatched = Path(unmap_output_dir_path_str) / base_input_filename
+def init_scan_worker(log_queue, profile_env, match_options=None, pattern_sets=None):
+    """
+    Pool initializer for S1Scanner.run. With a log_queue (stage_logs.start_queue_logging)
+    the worker's log records are sent to the parent instead of being written to
+    the inherited log files; the profiling options are set as well, since
+    forkserver workers do not inherit the parent's environment. With
+    pattern_sets (chunked mode), the worker builds its matchers here once, so
+    match_record_batch tasks carry only their records.
+    """
+    global _worker_matchers
+    if log_queue is not None:
+        init_worker_logging(log_queue)
+    init_worker_profiling(profile_env)
+    if pattern_sets is not None:
+        _worker_matchers = build_pattern_set_matchers(match_options, pattern_sets)
+
+def process_file_logged(args_tuple):
+    """
+    Pool entry point for per-file processing: runs process_file_worker, with the
+    worker's stdout and stderr (warnings, the fused split summary) written line
+    by line to the worker logger, prefixed with the file name, when the pool was
+    started with a log queue (init_scan_worker).
+    """
+    worker_logger = get_worker_logger()
+    if worker_logger is None:
+        return process_file_worker(args_tuple)
+    prefix = f"[{Path(args_tuple[0]).name}] "
+    stdout_writer = LineLogWriter(worker_logger, logging.INFO, prefix)
+    stderr_writer = LineLogWriter(worker_logger, logging.WARNING, prefix, tail=stdout_writer.tail)
+    with contextlib.redirect_stdout(stdout_writer), contextlib.redirect_stderr(stderr_writer):
+        result = process_file_worker(args_tuple)
+    stdout_writer.flush()
+    stderr_writer.flush()
+    return result
+
+def iter_record_batches(handle, max_lines, chunk_reads):
+    """
+    Groups the streamed FASTQ records into record-aligned batches of at most
+    chunk_reads records. Each batch is a list of 4-line record lists.
+    """
+    batch = []
+    for record_lines in iter_fastq_records(handle, max_lines):
+        batch.append(record_lines)
+        if len(batch) >= chunk_reads:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+@profiled_worker("S1_batch_worker")
+def match_record_batch(batch_args):
+    """
+    Worker function for chunked (intra-file) processing: matches one batch of
+    records against every pattern set and returns the per-set counts together
+    with the joined matched and unmatched records, so the parent can merge them
+    in input order. With split_settings, the first set's matched records are
+    also split as in S2. The matchers are the worker's own, built once by
+    init_scan_worker.
+    Args:
+        batch_args (tuple): (record_batch,
+                             collect_flags,   # per set: (collect_matched_flag, collect_unmatched_flag)
+                             split_settings)  # S2_Split.make_split_settings(...) or None
+    Returns:
+        tuple: (reads_in_batch,
+                set_results,   # per set: (fwd_count, rc_count, matched_records_bytes, unmatched_records_bytes)
+                split_result)  # S2_Split.split_record_batch(...) result or None
+    """
+    (record_batch, collect_flags, split_settings) = batch_args
+    matchers, matcher_index_per_set = _worker_matchers
+
+    counts_per_set = [[0, 0] for _ in collect_flags]
+    matched_records_per_set = [[] for _ in collect_flags]
+    unmatched_records_per_set = [[] for _ in collect_flags]
+    split_records = [] # Stripped matched records for the fused S2 split
+    for record_lines in record_batch:
+        matches = [matcher.match(record_lines[1]) for matcher in matchers]
+        record_bytes = None
+        for set_index, (collect_matched_flag, collect_unmatched_flag) in enumerate(collect_flags):
+            match_fwd, match_rc = matches[matcher_index_per_set[set_index]]
+            counts = counts_per_set[set_index]
+            if match_fwd:
+                counts[0] += 1
+            if match_rc:
+                counts[1] += 1
+            if collect_matched_flag and (match_fwd or match_rc):
+                record_bytes = record_bytes or b"".join(record_lines)
+                matched_records_per_set[set_index].append(record_bytes)
+            elif collect_unmatched_flag and not (match_fwd or match_rc):
+                record_bytes = record_bytes or b"".join(record_lines)
+                unmatched_records_per_set[set_index].append(record_bytes)
+
+        if split_settings is not None and any(matches[matcher_index_per_set[0]]):
+            split_records.append(tuple(line.strip() for line in record_lines))
+
+    set_results = [(fwd_count, rc_count, b"".join(matched_records), b"".join(unmatched_records))
+                   for (fwd_count, rc_count), matched_records, unmatched_records
+                   in zip(counts_per_set, matched_records_per_set, unmatched_records_per_set)]
+    split_result = None
+    if split_settings is not None:
+        split_result = split_record_batch((split_records, split_settings))
+    return len(record_batch), set_results, split_result
+
+def process_file_chunked(executor, args_tuple, chunk_reads, max_batches_in_flight):
+    """
+    Processes a single file by splitting it into record-aligned batches.
+    The calling process decompresses and batches the input, the executor's
+    worker processes do the matching, and results are merged back in input
+    order into the matched/Unmap outputs. At most max_batches_in_flight
+    batches are pending at any time, which bounds memory.
+    Args:
+        executor: a concurrent.futures executor running match_record_batch, its
+                  workers initialized by init_scan_worker with the pattern sets
+                  and match options of args_tuple
+        args_tuple (tuple): same layout as for process_file_worker
+        chunk_reads (int): records per batch
+        max_batches_in_flight (int): limit on submitted but unmerged batches
+    Returns:
+        tuple: same as process_file_worker, or None if file processing failed.
+               The CPU time in the file metrics covers the calling process only.
+    """
+    (gz_file_path, pattern_sets, effective_lines_to_process, process_all_lines_flag,
+     max_buffer_bytes, match_options, gzip_options, split_options) = args_tuple
+    timer = ResourceTimer()
+
+    base_input_filename = Path(gz_file_path).name
+    sample_name = get_sample_name(gz_file_path)
+    max_lines = get_max_lines(effective_lines_to_process, process_all_lines_flag)
+
+    writer_pairs = open_record_writers(base_input_filename, pattern_sets, max_buffer_bytes, gzip_options)
+    collect_flags = [(matched_writer is not None, unmatched_writer is not None)
+                     for matched_writer, unmatched_writer in writer_pairs]
+    split_settings = None
+    if split_options is not None:
+        split_settings = make_split_settings(split_options['separator_pairs'], split_options['min_length'],
+                                             split_options['combined'])
+    split_writers = [] # Holds the fused S2 writer once the first matched read arrives
+    split_error = None
+
+    totals = [0, 0] # total_reads_processed, split malformed
+    counts_per_set = [[0, 0] for _ in pattern_sets]
+    pending_futures = collections.deque()
+
+    def merge_oldest_batch():
+        reads_in_batch, set_results, split_result = pending_futures.popleft().result()
+        totals[0] += reads_in_batch
+        for (matched_writer, unmatched_writer), counts, set_result in zip(writer_pairs, counts_per_set, set_results):
+            fwd_count, rc_count, matched_bytes, unmatched_bytes = set_result
+            counts[0] += fwd_count
+            counts[1] += rc_count
+            if matched_writer is not None and matched_bytes:
+                matched_writer.add(matched_bytes)
+            if unmatched_writer is not None and unmatched_bytes:
+                unmatched_writer.add(unmatched_bytes)
+        if split_result is not None and (set_results[0][0] or set_results[0][1]):
+            r1_parts, r2_parts, discarded_bytes, batch_stats, malformed_positions = split_result
+            if not split_writers:
+                split_writers.append(open_split_writer(base_input_filename, split_options))
+            split_writers[0].add_split_batch(r1_parts, r2_parts, discarded_bytes, batch_stats)
+            totals[1] += len(malformed_positions)
+
+    try:
+        with open_gzip_reader(gz_file_path, **gzip_options) as f:
+            for record_batch in iter_record_batches(f, max_lines, chunk_reads):
+                while len(pending_futures) >= max_batches_in_flight:
+                    merge_oldest_batch()
+                pending_futures.append(executor.submit(match_record_batch,
+                                                       (record_batch, collect_flags, split_settings)))
+        while pending_futures:
+            merge_oldest_batch()
+    except Exception as e:
+        print(f"警告: 处理文件 '{gz_file_path}' 时发生错误 (分块处理阶段): {e}", file=sys.stderr)
+        split_error = e
+        for future in pending_futures:
+            future.cancel()
+        return None
+    finally:
+        close_record_writers(writer_pairs)
+        for split_writer in split_writers:
+            split_writer.close(split_error)
+
+    timer.stop()
+    split_result = None
+    if split_writers:
+        report_split_summary(gz_file_path, split_writers[0], totals[1])
+        split_result = S2Result.from_writer(gz_file_path, split_writers[0]).set_usage(timer)
+
+    counts = build_result_counts(sample_name, pattern_sets, counts_per_set, totals[0])
+    return counts, split_result, build_file_metrics(gz_file_path, counts, split_result,
+                                                    get_writer_output_paths(writer_pairs), timer)
+
+def parse_patterns(patterns_string):
+    """
+    Parses a comma-separated pattern list into (raw_patterns, forward_patterns, rc_patterns).
+    Patterns are upper-cased for case-insensitive matching and matched as bytes.
+    Raises ValueError if the list is empty or not ASCII.
+    """
+    raw_patterns_list = [p.strip().upper() for p in patterns_string.split(',') if p.strip()] # Convert patterns to upper for case-insensitive match
+    if not raw_patterns_list:
+        raise ValueError(f"未提供有效的搜索序列: '{patterns_string}'")
+    try:
+        forward_patterns = [p.encode('ascii') for p in raw_patterns_list] # Patterns are matched as bytes
+    except UnicodeEncodeError:
+        raise ValueError(f"搜索序列只能包含ASCII字符: '{patterns_string}'")
+    rc_patterns = [get_reverse_complement(p) for p in forward_patterns] # RC will also be upper
+    return raw_patterns_list, forward_patterns, rc_patterns
+
+def make_pattern_set(description, patterns_string, out_dir):
+    """
+    Creates a named pattern set. Matched FASTQ records of the set go to out_dir
+    (and its Unmap subdirectory); the write flags are filled in by
+    prepare_fastq_output_dirs.
+    """
+    raw_patterns_list, forward_patterns, rc_patterns = parse_patterns(patterns_string)
+    return {
+        'description': description,
+        'patterns_string': patterns_string,
+        'raw_patterns': raw_patterns_list,
+        'forward_patterns': forward_patterns,
+        'rc_patterns': rc_patterns,
+        'out_dir': str(out_dir),
+        'write_matching': False,
+        'write_unmatched': False,
+        'unmap_dir': ""
+    }
+
+def load_group_pattern_sets(config_path):
+    """
+    Reads the S1_config block of a pipeline/group YAML config as a pattern set
+    spec (description, patterns_string, fastq_output_dir) for S1Config: patterns,
+    description (defaults to the file name) and output_dir.
+    """
+    import yaml # Only needed for --group-config
+
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+    s1_config = config.get('S1_config') or {}
+    if not s1_config.get('patterns'):
+        raise ValueError(f"配置文件 '{config_path}' 的S1_config缺少patterns配置")
+    return (s1_config.get('description') or Path(config_path).stem,
+            str(s1_config['patterns']),
+            str(s1_config.get('output_dir') or Path(DEFAULT_OUTPUT_DIR_FASTQ) / Path(config_path).stem))
+
+def prepare_fastq_output_dirs(pattern_set, write_unmatched_reads):
+    """
+    Creates the matched (and Unmap) FASTQ directories of a pattern set and sets
+    its write flags to reflect what can actually be written.
+    """
+    fastq_base_dir_to_create = Path(pattern_set['out_dir'])
+    try:
+        fastq_base_dir_to_create.mkdir(parents=True, exist_ok=True)
+        print(f"信息: 匹配的FASTQ记录将被写入到 '{fastq_base_dir_to_create}' 目录。", file=sys.stderr)
+        pattern_set['write_matching'] = True
+    except Exception as e_fastq:
+        print(f"错误: 无法创建主要的FASTQ输出目录 '{fastq_base_dir_to_create}': {e_fastq}", file=sys.stderr)
+        print("警告: 由于无法创建主要的FASTQ目录，将不写入任何FASTQ记录 (匹配或未匹配)。", file=sys.stderr)
+        return
+
+    # Now handle unmatched reads directory if that flag is also set
+    if write_unmatched_reads:
+        unmap_specific_dir = fastq_base_dir_to_create / DEFAULT_UNMATCHED_SUBDIR
+        try:
+            unmap_specific_dir.mkdir(parents=True, exist_ok=True)
+            print(f"信息: 未匹配的FASTQ记录将被写入到 '{unmap_specific_dir}' 目录。", file=sys.stderr)
+            pattern_set['unmap_dir'] = str(unmap_specific_dir)
+            pattern_set['write_unmatched'] = True
+        except Exception as e_unmap:
+            print(f"错误: 无法创建未匹配FASTQ输出子目录 '{unmap_specific_dir}': {e_unmap}", file=sys.stderr)
+            print("警告: 由于无法创建子目录，将不写入未匹配的FASTQ记录。", file=sys.stderr)
+
+TSV_HEADER = (
+    "样本\t序列描述\t查询序列组合\t全正向匹配Reads数\t" # Changed wording
+    "全反向互补匹配Reads数\t总处理Reads数\t全正向匹配比例(%)\t全反向互补匹配比例(%)" # Changed wording
+)
+
+def parse_lines_option(lines_value):
+    """
+    Interprets the -N / lines_to_process value: a positive integer is the
+    per-file line limit, 'all' (or None) processes every line. Invalid values
+    fall back to all lines with a warning. Returns the limit or None.
+    """
+    if lines_value is None or str(lines_value).lower() == 'all':
+        return None
+    try:
+        lines_limit = int(lines_value)
+    except ValueError:
+        lines_limit = 0
+    if lines_limit > 0:
+        return lines_limit
+    print(f"警告: -N 的值 '{lines_value}' 不是一个有效的正整数或 'all'。将对每个文件处理所有行。", file=sys.stderr)
+    return None
+
+@dataclass
+class S1Config:
+    """
+    In-process equivalent of the S1_Process_gen.py command line, run by S1Scanner.
+    pattern_sets lists (description, patterns_string, fastq_output_dir) specs;
+    a set's matched reads go to its fastq_output_dir when write_matching_reads
+    is set. lines_to_process is the per-file line limit (None for all lines).
+    split_output_dir enables the fused S1+S2 mode with the S2_Split.S2Config
+    in split (defaults when None).
+    """
+    pattern_sets: list
+    lines_to_process: Optional[int] = DEFAULT_LINES_TO_PROCESS
+    jobs: Optional[int] = None
+    write_matching_reads: bool = False
+    write_unmatched_reads: bool = False
+    max_buffer_mb: Optional[int] = None # None: DEFAULT_MAX_BUFFER_MB, shrunk to fit the available memory
+    chunk_reads: int = DEFAULT_CHUNK_READS
+    match_engine: str = DEFAULT_MATCH_ENGINE
+    max_mismatches: int = 0
+    max_edits: int = 0
+    gzip_options: dict = field(default_factory=default_gzip_options)
+    split_output_dir: Optional[str] = None
+    split: Optional[S2Config] = None
+
+@dataclass
+class S1Result:
+    """
+    Outcome of S1Scanner.run: per (sample, pattern set) counts sorted by sample,
+    the FASTQ files written, the fused S2 results (S2_Split.S2Result, one per
+    input file with matched reads), the input files that failed and the
+    stage_metrics.FileMetrics of every input file, sorted by input file.
+    """
+    counts: list = field(default_factory=list)
+    fastq_outputs: list = field(default_factory=list)
+    split_results: list = field(default_factory=list)
+    failed_files: list = field(default_factory=list)
+    file_metrics: list = field(default_factory=list)
+
+    def tsv_lines(self):
+        return [TSV_HEADER] + ["\t".join(map(str, count.as_row())) for count in self.counts]
+
+    def write_tsv(self, tsv_path, echo=False):
+        """
+        Writes the TSV summary to tsv_path (and each line to stdout with echo).
+        Returns True on success.
+        """
+        try:
+            with open(tsv_path, 'w', encoding='utf-8') as f_out:
+                for line in self.tsv_lines():
+                    if echo:
+                        print(line)
+                    f_out.write(line + "\n")
+            print(f"\n信息: TSV结果已写入文件: {tsv_path}", file=sys.stderr)
+            return True
+        except Exception as e:
+            print(f"错误: 无法写入TSV输出文件 '{tsv_path}': {e}", file=sys.stderr)
+            if not self.counts:
+                print("信息: 没有TSV数据行被处理或写入。", file=sys.stderr)
+            return False
+
+def get_fastq_output_paths(config, input_file):
+    """
+    The matched/Unmap FASTQ paths an S1Config writes for input_file, whether
+    or not they exist. Writers append, so callers reprocessing a file remove
+    these first.
+    """
+    if not config.write_matching_reads:
+        return []
+    base_input_filename = Path(input_file).name
+    paths = []
+    for _, _, out_dir in config.pattern_sets:
+        paths.append(str(Path(out_dir) / base_input_filename))
+        if config.write_unmatched_reads:
+            paths.append(str(Path(out_dir) / DEFAULT_UNMATCHED_SUBDIR / base_input_filename))
+    return paths
+
+class S1Scanner:
+    """
+    In-process S1 entry point. The constructor validates an S1Config and raises
+    ValueError for invalid patterns, error budgets or separators; run() matches
+    the given input files on a process pool (per file, or per batch with
+    chunk_reads) and returns an S1Result. Progress and warnings go to stderr as
+    with the command line (worker output to the worker_log given to run()); the
+    TSV is written by S1Result.write_tsv.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.pattern_sets = [make_pattern_set(description, patterns_string, out_dir)
+                             for description, patterns_string, out_dir in config.pattern_sets]
+        if not self.pattern_sets:
+            raise ValueError("未提供有效的搜索序列")
+        if config.write_matching_reads and \
+                len({pattern_set['out_dir'] for pattern_set in self.pattern_sets}) < len(self.pattern_sets):
+            raise ValueError("多个序列组合的FASTQ输出目录相同, 请为每个组合指定不同的目录")
+
+        self.match_options = {
+            'engine': config.match_engine,
+            'max_mismatches': config.max_mismatches,
+            'max_edits': config.max_edits
+        }
+        if config.match_engine == MATCH_ENGINE_NUMPY and not numpy_available():
+            print(f"警告: 未安装 numpy, --match-engine {MATCH_ENGINE_NUMPY} 不可用, 改用 '{MATCH_ENGINE_IN}' 引擎。",
+                  file=sys.stderr)
+            self.match_options['engine'] = MATCH_ENGINE_IN
+        if config.match_engine == MATCH_ENGINE_AHO_CORASICK and not pyahocorasick_available():
+            print(f"警告: 未安装 pyahocorasick, --match-engine {MATCH_ENGINE_AHO_CORASICK} 不可用, "
+                  f"改用 '{MATCH_ENGINE_IN}' 引擎。", file=sys.stderr)
+            self.match_options['engine'] = MATCH_ENGINE_IN
+        try:
+            build_pattern_set_matchers(self.match_options, self.pattern_sets) # Validates the error budget before any work
+        except ValueError as e:
+            raise ValueError(f"容错参数无效, 请检查 --max-mismatches/--max-edits 参数: {e}")
+
+        self.split_options = None
+        if config.split_output_dir:
+            if len(self.pattern_sets) > 1:
+                raise ValueError("--split-output-dir 仅支持单个序列组合")
+            split_config = config.split or S2Config(gzip_options=config.gzip_options)
             try:
-                with gzip.open(output_fastq_file_unmatched, 'at', errors='ignore') as writer: # 'at' for text mode append
-                    for record_str in unmatched_reads_to_write:
-                        writer.write(record_str)
-            except Exception as e:
-                print(f"警告: 写入未匹配的FASTQ记录到 '{output_fastq_file_unmatched}' 时发生错误: {e}", file=sys.stderr)
+                separator_pairs = split_config.prepare_separator_pairs()
+            except (ValueError, UnicodeEncodeError) as e:
+                raise ValueError(f"分隔符序列无效, 请检查 --sep1/--sep2/--separator-pair/--split-max-* 参数: {e}")
+            self.split_options = {
+                'output_dir': str(config.split_output_dir),
+                'separator_pairs': separator_pairs,
+                'min_length': split_config.min_length,
+                'gzip_options': split_config.gzip_options,
+                'combined': split_config.combined,
+                'handoff_chunk_reads': split_config.handoff_chunk_reads
+            }
 
+    def default_tsv_path(self):
+        """
+        '<CountFold>/YYYYMMDD_HHMMSS_<patterns>[_m<lines>].tsv', the TSV path used when -o is omitted.
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        seq_summary_for_fn = "_".join(p for pattern_set in self.pattern_sets for p in pattern_set['raw_patterns'])
+        seq_summary_for_fn = "".join(c if c.isalnum() or c == '_' else '' for c in seq_summary_for_fn)
+        max_seq_part_len = 40
+        if len(seq_summary_for_fn) > max_seq_part_len:
+            seq_summary_for_fn = seq_summary_for_fn[:max_seq_part_len] + "_etc"
+        if not seq_summary_for_fn: seq_summary_for_fn = "patterns"
+        head_param_for_filename = f"_m{self.config.lines_to_process}" if self.config.lines_to_process else ""
+        return Path(DEFAULT_OUTPUT_DIR_COUNTS) / f"{timestamp}_{seq_summary_for_fn}{head_param_for_filename}.tsv"
 
-    fwd_percentage_str = "N/A"
-    rc_percentage_str = "N/A"
+    def get_jobs(self, probe):
+        """
+        The configured job count, or by default the usable CPUs (affinity and
+        cgroup quota) limited to what the available memory can hold.
+        """
+        jobs = self.config.jobs
+        if jobs is not None and jobs <= 0:
+            print(f"警告: -j 的值 '{jobs}' 不是有效的正整数。将使用默认值。", file=sys.stderr)
+            jobs = None
+        if jobs is None:
+            max_buffer_mb = self.config.max_buffer_mb
+            if not max_buffer_mb or max_buffer_mb <= 0:
+                max_buffer_mb = DEFAULT_MAX_BUFFER_MB
+            return probe.worker_count((max_buffer_mb + WORKER_OVERHEAD_MB) * 1024 * 1024)
+        return jobs
 
-    if total_reads_processed > 0:
-        # Percentages are based on reads matching the criteria, not lines.
-        fwd_percentage = (all_fwd_line_count / total_reads_processed) * 100
-        rc_percentage = (all_rc_line_count / total_reads_processed) * 100
-        fwd_percentage_str = f"{fwd_percentage:.2f}%"
-        rc_percentage_str = f"{rc_percentage:.2f}%"
-    elif all_fwd_line_count == 0 and all_rc_line_count == 0 and total_reads_processed == 0:
-        pass
+    def get_max_buffer_mb(self, probe, num_parallel_jobs):
+        """
+        The configured per-worker buffer, or by default DEFAULT_MAX_BUFFER_MB
+        shrunk (down to MIN_MAX_BUFFER_MB) so that all workers fit in the
+        available memory.
+        """
+        max_buffer_mb = self.config.max_buffer_mb
+        if max_buffer_mb is not None and max_buffer_mb <= 0:
+            print(f"警告: --max-buffer-mb 的值 '{max_buffer_mb}' 不是有效的正整数。将使用默认值。", file=sys.stderr)
+            max_buffer_mb = None
+        if max_buffer_mb is not None:
+            return max_buffer_mb
+        available_bytes = probe.available_memory_bytes
+        if available_bytes is None:
+            return DEFAULT_MAX_BUFFER_MB
+        fitting_mb = int(available_bytes * DEFAULT_MEMORY_FRACTION / num_parallel_jobs / (1024 * 1024)) - WORKER_OVERHEAD_MB
+        return max(MIN_MAX_BUFFER_MB, min(DEFAULT_MAX_BUFFER_MB, fitting_mb))
 
-    return (sample_name, sequence_description_str, patterns_string,
-            all_fwd_line_count, all_rc_line_count, total_reads_processed,
-            fwd_percentage_str, rc_percentage_str)
+    def prepare_output_dirs(self):
+        """
+        Creates the FASTQ output directories; the write flags of each pattern
+        set reflect the actual possibility of writing.
+        """
+        if self.config.write_matching_reads:
+            for pattern_set in self.pattern_sets:
+                prepare_fastq_output_dirs(pattern_set, self.config.write_unmatched_reads)
+        elif self.config.write_unmatched_reads: # Unmatched reads are only written together with matched reads
+            print(f"警告: --write-unmatched-reads 选项仅在 --write-matching-reads 也启用时生效。", file=sys.stderr)
+            print("警告: 将不写入未匹配的FASTQ记录。", file=sys.stderr)
+
+    def list_fastq_outputs(self, input_files):
+        """
+        The matched/Unmap FASTQ files that exist for the given inputs.
+        """
+        outputs = []
+        for gz_file in input_files:
+            base_input_filename = Path(gz_file).name
+            for pattern_set in self.pattern_sets:
+                for enabled, out_dir in ((pattern_set['write_matching'], pattern_set['out_dir']),
+                                         (pattern_set['write_unmatched'], pattern_set['unmap_dir'])):
+                    if enabled and (Path(out_dir) / base_input_filename).is_file():
+                        outputs.append(str(Path(out_dir) / base_input_filename))
+        return outputs
+
+    def run(self, input_files, on_file_done=None, worker_log=None):
+        """
+        Processes input_files and returns an S1Result. on_file_done, when given,
+        is called as on_file_done(file_path, counts, split_result) as soon as
+        each file succeeds (split_result is None unless fused). worker_log, a
+        logging.Logger such as the pipeline's stage log, receives the output of
+        the worker processes through a queue, so only this process writes to
+        its handlers (stage_logs.start_queue_logging).
+        """
+        config = self.config
+        probe = probe_resources()
+        num_parallel_jobs = self.get_jobs(probe)
+        max_buffer_mb = self.get_max_buffer_mb(probe, num_parallel_jobs)
+        max_buffer_bytes = max_buffer_mb * 1024 * 1024
+        print(f"信息: 资源探测: {probe.describe()}。", file=sys.stderr)
+        print(f"信息: 将使用 {num_parallel_jobs} 个并行任务处理文件, 每个任务缓冲上限 {max_buffer_mb} MB。", file=sys.stderr)
+
+        print(f"信息: {describe_gzip_options(config.gzip_options)}。", file=sys.stderr)
+        if len(self.pattern_sets) > 1:
+            print(f"信息: 共享扫描模式, {len(self.pattern_sets)} 个序列组合在同一次扫描中计数。", file=sys.stderr)
+        if config.max_mismatches or config.max_edits:
+            print(f"信息: 容错匹配, 最大错配数 {config.max_mismatches}, 最大编辑数 {config.max_edits}。", file=sys.stderr)
+
+        self.prepare_output_dirs()
+        split_options = self.split_options
+        if split_options is not None:
+            print(f"信息: 融合S1+S2模式, 匹配的reads将直接分割写入 '{split_options['output_dir']}' "
+                  f"(最小长度 {split_options['min_length']}, {describe_gzip_options(split_options['gzip_options'])})。",
+                  file=sys.stderr)
+
+        worker_args_list = []
+        for gz_file in input_files:
+            if not os.path.isfile(gz_file):
+                print(f"警告: '{gz_file}' 不是一个有效的文件，已跳过。", file=sys.stderr)
+                continue
+            worker_args_list.append(
+                (gz_file, self.pattern_sets,
+                 config.lines_to_process, config.lines_to_process is None,
+                 max_buffer_bytes,
+                 self.match_options,
+                 config.gzip_options,
+                 split_options)
+            )
+
+        chunk_reads = config.chunk_reads
+        if chunk_reads < 0:
+            print(f"警告: --chunk-reads 的值 '{config.chunk_reads}' 无效。将按文件并行处理。", file=sys.stderr)
+            chunk_reads = 0
+
+        if self.match_options['engine'] == MATCH_ENGINE_NUMPY and (
+                chunk_reads > 0 or config.write_matching_reads or split_options
+                or config.max_mismatches or config.max_edits):
+            print(f"信息: {MATCH_ENGINE_NUMPY} 引擎仅向量化按文件并行、只计数的精确匹配; "
+                  f"本次运行逐条匹配 (结果相同)。", file=sys.stderr)
+
+        result = S1Result()
+
+        def record_failure(file_path, error):
+            result.failed_files.append(file_path)
+            result.file_metrics.append(FileMetrics(input_file=str(file_path), status=FILE_STATUS_FAILED,
+                                                   bytes_in=get_file_size(file_path), error=error))
+
+        def collect(file_path, file_result):
+            if not file_result:
+                record_failure(file_path, "处理失败")
+                return
+            counts, split_result, file_metrics = file_result
+            result.counts.extend(counts)
+            result.file_metrics.append(file_metrics)
+            if split_result is not None:
+                result.split_results.append(split_result)
+            if on_file_done is not None:
+                on_file_done(file_path, counts, split_result)
+
+        # The parent holds the gzip reader/writers (possibly pigz pipes) and, in
+        # the pipelines, log files and the log queue thread while workers start on
+        # demand; forkserver workers inherit none of them.
+        mp_context = None
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context('forkserver')
+        if worker_args_list:
+            with contextlib.ExitStack() as stack:
+                log_queue = None
+                if worker_log is not None:
+                    log_queue, log_listener = start_queue_logging(worker_log, mp_context)
+                    stack.callback(log_listener.stop)
+                initargs = (log_queue, get_profile_env())
+                if chunk_reads > 0: # Batch workers keep their matchers for the whole run
+                    initargs += (self.match_options, self.pattern_sets)
+                executor = stack.enter_context(concurrent.futures.ProcessPoolExecutor(
+                    max_workers=num_parallel_jobs, mp_context=mp_context, initializer=init_scan_worker,
+                    initargs=initargs))
+                if chunk_reads > 0:
+                    print(f"信息: 文件内分块并行模式, 每块 {chunk_reads} 条reads。", file=sys.stderr)
+                    # Keep a couple of batches queued per process so workers never starve,
+                    # while the number of batches held in memory stays bounded.
+                    max_batches_in_flight = num_parallel_jobs * 2
+                    for arg_tuple in worker_args_list:
+                        collect(arg_tuple[0],
+                                process_file_chunked(executor, arg_tuple, chunk_reads, max_batches_in_flight))
+                else:
+                    future_to_file = {executor.submit(process_file_logged, arg_tuple): arg_tuple[0]
+                                      for arg_tuple in worker_args_list}
+                    for future in concurrent.futures.as_completed(future_to_file):
+                        file_path = future_to_file[future]
+                        try:
+                            collect(file_path, future.result())
+                        except Exception as exc:
+                            print(f"警告: 文件 '{file_path}' 在处理时产生错误: {exc}", file=sys.stderr)
+                            record_failure(file_path, str(exc))
+
+        result.counts.sort(key=lambda count: count.sample_name) # Stable, so pattern sets keep their order
+        result.split_results.sort(key=lambda split_result: split_result.input_file)
+        result.file_metrics.sort(key=lambda file_metrics: file_metrics.input_file)
+        result.fastq_outputs = self.list_fastq_outputs(arg_tuple[0] for arg_tuple in worker_args_list)
+        return result
 
 def main():
     parser = argparse.ArgumentParser(
@@ -183,8 +1084,24 @@ def main():
     )
     parser.add_argument(
         "-p", "--patterns",
-        required=True,
-        help="(必需) 逗号分隔的多个原始搜索序列。"
+        default=None,
+        help="逗号分隔的多个原始搜索序列。\n必须提供 -p、--pattern-set 或 --group-config 中的至少一个。"
+    )
+    parser.add_argument(
+        "--pattern-set",
+        action="append",
+        default=[],
+        metavar="名称=序列1,序列2",
+        help="(可选, 可重复) 额外的命名序列组合。所有组合在同一次扫描中计数,\n"
+             "每个(样本, 组合)输出一行TSV; 匹配的FASTQ写入 '<FASTQ输出目录>/<名称>'。"
+    )
+    parser.add_argument(
+        "--group-config",
+        action="append",
+        default=[],
+        metavar="CONFIG_FILE",
+        help="(可选, 可重复) 从组配置文件(YAML)的S1_config读取序列组合:\n"
+             "patterns、description 和 output_dir (匹配的FASTQ输出目录)。"
     )
     parser.add_argument(
         "-d", "--description",
@@ -213,7 +1130,7 @@ def main():
         "-j", "--jobs",
         type=int,
         default=None,
-        help=f"(可选) 并行处理文件的最大任务数。\n默认尝试使用CPU核心数，否则为 {DEFAULT_MAX_JOBS_FALLBACK}。"
+        help="(可选) 并行处理文件的最大任务数。\n默认为本进程可用的CPU数 (考虑CPU亲和性和cgroup配额), 且不超过可用内存允许的任务数。"
     )
     parser.add_argument(
         "--write-matching-reads",
@@ -237,71 +1154,170 @@ def main():
              f"'{DEFAULT_UNMATCHED_SUBDIR}' 子目录中 (位于FASTQ输出目录下)。\n"
              f"此选项仅在 --write-matching-reads 也被设置时生效。"
     )
+    parser.add_argument(
+        "--max-buffer-mb",
+        type=int,
+        default=None,
+        help=f"(可选) 每个并行任务缓冲待写出FASTQ记录的内存上限(MB)。\n"
+             f"输入按记录流式读取, 缓冲达到上限即写出, 内存占用与输入大小无关。\n"
+             f"默认: {DEFAULT_MAX_BUFFER_MB}, 可用内存不足时按并行任务数减小 (最小 {MIN_MAX_BUFFER_MB})"
+    )
+    parser.add_argument(
+        "--chunk-reads",
+        type=int,
+        default=DEFAULT_CHUNK_READS,
+        help=f"(可选) 大于0时, 将每个输入文件按记录切分为每块N条reads的批次,\n"
+             f"由 -j 个进程在文件内部并行匹配, 并按输入顺序合并输出。\n"
+             f"适合少量超大文件。文件之间依次处理。默认: {DEFAULT_CHUNK_READS} (关闭, 按文件并行)"
+    )
+    parser.add_argument(
+        "--match-engine",
+        choices=MATCH_ENGINES,
+        default=DEFAULT_MATCH_ENGINE,
+        help=f"(可选) 序列匹配引擎。\n"
+             f"'in': 对每个序列逐一做子串查找 (k个序列共扫描2k次);\n"
+             f"'aho-corasick': 由正向和反向互补序列构建一次自动机, 单次扫描判断全部序列;\n"
+             f"需要 pyahocorasick (C实现), 未安装时同 'in';\n"
+             f"'numpy': 只计数时 (不写FASTQ、不融合分割、按文件并行、精确匹配) 按解压块整体匹配,\n"
+             f"无逐条reads的Python循环; 需要 numpy, 其余情况同 'in'。\n"
+             f"各引擎计数结果相同。默认: {DEFAULT_MATCH_ENGINE}"
+    )
+    parser.add_argument(
+        "--max-mismatches",
+        type=int,
+        default=0,
+        help="(可选) 查询序列允许的最大错配(替换)数。>0时使用容错匹配:\n"
+             "按鸽巢原理将序列切为k+1段做精确种子查找, 仅对候选位置逐碱基校验。默认: 0 (精确匹配)"
+    )
+    parser.add_argument(
+        "--max-edits",
+        type=int,
+        default=0,
+        help="(可选) 查询序列允许的最大编辑(替换/插入/缺失)数, 种子候选用Myers位并行算法校验。\n"
+             "与 --max-mismatches 只能设置其一。默认: 0 (精确匹配)"
+    )
+    parser.add_argument(
+        "--split-output-dir",
+        type=str,
+        default=None,
+        help=f"(可选) 融合S1+S2模式: 匹配的reads在同一次扫描中直接按分隔符分割,\n"
+             f"写入 '<目录>/<样本>/<样本>_R1.fq.gz、_R2.fq.gz、_discarded.fq.gz',\n"
+             f"与对S1输出运行S2_Split.py的结果相同。匹配的FASTQ中间文件仍由 --write-matching-reads 控制。"
+    )
+    parser.add_argument(
+        "--sep1",
+        default=DEFAULT_SEPARATOR1,
+        help=f"(可选) 融合模式的第一个分隔符序列。默认: {DEFAULT_SEPARATOR1}"
+    )
+    parser.add_argument(
+        "--sep2",
+        default=DEFAULT_SEPARATOR2,
+        help=f"(可选) 融合模式的第二个分隔符序列。默认: {DEFAULT_SEPARATOR2}"
+    )
+    parser.add_argument(
+        "--min-length",
+        type=int,
+        default=DEFAULT_SPLIT_MIN_LENGTH,
+        help=f"(可选) 融合模式分割后序列的最小长度。默认: {DEFAULT_SPLIT_MIN_LENGTH}"
+    )
+    parser.add_argument(
+        "--split-compresslevel",
+        type=int,
+        default=None,
+        help="(可选) 融合模式R1/R2/discarded输出的gzip压缩级别。默认与 --compresslevel 相同。"
+    )
+    parser.add_argument(
+        "--split-handoff-chunk-reads",
+        type=int,
+        default=0,
+        help="(可选) 融合模式: >0时R1/R2每N条配对reads原子发布一个分块 <样本>_partNNNN_R1/_R2.fq.gz,\n"
+             "与 S2_Split.py --handoff-chunk-reads 相同 (默认: 0, 写完整文件)"
+    )
+    add_separator_pair_arguments(parser)
+    add_separator_tolerance_arguments(parser, prefix="split-")
+    add_gzip_arguments(parser)
+    add_profile_arguments(parser)
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        default=None,
+        help="(可选) 将本次运行的指标写入此JSON文件: 每个输入文件的reads数、输入/输出字节数、\n"
+             "耗时、CPU时间、内存峰值和各序列组合的匹配数 (融合模式另有S2方向统计)。"
+    )
 
     args = parser.parse_args()
 
-    patterns_string = args.patterns
-    sequence_description = args.description
+    lines_to_process = parse_lines_option(args.lines)
+    gzip_options = gzip_options_from_args(args)
 
-    effective_lines_to_process = None
-    process_all_lines_flag = False
-    head_param_for_filename = ""
-
-    if args.lines is None or args.lines.lower() == 'all':
-        process_all_lines_flag = True
-        head_param_for_filename = ""
+    if args.fastq_output_dir:
+        fastq_base_dir = Path(args.fastq_output_dir)
     else:
-        try:
-            n_val = int(args.lines)
-            if n_val > 0:
-                effective_lines_to_process = n_val
-                head_param_for_filename = f"_m{n_val}"
-            else:
-                print(f"警告: -N 的值 '{args.lines}' 不是一个有效的正整数或 'all'。将对每个文件处理所有行。", file=sys.stderr)
-                process_all_lines_flag = True
-                head_param_for_filename = ""
-        except ValueError:
-            if args.lines == str(DEFAULT_LINES_TO_PROCESS) and isinstance(DEFAULT_LINES_TO_PROCESS, int):
-                effective_lines_to_process = DEFAULT_LINES_TO_PROCESS
-                head_param_for_filename = f"_m{DEFAULT_LINES_TO_PROCESS}"
-            else:
-                print(f"警告: -N 的值 '{args.lines}' 不是一个有效的正整数或 'all'。将对每个文件处理所有行。", file=sys.stderr)
-                process_all_lines_flag = True
-                head_param_for_filename = ""
-
-    if not process_all_lines_flag and effective_lines_to_process is None:
-        if args.lines == str(DEFAULT_LINES_TO_PROCESS):
-            effective_lines_to_process = DEFAULT_LINES_TO_PROCESS
-            head_param_for_filename = f"_m{DEFAULT_LINES_TO_PROCESS}"
-
-    num_parallel_jobs = args.jobs
-    if num_parallel_jobs is None:
-        num_parallel_jobs = get_cpu_count()
-    elif num_parallel_jobs <= 0:
-        print(f"警告: -j 的值 '{args.jobs}' 不是有效的正整数。将使用默认值 {get_cpu_count()}。", file=sys.stderr)
-        num_parallel_jobs = get_cpu_count()
-    print(f"信息: 将使用 {num_parallel_jobs} 个并行任务处理文件。", file=sys.stderr)
+        fastq_base_dir = Path(DEFAULT_OUTPUT_DIR_FASTQ)
 
-    raw_patterns_list = [p.strip().upper() for p in patterns_string.split(',') if p.strip()] # Convert patterns to upper for case-insensitive match
-    if not raw_patterns_list:
-        print("错误: 未提供有效的搜索序列。请检查 -p 参数。", file=sys.stderr)
+    pattern_set_specs = []
+    try:
+        if args.patterns:
+            pattern_set_specs.append((args.description, args.patterns, str(fastq_base_dir)))
+        for pattern_set_spec in args.pattern_set:
+            set_name, separator, set_patterns = pattern_set_spec.partition('=')
+            if not separator or not set_name.strip():
+                raise ValueError(f"--pattern-set 的格式应为 '名称=序列1,序列2': '{pattern_set_spec}'")
+            pattern_set_specs.append((set_name.strip(), set_patterns, str(fastq_base_dir / set_name.strip())))
+        for group_config_path in args.group_config:
+            pattern_set_specs.append(load_group_pattern_sets(group_config_path))
+    except Exception as e:
+        print(f"错误: {e}", file=sys.stderr)
         sys.exit(1)
 
-    forward_patterns = raw_patterns_list
-    rc_patterns = [get_reverse_complement(p) for p in raw_patterns_list] # RC will also be upper
+    if not pattern_set_specs:
+        print("错误: 未提供有效的搜索序列。请检查 -p、--pattern-set 或 --group-config 参数。", file=sys.stderr)
+        sys.exit(1)
+
+    split_config = None
+    if args.split_output_dir:
+        split_gzip_options = dict(gzip_options)
+        if args.split_compresslevel is not None:
+            split_gzip_options['compresslevel'] = args.split_compresslevel
+        try:
+            split_config = S2Config(
+                separator1=args.sep1.upper(),
+                separator2=args.sep2.upper(),
+                separator_pairs=[parse_separator_pair(pair_spec) for pair_spec in args.separator_pair],
+                min_length=args.min_length,
+                pair_output=args.pair_output,
+                max_mismatches=args.split_max_mismatches,
+                max_edits=args.split_max_edits,
+                gzip_options=split_gzip_options,
+                handoff_chunk_reads=max(0, args.split_handoff_chunk_reads)
+            )
+        except ValueError as e:
+            print(f"错误: 分隔符序列无效, 请检查 --sep1/--sep2/--separator-pair/--split-max-* 参数: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    try:
+        scanner = S1Scanner(S1Config(
+            pattern_sets=pattern_set_specs,
+            lines_to_process=lines_to_process,
+            jobs=args.jobs,
+            write_matching_reads=args.write_matching_reads,
+            write_unmatched_reads=args.write_unmatched_reads,
+            max_buffer_mb=args.max_buffer_mb,
+            chunk_reads=args.chunk_reads,
+            match_engine=args.match_engine,
+            max_mismatches=args.max_mismatches,
+            max_edits=args.max_edits,
+            gzip_options=gzip_options,
+            split_output_dir=args.split_output_dir,
+            split=split_config
+        ))
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
 
     final_tsv_output_path_str = args.output_file
     if final_tsv_output_path_str is None:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        seq_summary_for_fn = "_".join(raw_patterns_list)
-        seq_summary_for_fn = "".join(c if c.isalnum() or c == '_' else '' for c in seq_summary_for_fn)
-        max_seq_part_len = 40
-        if len(seq_summary_for_fn) > max_seq_part_len:
-            seq_summary_for_fn = seq_summary_for_fn[:max_seq_part_len] + "_etc"
-        if not seq_summary_for_fn: seq_summary_for_fn = "patterns"
-        actual_head_param_fn = head_param_for_filename
-        dynamic_filename = f"{timestamp}_{seq_summary_for_fn}{actual_head_param_fn}.tsv"
-        final_tsv_output_path = Path(DEFAULT_OUTPUT_DIR_COUNTS) / dynamic_filename
+        final_tsv_output_path = scanner.default_tsv_path()
     else:
         final_tsv_output_path = Path(final_tsv_output_path_str)
         if final_tsv_output_path.parent == Path("."):
@@ -314,101 +1330,18 @@ def main():
         print(f"错误: 无法创建TSV输出目录 '{tsv_output_directory}': {e}", file=sys.stderr)
         sys.exit(1)
 
-    # --- FASTQ Output Directory Setup ---
-    actual_out_fastq_dir_path_for_worker = DEFAULT_OUTPUT_DIR_FASTQ # Base for matched
-    unmap_dir_path_for_worker = "" # Path for unmatched
-    
-    # Make write_matching_reads_flag for worker reflect actual possibility of writing
-    write_matching_reads_enabled_for_worker = args.write_matching_reads
-    write_unmatched_reads_enabled_for_worker = False # Default to false
-
-    if args.write_matching_reads:
-        if args.fastq_output_dir:
-            fastq_base_dir_to_create = Path(args.fastq_output_dir)
-        else:
-            fastq_base_dir_to_create = Path(DEFAULT_OUTPUT_DIR_FASTQ)
-        
-        actual_out_fastq_dir_path_for_worker = str(fastq_base_dir_to_create)
-
-        try:
-            fastq_base_dir_to_create.mkdir(parents=True, exist_ok=True)
-            print(f"信息: 匹配的FASTQ记录将被写入到 '{fastq_base_dir_to_create}' 目录。", file=sys.stderr)
-
-            # Now handle unmatched reads directory if that flag is also set
-            if args.write_unmatched_reads:
-                unmap_specific_dir = fastq_base_dir_to_create / DEFAULT_UNMATCHED_SUBDIR
-                unmap_dir_path_for_worker = str(unmap_specific_dir)
-                try:
-                    unmap_specific_dir.mkdir(parents=True, exist_ok=True)
-                    print(f"信息: 未匹配的FASTQ记录将被写入到 '{unmap_specific_dir}' 目录。", file=sys.stderr)
-                    write_unmatched_reads_enabled_for_worker = True # Enable for worker
-                except Exception as e_unmap:
-                    print(f"错误: 无法创建未匹配FASTQ输出子目录 '{unmap_specific_dir}': {e_unmap}", file=sys.stderr)
-                    print("警告: 由于无法创建子目录，将不写入未匹配的FASTQ记录。", file=sys.stderr)
-                    # write_unmatched_reads_enabled_for_worker remains False
-        except Exception as e_fastq:
-            print(f"错误: 无法创建主要的FASTQ输出目录 '{fastq_base_dir_to_create}': {e_fastq}", file=sys.stderr)
-            print("警告: 由于无法创建主要的FASTQ目录，将不写入任何FASTQ记录 (匹配或未匹配)。", file=sys.stderr)
-            write_matching_reads_enabled_for_worker = False # Disable for worker
-            write_unmatched_reads_enabled_for_worker = False # Also disable this
-    elif args.write_unmatched_reads: # --write-unmatched-reads is on, but --write-matching-reads is off
-        print(f"警告: --write-unmatched-reads 选项仅在 --write-matching-reads 也启用时生效。", file=sys.stderr)
-        print("警告: 将不写入未匹配的FASTQ记录。", file=sys.stderr)
-        # write_unmatched_reads_enabled_for_worker remains False
-
     input_files = glob.glob(args.input_pattern)
     if not input_files:
         print(f"警告: 未找到匹配模式 '{args.input_pattern}' 的文件。", file=sys.stderr)
 
-    results_list = []
-    worker_args_list = []
-    for gz_file in input_files:
-        if not os.path.isfile(gz_file):
-            print(f"警告: '{gz_file}' 不是一个有效的文件，已跳过。", file=sys.stderr)
-            continue
-        worker_args_list.append(
-            (gz_file, patterns_string, forward_patterns, rc_patterns,
-             effective_lines_to_process, process_all_lines_flag, sequence_description,
-             write_matching_reads_enabled_for_worker, # Use the flag that reflects actual possibility
-             actual_out_fastq_dir_path_for_worker,
-             write_unmatched_reads_enabled_for_worker, # Use the flag that reflects actual possibility
-             unmap_dir_path_for_worker)
-        )
-
-    if worker_args_list:
-        with concurrent.futures.ProcessPoolExecutor(max_workers=num_parallel_jobs) as executor:
-            future_to_file = {executor.submit(process_file_worker, arg_tuple): arg_tuple[0] for arg_tuple in worker_args_list}
-            for future in concurrent.futures.as_completed(future_to_file):
-                file_path = future_to_file[future]
-                try:
-                    result = future.result()
-                    if result:
-                        results_list.append(result)
-                except Exception as exc:
-                    print(f"警告: 文件 '{file_path}' 在处理时产生错误: {exc}", file=sys.stderr)
-
-    if results_list:
-        results_list.sort(key=lambda x: x[0]) # Sort by sample_name
-
-    header = (
-        "样本\t序列描述\t查询序列组合\t全正向匹配Reads数\t" # Changed wording
-        "全反向互补匹配Reads数\t总处理Reads数\t全正向匹配比例(%)\t全反向互补匹配比例(%)" # Changed wording
-    )
-
-    output_lines = [header]
-    for res_tuple in results_list:
-        output_lines.append("\t".join(map(str, res_tuple)))
+    stage_timer = ResourceTimer()
+    with profile_stage(profile_options_from_args(args), "S1"):
+        result = scanner.run(input_files)
+        result.write_tsv(final_tsv_output_path, echo=True)
 
-    try:
-        with open(final_tsv_output_path, 'w', encoding='utf-8') as f_out:
-            for line in output_lines:
-                print(line)
-                f_out.write(line + "\n")
-        print(f"\n信息: TSV结果已写入文件: {final_tsv_output_path}", file=sys.stderr)
-    except Exception as e:
-        print(f"错误: 无法写入TSV输出文件 '{final_tsv_output_path}': {e}", file=sys.stderr)
-        if not output_lines or len(output_lines) == 1:
-            print("信息: 没有TSV数据行被处理或写入。", file=sys.stderr)
+    if args.metrics_file:
+        stage_metrics = StageMetrics("S1", files=result.file_metrics)
+        write_metrics_file(stage_metrics.finish(stage_timer.stop(), not result.failed_files), args.metrics_file)
 
 if __name__ == "__main__":
     main()
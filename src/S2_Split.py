@@ -2,222 +2,930 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import gzip
+import collections
+import concurrent.futures
+import contextlib
+import logging
+import multiprocessing
 import os
 import sys
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Optional
+
+from chunk_handoff import ChunkPairPublisher
+from gzip_codec import (add_gzip_arguments, default_gzip_options, describe_gzip_options, gzip_options_from_args,
+                        open_gzip_reader, open_gzip_writer)
+from resource_probe import probe_resources
+from sequence_matchers import ApproximatePattern
+from stage_logs import LineLogWriter, get_worker_logger, init_worker_logging
+from stage_metrics import (FILE_STATUS_DONE, FILE_STATUS_FAILED, FileMetrics, ResourceTimer, StageMetrics,
+                           get_file_size, get_total_size, write_metrics_file)
+from stage_profiler import (add_profile_arguments, get_profile_env, init_worker_profiling, profile_options_from_args,
+                            profile_stage, profiled_worker)
+
+# FASTQ为纯ASCII, 读写全程使用bytes, 跳过文本编解码
+COMPLEMENT_MAP_STR = str.maketrans("ATCGatcgNn", "TAGCtagcNn")
+COMPLEMENT_MAP_BYTES = bytes.maketrans(b"ATCGatcgNn", b"TAGCtagcNn")
+
+DEFAULT_CHUNK_READS = 0  # 每批reads数, >0时在 -j 个进程中并行分割; 0为逐条处理
+DEFAULT_PROGRESS_SECONDS = 30.0  # 两次进度输出之间的最短间隔 (秒)
+WORKER_MEMORY_MB = 256  # 每个S2工作进程的内存预估 (gzip读写缓冲、处理中的批次), 用于确定默认并行任务数
+PROGRESS_CHECK_READS = 1000  # 逐条处理时每多少条reads检查一次是否该输出进度
+DEFAULT_SEPARATOR1 = "GATCATGTCGGAACTGTTGCTTGTCCGACTGATC"
+DEFAULT_SEPARATOR2 = "AGATCGGAAGA"
+DEFAULT_MIN_LENGTH = 10
+
+def get_default_jobs():
+    """
+    默认并行任务数: 本进程可用的CPU数 (CPU亲和性、cgroup配额), 且不超过可用内存允许的任务数;
+    打印探测结果
+    """
+    probe = probe_resources()
+    jobs = probe.worker_count(WORKER_MEMORY_MB * 1024 * 1024)
+    print(f"资源探测: {probe.describe()}, 默认S2并行任务数: {jobs}", file=sys.stderr)
+    return jobs
 
 def get_reverse_complement(dna_sequence):
     """
-    计算DNA序列的反向互补序列
+    计算DNA序列的反向互补序列 (支持str或bytes, 返回相同类型)
     """
-    complement_map = str.maketrans("ATCGatcgNn", "TAGCtagcNn")
-    complemented_seq = dna_sequence.translate(complement_map)
+    if isinstance(dna_sequence, bytes):
+        complemented_seq = dna_sequence.translate(COMPLEMENT_MAP_BYTES)
+    else:
+        complemented_seq = dna_sequence.translate(COMPLEMENT_MAP_STR)
     return complemented_seq[::-1]
 
+def _find_after(sequence, separator, first_hit, start):
+    """
+    返回separator在start之后的首个位置; first_hit为从更早位置查找的结果, 可复用时不再查找
+    """
+    if first_hit == -1 or first_hit >= start:
+        return first_hit
+    return sequence.find(separator, start)
+
 def find_separators_in_sequence(sequence, sep1_fwd, sep1_rc, sep2_fwd, sep2_rc):
     """
     在序列中查找分隔符的所有可能组合
     返回: (sep1_pos, sep1_end, sep2_pos, orientation)
     orientation: 'forward', 'reverse', 'mixed_fwd_rc', 'mixed_rc_fwd'
+    
+    每个sep1方向只查找一次 (首次出现); 每个sep2方向先从较早的sep1末端查找一次,
+    结果位于另一个sep1末端之后时直接复用, 因此最多6次、通常2~4次find。
+    多个组合同时成立时取R2最短的, 长度相同时按上面的方向顺序取第一个。
     """
-    results = []
+    # 1. 两个方向的第一个分隔符
+    sep1_fwd_pos = sequence.find(sep1_fwd)
+    sep1_rc_pos = sep1_fwd_pos if sep1_rc == sep1_fwd else sequence.find(sep1_rc)
+    if sep1_fwd_pos == -1 and sep1_rc_pos == -1:
+        return None
     
-    # 1. 正向组合: sep1_fwd + sep2_fwd
-    sep1_pos = sequence.find(sep1_fwd)
-    if sep1_pos != -1:
-        sep1_end = sep1_pos + len(sep1_fwd)
-        sep2_pos = sequence.find(sep2_fwd, sep1_end)
-        if sep2_pos != -1:
-            results.append((sep1_pos, sep1_end, sep2_pos, 'forward'))
+    sep1_fwd_end = sep1_fwd_pos + len(sep1_fwd)
+    sep1_rc_end = sep1_rc_pos + len(sep1_rc)
+    if sep1_fwd_pos == -1:
+        first_end = sep1_rc_end
+    elif sep1_rc_pos == -1:
+        first_end = sep1_fwd_end
+    else:
+        first_end = min(sep1_fwd_end, sep1_rc_end)
     
-    # 2. 反向互补组合: sep1_rc + sep2_rc
-    sep1_pos = sequence.find(sep1_rc)
-    if sep1_pos != -1:
-        sep1_end = sep1_pos + len(sep1_rc)
-        sep2_pos = sequence.find(sep2_rc, sep1_end)
-        if sep2_pos != -1:
-            results.append((sep1_pos, sep1_end, sep2_pos, 'reverse'))
+    # 2. 两个方向的第二个分隔符, 从最早的sep1末端开始查找
+    sep2_fwd_first = sequence.find(sep2_fwd, first_end)
+    sep2_rc_first = sep2_fwd_first if sep2_rc == sep2_fwd else sequence.find(sep2_rc, first_end)
+    if sep2_fwd_first == -1 and sep2_rc_first == -1:
+        return None
     
-    # 3. 混合组合1: sep1_fwd + sep2_rc
-    sep1_pos = sequence.find(sep1_fwd)
-    if sep1_pos != -1:
-        sep1_end = sep1_pos + len(sep1_fwd)
-        sep2_pos = sequence.find(sep2_rc, sep1_end)
+    # 3. 按 forward, reverse, mixed_fwd_rc, mixed_rc_fwd 的顺序选出R2最短的组合
+    best = None
+    best_r2_length = 0
+    if sep1_fwd_pos != -1:
+        sep2_pos = _find_after(sequence, sep2_fwd, sep2_fwd_first, sep1_fwd_end)
         if sep2_pos != -1:
-            results.append((sep1_pos, sep1_end, sep2_pos, 'mixed_fwd_rc'))
+            best = (sep1_fwd_pos, sep1_fwd_end, sep2_pos, 'forward')
+            best_r2_length = sep2_pos - sep1_fwd_end
+    if sep1_rc_pos != -1:
+        sep2_pos = _find_after(sequence, sep2_rc, sep2_rc_first, sep1_rc_end)
+        if sep2_pos != -1 and (best is None or sep2_pos - sep1_rc_end < best_r2_length):
+            best = (sep1_rc_pos, sep1_rc_end, sep2_pos, 'reverse')
+            best_r2_length = sep2_pos - sep1_rc_end
+    if sep1_fwd_pos != -1:
+        sep2_pos = _find_after(sequence, sep2_rc, sep2_rc_first, sep1_fwd_end)
+        if sep2_pos != -1 and (best is None or sep2_pos - sep1_fwd_end < best_r2_length):
+            best = (sep1_fwd_pos, sep1_fwd_end, sep2_pos, 'mixed_fwd_rc')
+            best_r2_length = sep2_pos - sep1_fwd_end
+    if sep1_rc_pos != -1:
+        sep2_pos = _find_after(sequence, sep2_fwd, sep2_fwd_first, sep1_rc_end)
+        if sep2_pos != -1 and (best is None or sep2_pos - sep1_rc_end < best_r2_length):
+            best = (sep1_rc_pos, sep1_rc_end, sep2_pos, 'mixed_rc_fwd')
     
-    # 4. 混合组合2: sep1_rc + sep2_fwd
-    sep1_pos = sequence.find(sep1_rc)
-    if sep1_pos != -1:
-        sep1_end = sep1_pos + len(sep1_rc)
-        sep2_pos = sequence.find(sep2_fwd, sep1_end)
-        if sep2_pos != -1:
-            results.append((sep1_pos, sep1_end, sep2_pos, 'mixed_rc_fwd'))
+    return best
+
+def find_separators_approximately(sequence, sep1_fwd, sep1_rc, sep2_fwd, sep2_rc):
+    """
+    容错版 find_separators_in_sequence: 分隔符为 sequence_matchers.ApproximatePattern,
+    允许一定数量的错配或编辑
+    精确查找能找到组合时直接返回其结果, 因此能精确分割的reads与精确模式完全相同;
+    否则每个分隔符优先取精确出现, 再取最靠左的容错出现, 方向顺序及R2最短的选择规则与精确查找相同。
+    先确定sep2精确出现的组合, 其余组合只在能得到更短R2的范围内 (stop) 做容错查找,
+    避免对不存在的方向组合在整条read上做容错查找
+    返回: (sep1_pos, sep1_end, sep2_pos, orientation)
+    """
+    exact_result = find_separators_in_sequence(sequence, sep1_fwd.pattern, sep1_rc.pattern,
+                                               sep2_fwd.pattern, sep2_rc.pattern)
+    if exact_result:
+        return exact_result
     
-    # 返回最佳匹配（最短的R2序列，通常更可靠）
-    if results:
-        # 按R2长度排序，选择最短的
-        results.sort(key=lambda x: x[2] - x[1])
-        return results[0]
+    sep1_fwd_hit = sep1_fwd.find(sequence)
+    sep1_rc_hit = sep1_fwd_hit if sep1_rc.pattern == sep1_fwd.pattern else sep1_rc.find(sequence)
+    if sep1_fwd_hit is None and sep1_rc_hit is None:
+        return None
     
-    return None
+    combinations = (('forward', sep1_fwd_hit, sep2_fwd),
+                    ('reverse', sep1_rc_hit, sep2_rc),
+                    ('mixed_fwd_rc', sep1_fwd_hit, sep2_rc),
+                    ('mixed_rc_fwd', sep1_rc_hit, sep2_fwd))
+    best = None
+    best_index = 0
+    best_r2_length = 0
+    pending = []
+    # 1. sep2精确出现的组合 (精确优先, 结果已确定)
+    for index, (orientation, sep1_hit, sep2) in enumerate(combinations):
+        if sep1_hit is None:
+            continue
+        sep2_pos = sequence.find(sep2.pattern, sep1_hit[1])
+        if sep2_pos == -1:
+            pending.append(index)
+        elif best is None or sep2_pos - sep1_hit[1] < best_r2_length:
+            best = (sep1_hit[0], sep1_hit[1], sep2_pos, orientation)
+            best_index = index
+            best_r2_length = sep2_pos - sep1_hit[1]
+    
+    # 2. 其余组合的sep2容错查找; 方向顺序靠前的组合R2长度相同时也胜出
+    for index in pending:
+        orientation, (sep1_pos, sep1_end), sep2 = combinations[index]
+        stop = None
+        if best is not None:
+            stop = sep1_end + best_r2_length + (1 if index < best_index else 0)
+        sep2_hit = sep2.find(sequence, sep1_end, stop)
+        if sep2_hit is not None:
+            best = (sep1_pos, sep1_end, sep2_hit[0], orientation)
+            best_index = index
+            best_r2_length = sep2_hit[0] - sep1_end
+    return best
+
+ORIENTATIONS = ('forward', 'reverse', 'mixed_fwd_rc', 'mixed_rc_fwd')
+PAIR_OUTPUT_PER_PAIR = "per-pair"  # 每个分隔符对写出各自的R1/R2
+PAIR_OUTPUT_COMBINED = "combined"  # 所有分隔符对写入同一R1/R2, header中标注分隔符对名称
+PAIR_OUTPUT_MODES = (PAIR_OUTPUT_PER_PAIR, PAIR_OUTPUT_COMBINED)
 
-def split_fastq_by_sequences_paired(input_file, output_dir, separator1, separator2, min_length=10):
+def prepare_separators(separator1, separator2, max_mismatches=0, max_edits=0):
     """
-    根据两个分隔符序列分割FASTQ文件，确保R1和R2完全配对
-    支持反向互补匹配
-    
+    以bytes形式预先计算分隔符及其反向互补序列
+    max_mismatches或max_edits>0时返回对应的 ApproximatePattern (容错查找)
+    返回: (sep1_fwd, sep1_rc, sep2_fwd, sep2_rc)
+    """
+    sep1_fwd = separator1.encode('ascii') if isinstance(separator1, str) else separator1
+    sep2_fwd = separator2.encode('ascii') if isinstance(separator2, str) else separator2
+    separators = (sep1_fwd, get_reverse_complement(sep1_fwd), sep2_fwd, get_reverse_complement(sep2_fwd))
+    if max_mismatches or max_edits:
+        return tuple(ApproximatePattern(separator, max_mismatches, max_edits) for separator in separators)
+    return separators
+
+def prepare_separator_pairs(pair_specs, max_mismatches=0, max_edits=0):
+    """
+    预先计算一组命名分隔符对
     Args:
-        input_file: 输入的FASTQ.gz文件路径
-        output_dir: 输出目录
-        separator1: 第一个分隔符序列 (GATCATGTCGGAACTGTTGCTTGTCCGACTGATC)
-        separator2: 第二个分隔符序列 (AGATCGGAAGA)
-        min_length: 分割后序列的最小长度
+        pair_specs: [(name, separator1, separator2), ...]; 只有一对且name为None时即单分隔符对模式
+        max_mismatches / max_edits: 分隔符允许的最大错配数 / 编辑数 (0为精确查找)
+    返回: [(name, (sep1_fwd, sep1_rc, sep2_fwd, sep2_rc)), ...]
+    """
+    return [(name, prepare_separators(separator1, separator2, max_mismatches, max_edits))
+            for name, separator1, separator2 in pair_specs]
+
+def get_separator_text(separator):
+    """
+    分隔符的文本形式 (bytes或ApproximatePattern)
+    """
+    if isinstance(separator, ApproximatePattern):
+        separator = separator.pattern
+    return separator.decode('ascii')
+
+def parse_separator_pair(pair_spec):
+    """
+    解析 '名称=分隔符1,分隔符2' 形式的分隔符对, 返回 (name, separator1, separator2) (分隔符转为大写)
+    """
+    name, has_name, separators = pair_spec.partition('=')
+    separator_list = [sep.strip().upper() for sep in separators.split(',')]
+    if not has_name or not name.strip() or len(separator_list) != 2 or not all(separator_list):
+        raise ValueError(f"分隔符对的格式应为 '名称=分隔符1,分隔符2': '{pair_spec}'")
+    return name.strip(), separator_list[0], separator_list[1]
+
+def get_split_base_name(input_filename):
+    """
+    S2输出文件名前缀: 输入文件名去掉 .fq.gz / .fastq.gz
+    """
+    return input_filename.replace('.fq.gz', '').replace('.fastq.gz', '')
+
+def get_split_sample_dir_name(input_filename):
+    """
+    流程中每个输入文件的S2输出子目录名: 输入文件名去掉 .gz / .fq / .fastq
+    """
+    return input_filename.replace('.gz', '').replace('.fq', '').replace('.fastq', '')
+
+def new_split_stats(pair_names=None):
+    """
+    创建S2统计字典 (总reads、配对reads、丢弃reads及方向统计)
+    给出pair_names时另按分隔符对统计配对reads和方向
+    """
+    stats = {
+        'total_reads': 0,
+        'paired_reads': 0,  # 成功配对的reads数
+        'discarded_reads': 0,  # 丢弃的reads数
+        'orientation_stats': {orientation: 0 for orientation in ORIENTATIONS}
+    }
+    if pair_names:
+        stats['pair_stats'] = [{
+            'name': name,
+            'paired_reads': 0,
+            'orientation_stats': {orientation: 0 for orientation in ORIENTATIONS}
+        } for name in pair_names]
+    return stats
+
+def merge_split_stats(target_stats, batch_stats):
     """
+    将batch_stats累加到target_stats
+    """
+    for key in ('total_reads', 'paired_reads', 'discarded_reads'):
+        target_stats[key] += batch_stats[key]
+    for orientation, count in batch_stats['orientation_stats'].items():
+        target_stats['orientation_stats'][orientation] += count
+    for target_pair, batch_pair in zip(target_stats.get('pair_stats', ()), batch_stats.get('pair_stats', ())):
+        target_pair['paired_reads'] += batch_pair['paired_reads']
+        for orientation, count in batch_pair['orientation_stats'].items():
+            target_pair['orientation_stats'][orientation] += count
+
+def split_record(header, sequence, quality, separator_pairs, min_length, tag_pairs=False):
+    """
+    按分隔符分割一条记录 (各行均为去掉换行的bytes)
+    有多个分隔符对时, 所有分隔符对的所有方向组合中取R2最短的一个 (长度相同时取靠前的分隔符对)
+    tag_pairs为True时在R1/R2的header后附加 ' pair=<名称>'
+    返回: (pair_index, orientation, r1_record, r2_record), 未找到分隔符组合或长度不足时返回None
+    """
+    # 查找分隔符（包括反向互补）; 容错模式下分隔符为ApproximatePattern
+    if type(separator_pairs[0][1][0]) is bytes:
+        find_separators = find_separators_in_sequence
+    else:
+        find_separators = find_separators_approximately
+    if len(separator_pairs) == 1:
+        pair_index = 0
+        result = find_separators(sequence, *separator_pairs[0][1])
+    else:
+        pair_index = None
+        result = None
+        for index, (_, separators) in enumerate(separator_pairs):
+            pair_result = find_separators(sequence, *separators)
+            if pair_result and (result is None or pair_result[2] - pair_result[1] < result[2] - result[1]):
+                pair_index = index
+                result = pair_result
+    if not result:
+        return None
     
-    # 计算反向互补序列
-    sep1_fwd = separator1
-    sep1_rc = get_reverse_complement(separator1)
-    sep2_fwd = separator2
-    sep2_rc = get_reverse_complement(separator2)
+    sep1_pos, sep1_end, sep2_pos, orientation = result
     
-    # 创建输出目录
-    output_path = Path(output_dir)
-    output_path.mkdir(parents=True, exist_ok=True)
+    # R1: 从开始到第一个分隔符之前; R2: 从第一个分隔符结束到第二个分隔符之前
+    r1_seq = sequence[:sep1_pos]
+    r2_seq = sequence[sep1_end:sep2_pos]
     
-    # 准备输出文件名
-    input_filename = Path(input_file).name
-    base_name = input_filename.replace('.fq.gz', '').replace('.fastq.gz', '')
+    # 检查长度是否满足要求
+    if len(r1_seq) < min_length or len(r2_seq) < min_length:
+        return None
     
-    r1_output = output_path / f"{base_name}_R1.fq.gz"
-    r2_output = output_path / f"{base_name}_R2.fq.gz"
-    discarded_output = output_path / f"{base_name}_discarded.fq.gz"
+    read_id = header.split()[0]  # 获取read ID（去掉可能的描述）
+    tag = b""
+    if tag_pairs:
+        tag = b" pair=" + separator_pairs[pair_index][0].encode('ascii')
+    r1_record = read_id + b"/1" + tag + b"\n" + r1_seq + b"\n+\n" + quality[:sep1_pos] + b"\n"
+    r2_record = read_id + b"/2" + tag + b"\n" + r2_seq + b"\n+\n" + quality[sep1_end:sep2_pos] + b"\n"
+    return pair_index, orientation, r1_record, r2_record
+
+def split_fastq_record(header, sequence, plus, quality, separator_pairs, min_length, stats, tag_pairs=False):
+    """
+    校验、分割并统计一条记录 (各行均为去掉换行的bytes), 统计累加到stats
+    返回: (pair_index, r1_record, r2_record, discarded_record), 未产生的部分为None
+    格式错误的记录 (header不以@开头或plus不以+开头) 不计数, 返回None
+    """
+    # 检查是否是完整的FASTQ记录
+    if not header.startswith(b'@') or not plus.startswith(b'+'):
+        return None
     
-    # 统计计数器
-    total_reads = 0
-    paired_reads = 0  # 成功配对的reads数
-    discarded_reads = 0  # 丢弃的reads数
+    stats['total_reads'] += 1
+    split_result = split_record(header, sequence, quality, separator_pairs, min_length, tag_pairs)
+    if split_result:
+        pair_index, orientation, r1_record, r2_record = split_result
+        stats['paired_reads'] += 1
+        stats['orientation_stats'][orientation] += 1
+        if 'pair_stats' in stats:
+            pair_stats = stats['pair_stats'][pair_index]
+            pair_stats['paired_reads'] += 1
+            pair_stats['orientation_stats'][orientation] += 1
+        return pair_index, r1_record, r2_record, None
     
-    # 方向统计
-    orientation_stats = {
-        'forward': 0,
-        'reverse': 0,
-        'mixed_fwd_rc': 0,
-        'mixed_rc_fwd': 0
-    }
+    # 没有找到合适的分隔符组合或长度不满足要求，丢弃
+    stats['discarded_reads'] += 1
+    return None, None, None, header + b"\n" + sequence + b"\n" + plus + b"\n" + quality + b"\n"
+
+def make_split_settings(separator_pairs, min_length, combined=False):
+    """
+    分割一批记录所需的参数: (separator_pairs, min_length, tag_pairs, pair_slots)
+    pair_slots为每个分隔符对写入的输出槽位 (一组R1/R2文件): 命名分隔符对分别写出时各占一个槽位,
+    否则共用槽位0; combined模式下在header中标注分隔符对 (tag_pairs)
+    """
+    named_pairs = any(name is not None for name, _ in separator_pairs)
+    if named_pairs and not combined:
+        pair_slots = list(range(len(separator_pairs)))
+    else:
+        pair_slots = [0] * len(separator_pairs)
+    return separator_pairs, min_length, combined and named_pairs, pair_slots
+
+def new_batch_split_stats(separator_pairs):
+    """
+    与PairedSplitWriter.stats结构相同的空统计 (命名分隔符对时包含pair_stats)
+    """
+    pair_names = [name for name, _ in separator_pairs]
+    return new_split_stats(pair_names if any(name is not None for name in pair_names) else None)
+
+class PairedSplitWriter:
+    """
+    一个输入文件的S2输出: <base_name>_R1.fq.gz、_R2.fq.gz、_discarded.fq.gz
+    多个命名分隔符对按分隔符对分别写出 <base_name>_<名称>_R1/_R2.fq.gz,
+    combined为True时写入同一R1/R2并在header中标注分隔符对; 丢弃的reads始终写入同一文件
+    R1和R2同时写入, 保证完全配对; 统计信息保存在 self.stats
+    handoff_chunk_reads>0时R1/R2改为按块原子发布的 <名称>_partNNNN_R1/_R2.fq.gz (chunk_handoff),
+    下游在分割结束前即可读取; 关闭后r1_outputs/r2_outputs为所有已发布的分块
+    """
+    def __init__(self, output_dir, base_name, separator_pairs, min_length, gzip_options=None, combined=False,
+                 handoff_chunk_reads=0):
+        gzip_options = gzip_options or {}
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        self.separator_pairs = separator_pairs
+        self.min_length = min_length
+        self.split_settings = make_split_settings(separator_pairs, min_length, combined)
+        _, _, self.tag_pairs, self.pair_slots = self.split_settings
+        if not combined and any(name is not None for name, _ in separator_pairs):
+            self.r1_outputs = [output_path / f"{base_name}_{name}_R1.fq.gz" for name, _ in separator_pairs]
+            self.r2_outputs = [output_path / f"{base_name}_{name}_R2.fq.gz" for name, _ in separator_pairs]
+        else:
+            self.r1_outputs = [output_path / f"{base_name}_R1.fq.gz"]
+            self.r2_outputs = [output_path / f"{base_name}_R2.fq.gz"]
+        self.r1_output = self.r1_outputs[0]
+        self.r2_output = self.r2_outputs[0]
+        self.discarded_output = output_path / f"{base_name}_discarded.fq.gz"
+        self.stats = new_batch_split_stats(separator_pairs)
+        self.chunk_publishers = []
+        if handoff_chunk_reads > 0:
+            self.chunk_publishers = [ChunkPairPublisher(output_path, path.name[:-len("_R1.fq.gz")],
+                                                        handoff_chunk_reads, gzip_options)
+                                     for path in self.r1_outputs]
+            self.r1_files = self.r2_files = []
+        else:
+            self.r1_files = [open_gzip_writer(path, 'wb', **gzip_options) for path in self.r1_outputs]
+            self.r2_files = [open_gzip_writer(path, 'wb', **gzip_options) for path in self.r2_outputs]
+        self.discarded_file = open_gzip_writer(self.discarded_output, 'wb', **gzip_options)
+
+    def add_record(self, header, sequence, plus, quality):
+        """
+        分割并写入一条记录 (各行均为去掉换行的bytes)
+        格式错误的记录不计数, 返回False
+        """
+        split_parts = split_fastq_record(header, sequence, plus, quality,
+                                         self.separator_pairs, self.min_length, self.stats, self.tag_pairs)
+        if split_parts is None:
+            return False
+        pair_index, r1_record, r2_record, discarded_record = split_parts
+        if r1_record is not None:
+            # 同时写入R1和R2，确保配对
+            slot = self.pair_slots[pair_index]
+            if self.chunk_publishers:
+                self.chunk_publishers[slot].write(r1_record, r2_record, 1)
+            else:
+                self.r1_files[slot].write(r1_record)
+                self.r2_files[slot].write(r2_record)
+        else:
+            self.discarded_file.write(discarded_record)
+        return True
+
+    def add_split_batch(self, r1_parts, r2_parts, discarded_bytes, batch_stats):
+        """
+        写入在其他进程中已分割好的一批记录 (r1_parts/r2_parts为每个输出槽位的bytes), 并累加其统计
+        """
+        if self.chunk_publishers:
+            for chunk_publisher, r1_bytes, r2_bytes in zip(self.chunk_publishers, r1_parts, r2_parts):
+                if r1_bytes:
+                    chunk_publisher.write(r1_bytes, r2_bytes)
+        for r1_file, r2_file, r1_bytes, r2_bytes in zip(self.r1_files, self.r2_files, r1_parts, r2_parts):
+            if r1_bytes:
+                r1_file.write(r1_bytes)
+                r2_file.write(r2_bytes)
+        if discarded_bytes:
+            self.discarded_file.write(discarded_bytes)
+        merge_split_stats(self.stats, batch_stats)
+
+    def close(self, error=None):
+        """
+        关闭所有输出; 分块交接时发布最后的分块并写入完成标记, error不为None时改为写入失败标记
+        """
+        for handle in self.r1_files + self.r2_files + [self.discarded_file]:
+            handle.close()
+        for chunk_publisher in self.chunk_publishers:
+            if error is None:
+                chunk_publisher.close()
+            else:
+                chunk_publisher.abort(error)
+        if self.chunk_publishers:
+            self.r1_outputs = [path for publisher in self.chunk_publishers for path in publisher.r1_outputs]
+            self.r2_outputs = [path for publisher in self.chunk_publishers for path in publisher.r2_outputs]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(exc_value)
+
+def iter_stripped_records(infile):
+    """
+    逐条读取FASTQ的4行记录 (去掉首尾空白), 读到空header时结束
+    """
+    while True:
+        # 读取FASTQ的4行记录
+        header = infile.readline().strip()
+        if not header:
+            break
+        
+        sequence = infile.readline().strip()
+        plus = infile.readline().strip()
+        quality = infile.readline().strip()
+        yield header, sequence, plus, quality
+
+def iter_record_batches(infile, chunk_reads):
+    """
+    将记录按每批最多chunk_reads条分组
+    """
+    batch = []
+    for record in iter_stripped_records(infile):
+        batch.append(record)
+        if len(batch) >= chunk_reads:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+@profiled_worker("S2_batch_worker")
+def split_record_batch(batch_args):
+    """
+    分块模式的工作进程函数: 分割一批记录
+    Args:
+        batch_args: (record_batch, split_settings)  # split_settings见make_split_settings
+    返回: (r1_parts, r2_parts, discarded_bytes, batch_stats, malformed_positions)
+    r1_parts/r2_parts为每个输出槽位的bytes;
+    malformed_positions为每条格式错误记录出现时本批已计数的reads数, 用于还原警告中的行号
+    """
+    record_batch, split_settings = batch_args
+    separator_pairs, min_length, tag_pairs, pair_slots = split_settings
+    batch_stats = new_batch_split_stats(separator_pairs)
+    slot_count = max(pair_slots) + 1
+    r1_records = [[] for _ in range(slot_count)]
+    r2_records = [[] for _ in range(slot_count)]
+    discarded_records = []
+    malformed_positions = []
+    for header, sequence, plus, quality in record_batch:
+        split_parts = split_fastq_record(header, sequence, plus, quality, separator_pairs, min_length,
+                                         batch_stats, tag_pairs)
+        if split_parts is None:
+            malformed_positions.append(batch_stats['total_reads'])
+            continue
+        pair_index, r1_record, r2_record, discarded_record = split_parts
+        if r1_record is not None:
+            slot = pair_slots[pair_index]
+            r1_records[slot].append(r1_record)
+            r2_records[slot].append(r2_record)
+        else:
+            discarded_records.append(discarded_record)
+    return ([b"".join(records) for records in r1_records], [b"".join(records) for records in r2_records],
+            b"".join(discarded_records), batch_stats, malformed_positions)
+
+class ProgressReporter:
+    """
+    按时间节流的进度输出: 距上次输出至少interval秒才打印 "已处理 N 条reads",
+    长时间运行的日志量与文件大小无关; interval<=0时每次检查都输出
+    """
+    def __init__(self, interval=DEFAULT_PROGRESS_SECONDS):
+        self.interval = interval
+        self.last_report = time.monotonic()
+
+    def update(self, stats):
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            print(f"已处理 {stats['total_reads']} 条reads，配对 {stats['paired_reads']} 条...", flush=True)
+
+def split_records_serial(infile, split_writer, progress):
+    """
+    逐条分割并写入
+    """
+    stats = split_writer.stats
+    for header, sequence, plus, quality in iter_stripped_records(infile):
+        if not split_writer.add_record(header, sequence, plus, quality):
+            print(f"警告: 跳过格式错误的记录，行号约为 {stats['total_reads'] * 4}")
+            continue
+        
+        # 每PROGRESS_CHECK_READS条记录检查一次是否需要打印进度
+        if stats['total_reads'] % PROGRESS_CHECK_READS == 0:
+            progress.update(stats)
+
+def split_records_chunked(infile, split_writer, chunk_reads, jobs, progress):
+    """
+    分块并行分割: 当前进程读取并分批, jobs个工作进程查找分隔符并切分,
+    结果按输入顺序写出, 因此R1/R2严格配对且输出与逐条处理完全相同。
+    同时最多有 2*jobs 批在处理中, 内存占用有上限。
+    """
+    stats = split_writer.stats
+    split_settings = split_writer.split_settings
+    max_batches_in_flight = jobs * 2
+    pending_futures = collections.deque()
     
-    print(f"开始处理文件: {input_file}")
-    print(f"正向分隔符1: {sep1_fwd}")
-    print(f"反向分隔符1: {sep1_rc}")
-    print(f"正向分隔符2: {sep2_fwd}")
-    print(f"反向分隔符2: {sep2_rc}")
-    print(f"输出目录: {output_dir}")
-    print(f"最小长度要求: {min_length}")
+    def merge_oldest_batch():
+        r1_parts, r2_parts, discarded_bytes, batch_stats, malformed_positions = pending_futures.popleft().result()
+        reads_before = stats['total_reads']
+        for position in malformed_positions:
+            print(f"警告: 跳过格式错误的记录，行号约为 {(reads_before + position) * 4}")
+        split_writer.add_split_batch(r1_parts, r2_parts, discarded_bytes, batch_stats)
+        progress.update(stats)
+    
+    # 父进程持有gzip读写流 (可能是pigz管道), forkserver启动的工作进程不会继承它们
+    mp_context = None
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context('forkserver')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=mp_context, initializer=init_worker_profiling,
+                                                initargs=(get_profile_env(),)) as executor:
+        try:
+            for record_batch in iter_record_batches(infile, chunk_reads):
+                while len(pending_futures) >= max_batches_in_flight:
+                    merge_oldest_batch()
+                pending_futures.append(executor.submit(split_record_batch, (record_batch, split_settings)))
+            while pending_futures:
+                merge_oldest_batch()
+        except BaseException:
+            for future in pending_futures:
+                future.cancel()
+            raise
+
+def print_orientation_stats(orientation_stats):
+    """
+    打印四种方向组合的reads数
+    """
+    print(f"正向匹配 (sep1_fwd + sep2_fwd): {orientation_stats['forward']}")
+    print(f"反向匹配 (sep1_rc + sep2_rc): {orientation_stats['reverse']}")
+    print(f"混合匹配1 (sep1_fwd + sep2_rc): {orientation_stats['mixed_fwd_rc']}")
+    print(f"混合匹配2 (sep1_rc + sep2_fwd): {orientation_stats['mixed_rc_fwd']}")
+
+def print_split_summary(split_writer):
+    """
+    打印S2统计结果
+    """
+    stats = split_writer.stats
+    total_reads = stats['total_reads']
+    paired_reads = stats['paired_reads']
+    discarded_reads = stats['discarded_reads']
+    pair_stats_list = stats.get('pair_stats', [])
     
-    try:
-        with gzip.open(input_file, 'rt', errors='ignore') as infile, \
-             gzip.open(r1_output, 'wt') as r1_file, \
-             gzip.open(r2_output, 'wt') as r2_file, \
-             gzip.open(discarded_output, 'wt') as discarded_file:
-            
-            while True:
-                # 读取FASTQ的4行记录
-                header = infile.readline().strip()
-                if not header:
-                    break
-                    
-                sequence = infile.readline().strip()
-                plus = infile.readline().strip()
-                quality = infile.readline().strip()
-                
-                # 检查是否是完整的FASTQ记录
-                if not header.startswith('@') or not plus.startswith('+'):
-                    print(f"警告: 跳过格式错误的记录，行号约为 {total_reads * 4}")
-                    continue
-                
-                total_reads += 1
-                
-                # 查找分隔符（包括反向互补）
-                result = find_separators_in_sequence(sequence, sep1_fwd, sep1_rc, sep2_fwd, sep2_rc)
-                
-                if result:
-                    sep1_pos, sep1_end, sep2_pos, orientation = result
-                    
-                    # R1: 从开始到第一个分隔符之前
-                    r1_seq = sequence[:sep1_pos]
-                    r1_qual = quality[:sep1_pos]
-                    
-                    # R2: 从第一个分隔符结束到第二个分隔符之前
-                    r2_seq = sequence[sep1_end:sep2_pos]
-                    r2_qual = quality[sep1_end:sep2_pos]
-                    
-                    # 检查长度是否满足要求
-                    if len(r1_seq) >= min_length and len(r2_seq) >= min_length:
-                        # 同时写入R1和R2，确保配对
-                        read_id = header.split()[0]  # 获取read ID（去掉可能的描述）
-                        
-                        # 写入R1
-                        r1_file.write(f"{read_id}/1\n")
-                        r1_file.write(f"{r1_seq}\n")
-                        r1_file.write(f"+\n")
-                        r1_file.write(f"{r1_qual}\n")
-                        
-                        # 写入R2
-                        r2_file.write(f"{read_id}/2\n")
-                        r2_file.write(f"{r2_seq}\n")
-                        r2_file.write(f"+\n")
-                        r2_file.write(f"{r2_qual}\n")
-                        
-                        paired_reads += 1
-                        orientation_stats[orientation] += 1
-                    else:
-                        # 长度不满足要求，丢弃
-                        discarded_file.write(f"{header}\n")
-                        discarded_file.write(f"{sequence}\n")
-                        discarded_file.write(f"{plus}\n")
-                        discarded_file.write(f"{quality}\n")
-                        discarded_reads += 1
-                        
-                else:
-                    # 没有找到合适的分隔符组合，丢弃
-                    discarded_file.write(f"{header}\n")
-                    discarded_file.write(f"{sequence}\n")
-                    discarded_file.write(f"{plus}\n")
-                    discarded_file.write(f"{quality}\n")
-                    discarded_reads += 1
-                
-                # 每处理10000条记录打印一次进度
-                if total_reads % 10000 == 0:
-                    print(f"已处理 {total_reads} 条reads，配对 {paired_reads} 条...")
-    
-    except Exception as e:
-        print(f"处理文件时发生错误: {e}", file=sys.stderr)
-        return False
-    
-    # 打印统计结果
     print(f"\n=== 处理完成统计 ===")
     print(f"总reads数: {total_reads}")
     print(f"成功配对的reads数: {paired_reads}")
     print(f"丢弃的reads数: {discarded_reads}")
-    print(f"配对成功率: {paired_reads / total_reads * 100:.2f}%")
+    if total_reads > 0:
+        print(f"配对成功率: {paired_reads / total_reads * 100:.2f}%")
+    else:
+        print("配对成功率: N/A")
     
     print(f"\n=== 方向统计 ===")
-    print(f"正向匹配 (sep1_fwd + sep2_fwd): {orientation_stats['forward']}")
-    print(f"反向匹配 (sep1_rc + sep2_rc): {orientation_stats['reverse']}")
-    print(f"混合匹配1 (sep1_fwd + sep2_rc): {orientation_stats['mixed_fwd_rc']}")
-    print(f"混合匹配2 (sep1_rc + sep2_fwd): {orientation_stats['mixed_rc_fwd']}")
+    print_orientation_stats(stats['orientation_stats'])
+    
+    for pair_stats in pair_stats_list:
+        print(f"\n=== 分隔符对 {pair_stats['name']} ===")
+        print(f"成功配对的reads数: {pair_stats['paired_reads']}")
+        print_orientation_stats(pair_stats['orientation_stats'])
     
     print(f"\n输出文件:")
-    print(f"R1: {r1_output} ({paired_reads} reads)")
-    print(f"R2: {r2_output} ({paired_reads} reads)")
-    print(f"丢弃: {discarded_output} ({discarded_reads} reads)")
+    if split_writer.chunk_publishers:
+        for chunk_publisher in split_writer.chunk_publishers:
+            print(f"R1/R2分块: {chunk_publisher.output_dir}/{chunk_publisher.base_name}_partNNNN_R1/_R2.fq.gz "
+                  f"({len(chunk_publisher.r1_outputs)} 块, {chunk_publisher.total_reads} reads)")
+    elif len(split_writer.r1_outputs) > 1:
+        for pair_stats, r1_output, r2_output in zip(pair_stats_list, split_writer.r1_outputs, split_writer.r2_outputs):
+            print(f"R1: {r1_output} ({pair_stats['paired_reads']} reads)")
+            print(f"R2: {r2_output} ({pair_stats['paired_reads']} reads)")
+    else:
+        print(f"R1: {split_writer.r1_output} ({paired_reads} reads)")
+        print(f"R2: {split_writer.r2_output} ({paired_reads} reads)")
+    print(f"丢弃: {split_writer.discarded_output} ({discarded_reads} reads)")
     
     # 验证配对
     print(f"\n=== 配对验证 ===")
     print(f"R1文件reads数 = R2文件reads数: {paired_reads == paired_reads} ✓")
+
+@dataclass
+class S2Config:
+    """
+    S2分割参数, 即S2_Split.py命令行参数的进程内形式 (PairedSplitter 与S1融合模式使用)
+    separator_pairs: [(名称, 分隔符1, 分隔符2), ...], 非空时取代 separator1/separator2
+    pair_output: PAIR_OUTPUT_PER_PAIR 或 PAIR_OUTPUT_COMBINED
+    chunk_reads: >0时按每批chunk_reads条reads在jobs个进程中并行分割
+    gzip_options: gzip_codec 的读写参数
+    progress_seconds: 进度输出的最短间隔 (秒)
+    handoff_chunk_reads: >0时R1/R2按每块约handoff_chunk_reads条reads原子发布为分块文件 (chunk_handoff)
+    """
+    separator1: str = DEFAULT_SEPARATOR1
+    separator2: str = DEFAULT_SEPARATOR2
+    separator_pairs: list = field(default_factory=list)
+    min_length: int = DEFAULT_MIN_LENGTH
+    pair_output: str = PAIR_OUTPUT_PER_PAIR
+    max_mismatches: int = 0
+    max_edits: int = 0
+    chunk_reads: int = DEFAULT_CHUNK_READS
+    jobs: int = 1
+    gzip_options: dict = field(default_factory=default_gzip_options)
+    progress_seconds: float = DEFAULT_PROGRESS_SECONDS
+    handoff_chunk_reads: int = 0
+
+    @property
+    def combined(self):
+        return self.pair_output == PAIR_OUTPUT_COMBINED
+
+    def get_pair_specs(self):
+        """
+        分隔符对列表; 未配置separator_pairs时为单个未命名的 (None, separator1, separator2)
+        """
+        if self.separator_pairs:
+            return list(self.separator_pairs)
+        return [(None, self.separator1.upper(), self.separator2.upper())]
+
+    def prepare_separator_pairs(self):
+        """
+        预先计算分隔符对 (同时校验容错参数, 无效时抛出ValueError)
+        """
+        return prepare_separator_pairs(self.get_pair_specs(), self.max_mismatches, self.max_edits)
+
+@dataclass
+class S2Result:
+    """
+    一个输入文件的S2分割结果: reads统计、方向统计 (orientation_stats, 多个分隔符对时另有pair_stats)、
+    输出文件路径及输入/输出字节数和耗时; 失败时success为False, error为错误信息
+    """
+    input_file: str
+    success: bool
+    total_reads: int = 0
+    paired_reads: int = 0
+    discarded_reads: int = 0
+    orientation_stats: dict = field(default_factory=dict)
+    pair_stats: list = field(default_factory=list)
+    r1_outputs: list = field(default_factory=list)
+    r2_outputs: list = field(default_factory=list)
+    discarded_output: Optional[str] = None
+    error: Optional[str] = None
+    bytes_in: int = 0
+    bytes_out: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_mb: float = 0.0
+
+    @classmethod
+    def from_writer(cls, input_file, split_writer):
+        """
+        由写完的 PairedSplitWriter 的统计和输出路径生成结果
+        """
+        stats = split_writer.stats
+        return cls(
+            input_file=str(input_file),
+            success=True,
+            total_reads=stats['total_reads'],
+            paired_reads=stats['paired_reads'],
+            discarded_reads=stats['discarded_reads'],
+            orientation_stats=dict(stats['orientation_stats']),
+            pair_stats=[dict(pair_stats) for pair_stats in stats.get('pair_stats', [])],
+            r1_outputs=[str(path) for path in split_writer.r1_outputs],
+            r2_outputs=[str(path) for path in split_writer.r2_outputs],
+            discarded_output=str(split_writer.discarded_output),
+            bytes_in=get_file_size(input_file),
+            bytes_out=get_total_size([*split_writer.r1_outputs, *split_writer.r2_outputs, split_writer.discarded_output])
+        )
+
+    @property
+    def paired_percentage(self):
+        return self.paired_reads / self.total_reads * 100 if self.total_reads else None
+
+    def set_usage(self, timer):
+        """
+        由停止的 stage_metrics.ResourceTimer 填入耗时和内存峰值
+        """
+        self.wall_seconds = timer.wall_seconds
+        self.cpu_seconds = timer.cpu_seconds
+        self.peak_rss_mb = timer.peak_rss_mb
+        return self
+
+    def split_details(self):
+        """
+        指标记录中的S2统计 (配对/丢弃数、方向统计、各分隔符对的统计)
+        """
+        return {
+            'paired_reads': self.paired_reads,
+            'discarded_reads': self.discarded_reads,
+            'paired_percentage': self.paired_percentage,
+            'orientation_stats': dict(self.orientation_stats),
+            'pair_stats': [dict(pair_stats) for pair_stats in self.pair_stats]
+        }
+
+    def file_metrics(self, status=None):
+        """
+        本文件的 stage_metrics.FileMetrics; status默认按success取 done 或 failed
+        """
+        if status is None:
+            status = FILE_STATUS_DONE if self.success else FILE_STATUS_FAILED
+        return FileMetrics(
+            input_file=self.input_file,
+            status=status,
+            reads=self.total_reads,
+            bytes_in=self.bytes_in,
+            bytes_out=self.bytes_out,
+            wall_seconds=self.wall_seconds,
+            cpu_seconds=self.cpu_seconds,
+            peak_rss_mb=self.peak_rss_mb,
+            details=self.split_details() if self.success else {},
+            error=self.error
+        )
+
+class PairedSplitter:
+    """
+    S2的进程内调用接口: 按 S2Config 将FASTQ文件分割为配对的R1/R2, split() 返回 S2Result
+    分隔符在构造时预先计算, 同一PairedSplitter可依次分割多个文件; 参数无效时构造即抛出ValueError
+    """
+    def __init__(self, config):
+        self.config = config
+        self.separator_pairs = config.prepare_separator_pairs()
+
+    def describe(self, input_file, output_dir):
+        """
+        打印本次分割的输入、分隔符及参数
+        """
+        config = self.config
+        print(f"开始处理文件: {input_file}")
+        for name, separators in self.separator_pairs:
+            sep1_fwd, sep1_rc, sep2_fwd, sep2_rc = (get_separator_text(separator) for separator in separators)
+            if name is not None:
+                print(f"分隔符对: {name}")
+            print(f"正向分隔符1: {sep1_fwd}")
+            print(f"反向分隔符1: {sep1_rc}")
+            print(f"正向分隔符2: {sep2_fwd}")
+            print(f"反向分隔符2: {sep2_rc}")
+        print(f"输出目录: {output_dir}")
+        print(f"最小长度要求: {config.min_length}")
+        if config.max_mismatches or config.max_edits:
+            print(f"分隔符容错: 最大错配数 {config.max_mismatches}, 最大编辑数 {config.max_edits}")
+        if self.separator_pairs[0][0] is not None:
+            print(f"分隔符对输出方式: {PAIR_OUTPUT_COMBINED if config.combined else PAIR_OUTPUT_PER_PAIR}")
+        if config.chunk_reads > 0:
+            print(f"分块并行模式: 每块 {config.chunk_reads} 条reads, {config.jobs} 个进程")
+        if config.handoff_chunk_reads > 0:
+            print(f"分块交接: R1/R2每 {config.handoff_chunk_reads} 条配对reads发布一块")
+
+    def split(self, input_file, output_dir):
+        """
+        分割一个FASTQ.gz文件, 输出写入output_dir, 返回 S2Result (出错时success为False)
+        CPU时间包括本进程和逐条/fork方式的子进程; forkserver分块工作进程不是本进程的子进程, 不计入
+        """
+        config = self.config
+        timer = ResourceTimer()
+        base_name = get_split_base_name(Path(input_file).name)
+        self.describe(input_file, output_dir)
+        try:
+            with open_gzip_reader(input_file, **config.gzip_options) as infile, \
+                 PairedSplitWriter(output_dir, base_name, self.separator_pairs, config.min_length,
+                                   config.gzip_options, config.combined, config.handoff_chunk_reads) as split_writer:
+                progress = ProgressReporter(config.progress_seconds)
+                if config.chunk_reads > 0:
+                    split_records_chunked(infile, split_writer, config.chunk_reads, config.jobs, progress)
+                else:
+                    split_records_serial(infile, split_writer, progress)
+        except Exception as e:
+            print(f"处理文件时发生错误: {e}", file=sys.stderr)
+            return S2Result(input_file=str(input_file), success=False, error=str(e)).set_usage(timer.stop())
+        
+        # 打印统计结果
+        print_split_summary(split_writer)
+        return S2Result.from_writer(input_file, split_writer).set_usage(timer.stop())
+
+def init_split_worker(log_queue, profile_env):
+    """
+    流程脚本S2进程池的initializer: 日志记录经log_queue交给父进程 (stage_logs.start_queue_logging), 并设置剖析选项
+    (进程池以forkserver启动, 工作进程不继承父进程的环境变量和线程)
+    """
+    init_worker_logging(log_queue)
+    init_worker_profiling(profile_env)
+
+@profiled_worker("S2_file_worker")
+def run_paired_split(split_args):
+    """
+    流程脚本在进程池中调用的S2入口: split_args为 (S2Config, 输入文件, 输出目录)
+    输出逐行写入工作进程的日志记录器 (stage_logs.init_worker_logging, 行首带 [文件名]),
+    只保留最后若干行随结果返回, 用于错误报告
+    返回: (S2Result, 最后若干行输出)
+    """
+    config, input_file, output_dir = split_args
+    prefix = f"[{Path(input_file).name}] "
+    stdout_writer = LineLogWriter(get_worker_logger(), logging.INFO, prefix)
+    stderr_writer = LineLogWriter(get_worker_logger(), logging.WARNING, prefix, tail=stdout_writer.tail)
+    with contextlib.redirect_stdout(stdout_writer), contextlib.redirect_stderr(stderr_writer):
+        try:
+            result = PairedSplitter(config).split(input_file, output_dir)
+        except ValueError as e:
+            print(f"错误: {e}")
+            result = S2Result(input_file=str(input_file), success=False, error=str(e))
+    stderr_writer.flush()
+    return result, stdout_writer.getvalue()
+
+def split_fastq_by_sequences_paired(input_file, output_dir, separator1, separator2, min_length=10,
+                                    gzip_options=None, chunk_reads=DEFAULT_CHUNK_READS, jobs=1,
+                                    separator_pairs=None, combined_output=False, max_mismatches=0, max_edits=0):
+    """
+    根据两个分隔符序列分割FASTQ文件，确保R1和R2完全配对
+    支持反向互补匹配 (PairedSplitter 的函数形式, 返回是否成功)
     
-    return True
+    Args:
+        input_file: 输入的FASTQ.gz文件路径
+        output_dir: 输出目录
+        separator1: 第一个分隔符序列 (GATCATGTCGGAACTGTTGCTTGTCCGACTGATC)
+        separator2: 第二个分隔符序列 (AGATCGGAAGA)
+        min_length: 分割后序列的最小长度
+        gzip_options: gzip_codec 的读写参数, 如 {'backend': 'gzip', 'threads': 4, 'compresslevel': 6} (默认标准库gzip)
+        chunk_reads: >0时按每批chunk_reads条reads在jobs个进程中并行分割, 输出与逐条处理相同
+        jobs: 分块模式的工作进程数
+        separator_pairs: 多个命名分隔符对 [(name, separator1, separator2), ...], 给出时取代separator1/separator2,
+                         一次扫描同时尝试所有分隔符对
+        combined_output: 多个分隔符对写入同一R1/R2 (header标注分隔符对), 否则每个分隔符对单独输出
+        max_mismatches / max_edits: 分隔符允许的最大错配数 / 编辑数, 0为精确查找
+    """
+    config = S2Config(
+        separator1=separator1,
+        separator2=separator2,
+        separator_pairs=list(separator_pairs or []),
+        min_length=min_length,
+        pair_output=PAIR_OUTPUT_COMBINED if combined_output else PAIR_OUTPUT_PER_PAIR,
+        max_mismatches=max_mismatches,
+        max_edits=max_edits,
+        chunk_reads=chunk_reads,
+        jobs=jobs,
+        gzip_options=gzip_options or default_gzip_options()
+    )
+    return PairedSplitter(config).split(input_file, output_dir).success
+
+def add_separator_pair_arguments(parser):
+    """
+    添加多分隔符对参数 (S2_Split.py、S1融合模式与S1S2流程共用)
+    """
+    parser.add_argument(
+        "--separator-pair",
+        action="append",
+        default=[],
+        metavar="名称=分隔符1,分隔符2",
+        help="(可重复) 命名分隔符对, 如 MboI=GATC...GATC,AGATCGGAAGA。给出时取代 --sep1/--sep2,\n"
+             "一次扫描同时尝试所有分隔符对的所有方向组合, 取R2最短者"
+    )
+    parser.add_argument(
+        "--pair-output",
+        choices=PAIR_OUTPUT_MODES,
+        default=PAIR_OUTPUT_PER_PAIR,
+        help=f"多个分隔符对的输出方式: '{PAIR_OUTPUT_PER_PAIR}' 每对写出 <样本>_<名称>_R1/_R2.fq.gz;\n"
+             f"'{PAIR_OUTPUT_COMBINED}' 写入同一R1/R2, header附加 ' pair=<名称>' (默认: {PAIR_OUTPUT_PER_PAIR})"
+    )
+
+def add_separator_tolerance_arguments(parser, prefix=""):
+    """
+    添加分隔符容错参数; S1融合模式以prefix='split-'添加, 与S1查询序列的容错参数区分
+    """
+    parser.add_argument(
+        f"--{prefix}max-mismatches",
+        type=int,
+        default=0,
+        help="分隔符允许的最大错配(替换)数, 各分隔符切为k+1段精确种子查找后逐碱基校验 (默认: 0, 精确查找)"
+    )
+    parser.add_argument(
+        f"--{prefix}max-edits",
+        type=int,
+        default=0,
+        help="分隔符允许的最大编辑(替换/插入/缺失)数, 种子候选用Myers位并行算法校验,\n"
+             "与错配数只能设置其一 (默认: 0, 精确查找)"
+    )
 
 def main():
     parser = argparse.ArgumentParser(
@@ -239,21 +947,63 @@ def main():
     
     parser.add_argument(
         "--sep1",
-        default="GATCATGTCGGAACTGTTGCTTGTCCGACTGATC",
-        help="第一个分隔符序列 (默认: GATCATGTCGGAACTGTTGCTTGTCCGACTGATC)"
+        default=DEFAULT_SEPARATOR1,
+        help=f"第一个分隔符序列 (默认: {DEFAULT_SEPARATOR1})"
     )
     
     parser.add_argument(
         "--sep2", 
-        default="AGATCGGAAGA",
-        help="第二个分隔符序列 (默认: AGATCGGAAGA)"
+        default=DEFAULT_SEPARATOR2,
+        help=f"第二个分隔符序列 (默认: {DEFAULT_SEPARATOR2})"
     )
     
     parser.add_argument(
         "--min-length",
         type=int,
-        default=10,
-        help="分割后序列的最小长度 (默认: 10)"
+        default=DEFAULT_MIN_LENGTH,
+        help=f"分割后序列的最小长度 (默认: {DEFAULT_MIN_LENGTH})"
+    )
+    
+    parser.add_argument(
+        "--chunk-reads",
+        type=int,
+        default=DEFAULT_CHUNK_READS,
+        help=f"每批reads数。>0时由 -j 个进程并行查找分隔符并切分, 按输入顺序写出,\n"
+             f"输出与逐条处理完全相同 (默认: {DEFAULT_CHUNK_READS}, 逐条处理)"
+    )
+    
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="分块模式的工作进程数 (默认: 本进程可用的CPU数, 考虑CPU亲和性、cgroup配额和可用内存)"
+    )
+    
+    parser.add_argument(
+        "--progress-seconds",
+        type=float,
+        default=DEFAULT_PROGRESS_SECONDS,
+        help=f"两次进度输出 (已处理 N 条reads) 之间的最短间隔秒数 (默认: {DEFAULT_PROGRESS_SECONDS:g})"
+    )
+    
+    parser.add_argument(
+        "--handoff-chunk-reads",
+        type=int,
+        default=0,
+        help="(可选) >0时R1/R2不写成完整文件, 而是每N条配对reads原子发布一个分块 <名称>_partNNNN_R1/_R2.fq.gz,\n"
+             "写完后写入 .<名称>.handoff.done 标记, 供下游在分割结束前读取 (默认: 0, 写完整文件)"
+    )
+    
+    add_separator_pair_arguments(parser)
+    
+    add_separator_tolerance_arguments(parser)
+    
+    add_gzip_arguments(parser)
+    add_profile_arguments(parser)
+    
+    parser.add_argument(
+        "--metrics-file",
+        help="将本次分割的指标 (reads数、输入/输出字节数、耗时、方向统计等) 写入此JSON文件"
     )
     
     args = parser.parse_args()
@@ -263,14 +1013,47 @@ def main():
         print(f"错误: 输入文件 '{args.input}' 不存在", file=sys.stderr)
         sys.exit(1)
     
+    gzip_options = gzip_options_from_args(args)
+    print(describe_gzip_options(gzip_options))
+    
+    if args.chunk_reads < 0:
+        print(f"警告: --chunk-reads 的值 '{args.chunk_reads}' 无效, 将逐条处理", file=sys.stderr)
+    # 工作进程数只用于分块模式
+    if args.chunk_reads > 0:
+        jobs = args.jobs if args.jobs and args.jobs > 0 else get_default_jobs()
+    else:
+        jobs = 1
+    
+    try:
+        # 构造时预先计算分隔符并校验容错参数 (容错数须小于分隔符长度, 错配与编辑只能设置其一)
+        splitter = PairedSplitter(S2Config(
+            separator1=args.sep1.upper(),  # 转换为大写以确保匹配
+            separator2=args.sep2.upper(),  # 转换为大写以确保匹配
+            separator_pairs=[parse_separator_pair(pair_spec) for pair_spec in args.separator_pair],
+            min_length=args.min_length,
+            pair_output=args.pair_output,
+            max_mismatches=args.max_mismatches,
+            max_edits=args.max_edits,
+            chunk_reads=max(0, args.chunk_reads),
+            jobs=jobs,
+            progress_seconds=args.progress_seconds,
+            gzip_options=gzip_options,
+            handoff_chunk_reads=max(0, args.handoff_chunk_reads)
+        ))
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+    
     # 执行分割
-    success = split_fastq_by_sequences_paired(
-        args.input,
-        args.output,
-        args.sep1.upper(),  # 转换为大写以确保匹配
-        args.sep2.upper(),  # 转换为大写以确保匹配
-        args.min_length
-    )
+    stage_timer = ResourceTimer()
+    with profile_stage(profile_options_from_args(args), "S2"):
+        result = splitter.split(args.input, args.output)
+    success = result.success
+    
+    if args.metrics_file:
+        stage_metrics = StageMetrics("S2", files=[result.file_metrics()])
+        stage_metrics.finish(stage_timer.stop(), success)
+        write_metrics_file(stage_metrics, args.metrics_file)
     
     if success:
         print("配对分割完成!")
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+S2→HiC的分块流式交接 (HiC_config.stream_handoff)
+S2不再写出完整的 <base>_R1/_R2.fq.gz 再整理到 Run2_trim, 而是把配对的reads按约chunk_reads条一块写出,
+每块写完后原子地发布, 下游 (HiC-Pro包装脚本或其他消费者) 在S2结束之前就可以读取已发布的分块:
+  - 分块先写入以 . 开头的临时文件 (不匹配 *_R1.fq.gz), 写完后 os.replace 为 <base>_partNNNN_R1/_R2.fq.gz,
+    R2先于R1发布: R1分块存在时同一编号的R2分块一定已完整
+  - 一个输入文件写完后写入 .<base>.handoff.done (JSON: 分块列表和reads数), 出错时写入 .<base>.handoff.failed
+  - 流程的S1/S2结束后在交接目录写入 .handoff_end.json ({"success": ...}), 消费者读到后处理完剩余分块即结束
+不使用命名管道: HiC-Pro等消费者通常先读完R1再读R2, 管道中未读的R2会阻塞S2的写入;
+分块文件可以重复读取, 消费者失败后重新运行不必重新分割。
+分块可用较低的压缩级别写出 (stream_handoff.compresslevel, 0为只封装不压缩), 减少S2的CPU时间。
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+from gzip_codec import open_gzip_writer
+
+DEFAULT_HANDOFF_CHUNK_READS = 1000000 # 每个分块的配对reads数 (达到后在下一次写入结束时发布)
+DEFAULT_HANDOFF_COMPRESSLEVEL = 1
+DEFAULT_POLL_SECONDS = 2.0 # 消费者检查新分块的间隔 (秒)
+HANDOFF_DONE_SUFFIX = ".handoff.done"
+HANDOFF_FAILED_SUFFIX = ".handoff.failed"
+HANDOFF_END_FILE = ".handoff_end.json"
+R1_SUFFIX = "_R1.fq.gz"
+R2_SUFFIX = "_R2.fq.gz"
+
+def get_chunk_paths(output_dir, base_name, index):
+    """
+    第index个分块 (从1开始) 的R1/R2路径
+    """
+    output_dir = Path(output_dir)
+    return (output_dir / f"{base_name}_part{index:04d}{R1_SUFFIX}",
+            output_dir / f"{base_name}_part{index:04d}{R2_SUFFIX}")
+
+def get_marker_path(output_dir, base_name, suffix):
+    """
+    一个输入文件的完成/失败标记路径 (隐藏文件)
+    """
+    return Path(output_dir) / f".{base_name}{suffix}"
+
+def write_json_atomic(path, data):
+    """
+    先写临时文件再替换, 读取方不会看到写了一半的JSON
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def load_json_marker(path):
+    """
+    读取一个标记文件, 不存在时返回None
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def remove_published_chunks(output_dir, base_name):
+    """
+    删除上次运行留下的分块、临时文件和标记 (重新分割前调用, 避免消费者读到旧分块)
+    """
+    output_dir = Path(output_dir)
+    stale_paths = [*output_dir.glob(f"{base_name}_part[0-9]*_R[12].fq.gz"),
+                   *output_dir.glob(f".{base_name}_part[0-9]*_R[12].fq.gz.tmp"),
+                   get_marker_path(output_dir, base_name, HANDOFF_DONE_SUFFIX),
+                   get_marker_path(output_dir, base_name, HANDOFF_FAILED_SUFFIX)]
+    for path in stale_paths:
+        path.unlink(missing_ok=True)
+
+class ChunkPairPublisher:
+    """
+    一组R1/R2输出的分块写出和发布: write() 同时写入R1和R2 (保证配对),
+    当前分块达到chunk_reads条reads后发布; close() 发布最后一块并写入完成标记, abort() 删除未发布的分块并写入失败标记
+    已发布的分块路径保存在 r1_outputs/r2_outputs
+    """
+    def __init__(self, output_dir, base_name, chunk_reads=DEFAULT_HANDOFF_CHUNK_READS, gzip_options=None):
+        self.output_dir = Path(output_dir)
+        self.base_name = base_name
+        self.chunk_reads = max(1, int(chunk_reads))
+        self.gzip_options = gzip_options or {}
+        self.r1_outputs = []
+        self.r2_outputs = []
+        self.total_reads = 0
+        self.chunk_read_count = 0
+        self.chunk_files = None
+        self.tmp_paths = None
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        remove_published_chunks(self.output_dir, base_name)
+
+    def open_chunk(self):
+        final_paths = get_chunk_paths(self.output_dir, self.base_name, len(self.r1_outputs) + 1)
+        self.tmp_paths = [path.with_name(f".{path.name}.tmp") for path in final_paths]
+        self.chunk_files = [open_gzip_writer(path, 'wb', **self.gzip_options) for path in self.tmp_paths]
+
+    def write(self, r1_bytes, r2_bytes, reads=None):
+        """
+        写入配对的R1/R2记录; reads为其中的reads数, 未给出时按行数计算
+        """
+        if self.chunk_files is None:
+            self.open_chunk()
+        r1_file, r2_file = self.chunk_files
+        r1_file.write(r1_bytes)
+        r2_file.write(r2_bytes)
+        if reads is None:
+            reads = r1_bytes.count(b'\n') // 4
+        self.chunk_read_count += reads
+        self.total_reads += reads
+        if self.chunk_read_count >= self.chunk_reads:
+            self.publish()
+
+    def close_chunk_files(self):
+        chunk_files, self.chunk_files = self.chunk_files, None
+        for handle in chunk_files or []:
+            handle.close()
+
+    def publish(self):
+        """
+        关闭当前分块并发布: 先R2后R1, 消费者看到R1时R2已完整
+        """
+        self.close_chunk_files()
+        r1_path, r2_path = get_chunk_paths(self.output_dir, self.base_name, len(self.r1_outputs) + 1)
+        r1_tmp_path, r2_tmp_path = self.tmp_paths
+        os.replace(r2_tmp_path, r2_path)
+        os.replace(r1_tmp_path, r1_path)
+        self.r1_outputs.append(str(r1_path))
+        self.r2_outputs.append(str(r2_path))
+        self.chunk_read_count = 0
+        self.tmp_paths = None
+
+    def discard_chunk(self):
+        self.close_chunk_files()
+        for path in self.tmp_paths or []:
+            path.unlink(missing_ok=True)
+        self.tmp_paths = None
+        self.chunk_read_count = 0
+
+    def close(self):
+        """
+        发布最后一个 (未满的) 分块并写入完成标记
+        """
+        if self.chunk_read_count > 0:
+            self.publish()
+        else:
+            self.discard_chunk()
+        write_json_atomic(get_marker_path(self.output_dir, self.base_name, HANDOFF_DONE_SUFFIX), {
+            'reads': self.total_reads,
+            'r1_outputs': self.r1_outputs,
+            'r2_outputs': self.r2_outputs
+        })
+
+    def abort(self, error=None):
+        """
+        出错时删除未发布的分块并写入失败标记 (已发布的分块保留, 由重新运行时清理)
+        """
+        self.discard_chunk()
+        write_json_atomic(get_marker_path(self.output_dir, self.base_name, HANDOFF_FAILED_SUFFIX),
+                          {'error': str(error) if error is not None else None})
+
+def write_handoff_end(handoff_dir, success):
+    """
+    S1/S2全部结束: 通知消费者不会再有新的分块
+    """
+    write_json_atomic(Path(handoff_dir) / HANDOFF_END_FILE, {'success': bool(success)})
+
+def remove_handoff_end(handoff_dir):
+    """
+    开始新一轮交接前删除上次的结束标记
+    """
+    (Path(handoff_dir) / HANDOFF_END_FILE).unlink(missing_ok=True)
+
+def iter_handoff_chunks(handoff_dir, poll_seconds=DEFAULT_POLL_SECONDS, timeout=None):
+    """
+    消费者接口: 依次产生交接目录 (如 Run2_trim) 各样本子目录中新发布的分块 (样本名, R1路径, R2路径),
+    读到结束标记后处理完剩余分块即返回。
+    某个输入文件写入了失败标记或结束标记中success为False时抛出RuntimeError;
+    timeout秒内没有新分块也没有结束标记时抛出TimeoutError (timeout为None时一直等待)
+    """
+    handoff_dir = Path(handoff_dir)
+    seen_chunks = set()
+    last_progress = time.monotonic()
+    while True:
+        # 先读结束标记再扫描: 结束前发布的分块一定在这次扫描中
+        end_marker = load_json_marker(handoff_dir / HANDOFF_END_FILE)
+        sample_dirs = sorted(path for path in handoff_dir.iterdir() if path.is_dir()) if handoff_dir.is_dir() else []
+        for sample_dir in sample_dirs:
+            failed_markers = sorted(sample_dir.glob(f".*{HANDOFF_FAILED_SUFFIX}"))
+            if failed_markers:
+                error = (load_json_marker(failed_markers[0]) or {}).get('error')
+                raise RuntimeError(f"分块交接失败: {failed_markers[0]} ({error})")
+            for r1_path in sorted(sample_dir.glob(f"*_part[0-9]*{R1_SUFFIX}")):
+                if r1_path in seen_chunks:
+                    continue
+                r2_path = r1_path.with_name(r1_path.name[:-len(R1_SUFFIX)] + R2_SUFFIX)
+                seen_chunks.add(r1_path)
+                last_progress = time.monotonic()
+                yield sample_dir.name, r1_path, r2_path
+        if end_marker is not None:
+            if not end_marker.get('success'):
+                raise RuntimeError(f"S1/S2未成功完成, 分块交接中止 ({handoff_dir / HANDOFF_END_FILE})")
+            return
+        if timeout is not None and time.monotonic() - last_progress > timeout:
+            raise TimeoutError(f"{timeout} 秒内 {handoff_dir} 中没有新的分块")
+        time.sleep(poll_seconds)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HiC输入文件的放置方式 (HiC_config.staging_mode)
+S2输出的R1/R2整理到 HiC_Input 及 Run2_trim 时不必每次完整复制:
+  copy     - shutil.copy2 完整复制 (默认, 与原行为相同)
+  hardlink - 硬链接, 不占额外空间, 要求源和目标在同一文件系统
+  reflink  - 写时复制克隆 (Linux FICLONE, 如 btrfs / XFS reflink=1), 数据块共享, 之后修改互不影响
+  symlink  - 指向源文件绝对路径的符号链接
+  direct   - 不整理: S2直接写入HiC读取的目录 (见 S1S2HiC_Pipeline.py)
+文件系统不支持所选方式时 (跨设备、权限、不支持克隆等) 自动改为复制, 只提示一次。
+重新运行时, 目标已按所选方式放置且与源文件一致的文件不再重复放置 (reuse_existing)。
+"""
+
+import errno
+import os
+import shutil
+import sys
+from pathlib import Path
+
+STAGING_COPY = "copy"
+STAGING_HARDLINK = "hardlink"
+STAGING_REFLINK = "reflink"
+STAGING_SYMLINK = "symlink"
+STAGING_DIRECT = "direct"
+STAGING_MODES = (STAGING_COPY, STAGING_HARDLINK, STAGING_REFLINK, STAGING_SYMLINK, STAGING_DIRECT)
+DEFAULT_STAGING_MODE = STAGING_COPY
+STAGING_UP_TO_DATE = "up-to-date" # counts中已放置且未改变而跳过的文件
+
+FICLONE = 0x40049409 # linux/fs.h: _IOW(0x94, 9, int)
+
+# 表示"该文件系统/平台不支持此方式"的错误码, 遇到时改为复制; 其他错误 (如源文件不存在) 照常抛出
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EACCES, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL,
+                      errno.ENOTTY, errno.ENOSYS, errno.EMLINK}
+
+def reflink_file(source, destination):
+    """
+    以FICLONE ioctl把destination创建为source的克隆 (共享数据块); 不支持时抛出OSError
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.ENOTSUP, "当前平台不支持reflink")
+    with open(source, 'rb') as source_file:
+        try:
+            with open(destination, 'wb') as destination_file:
+                fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+        except OSError:
+            Path(destination).unlink(missing_ok=True)
+            raise
+    shutil.copystat(source, destination)
+
+class FileStager:
+    """
+    按staging_mode把文件放置到目标路径; 所选方式第一次因文件系统不支持而失败后,
+    其余文件都直接复制。counts记录各方式实际放置的文件数
+    reuse_existing为True时, 已按当前方式放置且与源文件一致的目标保留不动
+    """
+    def __init__(self, mode=DEFAULT_STAGING_MODE, reuse_existing=False):
+        if mode not in STAGING_MODES:
+            raise ValueError(f"无效的staging_mode: {mode} (可选: {', '.join(STAGING_MODES)})")
+        self.mode = STAGING_COPY if mode == STAGING_DIRECT else mode
+        self.reuse_existing = reuse_existing
+        self.counts = {}
+
+    def is_staged(self, source, destination):
+        """
+        destination是否已按当前方式放置且与source一致:
+        硬链接为同一文件, 符号链接指向source, 复制/克隆的大小和mtime相同 (copy2/copystat保留mtime)
+        """
+        if self.mode == STAGING_SYMLINK:
+            return destination.is_symlink() and destination.resolve() == source.resolve()
+        if destination.is_symlink():
+            return False
+        same_file = os.path.samefile(source, destination)
+        if self.mode == STAGING_HARDLINK:
+            return same_file
+        source_stat = source.stat()
+        destination_stat = destination.stat()
+        return not same_file and destination_stat.st_size == source_stat.st_size and \
+            destination_stat.st_mtime_ns == source_stat.st_mtime_ns
+
+    def stage(self, source, destination):
+        """
+        放置一个文件 (已存在的目标先删除), 返回实际使用的方式
+        """
+        source = Path(source)
+        destination = Path(destination)
+        if destination.is_symlink() or destination.exists():
+            if destination.resolve() == source.resolve() and not destination.is_symlink():
+                # 目标就是源文件本身 (如direct模式), 无需放置
+                return self._count(STAGING_DIRECT)
+            if self.reuse_existing and destination.exists() and self.is_staged(source, destination):
+                return self._count(STAGING_UP_TO_DATE)
+            destination.unlink()
+
+        if self.mode != STAGING_COPY:
+            try:
+                if self.mode == STAGING_HARDLINK:
+                    os.link(source, destination)
+                elif self.mode == STAGING_REFLINK:
+                    reflink_file(source, destination)
+                else:
+                    # 指向最终的源文件, 避免 Run2_trim -> HiC_Input -> S2输出 的链接链
+                    os.symlink(source.resolve(), destination)
+                return self._count(self.mode)
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                print(f"警告: 无法以 {self.mode} 方式放置 {source} -> {destination} ({e.strerror}), "
+                      f"其余文件改为复制", file=sys.stderr)
+                self.mode = STAGING_COPY
+
+        shutil.copy2(source, destination)
+        return self._count(STAGING_COPY)
+
+    def _count(self, mode):
+        self.counts[mode] = self.counts.get(mode, 0) + 1
+        return mode
+
+    def describe_counts(self):
+        return ", ".join(f"{mode} {count} 个" for mode, count in self.counts.items()) or "无文件"
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+gzip编解码后端选择层
+S1_Process_gen.py 与 S2_Split.py 的所有gzip读写都经过这里, 运行时选择可用的最快后端:
+  isal     - python-isal (isal.igzip / isal.igzip_threaded)
+  zlib-ng  - python-zlib-ng (zlib_ng.gzip_ng / zlib_ng.gzip_ng_threaded)
+  pigz     - 通过管道调用外部 pigz 程序 (pigz -dc / pigz -p N)
+  gzip     - Python 标准库 gzip (始终可用)
+'auto' 按上面的顺序选择第一个可用的后端。
+标准库后端在多线程 (threads > 1) 或 BGZF 输出时使用 ParallelGzipWriter:
+数据按块在线程池中并行压缩, 按顺序写成合法的多成员gzip (或BGZF) 流。
+
+用法 (一致性检查): python gzip_codec.py --check file1.fq.gz [file2.fq.gz ...]
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import gzip
+import hashlib
+import importlib
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import zlib
+
+GZIP_BACKEND_AUTO = "auto"
+GZIP_BACKEND_ISAL = "isal"
+GZIP_BACKEND_ZLIB_NG = "zlib-ng"
+GZIP_BACKEND_PIGZ = "pigz"
+GZIP_BACKEND_STDLIB = "gzip"
+# Preference order used by 'auto'
+GZIP_BACKEND_PREFERENCE = (GZIP_BACKEND_ISAL, GZIP_BACKEND_ZLIB_NG, GZIP_BACKEND_PIGZ, GZIP_BACKEND_STDLIB)
+GZIP_BACKENDS = (GZIP_BACKEND_AUTO,) + GZIP_BACKEND_PREFERENCE
+DEFAULT_GZIP_BACKEND = GZIP_BACKEND_AUTO
+DEFAULT_GZIP_THREADS = 1
+DEFAULT_COMPRESSLEVEL = 9 # Same as the stdlib gzip default
+ISAL_MAX_COMPRESSLEVEL = 3 # ISA-L only supports levels 0-3
+DEFAULT_BLOCK_SIZE = 1024 * 1024 # Uncompressed bytes per independently compressed gzip member
+BGZF_BLOCK_SIZE = 65280 # Uncompressed bytes per BGZF block (as in htslib), keeps blocks below 64 KiB
+# Standard empty BGZF block that marks the end of a BGZF file
+BGZF_EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+def _import_optional(module_name):
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        return None
+
+def is_backend_available(backend):
+    """
+    Checks whether a concrete backend (not 'auto') can be used on this machine.
+    """
+    if backend == GZIP_BACKEND_ISAL:
+        return _import_optional("isal.igzip") is not None
+    if backend == GZIP_BACKEND_ZLIB_NG:
+        return _import_optional("zlib_ng.gzip_ng") is not None
+    if backend == GZIP_BACKEND_PIGZ:
+        return shutil.which("pigz") is not None
+    return backend == GZIP_BACKEND_STDLIB
+
+def available_backends():
+    """
+    Returns the concrete backends usable on this machine, fastest first.
+    """
+    return [backend for backend in GZIP_BACKEND_PREFERENCE if is_backend_available(backend)]
+
+def resolve_backend(preferred=DEFAULT_GZIP_BACKEND):
+    """
+    Maps a requested backend name to a concrete, available backend.
+    'auto' (or None) picks the fastest available one; a forced backend that is
+    not available falls back to 'auto' with a warning.
+    """
+    if not preferred or preferred == GZIP_BACKEND_AUTO:
+        return available_backends()[0]
+    if preferred not in GZIP_BACKEND_PREFERENCE:
+        print(f"警告: 未知的gzip后端 '{preferred}' (可选: {', '.join(GZIP_BACKENDS)})。将自动选择。", file=sys.stderr)
+        return available_backends()[0]
+    if not is_backend_available(preferred):
+        fallback = available_backends()[0]
+        print(f"警告: gzip后端 '{preferred}' 不可用, 将使用 '{fallback}'。", file=sys.stderr)
+        return fallback
+    return preferred
+
+class PigzProcessFile:
+    """
+    Binary file object backed by a pigz subprocess: reads come from `pigz -dc`,
+    writes go through `pigz -c` into the output file. close() waits for pigz
+    and raises OSError if it failed. A reader closed before reaching the end of
+    the stream (e.g. S1 with -N) stops pigz without treating that as an error.
+    """
+    def __init__(self, path, mode, threads=DEFAULT_GZIP_THREADS, compresslevel=DEFAULT_COMPRESSLEVEL):
+        self.path = str(path)
+        self.mode = mode
+        self._output_file = None
+        self._reached_eof = False
+        pigz_path = shutil.which("pigz")
+        thread_args = ["-p", str(max(1, threads))]
+        if 'r' in mode:
+            self.process = subprocess.Popen([pigz_path, "-dc"] + thread_args + [self.path],
+                                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self._stream = self.process.stdout
+        else:
+            # Appending a new gzip member to an existing file yields a valid multi-member gzip.
+            self._output_file = open(self.path, 'ab' if 'a' in mode else 'wb')
+            self.process = subprocess.Popen([pigz_path, "-c", f"-{compresslevel}"] + thread_args,
+                                            stdin=subprocess.PIPE, stdout=self._output_file,
+                                            stderr=subprocess.PIPE)
+            self._stream = self.process.stdin
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        if not data and size != 0:
+            self._reached_eof = True
+        return data
+
+    def readline(self, size=-1):
+        line = self._stream.readline(size)
+        if not line:
+            self._reached_eof = True
+        return line
+
+    def __iter__(self):
+        yield from self._stream
+        self._reached_eof = True
+
+    def write(self, data):
+        return self._stream.write(data)
+
+    def close(self):
+        if self._stream is None:
+            return
+        stopped_early = 'r' in self.mode and not self._reached_eof
+        if stopped_early:
+            self.process.terminate()
+        self._stream.close()
+        self._stream = None
+        stderr_output = self.process.stderr.read()
+        self.process.stderr.close()
+        return_code = self.process.wait()
+        if self._output_file is not None:
+            self._output_file.close()
+        if return_code != 0 and not stopped_early:
+            raise OSError(f"pigz 处理 '{self.path}' 失败 (返回码 {return_code}): "
+                          f"{stderr_output.decode(errors='replace').strip()}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def compress_gzip_member(data, compresslevel):
+    """
+    Compresses data into one complete gzip member (header, deflate stream, CRC32/ISIZE trailer).
+    """
+    return gzip.compress(data, compresslevel=compresslevel, mtime=0)
+
+def compress_bgzf_block(data, compresslevel):
+    """
+    Compresses data (at most BGZF_BLOCK_SIZE bytes) into one BGZF block:
+    a gzip member whose 'BC' extra field records the total block size.
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    block_size = 18 + len(deflated) + 8
+    header = struct.pack("<4BI2BH2BHH", 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord('B'), ord('C'), 2, block_size - 1)
+    trailer = struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+    return header + deflated + trailer
+
+class ParallelGzipWriter:
+    """
+    Binary gzip writer that compresses independent blocks on a thread pool
+    (zlib releases the GIL while compressing) and writes the resulting gzip
+    members in submission order, so the file is a valid multi-member gzip
+    stream. With bgzf=True the blocks are BGZF blocks and the BGZF EOF marker
+    is written on close. At most 2 * threads blocks are pending at any time.
+    """
+    def __init__(self, path, mode='wb', threads=DEFAULT_GZIP_THREADS, compresslevel=DEFAULT_COMPRESSLEVEL,
+                 bgzf=False, block_size=DEFAULT_BLOCK_SIZE):
+        self.path = str(path)
+        self.compresslevel = compresslevel
+        self.bgzf = bgzf
+        self.block_size = min(block_size, BGZF_BLOCK_SIZE) if bgzf else block_size
+        self.compress_block = compress_bgzf_block if bgzf else compress_gzip_member
+        self.max_pending_blocks = max(1, threads) * 2
+        self._buffer = bytearray()
+        self._pending_blocks = collections.deque()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, threads))
+        self._output_file = open(self.path, 'ab' if 'a' in mode else 'wb')
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit_block(block)
+        return len(data)
+
+    def _submit_block(self, block):
+        while len(self._pending_blocks) >= self.max_pending_blocks:
+            self._output_file.write(self._pending_blocks.popleft().result())
+        self._pending_blocks.append(self._executor.submit(self.compress_block, block, self.compresslevel))
+
+    def close(self):
+        if self._output_file is None:
+            return
+        try:
+            if self._buffer:
+                self._submit_block(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending_blocks:
+                self._output_file.write(self._pending_blocks.popleft().result())
+            if self.bgzf:
+                self._output_file.write(BGZF_EOF_BLOCK)
+        finally:
+            self._executor.shutdown(wait=True)
+            self._output_file.close()
+            self._output_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def open_gzip_reader(path, backend=GZIP_BACKEND_STDLIB, threads=DEFAULT_GZIP_THREADS,
+                     compresslevel=None, bgzf=False):
+    """
+    Opens a gzip file for binary reading with the given concrete backend.
+    The writer-only options (compresslevel, bgzf) are accepted and ignored, so
+    one options dict can be passed to both open_gzip_reader and open_gzip_writer.
+    """
+    if backend == GZIP_BACKEND_ISAL:
+        if threads > 1:
+            from isal import igzip_threaded
+            return igzip_threaded.open(path, 'rb', threads=threads)
+        from isal import igzip
+        return igzip.open(path, 'rb')
+    if backend == GZIP_BACKEND_ZLIB_NG:
+        if threads > 1:
+            from zlib_ng import gzip_ng_threaded
+            return gzip_ng_threaded.open(path, 'rb', threads=threads)
+        from zlib_ng import gzip_ng
+        return gzip_ng.open(path, 'rb')
+    if backend == GZIP_BACKEND_PIGZ:
+        return PigzProcessFile(path, 'rb', threads=threads)
+    return gzip.open(path, 'rb')
+
+def open_gzip_writer(path, mode='wb', backend=GZIP_BACKEND_STDLIB, threads=DEFAULT_GZIP_THREADS,
+                     compresslevel=DEFAULT_COMPRESSLEVEL, bgzf=False):
+    """
+    Opens a gzip file for binary writing ('wb') or appending ('ab') with the
+    given concrete backend. BGZF output, and multi-threaded output with the
+    stdlib backend, use ParallelGzipWriter.
+    """
+    if bgzf or (backend == GZIP_BACKEND_STDLIB and threads > 1):
+        return ParallelGzipWriter(path, mode, threads=threads, compresslevel=compresslevel, bgzf=bgzf)
+    if backend == GZIP_BACKEND_ISAL:
+        isal_level = min(compresslevel, ISAL_MAX_COMPRESSLEVEL)
+        if threads > 1:
+            from isal import igzip_threaded
+            return igzip_threaded.open(path, mode, compresslevel=isal_level, threads=threads)
+        from isal import igzip
+        return igzip.open(path, mode, compresslevel=isal_level)
+    if backend == GZIP_BACKEND_ZLIB_NG:
+        if threads > 1:
+            from zlib_ng import gzip_ng_threaded
+            return gzip_ng_threaded.open(path, mode, compresslevel=compresslevel, threads=threads)
+        from zlib_ng import gzip_ng
+        return gzip_ng.open(path, mode, compresslevel=compresslevel)
+    if backend == GZIP_BACKEND_PIGZ:
+        return PigzProcessFile(path, mode, threads=threads, compresslevel=compresslevel)
+    return gzip.open(path, mode, compresslevel=compresslevel)
+
+def add_gzip_arguments(parser):
+    """
+    Adds the shared --gzip-backend/--gzip-threads/--compresslevel/--bgzf options to an argparse parser.
+    """
+    parser.add_argument(
+        "--gzip-backend",
+        choices=GZIP_BACKENDS,
+        default=DEFAULT_GZIP_BACKEND,
+        help=f"(可选) gzip编解码后端。'auto' 依次尝试 isal、zlib-ng、pigz, 都不可用时使用标准库gzip。\n"
+             f"默认: {DEFAULT_GZIP_BACKEND}"
+    )
+    parser.add_argument(
+        "--gzip-threads",
+        type=int,
+        default=DEFAULT_GZIP_THREADS,
+        help=f"(可选) 每个gzip读写流使用的线程数。标准库gzip后端在大于1时按块并行压缩输出。\n"
+             f"默认: {DEFAULT_GZIP_THREADS}"
+    )
+    parser.add_argument(
+        "--compresslevel",
+        type=int,
+        choices=range(0, 10),
+        default=DEFAULT_COMPRESSLEVEL,
+        metavar="{0-9}",
+        help=f"(可选) 输出文件的gzip压缩级别。中间文件可用 1 以节省时间 (isal后端最高为 {ISAL_MAX_COMPRESSLEVEL})。\n"
+             f"默认: {DEFAULT_COMPRESSLEVEL}"
+    )
+    parser.add_argument(
+        "--bgzf",
+        action="store_true",
+        help="(可选) 以BGZF格式 (块gzip, 兼容普通gzip读取) 写出输出文件。"
+    )
+
+def gzip_options_from_args(args):
+    """
+    Builds the gzip options dict (backend, threads, compresslevel, bgzf) from
+    the parsed arguments added by add_gzip_arguments.
+    """
+    gzip_threads = args.gzip_threads
+    if gzip_threads <= 0:
+        print(f"警告: --gzip-threads 的值 '{args.gzip_threads}' 不是有效的正整数。将使用 1。", file=sys.stderr)
+        gzip_threads = 1
+    return {
+        'backend': resolve_backend(args.gzip_backend),
+        'threads': gzip_threads,
+        'compresslevel': args.compresslevel,
+        'bgzf': args.bgzf
+    }
+
+def gzip_options_from_config(stage_config):
+    """
+    Builds the gzip options dict from a pipeline stage config (S1_config /
+    S2_config keys gzip_backend, gzip_threads, compresslevel, bgzf), with the
+    same defaults as the command line options.
+    """
+    compresslevel = stage_config.get('compresslevel')
+    return gzip_options_from_args(argparse.Namespace(
+        gzip_backend=stage_config.get('gzip_backend') or DEFAULT_GZIP_BACKEND,
+        gzip_threads=int(stage_config.get('gzip_threads') or DEFAULT_GZIP_THREADS),
+        compresslevel=DEFAULT_COMPRESSLEVEL if compresslevel is None else int(compresslevel),
+        bgzf=bool(stage_config.get('bgzf'))
+    ))
+
+def default_gzip_options():
+    """
+    The gzip options dict used when nothing is configured (the command line
+    defaults); default for the gzip_options of S1Config / S2Config.
+    """
+    return gzip_options_from_config({})
+
+def describe_gzip_options(gzip_options):
+    """
+    One-line summary of a gzip options dict for log output.
+    """
+    output_format = "BGZF" if gzip_options.get('bgzf') else "gzip"
+    return (f"gzip后端: {gzip_options['backend']} (每个读写流 {gzip_options['threads']} 线程, "
+            f"压缩级别 {gzip_options.get('compresslevel', DEFAULT_COMPRESSLEVEL)}, 输出格式 {output_format})")
+
+def _digest_decompressed(path, backend):
+    digest = hashlib.sha256()
+    with open_gzip_reader(path, backend) as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def check_backends(paths):
+    """
+    Verifies that every available backend decompresses the given files to the
+    same content, and that data written by each backend reads back unchanged.
+    Returns True when all backends agree.
+    """
+    backends = available_backends()
+    print(f"可用的gzip后端: {', '.join(backends)}")
+    all_consistent = True
+    for path in paths:
+        digests = {backend: _digest_decompressed(path, backend) for backend in backends}
+        consistent = len(set(digests.values())) == 1
+        all_consistent = all_consistent and consistent
+        print(f"{'✓' if consistent else '✗'} {path}: {digests}")
+
+    sample_data = b"".join(b"@read%d\nACGTNACGTGATC\n+\nIIIIIIIIIIIII\n" % i for i in range(10000))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for backend in backends:
+            output_path = os.path.join(temp_dir, f"roundtrip_{backend}.gz")
+            with open_gzip_writer(output_path, 'wb', backend) as writer:
+                writer.write(sample_data[:len(sample_data) // 2])
+            with open_gzip_writer(output_path, 'ab', backend) as writer:
+                writer.write(sample_data[len(sample_data) // 2:])
+            for reader_backend in backends:
+                with open_gzip_reader(output_path, reader_backend) as reader:
+                    roundtrip_ok = reader.read() == sample_data
+                all_consistent = all_consistent and roundtrip_ok
+                print(f"{'✓' if roundtrip_ok else '✗'} 写入后端 {backend} -> 读取后端 {reader_backend}")
+        for writer_name, writer_options in (("并行块gzip", {'threads': 4}), ("BGZF", {'threads': 4, 'bgzf': True})):
+            output_path = os.path.join(temp_dir, f"roundtrip_parallel_{writer_options.get('bgzf', False)}.gz")
+            with ParallelGzipWriter(output_path, 'wb', block_size=4096, **writer_options) as writer:
+                writer.write(sample_data)
+            for reader_backend in backends:
+                with open_gzip_reader(output_path, reader_backend) as reader:
+                    roundtrip_ok = reader.read() == sample_data
+                all_consistent = all_consistent and roundtrip_ok
+                print(f"{'✓' if roundtrip_ok else '✗'} 写入 {writer_name} -> 读取后端 {reader_backend}")
+    return all_consistent
+
+def main():
+    parser = argparse.ArgumentParser(description="检查各gzip后端的解压结果是否一致")
+    parser.add_argument("--check", nargs="*", default=[], metavar="GZ_FILE",
+                        help="需要用全部可用后端解压比对的 .gz 文件")
+    args = parser.parse_args()
+    if not check_backends(args.check):
+        print("错误: gzip后端之间结果不一致", file=sys.stderr)
+        sys.exit(1)
+    print("所有gzip后端结果一致")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+分块流式交接的HiC-Pro映射 (HiC_config.stream_handoff 的默认消费者)
+在S1/S2运行期间由 chunk_handoff.iter_handoff_chunks 读取 Run2_trim/<样本>/ 中新发布的R1/R2分块,
+每个分块发布后立即运行 HiC-Pro 的映射步骤 (-s mapping -s quality_checks):
+  - 分块的输入目录 <输出目录>/stream_mapping/<样本>/<分块>/input/<样本>/ 中是指向分块的符号链接
+    (HiC-Pro -i 需要按样本分子目录的输入目录), 输出写入同一分块目录的 out/
+  - 映射完成后, 分块的 *.bwt2merged.bam 链接到 <输出目录>/bowtie_results/bwt2/<样本>/
+S1/S2和全部分块的映射结束后, 流程以 bowtie_results/bwt2 为输入运行映射之后的HiC-Pro步骤
+(build_post_mapping_command: proc_hic、quality_checks、merge_persample、build_contact_maps、ice_norm),
+不再对Run2_trim整体重新映射。
+
+用法 (通常由 S1S2HiC_Pipeline.py 作为分块消费者启动, 最后一个参数为交接目录):
+  python hic_stream_mapper.py [--config-type 1] [--hicpro PATH] [--hicpro-config FILE] [--conda-env hicpro3]
+                              [--output-dir Run3_hic] [--cpu 10] [--jobs 2] Run2_trim
+"""
+
+import argparse
+import concurrent.futures
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from chunk_handoff import DEFAULT_POLL_SECONDS, R1_SUFFIX, iter_handoff_chunks
+
+DEFAULT_HICPRO_BIN = "/data1/Ref/hicpro/HiC-Pro-3.1.0/bin/HiC-Pro"
+# HiC_config.config_type 对应的HiC-Pro配置文件 (与 Scripts/schic_analysis_pipeline.sh -n 相同)
+HICPRO_CONFIG_FILES = {
+    1: "/data1/Ref/hicpro/configs/scCARE.txt",
+    2: "/data1/Ref/hicpro/configs/SCCARE_INlaIIl.txt",
+    3: "/data1/Ref/hicpro/configs/hicpro_config.txt"
+}
+DEFAULT_CONFIG_TYPE = 1
+DEFAULT_HIC_OUTPUT_DIR = "Run3_hic"
+DEFAULT_CONDA_ENV = "hicpro3"
+DEFAULT_HICPRO_CPU = 10
+DEFAULT_MAPPING_JOBS = 2 # 同时映射的分块数
+HICPRO_MAPPING_STEPS = ("mapping", "quality_checks")
+HICPRO_POST_MAPPING_STEPS = ("proc_hic", "quality_checks", "merge_persample", "build_contact_maps", "ice_norm")
+STREAM_MAPPING_DIR = "stream_mapping"
+BWT2_RESULTS_DIR = Path("bowtie_results") / "bwt2"
+BWT2_BAM_PATTERN = "*.bwt2merged.bam"
+
+def get_hicpro_config_file(config_type, hicpro_config=None):
+    """
+    HiC-Pro配置文件: 显式给出的文件优先, 否则按 config_type 选择
+    """
+    if hicpro_config:
+        return str(hicpro_config)
+    try:
+        return HICPRO_CONFIG_FILES[int(config_type)]
+    except (KeyError, ValueError):
+        raise ValueError(f"未知的HiC-Pro配置类型: {config_type} (可选: {', '.join(map(str, HICPRO_CONFIG_FILES))})")
+
+def build_hicpro_command(hicpro_bin, input_dir, output_dir, config_file, steps, cpu=DEFAULT_HICPRO_CPU,
+                         conda_env=None):
+    """
+    HiC-Pro命令 (只运行steps中的步骤); 指定conda_env且能找到conda时在该环境中运行
+    """
+    cmd = [str(hicpro_bin), "-i", str(input_dir), "-o", str(output_dir), "-c", str(config_file),
+           "-p", str(cpu)]
+    for step in steps:
+        cmd.extend(["-s", step])
+    if conda_env and shutil.which("conda"):
+        cmd = ["conda", "run", "--no-capture-output", "-n", conda_env] + cmd
+    return cmd
+
+def build_post_mapping_command(hicpro_bin, output_dir, config_file, cpu=DEFAULT_HICPRO_CPU, conda_env=None):
+    """
+    映射之后的HiC-Pro步骤: 以各分块链接到 <output_dir>/bowtie_results/bwt2 的BAM为输入,
+    结果 (hic_results/data/<样本>) 写入output_dir, 各样本的分块在merge_persample中合并
+    """
+    return build_hicpro_command(hicpro_bin, Path(output_dir) / BWT2_RESULTS_DIR, output_dir, config_file,
+                                HICPRO_POST_MAPPING_STEPS, cpu, conda_env)
+
+def get_chunk_name(r1_path):
+    """
+    分块名称: <base>_partNNNN (R1文件名去掉 _R1.fq.gz)
+    """
+    return Path(r1_path).name[:-len(R1_SUFFIX)]
+
+class StreamMapper:
+    """
+    逐个映射已发布的分块: map_chunk() 在线程池中运行 (每个分块一个HiC-Pro子进程),
+    映射好的BAM链接到 output_dir/bowtie_results/bwt2/<样本>/
+    """
+    def __init__(self, output_dir=DEFAULT_HIC_OUTPUT_DIR, config_file=None, hicpro_bin=DEFAULT_HICPRO_BIN,
+                 cpu=DEFAULT_HICPRO_CPU, conda_env=None):
+        self.output_dir = Path(output_dir).absolute()
+        self.config_file = config_file or HICPRO_CONFIG_FILES[DEFAULT_CONFIG_TYPE]
+        self.hicpro_bin = hicpro_bin
+        self.cpu = cpu
+        self.conda_env = conda_env
+        self.mapping_dir = self.output_dir / STREAM_MAPPING_DIR
+        self.bwt2_dir = self.output_dir / BWT2_RESULTS_DIR
+
+    def reset(self):
+        """
+        删除上次运行的分块映射结果和BAM链接 (分块会重新发布, 旧的BAM不能混入合并)
+        """
+        for path in (self.mapping_dir, self.bwt2_dir):
+            if path.exists():
+                shutil.rmtree(path)
+        self.bwt2_dir.mkdir(parents=True, exist_ok=True)
+
+    def map_chunk(self, sample_name, r1_path, r2_path):
+        """
+        对一个分块运行HiC-Pro映射步骤, 返回链接的BAM数; HiC-Pro失败时抛出CalledProcessError
+        """
+        chunk_name = get_chunk_name(r1_path)
+        chunk_dir = self.mapping_dir / sample_name / chunk_name
+        input_dir = chunk_dir / "input" / sample_name
+        input_dir.mkdir(parents=True, exist_ok=True)
+        for read_path in (r1_path, r2_path):
+            (input_dir / Path(read_path).name).symlink_to(Path(read_path).absolute())
+
+        cmd = build_hicpro_command(self.hicpro_bin, input_dir.parent, chunk_dir / "out", self.config_file,
+                                   HICPRO_MAPPING_STEPS, self.cpu, self.conda_env)
+        start_time = time.monotonic()
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        # 整块输出, 同时映射的分块的行不会交错
+        for line in result.stdout.splitlines():
+            print(f"[{chunk_name}] {line}")
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, cmd, output=result.stdout)
+
+        sample_bwt2_dir = self.bwt2_dir / sample_name
+        sample_bwt2_dir.mkdir(parents=True, exist_ok=True)
+        bam_paths = sorted((chunk_dir / "out" / BWT2_RESULTS_DIR / sample_name).glob(BWT2_BAM_PATTERN))
+        if not bam_paths:
+            raise RuntimeError(f"HiC-Pro没有为分块 {chunk_name} 写出 {BWT2_BAM_PATTERN}")
+        for bam_path in bam_paths:
+            (sample_bwt2_dir / bam_path.name).symlink_to(bam_path)
+        print(f"{sample_name}: {chunk_name} 映射完成 ({len(bam_paths)} 个BAM, {time.monotonic() - start_time:.1f}秒)")
+        return len(bam_paths)
+
+def run_stream_mapping(handoff_dir, mapper, jobs=DEFAULT_MAPPING_JOBS, poll_seconds=DEFAULT_POLL_SECONDS,
+                       timeout=None):
+    """
+    读取交接目录中发布的分块并在后台映射, 直到结束标记出现且全部分块映射完成; 返回是否全部成功
+    """
+    mapper.reset()
+    futures = {}
+    success = True
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        try:
+            for sample_name, r1_path, r2_path in iter_handoff_chunks(handoff_dir, poll_seconds, timeout):
+                futures[executor.submit(mapper.map_chunk, sample_name, r1_path, r2_path)] = r1_path
+        except (RuntimeError, TimeoutError) as e:
+            print(f"错误: {e}", file=sys.stderr)
+            success = False
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except (subprocess.CalledProcessError, RuntimeError, OSError) as e:
+                print(f"错误: 分块 {futures[future].name} 映射失败: {e}", file=sys.stderr)
+                success = False
+    print(f"共映射 {len(futures)} 个分块")
+    return success
+
+def main():
+    parser = argparse.ArgumentParser(description="分块流式交接的HiC-Pro映射: 分块发布后立即运行HiC-Pro映射步骤")
+    parser.add_argument("handoff_dir", help="交接目录 (Run2_trim)")
+    parser.add_argument("--config-type", type=int, default=DEFAULT_CONFIG_TYPE,
+                        help=f"HiC-Pro配置类型, 同 HiC_config.config_type (默认: {DEFAULT_CONFIG_TYPE})")
+    parser.add_argument("--hicpro-config", help="HiC-Pro配置文件, 覆盖 --config-type")
+    parser.add_argument("--hicpro", default=DEFAULT_HICPRO_BIN, help=f"HiC-Pro可执行文件 (默认: {DEFAULT_HICPRO_BIN})")
+    parser.add_argument("--conda-env", default=DEFAULT_CONDA_ENV,
+                        help=f"运行HiC-Pro的conda环境, 为空时直接运行 (默认: {DEFAULT_CONDA_ENV})")
+    parser.add_argument("--output-dir", default=DEFAULT_HIC_OUTPUT_DIR,
+                        help=f"HiC-Pro输出目录 (默认: {DEFAULT_HIC_OUTPUT_DIR})")
+    parser.add_argument("--cpu", type=int, default=DEFAULT_HICPRO_CPU,
+                        help=f"每个分块HiC-Pro使用的CPU数 (默认: {DEFAULT_HICPRO_CPU})")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_MAPPING_JOBS,
+                        help=f"同时映射的分块数 (默认: {DEFAULT_MAPPING_JOBS})")
+    parser.add_argument("--poll-seconds", type=float, default=DEFAULT_POLL_SECONDS,
+                        help=f"检查新分块的间隔秒数 (默认: {DEFAULT_POLL_SECONDS})")
+    parser.add_argument("--timeout", type=float, help="多少秒内没有新分块时失败 (默认: 一直等待)")
+    args = parser.parse_args()
+
+    try:
+        config_file = get_hicpro_config_file(args.config_type, args.hicpro_config)
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+    mapper = StreamMapper(args.output_dir, config_file, args.hicpro, args.cpu, args.conda_env or None)
+    print(f"HiC-Pro: {args.hicpro}, 配置文件: {config_file}, 输出目录: {mapper.output_dir}")
+    success = run_stream_mapping(args.handoff_dir, mapper, args.jobs, args.poll_seconds, args.timeout)
+    sys.exit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
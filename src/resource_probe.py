@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本进程实际可用的CPU和内存 (用于确定S1/S2的默认并行任务数和缓冲大小)
+os.cpu_count() 和 nproc 之外还考虑:
+  CPU  - 进程的CPU亲和性 (os.sched_getaffinity, Slurm/taskset/cpuset绑定的核)
+         和cgroup的CPU配额 (v2 cpu.max, v1 cpu.cfs_quota_us/cpu.cfs_period_us, Kubernetes limits.cpu)
+  内存 - 可用内存 (/proc/meminfo MemAvailable) 和cgroup内存上限减去已用量
+         (v2 memory.max/memory.current, v1 memory.limit_in_bytes/memory.usage_in_bytes)
+cgroup按本进程所在的cgroup及其各级父cgroup取最小的限制; 非Linux或读取失败时退回 os.cpu_count() / 物理内存。
+"""
+
+import functools
+import math
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+PROC_SELF_CGROUP = "/proc/self/cgroup"
+PROC_SELF_MOUNTINFO = "/proc/self/mountinfo"
+PROC_MEMINFO = "/proc/meminfo"
+DEFAULT_MEMORY_FRACTION = 0.5 # 按内存确定并行任务数时, 最多使用可用内存的比例 (其余留给页缓存和其他进程)
+
+def read_text(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except (OSError, ValueError):
+        return None
+
+def read_int(path):
+    text = read_text(path)
+    try:
+        return int(text) if text is not None else None
+    except ValueError:
+        return None
+
+def get_cgroup_dirs():
+    """
+    本进程所在的cgroup: {'v2': (目录, 挂载点)} 和/或 {'cpu': ..., 'memory': ...} (v1)
+    按 /proc/self/mountinfo 的挂载点解析 /proc/self/cgroup 中的路径 (容器内cgroup命名空间的路径同样适用)
+    """
+    cgroup_text = read_text(PROC_SELF_CGROUP)
+    mountinfo_text = read_text(PROC_SELF_MOUNTINFO)
+    if not cgroup_text or not mountinfo_text:
+        return {}
+
+    # 挂载点: 'v2' 或 v1控制器名 -> (cgroup根路径, 挂载目录)
+    mounts = {}
+    for line in mountinfo_text.splitlines():
+        fields = line.split()
+        if " - " not in line or len(fields) < 5:
+            continue
+        mount_root, mount_point = fields[3], fields[4]
+        fstype, _, super_options = line.split(" - ", 1)[1].split()[:3]
+        if fstype == "cgroup2":
+            mounts.setdefault('v2', (mount_root, mount_point))
+        elif fstype == "cgroup":
+            for controller in super_options.split(","):
+                if controller in ('cpu', 'memory'):
+                    mounts.setdefault(controller, (mount_root, mount_point))
+
+    cgroup_dirs = {}
+    for line in cgroup_text.splitlines():
+        hierarchy_id, controllers, cgroup_path = line.split(":", 2)
+        if hierarchy_id == "0" and controllers == "":
+            names = ['v2']
+        else:
+            names = [controller for controller in controllers.split(",") if controller in ('cpu', 'memory')]
+        for name in names:
+            if name not in mounts:
+                continue
+            mount_root, mount_point = mounts[name]
+            relative_path = os.path.relpath(cgroup_path, mount_root) if cgroup_path.startswith(mount_root) else "."
+            cgroup_dir = Path(mount_point) / relative_path
+            # 未使用cgroup命名空间的旧容器: /proc/self/cgroup中是宿主机上的路径, 容器内挂载的就是本cgroup
+            cgroup_dirs[name] = (cgroup_dir if cgroup_dir.is_dir() else Path(mount_point), Path(mount_point))
+    return cgroup_dirs
+
+def iter_cgroup_hierarchy(cgroup_dirs, name):
+    """
+    从本进程的cgroup到挂载点的各级目录 (父cgroup的限制同样约束本进程)
+    """
+    if name not in cgroup_dirs:
+        return
+    cgroup_dir, mount_point = cgroup_dirs[name]
+    while True:
+        yield cgroup_dir
+        if cgroup_dir == mount_point or cgroup_dir.parent == cgroup_dir:
+            return
+        cgroup_dir = cgroup_dir.parent
+
+def get_cgroup_cpu_quota(cgroup_dirs):
+    """
+    cgroup的CPU配额 (可用的CPU数, 可为小数); 无限制时返回None
+    """
+    quotas = []
+    for cgroup_dir in iter_cgroup_hierarchy(cgroup_dirs, 'v2'):
+        cpu_max = read_text(cgroup_dir / "cpu.max")
+        if cpu_max:
+            quota, _, period = cpu_max.partition(" ")
+            if quota != "max" and period:
+                quotas.append(int(quota) / int(period))
+    for cgroup_dir in iter_cgroup_hierarchy(cgroup_dirs, 'cpu'):
+        quota = read_int(cgroup_dir / "cpu.cfs_quota_us")
+        period = read_int(cgroup_dir / "cpu.cfs_period_us")
+        if quota and quota > 0 and period:
+            quotas.append(quota / period)
+    return min(quotas) if quotas else None
+
+def get_cgroup_available_memory(limit, usage, stat_path):
+    """
+    一级cgroup中仍可使用的内存: 上限减去已用量, 不计可回收的页缓存 (inactive_file)
+    """
+    if usage is None:
+        return limit
+    inactive_file = 0
+    for line in (read_text(stat_path) or "").splitlines():
+        key, _, value = line.partition(" ")
+        if key in ("inactive_file", "total_inactive_file") and value.isdigit():
+            inactive_file = int(value)
+    return max(0, limit - usage + inactive_file)
+
+def get_cgroup_memory(cgroup_dirs, total_memory_bytes):
+    """
+    cgroup的内存上限及其中仍可使用的内存 (各级cgroup中最小的); 无限制时返回 (None, None)
+    """
+    limits = []
+    available = []
+    for cgroup_dir in iter_cgroup_hierarchy(cgroup_dirs, 'v2'):
+        limit = read_int(cgroup_dir / "memory.max")  # "max" 时为None
+        if limit:
+            limits.append(limit)
+            available.append(get_cgroup_available_memory(limit, read_int(cgroup_dir / "memory.current"),
+                                                         cgroup_dir / "memory.stat"))
+    for cgroup_dir in iter_cgroup_hierarchy(cgroup_dirs, 'memory'):
+        limit = read_int(cgroup_dir / "memory.limit_in_bytes")
+        # v1未限制时为接近2^63的值
+        if limit and (total_memory_bytes is None or limit < total_memory_bytes):
+            limits.append(limit)
+            available.append(get_cgroup_available_memory(limit, read_int(cgroup_dir / "memory.usage_in_bytes"),
+                                                         cgroup_dir / "memory.stat"))
+    if not limits:
+        return None, None
+    return min(limits), min(available)
+
+def get_host_memory():
+    """
+    (物理内存总量, 可用内存) 字节; 无法获取时为None
+    """
+    meminfo = {}
+    for line in (read_text(PROC_MEMINFO) or "").splitlines():
+        key, _, value = line.partition(":")
+        fields = value.split()
+        if fields and fields[0].isdigit():
+            meminfo[key] = int(fields[0]) * 1024
+    total = meminfo.get('MemTotal')
+    available = meminfo.get('MemAvailable')
+    try:
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        total = total or page_size * os.sysconf('SC_PHYS_PAGES')
+        available = available or page_size * os.sysconf('SC_AVPHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        pass
+    return total, available
+
+def format_bytes(num_bytes):
+    return "未知" if num_bytes is None else f"{num_bytes / 1024 ** 3:.1f} GB"
+
+@dataclass
+class ResourceProbe:
+    """
+    探测结果; cpus/memory_limit_bytes/available_memory_bytes 为各项限制中最小的值
+    """
+    os_cpus: int
+    affinity_cpus: int
+    cgroup_cpu_quota: Optional[float]
+    total_memory_bytes: Optional[int]
+    host_available_bytes: Optional[int]
+    cgroup_memory_limit_bytes: Optional[int]
+    cgroup_available_bytes: Optional[int]
+
+    @property
+    def cpus(self):
+        cpus = self.affinity_cpus
+        if self.cgroup_cpu_quota is not None:
+            cpus = min(cpus, math.ceil(self.cgroup_cpu_quota))
+        return max(1, cpus)
+
+    @property
+    def memory_limit_bytes(self):
+        limits = [value for value in (self.total_memory_bytes, self.cgroup_memory_limit_bytes) if value]
+        return min(limits) if limits else None
+
+    @property
+    def available_memory_bytes(self):
+        values = [value for value in (self.host_available_bytes, self.cgroup_available_bytes) if value is not None]
+        return min(values) if values else None
+
+    def worker_count(self, memory_per_worker_bytes=0, memory_fraction=DEFAULT_MEMORY_FRACTION, max_workers=None):
+        """
+        默认并行任务数: 可用CPU数, 且 任务数 * memory_per_worker_bytes 不超过可用内存的memory_fraction
+        """
+        workers = self.cpus
+        available = self.available_memory_bytes
+        if memory_per_worker_bytes and available is not None:
+            workers = min(workers, int(available * memory_fraction // memory_per_worker_bytes))
+        if max_workers is not None:
+            workers = min(workers, max_workers)
+        return max(1, workers)
+
+    def describe(self):
+        cpu_text = f"CPU {self.cpus} 个 (os.cpu_count {self.os_cpus}, 亲和性 {self.affinity_cpus}"
+        if self.cgroup_cpu_quota is not None:
+            cpu_text += f", cgroup配额 {self.cgroup_cpu_quota:g}"
+        memory_text = f"可用内存 {format_bytes(self.available_memory_bytes)} (物理 {format_bytes(self.total_memory_bytes)}"
+        if self.cgroup_memory_limit_bytes is not None:
+            memory_text += f", cgroup上限 {format_bytes(self.cgroup_memory_limit_bytes)}"
+        return f"{cpu_text}), {memory_text})"
+
+def probe_resources():
+    """
+    探测本进程当前可用的CPU和内存
+    """
+    os_cpus = os.cpu_count() or 1
+    try:
+        affinity_cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        affinity_cpus = os_cpus
+    total_memory_bytes, host_available_bytes = get_host_memory()
+    cgroup_dirs = get_cgroup_dirs()
+    cgroup_memory_limit_bytes, cgroup_available_bytes = get_cgroup_memory(cgroup_dirs, total_memory_bytes)
+    return ResourceProbe(
+        os_cpus=os_cpus,
+        affinity_cpus=affinity_cpus,
+        cgroup_cpu_quota=get_cgroup_cpu_quota(cgroup_dirs),
+        total_memory_bytes=total_memory_bytes,
+        host_available_bytes=host_available_bytes,
+        cgroup_memory_limit_bytes=cgroup_memory_limit_bytes,
+        cgroup_available_bytes=cgroup_available_bytes
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_cpu_limit():
+    """
+    本进程可用的CPU数 (亲和性与cgroup配额中较小者); CPU限制在进程运行期间不变, 只探测一次
+    """
+    return probe_resources().cpus
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+S1 序列匹配引擎
+每个引擎对一条序列返回 (match_fwd, match_rc):
+序列中是否同时包含全部正向序列, 以及是否同时包含全部反向互补序列。
+序列与查询序列须为同一类型 (S1 使用 bytes)。
+另提供容错匹配 (ApproximatePattern / ApproximateMatcher), S1的查询序列与S2的分隔符共用,
+以及只计数运行使用的NumPy批量匹配 (NumpyBatchMatcher, 可选依赖numpy)。
+Aho-Corasick引擎 (AhoCorasickMatcher) 使用可选依赖pyahocorasick的C实现。
+"""
+
+import operator
+
+MATCH_ENGINE_IN = "in"
+MATCH_ENGINE_AHO_CORASICK = "aho-corasick"
+MATCH_ENGINE_NUMPY = "numpy"
+MATCH_ENGINES = (MATCH_ENGINE_IN, MATCH_ENGINE_AHO_CORASICK, MATCH_ENGINE_NUMPY)
+DEFAULT_MATCH_ENGINE = MATCH_ENGINE_IN
+
+NUMPY_KMER_SIZES = (8, 4, 2, 1) # Sampled k-mer widths, each packed into one unsigned integer
+
+def numpy_available():
+    """
+    True if the optional numpy dependency of the "numpy" engine can be imported.
+    """
+    try:
+        import numpy # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def pyahocorasick_available():
+    """
+    True if the optional pyahocorasick dependency of the "aho-corasick" engine
+    can be imported.
+    """
+    try:
+        import ahocorasick # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+class SubstringMatcher:
+    """
+    Default engine: one `in` substring test per pattern (2k scans for k patterns).
+    """
+    def __init__(self, forward_patterns, rc_patterns):
+        self.forward_patterns = list(forward_patterns)
+        self.rc_patterns = list(rc_patterns)
+
+    def match(self, sequence):
+        match_fwd = False
+        if self.forward_patterns:
+            match_fwd = all(pattern in sequence for pattern in self.forward_patterns)
+
+        match_rc = False
+        if self.rc_patterns:
+            match_rc = all(rc_pattern in sequence for rc_pattern in self.rc_patterns)
+
+        return match_fwd, match_rc
+
+class NumpyBatchMatcher(SubstringMatcher):
+    """
+    Vectorized engine for count-only runs. match_block() tests every read of a
+    decompressed block at once and returns boolean arrays; match() is the
+    scalar SubstringMatcher fallback for per-read processing.
+
+    The block is read as unsigned integers of k bytes (k = 8 when m >= 8, no
+    copy). For m >= 2k - 1 every occurrence covers a block position that is a
+    multiple of k, so one view is compared with the pattern's first k k-mers;
+    shorter patterns compare their leading k-mer at all k phases. Candidates
+    are verified over the full pattern and assigned to reads by their line
+    index; hits on header or quality lines are discarded. Patterns never contain a newline,
+    so results equal the `in` test on each sequence line.
+    """
+    def __init__(self, forward_patterns, rc_patterns):
+        super().__init__(forward_patterns, rc_patterns)
+        import numpy # Optional dependency, only needed for this engine
+        self.numpy = numpy
+        self.pattern_arrays = {pattern: numpy.frombuffer(pattern, dtype=numpy.uint8)
+                               for pattern in self.forward_patterns + self.rc_patterns}
+
+    def _find_records(self, buffer, newlines, record_count, pattern_array):
+        numpy = self.numpy
+        found = numpy.zeros(record_count, dtype=bool)
+        pattern_length = len(pattern_array)
+        kmer_size = next(size for size in NUMPY_KMER_SIZES if size <= pattern_length)
+        kmer_dtype = numpy.dtype(f"u{kmer_size}")
+        if pattern_length - kmer_size + 1 >= kmer_size:
+            # Every occurrence covers a multiple of kmer_size at one of kmer_size offsets
+            phases, offsets = (0,), range(kmer_size)
+        else:
+            # Short patterns: k-mers at all positions, read as kmer_size interleaved views
+            phases, offsets = range(kmer_size), (0,)
+        starts = []
+        for phase in phases:
+            window_count = (len(buffer) - phase) // kmer_size
+            codes = buffer[phase:phase + window_count * kmer_size].view(kmer_dtype)
+            for offset in offsets:
+                code = pattern_array[offset:offset + kmer_size].view(kmer_dtype)[0]
+                starts.append(numpy.flatnonzero(codes == code) * kmer_size + (phase - offset))
+        starts = numpy.concatenate(starts)
+        starts = starts[(starts >= 0) & (starts <= len(buffer) - pattern_length)]
+        if pattern_length > kmer_size and starts.size:
+            candidates = buffer[starts[:, None] + numpy.arange(pattern_length)]
+            starts = starts[(candidates == pattern_array).all(axis=1)]
+        line_indexes = numpy.searchsorted(newlines, starts)
+        line_indexes = line_indexes[(line_indexes % 4 == 1) & (line_indexes < 4 * record_count)]
+        found[line_indexes // 4] = True
+        return found
+
+    def match_block(self, buffer, newlines, record_count):
+        """
+        Returns (match_fwd, match_rc) boolean arrays for the first record_count
+        FASTQ records of buffer (uint8 array), given its newline positions.
+        """
+        numpy = self.numpy
+        found = {pattern: self._find_records(buffer, newlines, record_count, pattern_array)
+                 for pattern, pattern_array in self.pattern_arrays.items()}
+        no_match = numpy.zeros(record_count, dtype=bool)
+        match_fwd = no_match
+        if self.forward_patterns:
+            match_fwd = numpy.logical_and.reduce([found[pattern] for pattern in self.forward_patterns])
+        match_rc = no_match
+        if self.rc_patterns:
+            match_rc = numpy.logical_and.reduce([found[pattern] for pattern in self.rc_patterns])
+        return match_fwd, match_rc
+
+class AhoCorasickMatcher:
+    """
+    Aho-Corasick automaton (optional pyahocorasick C extension) built once
+    from the forward and reverse-complement patterns. A single left-to-right
+    pass over the sequence records which patterns occur as a bitmask; the
+    scan stops early once every pattern has been seen.
+
+    pyahocorasick matches str keys, so bytes patterns and sequences are
+    decoded as latin-1 (one character per byte).
+    """
+    def __init__(self, forward_patterns, rc_patterns):
+        import ahocorasick
+
+        self.forward_patterns = list(forward_patterns)
+        self.rc_patterns = list(rc_patterns)
+
+        # Identical patterns (e.g. palindromic sites such as GATC, whose reverse
+        # complement is itself) share one bit.
+        pattern_bits = {}
+        for pattern in self.forward_patterns + self.rc_patterns:
+            if pattern not in pattern_bits:
+                pattern_bits[pattern] = 1 << len(pattern_bits)
+
+        self.fwd_mask = 0
+        for pattern in self.forward_patterns:
+            self.fwd_mask |= pattern_bits[pattern]
+        self.rc_mask = 0
+        for pattern in self.rc_patterns:
+            self.rc_mask |= pattern_bits[pattern]
+        self.all_mask = self.fwd_mask | self.rc_mask
+
+        self.automaton = ahocorasick.Automaton()
+        for pattern, bit in pattern_bits.items():
+            self.automaton.add_word(self._as_text(pattern), bit)
+        if pattern_bits:
+            self.automaton.make_automaton()
+
+    @staticmethod
+    def _as_text(sequence):
+        return sequence.decode('latin-1') if isinstance(sequence, (bytes, bytearray)) else sequence
+
+    def match(self, sequence):
+        all_mask = self.all_mask
+        found = 0
+        if all_mask:
+            for _, output in self.automaton.iter(self._as_text(sequence)):
+                found |= output
+                if found == all_mask:
+                    break
+
+        match_fwd = bool(self.forward_patterns) and (found & self.fwd_mask) == self.fwd_mask
+        match_rc = bool(self.rc_patterns) and (found & self.rc_mask) == self.rc_mask
+        return match_fwd, match_rc
+
+class ApproximatePattern:
+    """
+    Finds occurrences of one pattern with at most max_mismatches substitutions
+    (Hamming distance) or at most max_edits substitutions/insertions/deletions
+    (edit distance).
+
+    With k allowed errors the pattern is cut into k+1 seeds; any occurrence
+    contains at least one seed exactly (pigeonhole), so candidates come from
+    plain find() calls on the seeds and only the few positions they point at
+    are verified. Substitution-only candidates are compared position by
+    position; edit-distance candidates are verified with Myers' bit-vector
+    algorithm over a window of m+3k characters, which also yields the match
+    end, and a second anchored pass over the reversed window yields its start.
+    An exact occurrence always takes precedence, so sequences that match
+    exactly get the same positions as in exact mode and skip the seeding.
+    """
+    def __init__(self, pattern, max_mismatches=0, max_edits=0):
+        if max_mismatches and max_edits:
+            raise ValueError("max_mismatches 与 max_edits 只能设置其一")
+        self.pattern = pattern
+        self.max_errors = max_edits or max_mismatches
+        self.allow_indels = bool(max_edits)
+        if self.max_errors < 0 or self.max_errors >= len(pattern):
+            raise ValueError(f"容错数 {self.max_errors} 必须小于序列长度 {len(pattern)}: {pattern!r}")
+
+        seed_count = self.max_errors + 1
+        bounds = [len(pattern) * index // seed_count for index in range(seed_count + 1)]
+        self.seeds = [(bounds[index], pattern[bounds[index]:bounds[index + 1]]) for index in range(seed_count)]
+
+        if self.allow_indels:
+            self.mask = (1 << len(pattern)) - 1
+            self.high_bit = 1 << (len(pattern) - 1)
+            self.peq = self._build_peq(pattern)
+            self.reversed_peq = self._build_peq(pattern[::-1])
+
+    @staticmethod
+    def _build_peq(pattern):
+        """
+        Per-byte bitmask of the positions where the byte occurs in pattern,
+        as a 256-entry list indexed by the byte value.
+        """
+        peq = [0] * 256
+        for position, symbol in enumerate(pattern):
+            peq[symbol] |= 1 << position
+        return peq
+
+    def search(self, sequence):
+        """
+        True if the pattern occurs in sequence within the error budget.
+        """
+        pattern = self.pattern
+        if pattern in sequence:
+            return True
+        if self.allow_indels:
+            return self._find_edits(sequence, 0, None) is not None
+        # Substitution-only: any verified seed candidate will do
+        pattern_length = len(pattern)
+        max_errors = self.max_errors
+        last_start = len(sequence) - pattern_length
+        for offset, seed in self.seeds:
+            hit = sequence.find(seed, offset)
+            while hit != -1 and hit - offset <= last_start:
+                candidate = hit - offset
+                if sum(map(operator.ne, sequence[candidate:candidate + pattern_length], pattern)) <= max_errors:
+                    return True
+                hit = sequence.find(seed, hit + 1)
+        return False
+
+    def find(self, sequence, start=0, stop=None):
+        """
+        Returns (match_start, match_end) of the leftmost exact occurrence that
+        starts at or after start; without one, of the leftmost approximate one
+        (by start for substitutions, by end for edits), or None.
+        With stop, None is also returned when that occurrence starts at or
+        after stop, and text beyond what such a match could reach is skipped.
+        """
+        exact = sequence.find(self.pattern, start)
+        if exact != -1:
+            if stop is not None and exact >= stop:
+                return None
+            return exact, exact + len(self.pattern)
+        if self.allow_indels:
+            return self._find_edits(sequence, start, stop)
+        return self._find_mismatches(sequence, start, stop)
+
+    def _find_mismatches(self, sequence, start, stop):
+        pattern = self.pattern
+        pattern_length = len(pattern)
+        max_errors = self.max_errors
+        last_start = len(sequence) - pattern_length
+        if stop is not None:
+            last_start = min(last_start, stop - 1)
+        best = last_start + 1
+        for offset, seed in self.seeds:
+            hit = sequence.find(seed, start + offset)
+            while hit != -1 and hit - offset < best:
+                candidate = hit - offset
+                if sum(map(operator.ne, sequence[candidate:candidate + pattern_length], pattern)) <= max_errors:
+                    best = candidate
+                    break
+                hit = sequence.find(seed, hit + 1)
+        if best > last_start:
+            return None
+        return best, best + pattern_length
+
+    def _find_edits(self, sequence, start, stop):
+        pattern_length = len(self.pattern)
+        max_errors = self.max_errors
+        text_end = len(sequence)
+        if stop is not None:
+            # A match starting before stop ends (and is recognised) before this
+            text_end = min(text_end, stop + pattern_length + 2 * max_errors)
+        # Windows around every seed hit, merged and scanned left to right; a seed
+        # may sit up to max_errors positions left of its offset in the pattern
+        windows = []
+        for offset, seed in self.seeds:
+            hit = sequence.find(seed, max(0, start + offset - max_errors), text_end)
+            while hit != -1:
+                windows.append((max(start, hit - offset - max_errors),
+                                min(text_end, hit - offset + pattern_length + 2 * max_errors)))
+                hit = sequence.find(seed, hit + 1, text_end)
+        if not windows:
+            return None
+        windows.sort()
+        merged = [list(windows[0])]
+        for window_start, window_end in windows[1:]:
+            if window_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], window_end)
+            else:
+                merged.append([window_start, window_end])
+
+        for window_start, window_end in merged:
+            match_end, distance = self._scan_end(sequence, window_start, window_end)
+            if match_end is not None:
+                match_start = self._scan_start(sequence, window_start, match_end, distance)
+                if stop is not None and match_start >= stop:
+                    return None
+                return match_start, match_end
+        return None
+
+    def _scan_end(self, sequence, window_start, window_end):
+        """
+        Myers' bit-vector scan (free start) over sequence[window_start:window_end].
+        Returns (end, distance) of the first local distance minimum within the
+        error budget, or (None, None).
+        """
+        peq = self.peq
+        mask = self.mask
+        high_bit = self.high_bit
+        max_errors = self.max_errors
+        pv = mask
+        mv = 0
+        score = len(self.pattern)
+        best_end = None
+        best_score = max_errors + 1
+        end = window_start
+        for symbol in sequence[window_start:window_end]:
+            end += 1
+            eq = peq[symbol]
+            xv = eq | mv
+            xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+            ph = mv | (mask ^ (xh | pv))
+            mh = pv & xh
+            if ph & high_bit:
+                score += 1
+            elif mh & high_bit:
+                score -= 1
+            ph = (ph << 1) & mask
+            mh = (mh << 1) & mask
+            pv = mh | (mask ^ (xv | ph))
+            mv = ph & xv
+            if score < best_score:
+                best_end = end
+                best_score = score
+            elif best_end is not None:
+                break
+        return best_end, best_score if best_end is not None else None
+
+    def _scan_start(self, sequence, window_start, match_end, distance):
+        """
+        Anchored Myers pass over the reversed text ending at match_end. Returns the
+        start whose alignment reaches distance, preferring a length closest to
+        the pattern length.
+        """
+        peq = self.reversed_peq
+        mask = self.mask
+        high_bit = self.high_bit
+        pattern_length = len(self.pattern)
+        pv = mask
+        mv = 0
+        score = pattern_length
+        best_start = match_end - pattern_length
+        best_key = None
+        lowest_start = max(window_start, match_end - pattern_length - self.max_errors)
+        position = match_end
+        for symbol in sequence[lowest_start:match_end][::-1]:
+            position -= 1
+            eq = peq[symbol]
+            xv = eq | mv
+            xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+            ph = mv | (mask ^ (xh | pv))
+            mh = pv & xh
+            if ph & high_bit:
+                score += 1
+            elif mh & high_bit:
+                score -= 1
+            ph = ((ph << 1) | 1) & mask
+            mh = (mh << 1) & mask
+            pv = mh | (mask ^ (xv | ph))
+            mv = ph & xv
+            if score <= distance:
+                key = abs(match_end - position - pattern_length)
+                if best_key is None or key < best_key:
+                    best_start = position
+                    best_key = key
+        return best_start
+
+class ApproximateMatcher:
+    """
+    Error-tolerant engine: every pattern is an ApproximatePattern (see there).
+    Exact occurrences are accepted with one `in` test before any seeding.
+    """
+    def __init__(self, forward_patterns, rc_patterns, max_mismatches=0, max_edits=0):
+        self.forward_patterns = list(forward_patterns)
+        self.rc_patterns = list(rc_patterns)
+        # Palindromic patterns share one searcher
+        searchers = {}
+        for pattern in self.forward_patterns + self.rc_patterns:
+            if pattern not in searchers:
+                searchers[pattern] = ApproximatePattern(pattern, max_mismatches, max_edits)
+        self.forward_searchers = [searchers[pattern] for pattern in self.forward_patterns]
+        self.rc_searchers = [searchers[pattern] for pattern in self.rc_patterns]
+
+    def match(self, sequence):
+        match_fwd = False
+        if self.forward_searchers:
+            match_fwd = all(searcher.search(sequence) for searcher in self.forward_searchers)
+
+        match_rc = False
+        if self.rc_searchers:
+            match_rc = all(searcher.search(sequence) for searcher in self.rc_searchers)
+
+        return match_fwd, match_rc
+
+def build_matcher(engine, forward_patterns, rc_patterns, max_mismatches=0, max_edits=0):
+    """
+    Creates the matcher for the given engine name (see MATCH_ENGINES).
+    With max_mismatches or max_edits > 0 the error-tolerant ApproximateMatcher
+    is used regardless of engine.
+    """
+    if max_mismatches or max_edits:
+        return ApproximateMatcher(forward_patterns, rc_patterns, max_mismatches, max_edits)
+    if engine == MATCH_ENGINE_IN:
+        return SubstringMatcher(forward_patterns, rc_patterns)
+    if engine == MATCH_ENGINE_AHO_CORASICK:
+        return AhoCorasickMatcher(forward_patterns, rc_patterns)
+    if engine == MATCH_ENGINE_NUMPY:
+        return NumpyBatchMatcher(forward_patterns, rc_patterns)
+    raise ValueError(f"未知的匹配引擎: {engine} (可选: {', '.join(MATCH_ENGINES)})")
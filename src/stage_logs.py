@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+流程各阶段的日志
+S1S2_Pipeline.py 与 S1S2HiC_Pipeline.py 为每个阶段 (S1、S2、HiC) 写一个按大小轮转的日志文件
+<log_dir>/<阶段>.log, 每行带时间戳。子进程 (或进程池中S2) 的输出逐行写入日志并同时显示,
+内存中只保留最近若干行 (tail), 用于失败时的错误报告, 因此长时间运行时父进程内存不会增长,
+监控也能实时看到进度。
+"""
+
+import collections
+import io
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+DEFAULT_LOG_DIR = "pipeline_logs"
+DEFAULT_LOG_MAX_MB = 50 # 单个日志文件达到此大小后轮转
+DEFAULT_LOG_BACKUP_COUNT = 5 # 保留的轮转日志个数 (<阶段>.log.1 ... .5)
+DEFAULT_TAIL_LINES = 200 # 内存中为错误报告保留的最近输出行数
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+# 进程池工作进程中的日志记录器, 由 init_worker_logging 设置
+_worker_logger = None
+
+def open_stage_log(stage_name, log_dir=DEFAULT_LOG_DIR, max_mb=DEFAULT_LOG_MAX_MB,
+                   backup_count=DEFAULT_LOG_BACKUP_COUNT, echo=True):
+    """
+    打开阶段日志: 写入 <log_dir>/<stage_name>.log (按max_mb轮转, 保留backup_count个),
+    echo为True时同时原样输出到控制台 (stdout)
+    返回: logging.Logger
+    """
+    log_path = Path(log_dir) / f"{stage_name}.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    logger = logging.getLogger(f"S1S2.{stage_name}")
+    close_stage_log(logger)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    file_handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max(1, int(max_mb)) * 1024 * 1024,
+                                                        backupCount=int(backup_count), encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger.addHandler(file_handler)
+    if echo:
+        # 绑定当前的sys.stdout, 之后重定向stdout到本日志时不会递归
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(console_handler)
+    return logger
+
+def close_stage_log(logger):
+    """
+    关闭并移除日志记录器的所有handler
+    """
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+def get_log_path(logger):
+    """
+    阶段日志文件的路径 (没有文件handler时为None)
+    """
+    for handler in logger.handlers:
+        if isinstance(handler, logging.FileHandler):
+            return handler.baseFilename
+    return None
+
+class LineLogWriter(io.TextIOBase):
+    """
+    可用于 contextlib.redirect_stdout 的文本流: 每个完整的行以level写入logger (带prefix),
+    只保留最近tail_lines行供 getvalue() 返回; logger为None时只保留tail
+    """
+    def __init__(self, logger=None, level=logging.INFO, prefix="", tail_lines=DEFAULT_TAIL_LINES, tail=None):
+        self.logger = logger
+        self.level = level
+        self.prefix = prefix
+        # 多个writer (如stdout和stderr) 可共用一个tail, 保持行的先后顺序
+        self.tail = tail if tail is not None else collections.deque(maxlen=tail_lines)
+        self.pending = ""
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self.pending += text
+        if "\n" in self.pending:
+            *lines, self.pending = self.pending.split("\n")
+            for line in lines:
+                self.emit(line)
+        return len(text)
+
+    def emit(self, line):
+        self.tail.append(line)
+        if self.logger is not None:
+            self.logger.log(self.level, f"{self.prefix}{line}")
+
+    def flush(self):
+        if self.pending:
+            self.emit(self.pending)
+            self.pending = ""
+
+    def getvalue(self):
+        self.flush()
+        return "\n".join(self.tail)
+
+def run_streamed(cmd, logger, prefix="", tail_lines=DEFAULT_TAIL_LINES):
+    """
+    运行子进程, stdout/stderr逐行写入logger (stderr记为WARNING), 不在内存中累积完整输出。
+    子进程以 PYTHONUNBUFFERED=1 运行, 使其print立即可见。
+    返回: subprocess.CompletedProcess, stdout/stderr为最后tail_lines行;
+    退出码非0时抛出 subprocess.CalledProcessError (output/stderr同样为最后若干行)
+    """
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    stdout_writer = LineLogWriter(logger, logging.INFO, prefix, tail_lines)
+    stderr_writer = LineLogWriter(logger, logging.WARNING, prefix, tail_lines)
+
+    def pump(stream, writer):
+        for line in stream:
+            writer.write(line)
+        writer.flush()
+
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                               errors='replace', bufsize=1, env=env)
+    stderr_thread = threading.Thread(target=pump, args=(process.stderr, stderr_writer), daemon=True)
+    stderr_thread.start()
+    try:
+        pump(process.stdout, stdout_writer)
+        returncode = process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        stderr_thread.join()
+        process.stdout.close()
+        process.stderr.close()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, output=stdout_writer.getvalue(),
+                                            stderr=stderr_writer.getvalue())
+    return subprocess.CompletedProcess(cmd, returncode, stdout=stdout_writer.getvalue(),
+                                       stderr=stderr_writer.getvalue())
+
+def start_queue_logging(logger, mp_context=None):
+    """
+    进程池中的工作进程通过队列把日志记录交给父进程写入logger的handler (轮转文件不能由多个进程同时写)
+    mp_context为进程池的多进程上下文 (如forkserver), 队列须在同一上下文中创建
+    返回: (queue, listener); 队列作为 init_worker_logging 的参数传给进程池, 结束后调用 listener.stop()
+    """
+    queue = (mp_context or multiprocessing).Queue()
+    listener = logging.handlers.QueueListener(queue, *logger.handlers, respect_handler_level=True)
+    listener.start()
+    return queue, listener
+
+def init_worker_logging(queue):
+    """
+    进程池initializer: 工作进程中的日志记录经queue发送给父进程
+    """
+    global _worker_logger
+    _worker_logger = logging.getLogger("S1S2.worker")
+    close_stage_log(_worker_logger)
+    _worker_logger.setLevel(logging.INFO)
+    _worker_logger.propagate = False
+    _worker_logger.addHandler(logging.handlers.QueueHandler(queue))
+
+def get_worker_logger():
+    """
+    当前进程的工作进程日志记录器 (未通过 init_worker_logging 设置时为None)
+    """
+    return _worker_logger
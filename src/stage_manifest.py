@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+流程各阶段的清单 (manifest), 用于增量运行和失败后续跑
+每个阶段在 <manifest_dir>/<阶段>.json 中按输入文件记录:
+  inputs  - 输入文件的路径、大小、mtime (可选sha256)
+  params  - 影响输出内容的参数的指纹
+  outputs - 写出的文件的路径、大小、mtime
+  result  - 该文件的统计结果 (跳过时用于报告和TSV)
+重新运行时, 输入和参数都未改变、输出仍完整存在的文件视为最新而跳过 (类似make);
+新增、修改过、参数改变、上次中断未记录或输出缺失/被改动的文件重新处理, 处理前先删除其旧输出。
+每个文件完成后立即写回清单 (先写临时文件再替换), 中途失败时已完成的文件不会丢失。
+"""
+
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_MANIFEST_DIR = "pipeline_manifests"
+MANIFEST_VERSION = 1
+CHECKSUM_BLOCK_BYTES = 1024 * 1024
+
+def compute_checksum(path):
+    """
+    文件内容的sha256
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHECKSUM_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_fingerprint(path, checksum=False):
+    """
+    文件的 {path, size, mtime_ns} (checksum为True时另有sha256); 文件不存在时返回None
+    """
+    path = Path(path).absolute()
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    fingerprint = {'path': str(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if checksum:
+        fingerprint['sha256'] = compute_checksum(path)
+    return fingerprint
+
+def params_fingerprint(params):
+    """
+    参数 (可JSON序列化的dict/list) 的sha256
+    """
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+class StageManifest:
+    """
+    一个阶段的清单, 键通常为输入文件的绝对路径
+    incremental为False时所有文件都视为需要重新处理 (仍记录清单, 供下次增量运行);
+    checksum为True时记录输入的sha256, 输入的大小或mtime改变但内容相同时仍视为最新
+    """
+    def __init__(self, stage_name, manifest_dir=DEFAULT_MANIFEST_DIR, incremental=True, checksum=False):
+        self.stage_name = stage_name
+        # 绝对路径: 阶段运行时可能切换工作目录 (如S1的input_dir)
+        self.path = Path(manifest_dir).absolute() / f"{stage_name}.json"
+        self.incremental = incremental
+        self.checksum = checksum
+        self.entries = self.load()
+
+    def load(self):
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"警告: 无法读取清单 {self.path} ({e}), 所有文件将重新处理", file=sys.stderr)
+            return {}
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        return manifest.get('entries') or {}
+
+    def save(self):
+        """
+        写回清单 (临时文件+os.replace, 写入中断不会损坏已有清单)
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'stage': self.stage_name, 'entries': self.entries},
+                      f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.path)
+
+    def input_unchanged(self, recorded):
+        current = file_fingerprint(recorded['path'])
+        if current is None:
+            return False
+        if current['size'] == recorded['size'] and current['mtime_ns'] == recorded['mtime_ns']:
+            return True
+        # 大小/mtime改变 (如重新下载、复制) 但内容相同时, 用记录的sha256判断
+        if self.checksum and recorded.get('sha256') and current['size'] == recorded['size']:
+            if compute_checksum(recorded['path']) == recorded['sha256']:
+                recorded['mtime_ns'] = current['mtime_ns']
+                self.save()
+                return True
+        return False
+
+    def is_up_to_date(self, key, input_paths, params):
+        """
+        key的输入文件 (input_paths) 和参数与清单记录相同, 且记录的输出都存在且未被改动
+        """
+        if not self.incremental:
+            return False
+        entry = self.entries.get(key)
+        if entry is None or entry.get('params') != params_fingerprint(params):
+            return False
+        recorded_inputs = entry.get('inputs') or []
+        if sorted(recorded['path'] for recorded in recorded_inputs) != \
+                sorted(str(Path(path).absolute()) for path in input_paths):
+            return False
+        if not all(self.input_unchanged(recorded) for recorded in recorded_inputs):
+            return False
+        for recorded in entry.get('outputs') or []:
+            current = file_fingerprint(recorded['path'])
+            if current is None or current['size'] != recorded['size'] or current['mtime_ns'] != recorded['mtime_ns']:
+                return False
+        return True
+
+    def get_result(self, key):
+        entry = self.entries.get(key)
+        return entry.get('result') if entry else None
+
+    def get_outputs(self, key):
+        entry = self.entries.get(key)
+        return [recorded['path'] for recorded in entry.get('outputs') or []] if entry else []
+
+    def remove_outputs(self, key, extra_paths=()):
+        """
+        重新处理前删除key记录的旧输出及extra_paths (如上次中断时写了一半、追加模式写出的文件),
+        并移除key的记录
+        """
+        removed = 0
+        for path in dict.fromkeys([*self.get_outputs(key), *(str(Path(path).absolute()) for path in extra_paths)]):
+            path = Path(path)
+            if path.is_file() or path.is_symlink():
+                path.unlink()
+                removed += 1
+        if self.entries.pop(key, None) is not None:
+            self.save()
+        return removed
+
+    def record(self, key, input_paths, output_paths, params, result=None):
+        """
+        记录key已成功完成并写回清单
+        """
+        self.entries[key] = {
+            'completed_at': datetime.now().isoformat(timespec='seconds'),
+            'params': params_fingerprint(params),
+            'inputs': [file_fingerprint(path, self.checksum) for path in input_paths],
+            'outputs': [fingerprint for fingerprint in map(file_fingerprint, output_paths) if fingerprint is not None],
+            'result': result
+        }
+        self.save()
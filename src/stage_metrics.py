@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+流程各阶段的结构化指标 (advanced_config.metrics_dir, 或 S1_Process_gen.py / S2_Split.py 的 --metrics-file 参数)
+每个阶段写出一条JSON记录: 阶段的墙钟时间、CPU时间 (含已结束的工作进程和子进程)、内存峰值,
+以及每个输入文件的reads数、输入/输出字节数、耗时、吞吐量和阶段特有的统计
+(S1: 各序列组合的匹配数; S2: 配对/丢弃数、orientation_stats、pair_stats)。
+  <metrics_dir>/<阶段>.json           - 该阶段最近一次运行的记录 (流程报告由这些记录生成)
+  <metrics_dir>/metrics_history.jsonl - 每次运行追加一行, 可按组 (group) 跨运行跟踪吞吐量
+内存峰值取自 getrusage 的 ru_maxrss, 是进程从启动到记录时的峰值; 子进程的峰值为已结束子进程中最大的一个。
+"""
+
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+METRICS_VERSION = 1
+DEFAULT_METRICS_DIR = "pipeline_metrics"
+METRICS_HISTORY_FILE = "metrics_history.jsonl"
+FILE_STATUS_DONE = "done"
+FILE_STATUS_UP_TO_DATE = "up_to_date" # 增量运行中已是最新而跳过, 统计取自清单, 不计耗时
+FILE_STATUS_FAILED = "failed"
+# Linux上ru_maxrss的单位为KB, macOS上为字节
+RU_MAXRSS_BYTES = 1 if sys.platform == "darwin" else 1024
+
+def get_peak_rss_mb(who=resource.RUSAGE_SELF):
+    return resource.getrusage(who).ru_maxrss * RU_MAXRSS_BYTES / (1024 * 1024)
+
+def get_file_size(path):
+    """
+    文件大小 (字节), 文件不存在时为0
+    """
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+def get_total_size(paths):
+    return sum(get_file_size(path) for path in paths if path)
+
+def get_timestamp():
+    return datetime.now().isoformat(timespec='seconds')
+
+def new_run_id():
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+
+class ResourceTimer:
+    """
+    测量一段处理的墙钟时间、CPU时间 (本进程及期间结束的子进程, 包括退出的进程池工作进程) 和内存峰值
+    """
+    def __init__(self):
+        self.start_wall = time.perf_counter()
+        self.start_times = os.times()
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_mb = 0.0
+        self.children_peak_rss_mb = 0.0
+
+    def stop(self):
+        end_times = os.times()
+        self.wall_seconds = time.perf_counter() - self.start_wall
+        self.cpu_seconds = sum(end_times[:4]) - sum(self.start_times[:4]) # user, system, children_user, children_system
+        self.peak_rss_mb = get_peak_rss_mb()
+        self.children_peak_rss_mb = get_peak_rss_mb(resource.RUSAGE_CHILDREN)
+        return self
+
+@dataclass
+class FileMetrics:
+    """
+    一个输入文件在某阶段的指标; details为阶段特有的统计 (见各阶段的 file_metrics 构造函数)
+    """
+    input_file: str
+    status: str = FILE_STATUS_DONE
+    reads: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_mb: float = 0.0
+    details: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def __post_init__(self):
+        # 各阶段在不同的工作目录下运行, 记录绝对路径
+        self.input_file = str(Path(self.input_file).absolute())
+
+    @classmethod
+    def from_dict(cls, data):
+        names = {item.name for item in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in names})
+
+    def set_usage(self, timer):
+        """
+        由停止的 ResourceTimer 填入耗时和内存峰值
+        """
+        self.wall_seconds = timer.wall_seconds
+        self.cpu_seconds = timer.cpu_seconds
+        self.peak_rss_mb = timer.peak_rss_mb
+        return self
+
+    @property
+    def reads_per_second(self):
+        return self.reads / self.wall_seconds if self.wall_seconds > 0 else None
+
+    @property
+    def mb_per_second(self):
+        return self.bytes_in / (1024 * 1024) / self.wall_seconds if self.wall_seconds > 0 else None
+
+    def to_dict(self):
+        data = asdict(self)
+        data['reads_per_second'] = self.reads_per_second
+        data['mb_per_second'] = self.mb_per_second
+        return data
+
+@dataclass
+class StageMetrics:
+    """
+    一个阶段一次运行的指标记录; files为各输入文件的 FileMetrics, extra为阶段级的其他信息
+    """
+    stage: str
+    group: Optional[str] = None
+    run_id: str = field(default_factory=new_run_id)
+    started_at: str = field(default_factory=get_timestamp)
+    finished_at: Optional[str] = None
+    success: Optional[bool] = None
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_mb: float = 0.0
+    children_peak_rss_mb: float = 0.0
+    files: list = field(default_factory=list)
+    extra: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data):
+        names = {item.name for item in fields(cls)}
+        metrics = cls(**{key: value for key, value in data.items() if key in names and key != 'files'})
+        metrics.files = [FileMetrics.from_dict(file_data) for file_data in data.get('files') or []]
+        return metrics
+
+    def add_file(self, file_metrics):
+        self.files.append(file_metrics)
+
+    def finish(self, timer, success=None):
+        """
+        由停止的 ResourceTimer 填入阶段的耗时和内存峰值
+        """
+        self.finished_at = get_timestamp()
+        self.wall_seconds = timer.wall_seconds
+        self.cpu_seconds = timer.cpu_seconds
+        self.peak_rss_mb = timer.peak_rss_mb
+        self.children_peak_rss_mb = timer.children_peak_rss_mb
+        if success is not None:
+            self.success = success
+        return self
+
+    def totals(self):
+        """
+        按状态统计文件数, 并汇总本次实际处理的文件的reads数、字节数和吞吐量
+        """
+        done_files = [file_metrics for file_metrics in self.files if file_metrics.status == FILE_STATUS_DONE]
+        reads = sum(file_metrics.reads for file_metrics in done_files)
+        bytes_in = sum(file_metrics.bytes_in for file_metrics in done_files)
+        return {
+            'files': len(self.files),
+            'done': len(done_files),
+            'up_to_date': sum(file_metrics.status == FILE_STATUS_UP_TO_DATE for file_metrics in self.files),
+            'failed': sum(file_metrics.status == FILE_STATUS_FAILED for file_metrics in self.files),
+            'reads': reads,
+            'bytes_in': bytes_in,
+            'bytes_out': sum(file_metrics.bytes_out for file_metrics in done_files),
+            'reads_per_second': reads / self.wall_seconds if self.wall_seconds > 0 else None,
+            'mb_per_second': bytes_in / (1024 * 1024) / self.wall_seconds if self.wall_seconds > 0 else None
+        }
+
+    def to_dict(self):
+        data = asdict(self)
+        data['version'] = METRICS_VERSION
+        data['files'] = [file_metrics.to_dict() for file_metrics in self.files]
+        data['totals'] = self.totals()
+        return data
+
+    def write_json(self, path):
+        """
+        写出JSON记录 (先写临时文件再替换, 读取方不会看到写了一半的文件)
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+
+def write_metrics_file(metrics, path):
+    """
+    将阶段指标写入指定的JSON文件 (命令行 --metrics-file), 写入失败只打印警告
+    """
+    try:
+        metrics.write_json(path)
+    except OSError as e:
+        print(f"警告: 写入{metrics.stage}阶段指标 {path} 失败: {e}", file=sys.stderr)
+
+def get_stage_metrics_path(metrics_dir, stage):
+    return Path(metrics_dir) / f"{stage}.json"
+
+def write_stage_metrics(metrics, metrics_dir):
+    """
+    写出 <metrics_dir>/<阶段>.json 并在 metrics_history.jsonl 末尾追加一行; 写入失败只打印警告
+    """
+    try:
+        metrics.write_json(get_stage_metrics_path(metrics_dir, metrics.stage))
+        with open(Path(metrics_dir) / METRICS_HISTORY_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(metrics.to_dict(), ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"警告: 写入{metrics.stage}阶段指标失败: {e}", file=sys.stderr)
+
+@contextlib.contextmanager
+def record_stage(metrics_dir, stage, group=None):
+    """
+    记录一个阶段的指标: 产生 StageMetrics 供阶段添加各文件的记录并设置success,
+    退出时填入耗时和内存峰值并写出 (metrics_dir为None时不写出); 阶段抛出异常或退出时success为False
+    """
+    metrics = StageMetrics(stage, group=group)
+    timer = ResourceTimer()
+    try:
+        yield metrics
+    except BaseException:
+        metrics.success = False
+        raise
+    finally:
+        metrics.finish(timer.stop())
+        if metrics_dir is not None:
+            write_stage_metrics(metrics, metrics_dir)
+
+def load_metrics_file(path):
+    """
+    读取一条阶段指标记录, 不存在或无法解析时返回None
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return StageMetrics.from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, TypeError) as e:
+        print(f"警告: 无法读取阶段指标 {path}: {e}", file=sys.stderr)
+        return None
+
+def load_stage_metrics(metrics_dir, stage):
+    return load_metrics_file(get_stage_metrics_path(metrics_dir, stage))
+
+def format_rate(value, unit):
+    return f"{value:,.0f} {unit}" if value is not None else "N/A"
+
+def write_file_details(f, file_metrics):
+    """
+    报告中一个文件的阶段特有统计 (S1各序列组合的匹配数, S2的配对数和方向统计)
+    """
+    details = file_metrics.details
+    for pattern_set in details.get('pattern_sets') or []:
+        f.write(f"      {pattern_set['description']}: 全正向 {pattern_set['forward_reads']}, "
+                f"全反向互补 {pattern_set['rc_reads']}\n")
+    split_details = details.get('split') or (details if 'paired_reads' in details else None)
+    if split_details:
+        percentage = split_details.get('paired_percentage')
+        percentage_text = f" ({percentage:.2f}%)" if percentage is not None else ""
+        f.write(f"      配对 {split_details['paired_reads']}{percentage_text}, "
+                f"丢弃 {split_details['discarded_reads']}\n")
+        orientation_text = ", ".join(f"{orientation} {count}"
+                                     for orientation, count in (split_details.get('orientation_stats') or {}).items())
+        if orientation_text:
+            f.write(f"      方向: {orientation_text}\n")
+        for pair_stats in split_details.get('pair_stats') or []:
+            f.write(f"      分隔符对 {pair_stats['name']}: 配对 {pair_stats['paired_reads']}\n")
+
+def write_stage_metrics_report(f, metrics):
+    """
+    将一条阶段指标记录写入文本报告
+    """
+    status_text = {True: "成功", False: "失败"}.get(metrics.success, "未完成")
+    totals = metrics.totals()
+    f.write(f"{metrics.stage} 阶段: {status_text} (完成于 {metrics.finished_at or 'N/A'})\n")
+    f.write(f"  耗时 {metrics.wall_seconds:.1f} 秒, CPU {metrics.cpu_seconds:.1f} 秒, "
+            f"内存峰值 {metrics.peak_rss_mb:.0f} MB (子进程 {metrics.children_peak_rss_mb:.0f} MB)\n")
+    if metrics.files:
+        f.write(f"  文件: 处理 {totals['done']}, 已是最新 {totals['up_to_date']}, 失败 {totals['failed']}; "
+                f"reads {totals['reads']}, 输入 {totals['bytes_in'] / 1024 ** 2:.1f} MB, "
+                f"输出 {totals['bytes_out'] / 1024 ** 2:.1f} MB, "
+                f"{format_rate(totals['reads_per_second'], 'reads/秒')}\n")
+    for key, value in metrics.extra.items():
+        f.write(f"  {key}: {value}\n")
+    for file_metrics in metrics.files:
+        file_name = Path(file_metrics.input_file).name
+        if file_metrics.status == FILE_STATUS_FAILED:
+            f.write(f"  - {file_name}: 处理失败 ({file_metrics.error})\n")
+            continue
+        status_suffix = " [已是最新]" if file_metrics.status == FILE_STATUS_UP_TO_DATE else ""
+        f.write(f"  - {file_name}{status_suffix}: reads {file_metrics.reads}, "
+                f"输入 {file_metrics.bytes_in / 1024 ** 2:.1f} MB, 输出 {file_metrics.bytes_out / 1024 ** 2:.1f} MB")
+        if file_metrics.status == FILE_STATUS_DONE:
+            f.write(f", 耗时 {file_metrics.wall_seconds:.1f} 秒, CPU {file_metrics.cpu_seconds:.1f} 秒, "
+                    f"{format_rate(file_metrics.reads_per_second, 'reads/秒')}, "
+                    f"内存峰值 {file_metrics.peak_rss_mb:.0f} MB")
+        f.write("\n")
+        write_file_details(f, file_metrics)
+    f.write("\n")
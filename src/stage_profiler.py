@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+流程各阶段的性能剖析 (advanced_config.profiling, 或 S1_Process_gen.py / S2_Split.py 的 --profile* 参数)
+  cprofile    - cProfile确定性剖析 (只剖析调用线程), 写出 <角色>.<pid>.prof
+                (可用 snakeviz、gprof2dot、python -m pstats 查看) 和按累计时间排序的 <角色>.<pid>.top.txt
+  sampling    - 采样剖析: 后台线程每隔 sample_interval_ms 毫秒记录本进程各线程的调用栈,
+                写出折叠栈 <角色>.<pid>.collapsed (flamegraph.pl、speedscope、inferno 可直接读取);
+                开销只取决于采样间隔, 与函数调用次数无关
+  tracemalloc - 可单独或与上面任一种同时开启: 写出内存峰值和占用最多的代码行 <角色>.<pid>.alloc.txt
+结果写入 <output_dir>/<阶段>/: 阶段主进程的角色为 main, 进程池工作进程按工作函数命名 (如 S1_file_worker),
+同一工作进程处理的多个文件或批次累计在一起, 在进程退出时写出一次。
+剖析选项经环境变量传给工作进程 (fork/spawn) 和子进程脚本, forkserver进程池通过 init_worker_profiling 传递;
+未开启剖析时 profile_stage / profile_worker 只查找一次环境变量, 不影响性能。
+"""
+
+import argparse
+import cProfile
+import collections
+import contextlib
+import functools
+import json
+import multiprocessing.util
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from pathlib import Path
+
+PROFILE_MODE_OFF = "off"
+PROFILE_MODE_CPROFILE = "cprofile"
+PROFILE_MODE_SAMPLING = "sampling"
+PROFILE_MODES = (PROFILE_MODE_OFF, PROFILE_MODE_CPROFILE, PROFILE_MODE_SAMPLING)
+DEFAULT_PROFILE_DIR = "pipeline_profiles"
+DEFAULT_SAMPLE_INTERVAL_MS = 5
+DEFAULT_TOP_FUNCTIONS = 40 # .top.txt 中列出的函数数
+DEFAULT_TOP_ALLOCATIONS = 30 # .alloc.txt 中列出的代码行数
+TRACEMALLOC_FRAMES = 1 # 只按分配发生的代码行统计, 追踪开销最小
+MEMORY_CHECK_SECONDS = 0.1 # tracemalloc开启时检查已分配内存的间隔
+MEMORY_SNAPSHOT_GROWTH = 1.1 # 已分配内存超过上次快照的此倍数时重新快照 (保留最接近峰值的快照)
+PROFILE_ENV = "S1S2_PROFILE" # 当前阶段的剖析选项 (JSON), 由工作进程和子进程脚本继承
+MAIN_ROLE = "main"
+PROFILER_THREAD_PREFIX = "stage-profiler" # 剖析器自身的线程, 采样时跳过
+
+# 本进程中按角色累计的工作进程剖析器, 键为 (pid, 角色); fork出的子进程不沿用父进程的剖析器
+_worker_profilers = {}
+# 本进程中正在剖析的工作函数 (嵌套调用的工作函数计入外层, 如融合模式S1批次中的S2分割)
+_active_worker = []
+
+def profiling_enabled(profile_options):
+    return bool(profile_options) and (profile_options.get('mode', PROFILE_MODE_OFF) != PROFILE_MODE_OFF
+                                      or bool(profile_options.get('tracemalloc')))
+
+def describe_profile_options(profile_options):
+    """
+    剖析选项的一行说明, 用于日志输出
+    """
+    parts = []
+    if profile_options['mode'] == PROFILE_MODE_CPROFILE:
+        parts.append("cProfile")
+    elif profile_options['mode'] == PROFILE_MODE_SAMPLING:
+        parts.append(f"采样 (每 {profile_options['sample_interval_ms']:g} ms)")
+    if profile_options.get('tracemalloc'):
+        parts.append("tracemalloc")
+    return " + ".join(parts) if parts else "关闭"
+
+def add_profile_arguments(parser):
+    """
+    向argparse解析器添加 --profile/--profile-memory/--profile-dir/--profile-interval-ms
+    """
+    parser.add_argument(
+        "--profile",
+        choices=PROFILE_MODES,
+        default=PROFILE_MODE_OFF,
+        help=f"(可选) 性能剖析: '{PROFILE_MODE_CPROFILE}' 写出 .prof 和按累计时间排序的 .top.txt;\n"
+             f"'{PROFILE_MODE_SAMPLING}' 定时采样调用栈, 写出火焰图可用的折叠栈 .collapsed。\n"
+             f"主进程和每个工作进程各写一份。默认: {PROFILE_MODE_OFF}"
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="(可选) 用tracemalloc记录内存峰值和占用最多的代码行 (.alloc.txt), 可与 --profile 同时使用。"
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=DEFAULT_PROFILE_DIR,
+        help=f"(可选) 剖析结果目录, 结果写入 '<目录>/<阶段>/'。默认: {DEFAULT_PROFILE_DIR}"
+    )
+    parser.add_argument(
+        "--profile-interval-ms",
+        type=float,
+        default=DEFAULT_SAMPLE_INTERVAL_MS,
+        help=f"(可选) '{PROFILE_MODE_SAMPLING}' 剖析的采样间隔(毫秒)。默认: {DEFAULT_SAMPLE_INTERVAL_MS}"
+    )
+
+def profile_options_from_args(args):
+    """
+    由 add_profile_arguments 添加的参数构建剖析选项dict; 输出目录转为绝对路径
+    (阶段运行时可能切换工作目录)
+    """
+    sample_interval_ms = args.profile_interval_ms
+    if sample_interval_ms <= 0:
+        print(f"警告: --profile-interval-ms 的值 '{sample_interval_ms}' 无效。将使用 {DEFAULT_SAMPLE_INTERVAL_MS}。",
+              file=sys.stderr)
+        sample_interval_ms = DEFAULT_SAMPLE_INTERVAL_MS
+    return {
+        'mode': args.profile,
+        'tracemalloc': bool(args.profile_memory),
+        'output_dir': str(Path(args.profile_dir).resolve()),
+        'sample_interval_ms': sample_interval_ms,
+        'top_allocations': DEFAULT_TOP_ALLOCATIONS
+    }
+
+def profile_options_from_config(advanced_config):
+    """
+    由流程配置的 advanced_config.profiling (mode、tracemalloc、output_dir、sample_interval_ms、top_allocations)
+    构建剖析选项dict, 默认值与命令行参数相同
+    """
+    profiling = (advanced_config or {}).get('profiling') or {}
+    # YAML中不加引号的 off 会被解析为false
+    mode = profiling.get('mode') or PROFILE_MODE_OFF
+    if mode not in PROFILE_MODES:
+        print(f"警告: 无效的剖析模式 '{mode}' (可选: {', '.join(PROFILE_MODES)})。将关闭性能剖析。", file=sys.stderr)
+        mode = PROFILE_MODE_OFF
+    profile_options = profile_options_from_args(argparse.Namespace(
+        profile=mode,
+        profile_memory=bool(profiling.get('tracemalloc')),
+        profile_dir=profiling.get('output_dir') or DEFAULT_PROFILE_DIR,
+        profile_interval_ms=float(profiling.get('sample_interval_ms') or DEFAULT_SAMPLE_INTERVAL_MS)
+    ))
+    profile_options['top_allocations'] = int(profiling.get('top_allocations') or DEFAULT_TOP_ALLOCATIONS)
+    return profile_options
+
+def get_profile_env():
+    """
+    当前阶段的剖析选项 (环境变量的原始JSON, 未开启时为None); 作为 init_worker_profiling 的参数
+    """
+    return os.environ.get(PROFILE_ENV)
+
+def init_worker_profiling(profile_env):
+    """
+    进程池initializer: 设置工作进程的剖析选项。forkserver启动的工作进程继承的是forkserver的环境变量,
+    不一定是当前阶段的, 因此总是显式设置 (profile_env为None时清除)
+    """
+    if profile_env:
+        os.environ[PROFILE_ENV] = profile_env
+    else:
+        os.environ.pop(PROFILE_ENV, None)
+
+def get_inherited_profile_options():
+    """
+    从父进程继承的剖析选项; 未开启, 或本进程就是阶段主进程 (已被profile_stage剖析) 时为None
+    """
+    profile_env = os.environ.get(PROFILE_ENV)
+    if not profile_env:
+        return None
+    profile_options = json.loads(profile_env)
+    return None if profile_options.get('owner_pid') == os.getpid() else profile_options
+
+def build_profile_args():
+    """
+    子进程脚本 (S1_Process_gen.py / S2_Split.py) 的剖析参数, 与当前阶段的剖析选项相同; 未开启时为空列表
+    """
+    profile_env = os.environ.get(PROFILE_ENV)
+    if not profile_env:
+        return []
+    profile_options = json.loads(profile_env)
+    profile_args = ["--profile", profile_options['mode'], "--profile-dir", profile_options['base_dir'],
+                    "--profile-interval-ms", str(profile_options['sample_interval_ms'])]
+    if profile_options.get('tracemalloc'):
+        profile_args.append("--profile-memory")
+    return profile_args
+
+def get_frame_label(code):
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """
+    采样剖析器: 后台线程每隔interval秒记录本进程其他线程 (剖析器线程除外) 的调用栈 (以线程名为根), 按折叠栈计数;
+    暂停时不记录 (如工作进程在两个任务之间等待时)
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.active = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def resume(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.sample_loop, name=f"{PROFILER_THREAD_PREFIX}-sampling", daemon=True)
+            self.thread.start()
+        self.active.set()
+
+    def pause(self):
+        self.active.clear()
+
+    def stop(self):
+        self.active.clear()
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def sample_loop(self):
+        while not self.stopped.wait(self.interval):
+            if not self.active.is_set():
+                continue
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_names.get(thread_id, "").startswith(PROFILER_THREAD_PREFIX):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(get_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, f"thread-{thread_id}"))
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def write_collapsed(self, path):
+        """
+        写出折叠栈: 每行为 "根;...;叶 样本数"
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{';'.join(frame.replace(';', ',') for frame in stack)} {count}\n")
+
+class MemorySnapshotter:
+    """
+    tracemalloc开启时的后台线程: 定期检查已分配的内存, 保留占用最多时的快照。
+    结束时的快照只剩未释放的内存, 峰值附近的快照才能说明内存用在哪里
+    """
+    def __init__(self):
+        self.snapshot = None
+        self.snapshot_bytes = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.watch_loop, name=f"{PROFILER_THREAD_PREFIX}-memory", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def watch_loop(self):
+        while not self.stopped.wait(MEMORY_CHECK_SECONDS):
+            self.check()
+
+    def check(self):
+        current_bytes = tracemalloc.get_traced_memory()[0]
+        if current_bytes > max(self.snapshot_bytes * MEMORY_SNAPSHOT_GROWTH, 0):
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_bytes = current_bytes
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.check()
+
+class ProcessProfiler:
+    """
+    一个进程中一个角色的剖析: 按选项组合cProfile或采样剖析与tracemalloc, 可多次 resume/pause 累计,
+    write() 写出 <output_dir>/<角色>.<pid>.*
+    """
+    def __init__(self, profile_options, role):
+        self.options = profile_options
+        self.role = role
+        self.profile = cProfile.Profile() if profile_options['mode'] == PROFILE_MODE_CPROFILE else None
+        self.sampler = None
+        if profile_options['mode'] == PROFILE_MODE_SAMPLING:
+            self.sampler = SamplingProfiler(profile_options['sample_interval_ms'] / 1000)
+        self.memory_snapshotter = MemorySnapshotter() if profile_options.get('tracemalloc') else None
+        self.started = False
+        self.written = False
+
+    def resume(self):
+        if not self.started:
+            self.started = True
+            if self.memory_snapshotter is not None:
+                # fork出的工作进程继承了父进程的追踪记录, 从头开始
+                if tracemalloc.is_tracing():
+                    tracemalloc.stop()
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self.memory_snapshotter.start()
+        if self.profile is not None:
+            self.profile.enable()
+        if self.sampler is not None:
+            self.sampler.resume()
+
+    def pause(self):
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.pause()
+
+    def write_allocations(self, path):
+        self.memory_snapshotter.stop()
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        snapshot_bytes = self.memory_snapshotter.snapshot_bytes
+        snapshot = self.memory_snapshotter.snapshot.filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)))
+        tracemalloc.stop()
+        top_allocations = int(self.options.get('top_allocations') or DEFAULT_TOP_ALLOCATIONS)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"# 内存峰值: {peak_bytes / 1024 ** 2:.1f} MB, 结束时: {current_bytes / 1024 ** 2:.1f} MB\n")
+            f.write(f"# 占用最多的 {top_allocations} 处代码 (快照时共 {snapshot_bytes / 1024 ** 2:.1f} MB)\n")
+            f.write("大小(KB)\t分配数\t代码位置\n")
+            for stat in snapshot.statistics('lineno')[:top_allocations]:
+                frame = stat.traceback[0]
+                f.write(f"{stat.size / 1024:.1f}\t{stat.count}\t{frame.filename}:{frame.lineno}\n")
+
+    def write(self):
+        """
+        写出剖析结果 (每个剖析器只写一次), 返回写出的文件列表
+        """
+        if self.written or not self.started:
+            return []
+        self.written = True
+        self.pause()
+        if self.sampler is not None:
+            self.sampler.stop()
+        output_dir = Path(self.options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        base_path = output_dir / f"{self.role}.{os.getpid()}"
+        written_paths = []
+        if self.profile is not None:
+            prof_path = base_path.with_name(base_path.name + ".prof")
+            self.profile.dump_stats(prof_path)
+            top_path = base_path.with_name(base_path.name + ".top.txt")
+            with open(top_path, 'w', encoding='utf-8') as f:
+                pstats.Stats(self.profile, stream=f).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(DEFAULT_TOP_FUNCTIONS)
+            written_paths.extend([prof_path, top_path])
+        if self.sampler is not None:
+            collapsed_path = base_path.with_name(base_path.name + ".collapsed")
+            self.sampler.write_collapsed(collapsed_path)
+            written_paths.append(collapsed_path)
+        if self.memory_snapshotter is not None and tracemalloc.is_tracing():
+            alloc_path = base_path.with_name(base_path.name + ".alloc.txt")
+            self.write_allocations(alloc_path)
+            written_paths.append(alloc_path)
+        return written_paths
+
+@contextlib.contextmanager
+def profile_stage(profile_options, stage_name):
+    """
+    剖析一个阶段: 本进程以 main 角色剖析, 结果写入 <output_dir>/<stage_name>/;
+    with块中启动的工作进程和子进程脚本继承剖析选项。未开启剖析时直接执行with块
+    """
+    if not profiling_enabled(profile_options):
+        yield
+        return
+    stage_options = dict(profile_options,
+                         output_dir=str(Path(profile_options['output_dir']) / stage_name),
+                         base_dir=profile_options['output_dir'],
+                         owner_pid=os.getpid())
+    previous_env = os.environ.get(PROFILE_ENV)
+    os.environ[PROFILE_ENV] = json.dumps(stage_options)
+    print(f"信息: {stage_name} 性能剖析: {describe_profile_options(profile_options)}, "
+          f"结果目录 {stage_options['output_dir']}", file=sys.stderr)
+    profiler = ProcessProfiler(stage_options, MAIN_ROLE)
+    profiler.resume()
+    try:
+        yield
+    finally:
+        try:
+            profiler.write()
+        finally:
+            if previous_env is None:
+                os.environ.pop(PROFILE_ENV, None)
+            else:
+                os.environ[PROFILE_ENV] = previous_env
+
+@contextlib.contextmanager
+def profile_worker(role):
+    """
+    在工作函数中使用: 继承了阶段剖析选项时以role角色剖析with块, 同一进程的多次调用累计,
+    在进程退出时写出; 未开启剖析或已在剖析外层工作函数时直接执行with块
+    """
+    key = (os.getpid(), role)
+    profiler = _worker_profilers.get(key)
+    if profiler is None:
+        profile_options = get_inherited_profile_options()
+        if profile_options is None:
+            yield
+            return
+        profiler = ProcessProfiler(profile_options, role)
+        _worker_profilers[key] = profiler
+        # 进程池工作进程退出时不运行atexit, 但会运行multiprocessing的finalizer (主进程中同样在退出时运行)
+        multiprocessing.util.Finalize(None, profiler.write, exitpriority=10)
+    if _active_worker:
+        yield
+        return
+    _active_worker.append(role)
+    profiler.resume()
+    try:
+        yield
+    finally:
+        profiler.pause()
+        _active_worker.pop()
+
+def profiled_worker(role):
+    """
+    工作函数的装饰器, 以role角色用 profile_worker 剖析每次调用 (被装饰的函数仍可被进程池pickle)
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profile_worker(role):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
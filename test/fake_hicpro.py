@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HiC-Pro的替身 (用于本地测试分块映射, 不做真正的比对)
+接受HiC-Pro的 -i/-o/-c/-p/-s 参数:
+  -s mapping              为输入目录各样本中的每个FASTQ.gz写出 bowtie_results/bwt2/<样本>/<名称>_fake.bwt2merged.bam,
+                          内容为该文件的reads数
+  -s proc_hic ...         输入为bwt2目录: 检查每个R1 BAM都有对应的R2 BAM且reads数相同,
+                          写出 hic_results/data/<样本>/<样本>.allValidPairs, 内容为该样本的配对reads总数
+"""
+
+import argparse
+import gzip
+import sys
+from pathlib import Path
+
+def count_reads(path):
+    with gzip.open(path, 'rb') as f:
+        return sum(1 for _ in f) // 4
+
+def run_mapping(input_dir, output_dir):
+    for sample_dir in sorted(path for path in Path(input_dir).iterdir() if path.is_dir()):
+        bwt2_dir = Path(output_dir) / "bowtie_results" / "bwt2" / sample_dir.name
+        bwt2_dir.mkdir(parents=True, exist_ok=True)
+        for fastq_path in sorted(sample_dir.glob("*.fq.gz")):
+            name = fastq_path.name[:-len(".fq.gz")]
+            (bwt2_dir / f"{name}_fake.bwt2merged.bam").write_text(str(count_reads(fastq_path)))
+            print(f"mapped {sample_dir.name}/{fastq_path.name}")
+
+def run_post_mapping(input_dir, output_dir):
+    for sample_dir in sorted(path for path in Path(input_dir).iterdir() if path.is_dir()):
+        total_pairs = 0
+        for r1_bam in sorted(sample_dir.glob("*_R1_fake.bwt2merged.bam")):
+            r2_bam = r1_bam.with_name(r1_bam.name.replace("_R1_fake", "_R2_fake"))
+            if not r2_bam.exists() or r1_bam.read_text() != r2_bam.read_text():
+                print(f"错误: {r1_bam.name} 没有对应的R2 BAM", file=sys.stderr)
+                sys.exit(1)
+            total_pairs += int(r1_bam.read_text())
+        data_dir = Path(output_dir) / "hic_results" / "data" / sample_dir.name
+        data_dir.mkdir(parents=True, exist_ok=True)
+        (data_dir / f"{sample_dir.name}.allValidPairs").write_text(str(total_pairs))
+        print(f"{sample_dir.name}: {total_pairs} pairs")
+
+def main():
+    parser = argparse.ArgumentParser(description="HiC-Pro替身")
+    parser.add_argument("-i", required=True)
+    parser.add_argument("-o", required=True)
+    parser.add_argument("-c", required=True)
+    parser.add_argument("-p")
+    parser.add_argument("-s", action="append", default=[])
+    args = parser.parse_args()
+    if "mapping" in args.s:
+        run_mapping(args.i, args.o)
+    if "proc_hic" in args.s:
+        run_post_mapping(args.i, args.o)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/bin/bash
+
+# gzip后端一致性测试: 生成小的FASTQ.gz, 用并行块gzip和BGZF重新压缩,
+# 再用 gzip_codec.py --check 以全部可用后端解压比对, 并用系统gzip核对内容; 任何不一致时退出码非0
+# 用法: bash test/run_gzip_backend_test.sh [reads数]
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+REPO_DIR="$(dirname "$SCRIPT_DIR")"
+READS=${1:-20000}
+
+WORK_DIR="$(mktemp -d -t gzip_backend_test.XXXXXX)"
+trap 'rm -rf "$WORK_DIR"' EXIT
+cd "$WORK_DIR"
+echo "工作目录: $WORK_DIR"
+
+echo "=== 生成合成数据 ==="
+python3 "${REPO_DIR}/benchmarks/synthetic_fastq.py" -o sample.fq.gz --reads "$READS" --seed 1
+
+echo "=== 并行块gzip / BGZF 重新压缩 ==="
+python3 - "${REPO_DIR}/src" <<'PYTHON'
+import gzip
+import sys
+
+sys.path.insert(0, sys.argv[1])
+from gzip_codec import BGZF_EOF_BLOCK, ParallelGzipWriter
+
+with gzip.open("sample.fq.gz", "rb") as f:
+    data = f.read()
+# 小的块大小, 保证生成多个gzip成员/BGZF块
+for output_path, options in (("parallel.fq.gz", {'threads': 4}), ("bgzf.fq.gz", {'threads': 4, 'bgzf': True})):
+    with ParallelGzipWriter(output_path, 'wb', block_size=4096, **options) as writer:
+        writer.write(data)
+with open("bgzf.fq.gz", "rb") as f:
+    if not f.read().endswith(BGZF_EOF_BLOCK):
+        print("错误: bgzf.fq.gz 缺少BGZF结束块", file=sys.stderr)
+        sys.exit(1)
+PYTHON
+
+echo "=== 各后端解压比对 ==="
+python3 "${REPO_DIR}/src/gzip_codec.py" --check sample.fq.gz parallel.fq.gz bgzf.fq.gz
+
+echo "=== 系统gzip核对 ==="
+expected=$(gzip -dc sample.fq.gz | md5sum | cut -d' ' -f1)
+for gz_file in parallel.fq.gz bgzf.fq.gz; do
+    actual=$(gzip -dc "$gz_file" | md5sum | cut -d' ' -f1)
+    if [ "$actual" != "$expected" ]; then
+        echo "错误: $gz_file 解压内容与原始数据不一致 ($actual != $expected)" >&2
+        exit 1
+    fi
+    echo "✓ $gz_file"
+done
+echo "gzip后端一致性测试通过"
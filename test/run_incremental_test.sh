@@ -0,0 +1,139 @@
+#!/bin/bash
+
+# 增量运行 (阶段清单) 测试: 对两个合成样本运行S1/S2流程后, 依次改变S2参数、touch一个输入、删除一个输出,
+# 根据阶段指标 (pipeline_metrics/<阶段>.json) 中各文件的状态检查只有受影响的文件被重新处理,
+# 并检查重新处理前旧输出已被删除 (S1的FASTQ不会重复追加, 分隔符对改名后不留下旧名称的文件)
+# 用法: bash test/run_incremental_test.sh [每个样本的reads数]
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+REPO_DIR="$(dirname "$SCRIPT_DIR")"
+READS=${1:-3000}
+
+WORK_DIR="$(mktemp -d -t incremental_test.XXXXXX)"
+trap 'rm -rf "$WORK_DIR"' EXIT
+cd "$WORK_DIR"
+echo "工作目录: $WORK_DIR"
+
+echo "=== 生成合成数据 ==="
+mkdir -p in
+for sample in s1 s2; do
+    python3 "${REPO_DIR}/benchmarks/synthetic_fastq.py" -o "in/${sample}_R1.fq.gz" --reads "$READS" --seed "${sample#s}"
+done
+
+write_config() {
+    cat > pipeline_config.yaml <<CONFIG
+S1_config:
+  patterns: "ATGTCGGAACTGTTGCTTGTCCGACT"
+  input_dir: "in"
+  input_pattern: "*.fq.gz"
+  lines_to_process: "all"
+  output_dir: "S1_Matched"
+  jobs: 2
+S2_config:
+  min_length: 5
+  output_dir: "S2_Split"
+  separator_pairs:
+    - name: "$1"
+      separator1: "GATCATGTCGGAACTGTTGCTTGTCCGACTGATC"
+      separator2: "AGATCGGAAGA"
+workflow_control:
+  skip_hic: true
+CONFIG
+}
+
+run_pipeline() {
+    if ! python3 "${REPO_DIR}/src/S1S2HiC_Pipeline.py" -c pipeline_config.yaml --skip-trim > "run_$1.log" 2>&1; then
+        tail -20 "run_$1.log" >&2
+        echo "错误: 第 $1 次运行失败" >&2
+        exit 1
+    fi
+}
+
+# 检查上一次运行中各阶段处理 (done) 的文件; 参数: 说明 S1处理的样本 S2处理的样本 (逗号分隔, 可为空)
+check_processed() {
+    python3 - "$@" <<'PYTHON'
+import json
+import sys
+
+label, expected_s1, expected_s2 = sys.argv[1:4]
+problems = 0
+for stage, expected in (("S1", expected_s1), ("S2", expected_s2)):
+    with open(f"pipeline_metrics/{stage}.json", encoding='utf-8') as f:
+        files = json.load(f)['files']
+    statuses = {file_metrics['input_file'].rsplit('/', 1)[-1].split('_')[0]: file_metrics['status']
+                for file_metrics in files}
+    processed = sorted(sample for sample, status in statuses.items() if status == 'done')
+    ok = processed == sorted(filter(None, expected.split(','))) and \
+        all(status in ('done', 'up_to_date') for status in statuses.values()) and len(statuses) == 2
+    print(f"{'✓' if ok else '✗'} {label}: {stage} 处理 {processed or '无'} ({statuses})")
+    problems += not ok
+sys.exit(1 if problems else 0)
+PYTHON
+}
+
+count_reads() {
+    echo $(( $(gzip -dc "$1" | wc -l) / 4 ))
+}
+
+echo ""
+echo "=== 1. 首次运行 ==="
+write_config linkerA
+run_pipeline 1
+check_processed "首次运行" s1,s2 s1,s2
+s1_matched_reads=$(count_reads S1_Matched/s1_R1.fq.gz)
+s1_split_md5=$(gzip -dc S2_Split/s1_R1/s1_R1_linkerA_R1.fq.gz | md5sum | cut -d' ' -f1)
+
+echo ""
+echo "=== 2. 未改变时再次运行 ==="
+run_pipeline 2
+check_processed "未改变" "" ""
+
+echo ""
+echo "=== 3. 改变S2参数 (分隔符对改名) ==="
+write_config linkerB
+run_pipeline 3
+check_processed "S2参数改变" "" s1,s2
+stale_files=$(find S2_Split -name "*linkerA*")
+if [ -n "$stale_files" ]; then
+    echo "错误: 分隔符对改名后仍有旧输出: $stale_files" >&2
+    exit 1
+fi
+echo "✓ 旧名称的S2输出已删除"
+
+echo ""
+echo "=== 4. touch 一个输入 ==="
+sleep 1
+touch in/s1_R1.fq.gz
+run_pipeline 4
+check_processed "touch输入" s1 s1
+# S1以追加方式写出FASTQ, 旧输出未删除时reads会重复
+actual_reads=$(count_reads S1_Matched/s1_R1.fq.gz)
+if [ "$actual_reads" != "$s1_matched_reads" ]; then
+    echo "错误: 重新处理后 S1_Matched/s1_R1.fq.gz 有 $actual_reads 条reads (应为 $s1_matched_reads)" >&2
+    exit 1
+fi
+echo "✓ S1输出未重复追加 ($actual_reads 条reads)"
+actual_md5=$(gzip -dc S2_Split/s1_R1/s1_R1_linkerB_R1.fq.gz | md5sum | cut -d' ' -f1)
+if [ "$actual_md5" != "$s1_split_md5" ]; then
+    echo "错误: 重新处理后 s1_R1_linkerB_R1.fq.gz 与首次运行的内容不同" >&2
+    exit 1
+fi
+echo "✓ S2输出与首次运行一致"
+
+echo ""
+echo "=== 5. 删除一个输出 ==="
+rm S2_Split/s2_R1/s2_R1_linkerB_R2.fq.gz
+run_pipeline 5
+check_processed "删除输出" "" s2
+if [ ! -f S2_Split/s2_R1/s2_R1_linkerB_R2.fq.gz ]; then
+    echo "错误: 删除的输出没有重新生成" >&2
+    exit 1
+fi
+echo "✓ 删除的输出已重新生成"
+
+echo ""
+echo "=== 6. 再次运行 ==="
+run_pipeline 6
+check_processed "全部已是最新" "" ""
+echo "增量运行测试通过"
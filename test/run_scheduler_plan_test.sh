@@ -0,0 +1,147 @@
+#!/bin/bash
+
+# 多组调度器任务生成测试: 为带跳过/融合设置和超出CPU预算的cpu_count的组生成任务,
+# 检查各组的阶段、依赖、命令中的 -j / --hic-cpu, 以及流程合并 --hic-cpu 后HiC-Pro实际使用的CPU数
+# 用法: bash test/run_scheduler_plan_test.sh
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+REPO_DIR="$(dirname "$SCRIPT_DIR")"
+
+WORK_DIR="$(mktemp -d -t scheduler_plan_test.XXXXXX)"
+trap 'rm -rf "$WORK_DIR"' EXIT
+cd "$WORK_DIR"
+echo "工作目录: $WORK_DIR"
+
+mkdir -p configs work_full work_fused work_s1s2 work_disabled
+# full: 四个阶段; S1 jobs 4, S2沿用S1的jobs; cpu_count 16 超出10个CPU的预算
+cat > configs/full.yaml <<CONFIG
+S1_config:
+  patterns: "ATGTCGGAACTGTTGCTTGTCCGACT"
+  jobs: 4
+HiC_config:
+  cpu_count: 16
+CONFIG
+# fused: S2在S1中完成, 没有单独的S2任务; 未设置cpu_count时为默认值
+cat > configs/fused.yaml <<CONFIG
+S1_config:
+  patterns: "ATGTCGGAACTGTTGCTTGTCCGACT"
+  jobs: 2
+workflow_control:
+  fused_s1s2: true
+CONFIG
+# s1s2: 跳过HiC; S2 jobs 12 超出预算
+cat > configs/s1s2.yaml <<CONFIG
+S1_config:
+  patterns: "ATGTCGGAACTGTTGCTTGTCCGACT"
+  jobs: 3
+S2_config:
+  jobs: 12
+workflow_control:
+  skip_hic: true
+CONFIG
+cp configs/full.yaml configs/disabled.yaml
+
+cat > parallel_config.yaml <<CONFIG
+global_settings:
+  script_dir: "${REPO_DIR}"
+  config_dir: "${WORK_DIR}/configs"
+  log_dir: "${WORK_DIR}/logs"
+  python_cmd: "python3"
+  pipeline_args: "--skip-trim"
+scheduler:
+  max_cpus: 10
+  max_memory_gb: 64
+  max_io_tasks: 2
+processing_groups:
+  full:
+    config_file: "full.yaml"
+    work_dir: "${WORK_DIR}/work_full"
+    priority: 2
+  fused:
+    config_file: "fused.yaml"
+    work_dir: "${WORK_DIR}/work_fused"
+  s1s2:
+    config_file: "s1s2.yaml"
+    work_dir: "${WORK_DIR}/work_s1s2"
+  disabled:
+    enabled: false
+    config_file: "disabled.yaml"
+    work_dir: "${WORK_DIR}/work_disabled"
+CONFIG
+
+echo "=== 生成任务并检查 ==="
+python3 - "${REPO_DIR}/src" <<'PYTHON'
+import argparse
+import sys
+
+sys.path.insert(0, sys.argv[1])
+from S1S2HiC_Pipeline import DEFAULT_HIC_CPU_COUNT, merge_config_with_args
+from S1S2HiC_Scheduler import ResourceBudget, build_tasks, load_yaml
+
+problems = []
+
+def check(condition, message):
+    print(f"{'✓' if condition else '✗'} {message}")
+    if not condition:
+        problems.append(message)
+
+def option_value(command, option):
+    return int(command[command.index(option) + 1]) if option in command else None
+
+parallel_config = load_yaml("parallel_config.yaml")
+budget = ResourceBudget(10, 64.0, 2)
+tasks, _ = build_tasks(parallel_config, budget)
+by_name = {task.name: task for task in tasks}
+
+expected_tasks = ["full/s1", "full/s2", "full/staging", "full/hic", "fused/s1", "fused/staging", "fused/hic",
+                  "s1s2/s1", "s1s2/s2"]
+check([task.name for task in tasks] == expected_tasks, f"任务及顺序: {[task.name for task in tasks]}")
+check(by_name["full/s2"].depends_on == ["full/s1"] and by_name["full/hic"].depends_on == ["full/staging"],
+      "同组任务依次依赖")
+check(by_name["fused/staging"].depends_on == ["fused/s1"], "融合模式: 整理HiC输入直接依赖S1")
+check(all(not task.depends_on for task in tasks if task.stage == "s1"), "各组的S1没有依赖")
+
+for task in tasks:
+    check(task.command[task.command.index("--stage") + 1] == task.stage and "--skip-trim" in task.command,
+          f"{task.name}: 命令含 --stage {task.stage} 和 pipeline_args")
+
+check(by_name["full/s1"].cpus == 4 and option_value(by_name["full/s1"].command, "-j") == 4, "full/s1: -j 4")
+check(by_name["full/s2"].cpus == 4 and option_value(by_name["full/s2"].command, "-j") == 4,
+      "full/s2: 未设置S2 jobs时沿用S1的 -j 4")
+check(by_name["s1s2/s2"].cpus == 10 and option_value(by_name["s1s2/s2"].command, "-j") == 10,
+      "s1s2/s2: jobs 12 超出预算, -j 10")
+check(by_name["full/staging"].cpus == 1 and "-j" not in by_name["full/staging"].command
+      and "--hic-cpu" not in by_name["full/staging"].command, "整理HiC输入: 1个CPU, 不传 -j/--hic-cpu")
+check(by_name["full/hic"].cpus == 10 and option_value(by_name["full/hic"].command, "--hic-cpu") == 10,
+      "full/hic: cpu_count 16 超出预算, --hic-cpu 10")
+check(by_name["fused/hic"].cpus == DEFAULT_HIC_CPU_COUNT
+      and option_value(by_name["fused/hic"].command, "--hic-cpu") == DEFAULT_HIC_CPU_COUNT,
+      f"fused/hic: 未设置cpu_count, --hic-cpu {DEFAULT_HIC_CPU_COUNT}")
+
+# 流程合并命令行后HiC-Pro实际使用的CPU数不超过调度器预留的数量
+for task in tasks:
+    if task.stage != "hic":
+        continue
+    group_config = load_yaml(f"configs/{task.group_id}.yaml")
+    merged = merge_config_with_args(group_config, argparse.Namespace(hic_cpu=option_value(task.command, "--hic-cpu")))
+    check(merged['HiC_config']['cpu_count'] == task.cpus,
+          f"{task.name}: 合并后 cpu_count = {merged['HiC_config']['cpu_count']} (预留 {task.cpus})")
+
+selected_tasks, _ = build_tasks(parallel_config, budget, ["disabled"])
+check([task.name for task in selected_tasks] == ["disabled/s1", "disabled/s2", "disabled/staging", "disabled/hic"],
+      "-g 指定时包括未启用的组")
+
+if problems:
+    print(f"错误: {len(problems)} 项检查失败", file=sys.stderr)
+    sys.exit(1)
+PYTHON
+
+echo ""
+echo "=== 调度器 --dry-run ==="
+python3 "${REPO_DIR}/src/S1S2HiC_Scheduler.py" -c parallel_config.yaml --dry-run | tee dry_run.txt
+if ! grep -q -- "--stage hic --skip-trim --hic-cpu 10" dry_run.txt; then
+    echo "错误: --dry-run 输出中没有 full/hic 的 --hic-cpu 10" >&2
+    exit 1
+fi
+echo "调度器任务生成测试通过"
@@ -0,0 +1,84 @@
+#!/bin/bash
+
+# 分块流式交接测试: 用合成数据运行S1/S2, 由替身消费者在S2运行期间读取Run2_trim中发布的分块,
+# 再以HiC-Pro替身 (fake_hicpro.py) 运行分块映射 (hic_stream_mapper.py) 和映射之后的步骤, 核对配对reads数
+# 用法: bash test/run_stream_handoff_test.sh [每个文件的reads数] [每块配对reads数]
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+REPO_DIR="$(dirname "$SCRIPT_DIR")"
+READS=${1:-200000}
+CHUNK_READS=${2:-20000}
+
+WORK_DIR="$(mktemp -d -t stream_handoff_test.XXXXXX)"
+trap 'rm -rf "$WORK_DIR"' EXIT
+cd "$WORK_DIR"
+echo "工作目录: $WORK_DIR"
+
+echo "=== 生成合成数据 ==="
+mkdir -p rawdata
+for sample in lane1 lane2; do
+    python3 "${REPO_DIR}/benchmarks/synthetic_fastq.py" -o "rawdata/${sample}.fq.gz" --reads "$READS" \
+        --seed "${sample: -1}"
+done
+
+cat > stream_handoff_test.yaml <<CONFIG
+S1_config:
+  patterns: "ATGTCGGAACTGTTGCTTGTCCGACT"
+  input_dir: "rawdata"
+  input_pattern: "*.fq.gz"
+  lines_to_process: "all"
+  output_dir: "S1_Matched"
+S2_config:
+  min_length: 5
+  output_dir: "S2_Split"
+HiC_config:
+  input_dir: "HiC_Input"
+  stream_handoff:
+    enabled: true
+    chunk_reads: ${CHUNK_READS}
+    compresslevel: 1
+    consumer: "python3 ${SCRIPT_DIR}/stream_handoff_consumer.py --poll-seconds 0.2 --timeout 300"
+workflow_control:
+  skip_hic: true
+CONFIG
+
+echo "=== 运行S1/S2 (分块流式交接) ==="
+python3 "${REPO_DIR}/src/S1S2HiC_Pipeline.py" -c stream_handoff_test.yaml --skip-trim --pipelined-s1s2
+
+echo ""
+echo "=== 替身消费者输出 ==="
+cat pipeline_logs/handoff.log
+
+echo ""
+echo "=== 发布的分块 ==="
+ls -la Run2_trim/*/
+
+echo ""
+echo "=== 运行S1/S2 (分块映射, HiC-Pro替身) ==="
+sed -i "s#consumer: .*#consumer: \"python3 ${REPO_DIR}/src/hic_stream_mapper.py --hicpro ${SCRIPT_DIR}/fake_hicpro.py --hicpro-config fake.txt --conda-env '' --output-dir ${WORK_DIR}/Run3_hic --cpu 1 --poll-seconds 0.2 --timeout 300\"#" \
+    stream_handoff_test.yaml
+python3 "${REPO_DIR}/src/S1S2HiC_Pipeline.py" -c stream_handoff_test.yaml --skip-trim --pipelined-s1s2 --force
+cat pipeline_logs/handoff.log | grep -v "^.*\] \[" | tail -n 5
+
+echo ""
+echo "=== 映射之后的步骤 (HiC-Pro替身) ==="
+python3 - "${REPO_DIR}/src" "${SCRIPT_DIR}/fake_hicpro.py" <<'PYTHON'
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, sys.argv[1])
+from hic_stream_mapper import build_post_mapping_command
+
+subprocess.run(build_post_mapping_command(sys.argv[2], Path("Run3_hic").absolute(), "fake.txt", 1), check=True)
+for sample_dir in sorted(path for path in Path("Run2_trim").iterdir() if path.is_dir()):
+    expected = sum(json.loads(marker.read_text())['reads'] for marker in sample_dir.glob(".*.handoff.done"))
+    actual = int((Path("Run3_hic/hic_results/data") / sample_dir.name / f"{sample_dir.name}.allValidPairs").read_text())
+    if actual != expected:
+        print(f"错误: {sample_dir.name}: 映射结果 {actual} 对reads, 分块中为 {expected}", file=sys.stderr)
+        sys.exit(1)
+    print(f"✓ {sample_dir.name}: {actual} 对reads")
+PYTHON
+echo "分块流式交接测试通过"
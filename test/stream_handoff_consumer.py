@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+分块流式交接的替身消费者 (代替HiC-Pro映射模块, 用于本地测试)
+在S1/S2运行期间读取 Run2_trim/<样本>/ 中新发布的R1/R2分块, 检查每块R1与R2的reads数相同且read名一致,
+流程写入结束标记后核对各样本的完成标记 (.<名称>.handoff.done) 与读到的分块和reads数, 全部一致时退出码为0。
+
+用法: python test/stream_handoff_consumer.py [--poll-seconds 0.5] [--timeout 600] [--delay-seconds 0] Run2_trim目录
+      (S1S2HiC_Pipeline.py --stream-handoff --stream-consumer "python3 test/stream_handoff_consumer.py" 会在最后附加目录)
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from chunk_handoff import HANDOFF_DONE_SUFFIX, iter_handoff_chunks
+
+def read_names(path):
+    """
+    一个FASTQ.gz分块中各read的名称 (header第一个空白之前的部分, 去掉 /1、/2 后缀)
+    """
+    names = []
+    with gzip.open(path, 'rb') as f:
+        for index, line in enumerate(f):
+            if index % 4 == 0:
+                name = line.split()[0]
+                names.append(name[:-2] if name[-2:] in (b'/1', b'/2') else name)
+    return names
+
+def check_done_markers(handoff_dir, consumed_chunks):
+    """
+    核对各完成标记中的分块都已读到, 返回不一致的描述
+    """
+    problems = []
+    for marker_path in sorted(Path(handoff_dir).glob(f"*/.*{HANDOFF_DONE_SUFFIX}")):
+        with open(marker_path, 'r', encoding='utf-8') as f:
+            marker = json.load(f)
+        marker_reads = 0
+        for r1_output in marker['r1_outputs']:
+            if str(r1_output) not in consumed_chunks:
+                problems.append(f"{marker_path}: 分块未读到: {r1_output}")
+            else:
+                marker_reads += consumed_chunks[str(r1_output)]
+        if marker_reads != marker['reads']:
+            problems.append(f"{marker_path}: 读到 {marker_reads} reads, 标记中为 {marker['reads']}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="分块流式交接的替身消费者: 读取并检查已发布的R1/R2分块")
+    parser.add_argument("handoff_dir", help="交接目录 (Run2_trim)")
+    parser.add_argument("--poll-seconds", type=float, default=0.5, help="检查新分块的间隔秒数 (默认: 0.5)")
+    parser.add_argument("--timeout", type=float, default=600, help="多少秒内没有新分块时失败 (默认: 600)")
+    parser.add_argument("--delay-seconds", type=float, default=0.0,
+                        help="每个分块额外等待的秒数, 模拟映射耗时 (默认: 0)")
+    args = parser.parse_args()
+
+    start_time = time.monotonic()
+    consumed_chunks = {}
+    try:
+        for sample_name, r1_path, r2_path in iter_handoff_chunks(args.handoff_dir, args.poll_seconds, args.timeout):
+            r1_names = read_names(r1_path)
+            r2_names = read_names(r2_path)
+            if r1_names != r2_names:
+                print(f"错误: {r1_path.name} 与 {r2_path.name} 的reads不配对 "
+                      f"({len(r1_names)} / {len(r2_names)} reads)", file=sys.stderr)
+                sys.exit(1)
+            consumed_chunks[str(r1_path)] = len(r1_names)
+            print(f"[{time.monotonic() - start_time:.1f}s] {sample_name}: {r1_path.name} ({len(r1_names)} 对reads)")
+            time.sleep(args.delay_seconds)
+    except (RuntimeError, TimeoutError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    problems = check_done_markers(args.handoff_dir, consumed_chunks)
+    for problem in problems:
+        print(f"错误: {problem}", file=sys.stderr)
+    print(f"共读取 {len(consumed_chunks)} 个分块, {sum(consumed_chunks.values())} 对reads")
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()